@@ -6,6 +6,7 @@ from uuid import uuid4
 from collections import OrderedDict
 
 from celery import shared_task
+from django.core.cache import cache
 from django.db import transaction, IntegrityError
 from django.db.models import Q
 from django.contrib.auth import get_user_model
@@ -18,6 +19,7 @@ from common.djangoapps.credo_modules.mongo import get_last_published_course_vers
     get_versions_for_blocks
 from common.djangoapps.credo_modules.models import SiblingBlockUpdateTask
 from common.djangoapps.student.auth import has_studio_write_access
+from .sibling_graph import SiblingGraph, invalidate_sibling_graph
 from xmodule.modulestore import ModuleStoreEnum
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.exceptions import ItemNotFoundError
@@ -30,6 +32,12 @@ from milestones.models import Milestone, CourseContentMilestone
 User = get_user_model()
 log = logging.getLogger(__name__)
 
+SIBLING_UPDATE_PROGRESS_STEP = 20
+# related courses are updated in parallel by the separate tasks, every task updates this number of courses
+SIBLING_UPDATE_COURSES_PER_TASK = 1
+# the source subtree is loaded once and shared between the tasks through the cache
+SIBLING_SOURCE_CACHE_TIMEOUT = 60 * 60 * 6
+
 
 class CopyInfoEntry:
     data = None
@@ -54,11 +62,17 @@ class CopyInfoEntry:
 
         self.asides_to_update = None
         self.tags = {}
-        for aside in xblock.runtime.get_asides(xblock):
-            if aside.scope_ids.block_type in ('tagging_aside', 'tagging_ora_aside') and aside.saved_tags:
-                self.asides_to_update = [aside]
-                self.tags = aside.get_sorted_tags()
-                break
+        aside = get_tagging_aside(xblock)
+        if aside:
+            self.asides_to_update = [aside]
+            self.tags = aside.get_sorted_tags()
+
+
+def get_tagging_aside(xblock):
+    for aside in xblock.runtime.get_asides(xblock):
+        if aside.scope_ids.block_type in ('tagging_aside', 'tagging_ora_aside') and aside.saved_tags:
+            return aside
+    return None
 
 
 def create_api_block_info(usage_key, user, block_hash_id=None, created_as_copy=False,
@@ -83,6 +97,7 @@ def create_api_block_info(usage_key, user, block_hash_id=None, created_as_copy=F
     api_block_info.set_has_children()
     if auto_save:
         api_block_info.save()
+        invalidate_sibling_graph(hash_ids=[block_hash_id])
     return api_block_info
 
 
@@ -117,8 +132,9 @@ def copy_api_block_info(source_item, dest_module, user, level=0, auto_save=True,
                 source_block_hash = source_block_info.hash_id
 
     if source_item.category == 'vertical':
-        not_siblings = ApiBlockInfoNotSiblings.objects.filter(
-            Q(source_block_id=str(source_item.location)) | Q(dst_block_id=str(source_item.location)))
+        not_siblings = list(ApiBlockInfoNotSiblings.objects.filter(
+            Q(source_block_id=str(source_item.location)) | Q(dst_block_id=str(source_item.location))))
+        other_block_ids = []
         for not_sibling in not_siblings:
             other_block_id = not_sibling.source_block_id if not_sibling.dst_block_id == str(source_item.location) else not_sibling.dst_block_id
             ApiBlockInfoNotSiblings(
@@ -128,6 +144,11 @@ def copy_api_block_info(source_item, dest_module, user, level=0, auto_save=True,
                 dst_course_id=str(UsageKey.from_string(str(dest_module.location)).course_key),
                 user_id=user.id
             ).save()
+            other_block_ids.append(other_block_id)
+        if other_block_ids:
+            # invalidate only after the new rows are saved, otherwise the old data could be cached again
+            invalidate_sibling_graph(hash_ids=[source_block_hash],
+                                     block_ids=[str(source_item.location)] + other_block_ids)
 
     return create_api_block_info(dest_module.location, user,
                                  block_hash_id=source_block_hash,
@@ -156,10 +177,12 @@ def update_api_blocks_before_publish(xblock, user):
                 check_connection_between_siblings(user, course_id, vertical_blocks)
             ApiBlockInfo.objects.filter(course_id=course_id, block_id__in=block_ids, deleted=False)\
                 .update(published_after_copy=True, created_as_copy_from_course_id=None)
+            invalidate_sibling_graph(block_ids=block_ids)
         else:
             api_block_info.created_as_copy_from_course_id = None
             api_block_info.published_after_copy = True
             api_block_info.save()
+            invalidate_sibling_graph(hash_ids=[api_block_info.hash_id])
 
         if xblock.category != 'chapter':
             xblock_parent = xblock.get_parent()
@@ -171,16 +194,62 @@ def update_api_blocks_before_publish(xblock, user):
                 update_api_blocks_before_publish(xblock_parent, user)
 
 
-def check_and_restore_sibling_conection(block_id, block_hash_id, content_version):
-    not_sibling_blocks = ApiBlockInfoNotSiblings.objects.filter(Q(source_block_id=block_id) | Q(dst_block_id=block_id))
-    for block in not_sibling_blocks:
-        related_block_id = block.source_block_id if block.dst_block_id == block_id else block.dst_block_id
-        not_sibling_block = ApiBlockInfo.objects.filter(
-            hash_id=block_hash_id, block_id=related_block_id, published_content_version=content_version).first()
-        if not_sibling_block:
-            ApiBlockInfoNotSiblings.objects.filter(
-                Q(source_block_id=block_id, dst_block_id=related_block_id)
-                | Q(source_block_id=related_block_id, dst_block_id=block_id)).delete()
+def get_not_siblings_pairs(block_ids_1, block_ids_2):
+    """
+    Returns set of (block_id, block_id) pairs marked as "not siblings" (both directions are included)
+    """
+    pairs = set()
+    if not block_ids_1 or not block_ids_2:
+        return pairs
+    block_ids_1 = list(block_ids_1)
+    block_ids_2 = list(block_ids_2)
+    for source_block_id, dst_block_id in ApiBlockInfoNotSiblings.objects.filter(
+            Q(source_block_id__in=block_ids_1, dst_block_id__in=block_ids_2)
+            | Q(source_block_id__in=block_ids_2, dst_block_id__in=block_ids_1)
+    ).values_list('source_block_id', 'dst_block_id'):
+        pairs.add((source_block_id, dst_block_id))
+        pairs.add((dst_block_id, source_block_id))
+    return pairs
+
+
+def restore_sibling_connections(blocks):
+    """
+    Restores connection between the published blocks and the related blocks with the same content version.
+    `blocks` is dict {block_id: (hash_id, content_version)}
+    """
+    if not blocks:
+        return
+
+    block_ids = list(blocks.keys())
+    not_sibling_rows = list(ApiBlockInfoNotSiblings.objects.filter(
+        Q(source_block_id__in=block_ids) | Q(dst_block_id__in=block_ids)
+    ).values_list('id', 'source_block_id', 'dst_block_id'))
+    if not not_sibling_rows:
+        return
+
+    checks = []
+    for _row_id, source_block_id, dst_block_id in not_sibling_rows:
+        if source_block_id in blocks:
+            checks.append((source_block_id, dst_block_id))
+        if dst_block_id in blocks:
+            checks.append((dst_block_id, source_block_id))
+
+    related_blocks = set(ApiBlockInfo.objects.filter(
+        block_id__in=[related_block_id for _block_id, related_block_id in checks],
+        hash_id__in=[blocks[block_id][0] for block_id, _related_block_id in checks]
+    ).values_list('block_id', 'hash_id', 'published_content_version'))
+
+    restored_pairs = set()
+    for block_id, related_block_id in checks:
+        hash_id, content_version = blocks[block_id]
+        if (related_block_id, hash_id, content_version) in related_blocks:
+            restored_pairs.add(frozenset((block_id, related_block_id)))
+
+    row_ids = [row_id for row_id, source_block_id, dst_block_id in not_sibling_rows
+               if frozenset((source_block_id, dst_block_id)) in restored_pairs]
+    if row_ids:
+        ApiBlockInfoNotSiblings.objects.filter(id__in=row_ids).delete()
+        invalidate_sibling_graph(hash_ids=[hash_id for hash_id, _content_version in blocks.values()])
 
 
 def update_sibling_block_after_publish(related_courses, xblock, user, vertical_ids_with_changes):
@@ -188,21 +257,28 @@ def update_sibling_block_after_publish(related_courses, xblock, user, vertical_i
     course_ids_without_changes = []
     course_id = str(xblock.location.course_key)
 
+    content_versions = {}
     for module in yield_dynamic_descriptor_descendants(xblock, user.id):
         if module.category == 'vertical':
-            content_version = get_content_version(module)
-            block_id = str(module.location)
-            src_api_blocks_info = ApiBlockInfo.objects.filter(
-                block_id=block_id, deleted=False).first()
-            if src_api_blocks_info:
-                src_api_blocks_info.published_content_version = content_version
-                src_api_blocks_info.save()
-
+            content_versions[str(module.location)] = get_content_version(module)
+
+    if content_versions:
+        src_api_blocks_info = {}
+        for src_api_block_info in ApiBlockInfo.objects.filter(
+                block_id__in=list(content_versions.keys()), deleted=False).order_by('id'):
+            if src_api_block_info.block_id not in src_api_blocks_info:
+                src_api_block_info.published_content_version = content_versions[src_api_block_info.block_id]
                 # restore connection between siblings
-                if src_api_blocks_info.reverted_to_previous_version:
-                    src_api_blocks_info.reverted_to_previous_version = False
-                    src_api_blocks_info.save()
-                check_and_restore_sibling_conection(block_id, src_api_blocks_info.hash_id, content_version)
+                src_api_block_info.reverted_to_previous_version = False
+                src_api_blocks_info[src_api_block_info.block_id] = src_api_block_info
+        if src_api_blocks_info:
+            ApiBlockInfo.objects.bulk_update(list(src_api_blocks_info.values()),
+                                             ['published_content_version', 'reverted_to_previous_version'], 500)
+            invalidate_sibling_graph(hash_ids=[info.hash_id for info in src_api_blocks_info.values()])
+            restore_sibling_connections({
+                block_id: (src_api_block_info.hash_id, src_api_block_info.published_content_version)
+                for block_id, src_api_block_info in src_api_blocks_info.items()
+            })
 
     course_ids_updated = [course_id]
     if xblock.category in ApiBlockInfo.CATEGORY_HAS_CHILDREN:
@@ -227,45 +303,46 @@ def update_sibling_block_after_publish(related_courses, xblock, user, vertical_i
                     course_ids_without_changes.append(related_course_id)
 
         # break connection between siblings
-        if course_ids_without_changes:
+        if course_ids_without_changes and vertical_ids_with_changes:
             not_siblings_list = []
 
-            src_blocks_tmp = ApiBlockInfo.objects.filter(
-                block_id__in=vertical_ids_with_changes, deleted=False)
-            hashes_tmp = [src_block.hash_id for src_block in src_blocks_tmp]
-            src_related_blocks = ApiBlockInfo.objects.filter(
-                hash_id__in=hashes_tmp, course_id__in=course_ids_updated, deleted=False)
-            for src_item in src_related_blocks:
+            hashes_tmp = set(ApiBlockInfo.objects.filter(
+                block_id__in=vertical_ids_with_changes, deleted=False).values_list('hash_id', flat=True))
+            src_related_blocks = list(ApiBlockInfo.objects.filter(
+                hash_id__in=hashes_tmp, course_id__in=course_ids_updated, deleted=False
+            ).values_list('block_id', 'hash_id'))
+
+            dst_blocks = {}
+            for dst_course_id, dst_hash_id, dst_block_id in ApiBlockInfo.objects.filter(
+                    hash_id__in=hashes_tmp, course_id__in=course_ids_without_changes, deleted=False
+            ).order_by('id').values_list('course_id', 'hash_id', 'block_id'):
+                dst_blocks.setdefault((dst_course_id, dst_hash_id), dst_block_id)
+
+            not_siblings = get_not_siblings_pairs([block_id for block_id, _hash_id in src_related_blocks],
+                                                  list(dst_blocks.values()))
+            for src_block_id, src_hash_id in src_related_blocks:
                 for course_id_without_changes in course_ids_without_changes:
-                    dst_block = ApiBlockInfo.objects.filter(course_id=course_id_without_changes, hash_id=src_item.hash_id,
-                                                            deleted=False).first()
-                    if not dst_block:
-                        continue
-                    b1 = ApiBlockInfoNotSiblings.objects.filter(source_block_id=src_item.block_id,
-                                                                dst_block_id=dst_block.block_id).first()
-                    if b1:
-                        continue
-                    b2 = ApiBlockInfoNotSiblings.objects.filter(source_block_id=dst_block.block_id,
-                                                                dst_block_id=src_item.block_id).first()
-                    if b2:
+                    dst_block_id = dst_blocks.get((course_id_without_changes, src_hash_id))
+                    if not dst_block_id or (src_block_id, dst_block_id) in not_siblings:
                         continue
 
+                    not_siblings.add((src_block_id, dst_block_id))
+                    not_siblings.add((dst_block_id, src_block_id))
                     not_siblings_list.append(ApiBlockInfoNotSiblings(
-                        source_block_id=src_item.block_id,
-                        source_course_id=str(UsageKey.from_string(src_item.block_id).course_key),
-                        dst_block_id=dst_block.block_id,
-                        dst_course_id=str(UsageKey.from_string(dst_block.block_id).course_key),
+                        source_block_id=src_block_id,
+                        source_course_id=str(UsageKey.from_string(src_block_id).course_key),
+                        dst_block_id=dst_block_id,
+                        dst_course_id=str(UsageKey.from_string(dst_block_id).course_key),
                         user_id=user.id
                     ))
 
             if not_siblings_list:
                 ApiBlockInfoNotSiblings.objects.bulk_create(not_siblings_list, 1000)
+                invalidate_sibling_graph(hash_ids=hashes_tmp)
 
         def process_on_commit():
             if update_res:
-                for task_id, rel_course_id, rel_course_action in update_res:
-                    update_sibling_block_in_related_course.delay(
-                        task_id, str(xblock.location), rel_course_id, rel_course_action == 'publish', user.id)
+                update_sibling_blocks_in_related_courses.delay(task_uuid, str(xblock.location), user.id)
 
         transaction.on_commit(process_on_commit)
         if update_res:
@@ -273,16 +350,37 @@ def update_sibling_block_after_publish(related_courses, xblock, user, vertical_i
     return None
 
 
-def _copy_fields_from_one_xblock_to_other(store, source_block, dst_block_id, user, save_xblock_fn, lib_tools=None):
-    dst_item = store.get_item(UsageKey.from_string(dst_block_id))
+class SiblingSourceBlock:
+    """
+    Data of the source block shared between the updates of all related courses.
+    It is saved into the cache, so the aside objects aren't kept: they are loaded again
+    only for the blocks which are really updated (see _copy_fields_from_one_xblock_to_other)
+    """
 
-    source_block_info = CopyInfoEntry(source_block)
-    dst_block_info = CopyInfoEntry(dst_item)
+    def __init__(self, module):
+        self.location = module.location
+        self.category = module.category
+        self.parent = module.parent
+        self.display_name = module.display_name
+        self.source_library_version = getattr(module, 'source_library_version', None)
+        self.children_ids = [str(child) for child in module.children] if module.has_children else []
+        self.copy_info = None
+        # chapter/sequential blocks are never updated
+        if self.location.block_type not in ('chapter', 'sequential'):
+            self.copy_info = CopyInfoEntry(module)
+            self.copy_info.asides_to_update = None
 
+
+def _copy_fields_from_one_xblock_to_other(store, source_block, dst_block_id, user, save_xblock_fn, lib_tools=None):
     # Don't update chapter/sequential blocks
     if source_block.location.block_type in ('chapter', 'sequential'):
         return
 
+    dst_item = store.get_item(UsageKey.from_string(dst_block_id))
+
+    source_block_info = source_block.copy_info
+    dst_block_info = CopyInfoEntry(dst_item)
+
     update_library_content = False
     if lib_tools and source_block.location.block_type == 'library_content'\
       and source_block.source_library_version != dst_item.source_library_version:
@@ -296,6 +394,9 @@ def _copy_fields_from_one_xblock_to_other(store, source_block, dst_block_id, use
         need_update = True
 
     if need_update:
+        if source_block_info.tags and source_block_info.asides_to_update is None:
+            aside = get_tagging_aside(store.get_item(source_block.location))
+            source_block_info.asides_to_update = [aside] if aside else None
         save_xblock_fn(user, dst_item,
                        data=source_block_info.data,
                        metadata=source_block_info.metadata,
@@ -317,7 +418,7 @@ def get_versions_info_data(course_id, block_ids, course_version=None):
 
 
 def _update_sibling_block_add_new_items(items_to_add, allowed_categories, src_block_to_dst_block, dst_course_key,
-                                        user, published_after_copy, duplicate_xblock_fn):
+                                        user, published_after_copy, duplicate_xblock_fn, progress=None):
     for category in allowed_categories:
         for src_block in items_to_add:
             if (src_block.category == 'sequential' and category == 'sequential') \
@@ -331,276 +432,448 @@ def _update_sibling_block_add_new_items(items_to_add, allowed_categories, src_bl
                             UsageKey.from_string(dst_block_parent), src_block.location, user,
                             src_block.display_name, course_key=dst_course_key, force_create_api_block_info=True,
                             published_after_copy=published_after_copy)
+                if progress:
+                    progress.step()
+
+
+def _get_sibling_not_connected(verticals, source_course_id, dst_course_id):
+    """
+    `verticals` is dict {vertical_block_id: [children block ids]}.
+    Returns set of ids of the verticals (and their children) which are disconnected
+    from the sibling blocks in the `dst_course_id` course
+    """
+    sibling_not_connected = set()
+    if not verticals:
+        return sibling_not_connected
+
+    src_hashes = {}
+    for block_id, hash_id in ApiBlockInfo.objects.filter(
+            block_id__in=list(verticals.keys()), course_id=source_course_id
+    ).order_by('id').values_list('block_id', 'hash_id'):
+        src_hashes.setdefault(block_id, hash_id)
+
+    dst_blocks = {}
+    if src_hashes:
+        for hash_id, block_id in ApiBlockInfo.objects.filter(
+                hash_id__in=set(src_hashes.values()), course_id=dst_course_id).values_list('hash_id', 'block_id'):
+            dst_blocks.setdefault(hash_id, []).append(block_id)
+    if not dst_blocks:
+        return sibling_not_connected
+
+    not_siblings = get_not_siblings_pairs(
+        list(src_hashes.keys()), [block_id for block_ids in dst_blocks.values() for block_id in block_ids])
+    for block_id, children_ids in verticals.items():
+        for dst_block_id in dst_blocks.get(src_hashes.get(block_id), []):
+            if (block_id, dst_block_id) in not_siblings:
+                sibling_not_connected.add(block_id)
+                sibling_not_connected.update(children_ids)
+    return sibling_not_connected
 
 
-def _get_sibling_not_connected(source_item, source_course_id, dst_course_id, user):
-    sibling_not_connected = []
+class SiblingUpdateProgress:
+    """
+    Saves the number of the processed blocks into the SiblingBlockUpdateTask
+    """
 
-    for module in yield_dynamic_descriptor_descendants(source_item, user.id):
-        if module.category == 'vertical':
-            src_block_info = ApiBlockInfo.objects.filter(
-                block_id=str(module.location), course_id=source_course_id).first()
-            if src_block_info:
-                dst_block_info_data = ApiBlockInfo.objects.filter(
-                    hash_id=src_block_info.hash_id, course_id=dst_course_id)
-                if len(dst_block_info_data):
-                    for dst_block_info in dst_block_info_data:
-                        block_to_check_1 = src_block_info.block_id
-                        block_to_check_2 = dst_block_info.block_id
-                        not_siblings = _check_blocks_not_siblings(block_to_check_1, block_to_check_2)
-                        if not_siblings:
-                            sibling_not_connected.append(src_block_info.block_id)
-                            for child in module.get_children():
-                                sibling_not_connected.append(str(child.location))
-    return sibling_not_connected
+    def __init__(self, sibling_update_task=None):
+        self.sibling_update_task = sibling_update_task
+        self.total = 0
+        self.processed = 0
+        self._saved = 0
 
+    def add_total(self, count):
+        if count:
+            self.total = self.total + count
+            self.save()
 
-def _check_blocks_not_siblings(block_to_check_1, block_to_check_2):
-    not_siblings = False
-    b1 = ApiBlockInfoNotSiblings.objects.filter(
-        source_block_id=block_to_check_1, dst_block_id=block_to_check_2).first()
-    if b1:
-        not_siblings = True
-    else:
-        b2 = ApiBlockInfoNotSiblings.objects.filter(
-            source_block_id=block_to_check_2, dst_block_id=block_to_check_1).first()
-        if b2:
-            not_siblings = True
-    return not_siblings
+    def step(self):
+        self.processed = self.processed + 1
+        if self.processed - self._saved >= SIBLING_UPDATE_PROGRESS_STEP:
+            self.save()
 
+    def save(self):
+        if self.sibling_update_task:
+            self.sibling_update_task.blocks_total = self.total
+            self.sibling_update_task.blocks_processed = self.processed
+            SiblingBlockUpdateTask.objects.filter(id=self.sibling_update_task.id).update(
+                blocks_total=self.total, blocks_processed=self.processed)
+        self._saved = self.processed
 
-@shared_task()
-def update_sibling_block_in_related_course(task_id, source_usage_id, dst_course_id, need_publish, user_id):
-    try:
-        sibling_update_task = SiblingBlockUpdateTask.objects.get(id=task_id)
-    except SiblingBlockUpdateTask.DoesNotExist:
-        return
 
-    try:
-        user = User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        log.exception("update_sibling_block: user not found", user_id)
+def _set_sibling_update_tasks_error(sibling_update_tasks):
+    for sibling_update_task in sibling_update_tasks:
         sibling_update_task.set_error()
         sibling_update_task.save()
-        return
 
-    try:
-        sibling_update_task.set_started()
-        sibling_update_task.save()
 
-        res = _update_sibling_block_in_related_course(source_usage_id, dst_course_id, need_publish, user,
-                                                      sibling_update_task=sibling_update_task)
+class SiblingBlockPropagation:
+    """
+    Propagates the changes of the source block to the sibling blocks of the related courses.
 
-        if res:
-            sibling_update_task.set_finished()
-            sibling_update_task.save()
+    The source subtree is loaded once and saved into the cache (`start`), then the related courses are
+    updated in parallel by the update_sibling_blocks_in_related_courses_chunk tasks which read the source data
+    from the cache (`run`). The courses of one task are updated one by one, every course is updated
+    inside its own bulk operation.
+    """
+
+    def __init__(self, source_usage_id, user, task_uuid=None):
+        self.task_uuid = task_uuid
+        self.source_usage_id = source_usage_id
+        self.source_usage_key = UsageKey.from_string(source_usage_id)
+        self.course_id = str(self.source_usage_key.course_key)
+        self.user = user
+        self.blocks = []
+        self.verticals = {}
+        self.src_blocks_info = {}
+        self.source_main_block_info = None
+        self._source_vertical_hash_ids = None
+
+    def load(self):
+        store = modulestore()
+        with store.bulk_operations(self.source_usage_key.course_key):
+            source_item = store.get_item(self.source_usage_key)
+            for module in yield_dynamic_descriptor_descendants(source_item, self.user.id):
+                block = SiblingSourceBlock(module)
+                self.blocks.append(block)
+                if block.category == 'vertical':
+                    self.verticals[str(block.location)] = block.children_ids
+
+        for src_block_info in ApiBlockInfo.objects.filter(
+                course_id=self.course_id, block_id__in=[str(block.location) for block in self.blocks], deleted=False
+        ).order_by('id'):
+            self.src_blocks_info.setdefault(src_block_info.block_id, src_block_info)
+
+        source_main_block_info = self.src_blocks_info.get(self.source_usage_id)
+        if source_main_block_info and source_main_block_info.has_children:
+            self.source_main_block_info = source_main_block_info
+
+    def _source_cache_key(self):
+        return 'sibling_source:' + self.task_uuid
+
+    def save_source(self):
+        if not self.task_uuid:
+            return
+        try:
+            cache.set(self._source_cache_key(), {
+                'blocks': self.blocks,
+                'verticals': self.verticals,
+                'src_blocks_info': self.src_blocks_info,
+                'source_main_block_info': self.source_main_block_info,
+            }, SIBLING_SOURCE_CACHE_TIMEOUT)
+        except Exception as e:  # pylint: disable=broad-except
+            # the tasks load the subtree by themselves
+            log.exception(e)
+
+    def load_source(self):
+        source = cache.get(self._source_cache_key()) if self.task_uuid else None
+        if source is None:
+            self.load()
         else:
+            self.blocks = source['blocks']
+            self.verticals = source['verticals']
+            self.src_blocks_info = source['src_blocks_info']
+            self.source_main_block_info = source['source_main_block_info']
+
+    def start(self, sibling_update_tasks):
+        """
+        Loads the source subtree and starts the tasks updating the related courses
+        """
+        try:
+            self.load()
+            self.save_source()
+        except Exception:
+            _set_sibling_update_tasks_error(sibling_update_tasks)
+            raise
+
+        for i in range(0, len(sibling_update_tasks), SIBLING_UPDATE_COURSES_PER_TASK):
+            update_sibling_blocks_in_related_courses_chunk.delay(
+                self.task_uuid, self.source_usage_id, self.user.id,
+                [t.id for t in sibling_update_tasks[i:i + SIBLING_UPDATE_COURSES_PER_TASK]])
+
+    def _get_source_vertical_hash_ids(self):
+        if self._source_vertical_hash_ids is None:
+            source_vertical_blocks_ids = get_vertical_blocks_with_changes(self.source_usage_id, self.user)
+            self._source_vertical_hash_ids = list(ApiBlockInfo.objects.filter(
+                course_id=self.course_id,
+                block_id__in=source_vertical_blocks_ids,
+                deleted=False).values_list('hash_id', flat=True))
+        return self._source_vertical_hash_ids
+
+    def run(self, sibling_update_tasks):
+        try:
+            self.load_source()
+        except Exception:
+            _set_sibling_update_tasks_error(sibling_update_tasks)
+            raise
+
+        # modulestore writes (and the signal handlers they fire) aren't thread-safe,
+        # so the related courses of one task are updated one by one. An error in one course doesn't
+        # stop the update of the others, but it is re-raised at the end to mark the task as failed
+        error = None
+        for sibling_update_task in sibling_update_tasks:
+            try:
+                self.process_task(sibling_update_task)
+            except Exception as e:  # pylint: disable=broad-except
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+
+    def process_task(self, sibling_update_task):
+        try:
+            sibling_update_task.set_started()
+            sibling_update_task.save()
+
+            res = self.update_course(sibling_update_task.sibling_course_id, sibling_update_task.published,
+                                     sibling_update_task=sibling_update_task)
+            if res:
+                sibling_update_task.set_finished()
+            else:
+                sibling_update_task.set_error()
+            sibling_update_task.save()
+        except Exception as e:
+            log.exception(e)
             sibling_update_task.set_error()
             sibling_update_task.save()
-    except Exception as e:
-        log.exception(e)
-        sibling_update_task.set_error()
-        sibling_update_task.save()
-        raise
-
-
-def _update_sibling_block_in_related_course(source_usage_id, dst_course_id, need_publish, user, sibling_update_task=None):
-    from .views.item import _save_xblock as save_xblock_fn, _delete_item as delete_xblock_fn,\
-        _duplicate_item as duplicate_xblock_fn
-
-    source_usage_key = UsageKey.from_string(source_usage_id)
-    source_course_key = source_usage_key.course_key
-    dst_course_key = CourseKey.from_string(dst_course_id)
-
-    course_id = str(source_course_key)
-    items_to_update = OrderedDict()
-    items_to_add = []
-    store = modulestore()
-    src_block_to_dst_block = {}
-    dst_block_ids = []
-    dst_block_ids_has_children = []
-    items_to_remove = []
-    src_modules_ids = []
-
-    # try to find main dst block to publish
-    # (block in the "dst_course_id" course that corresponding to "source_usage_id")
-    source_main_block_info = ApiBlockInfo.objects.filter(
-        block_id=str(source_usage_id), course_id=course_id, has_children=True, deleted=False).first()
-
-    find_vert_blocks_manually = False
-    dst_main_block_id = "not_exist"
-
-    if source_main_block_info:
-        dst_main_block_info = ApiBlockInfo.objects.filter(
-            hash_id=source_main_block_info.hash_id, course_id=dst_course_id, deleted=False).first()
-        if dst_main_block_info:
-            all_dst_blocks = ApiBlockInfo.objects.filter(hash_id=source_main_block_info.hash_id, course_id=dst_course_id,
-                                                         deleted=False)
-
-            dst_main_block_id = dst_main_block_info.block_id
+            raise
+
+    def update_course(self, dst_course_id, need_publish, sibling_update_task=None):
+        from .views.item import _save_xblock as save_xblock_fn, _delete_item as delete_xblock_fn,\
+            _duplicate_item as duplicate_xblock_fn
+
+        user = self.user
+        course_id = self.course_id
+        dst_course_key = CourseKey.from_string(dst_course_id)
+        store = modulestore()
+        progress = SiblingUpdateProgress(sibling_update_task)
+
+        items_to_update = OrderedDict()
+        items_to_add = []
+        items_to_remove = []
+        src_block_to_dst_block = {}
+        dst_block_ids = set()
+        src_modules_ids = set(str(block.location) for block in self.blocks)
+        vertical_blocks = []
+
+        # try to find main dst block to publish
+        # (block in the "dst_course_id" course that corresponding to "source_usage_id")
+        dst_main_block_id = "not_exist"
+        all_dst_blocks = []
+        if self.source_main_block_info:
+            all_dst_blocks = list(ApiBlockInfo.objects.filter(
+                hash_id=self.source_main_block_info.hash_id, course_id=dst_course_id, deleted=False).order_by('id'))
+        if all_dst_blocks:
+            dst_main_block_id = all_dst_blocks[0].block_id
         else:
-            find_vert_blocks_manually = True
-    else:
-        find_vert_blocks_manually = True
-
-    if find_vert_blocks_manually:
-        source_vertical_blocks_ids = get_vertical_blocks_with_changes(source_usage_id, user)
-        source_vertical_api_blocks = ApiBlockInfo.objects.filter(
-            course_id=source_usage_id,
-            block_id__in=source_vertical_blocks_ids,
-            deleted=False)
-        source_vertical_hash_ids = [v.hash_id for v in source_vertical_api_blocks]
-        all_dst_blocks = ApiBlockInfo.objects.filter(
-            hash_id__in=source_vertical_hash_ids,
-            course_id=dst_course_id,
-            deleted=False)
-
-    if sibling_update_task:
-        sibling_update_task.sibling_block_id = dst_main_block_id
-
-        last_published_version = get_last_published_course_version(dst_course_key)
-        sibling_update_task.sibling_block_prev_version = last_published_version
-        sibling_update_task.save()
+            source_vertical_hash_ids = self._get_source_vertical_hash_ids()
+            if source_vertical_hash_ids:
+                all_dst_blocks = list(ApiBlockInfo.objects.filter(
+                    hash_id__in=source_vertical_hash_ids, course_id=dst_course_id, deleted=False))
+
+        if sibling_update_task:
+            sibling_update_task.sibling_block_id = dst_main_block_id
+            sibling_update_task.sibling_block_prev_version = get_last_published_course_version(dst_course_key)
+            sibling_update_task.save()
 
-    vertical_blocks = []
+        sibling_src_not_connected = _get_sibling_not_connected(self.verticals, course_id, dst_course_id)
 
-    with store.bulk_operations(source_course_key):
-        source_item = modulestore().get_item(source_usage_key)
-        sibling_src_not_connected = _get_sibling_not_connected(source_item, course_id, dst_course_id, user)
+        dst_blocks_by_hash = {}
+        for dst_block_info in ApiBlockInfo.objects.filter(
+                hash_id__in=set(info.hash_id for info in self.src_blocks_info.values()), course_id=dst_course_id
+        ).order_by('id'):
+            dst_blocks_by_hash.setdefault(dst_block_info.hash_id, []).append(dst_block_info)
 
-        for module in yield_dynamic_descriptor_descendants(source_item, user.id):
-            src_modules_ids.append(str(module.location))
-            if str(module.location) in sibling_src_not_connected:
+        dst_blocks_to_save = []
+        for block in self.blocks:
+            block_id = str(block.location)
+            if block_id in sibling_src_not_connected:
                 continue
-            src_block_info = ApiBlockInfo.objects.filter(
-                block_id=str(module.location), course_id=course_id, deleted=False).first()
-            if module.category == 'vertical' and src_block_info.published_content_version:
+            src_block_info = self.src_blocks_info.get(block_id)
+            if not src_block_info:
+                continue
+            if block.category == 'vertical' and src_block_info.published_content_version:
                 vertical_blocks.append({
-                    "block_id": str(module.location),
+                    "block_id": block_id,
                     "published_content_version": src_block_info.published_content_version,
                     "hash_id": src_block_info.hash_id
                 })
-            if src_block_info:
-                dst_block_info_data = ApiBlockInfo.objects.filter(
-                    hash_id=src_block_info.hash_id, course_id=dst_course_id)
-                if len(dst_block_info_data):
-                    for dst_block_info in dst_block_info_data:
-                        if dst_block_info.deleted:
-                            continue
-
-                        if dst_block_info.reverted_to_previous_version:
-                            dst_block_info.reverted_to_previous_version = False
-                            dst_block_info.save(update_fields=['reverted_to_previous_version'])
-                        if need_publish and src_block_info.published_content_version:
-                            dst_block_info.published_content_version = src_block_info.published_content_version
-                            dst_block_info.save(update_fields=['published_content_version'])
-
-                        items_to_update[dst_block_info.block_id] = module
-                        if src_block_info.block_id not in src_block_to_dst_block:
-                            src_block_to_dst_block[src_block_info.block_id] = []
-                        src_block_to_dst_block[src_block_info.block_id].append(dst_block_info.block_id)
-                        dst_block_ids.append(dst_block_info.block_id)
-                        if dst_block_info.has_children:
-                            dst_block_ids_has_children.append(dst_block_info.block_id)
-                else:
-                    items_to_add.append(module)
-
-    store = modulestore()
-    lib_tools = LibraryToolsService(store, user.id)
+            dst_block_info_data = dst_blocks_by_hash.get(src_block_info.hash_id)
+            if dst_block_info_data:
+                for dst_block_info in dst_block_info_data:
+                    if dst_block_info.deleted:
+                        continue
 
-    with store.bulk_operations(dst_course_key):
-        for block_id, src_block in items_to_update.items():
-            _copy_fields_from_one_xblock_to_other(store, src_block, block_id, user, save_xblock_fn,
-                                                  lib_tools=lib_tools)
-        if items_to_update:
-            if need_publish:
-                ApiBlockInfo.objects.filter(
-                    course_id=dst_course_id, block_id__in=list(items_to_update.keys()), deleted=False
-                ).update(
-                    created_as_copy=True, created_as_copy_from_course_id=course_id,
-                    published_after_copy=True
-                )
+                    need_save = False
+                    if dst_block_info.reverted_to_previous_version:
+                        dst_block_info.reverted_to_previous_version = False
+                        need_save = True
+                    if need_publish and src_block_info.published_content_version:
+                        dst_block_info.published_content_version = src_block_info.published_content_version
+                        need_save = True
+                    if need_save:
+                        dst_blocks_to_save.append(dst_block_info)
+
+                    items_to_update[dst_block_info.block_id] = block
+                    src_block_to_dst_block.setdefault(src_block_info.block_id, []).append(dst_block_info.block_id)
+                    dst_block_ids.add(dst_block_info.block_id)
             else:
+                items_to_add.append(block)
+
+        if dst_blocks_to_save:
+            ApiBlockInfo.objects.bulk_update(
+                dst_blocks_to_save, ['reverted_to_previous_version', 'published_content_version'], 500)
+
+        progress.add_total(len(items_to_update) + len(items_to_add)
+                           + (len(all_dst_blocks) if need_publish else 0))
+        lib_tools = LibraryToolsService(store, user.id)
+
+        with store.bulk_operations(dst_course_key):
+            for block_id, src_block in items_to_update.items():
+                _copy_fields_from_one_xblock_to_other(store, src_block, block_id, user, save_xblock_fn,
+                                                      lib_tools=lib_tools)
+                progress.step()
+            if items_to_update:
                 ApiBlockInfo.objects.filter(
                     course_id=dst_course_id, block_id__in=list(items_to_update.keys()), deleted=False
                 ).update(
                     created_as_copy=True, created_as_copy_from_course_id=course_id,
-                    published_after_copy=False
+                    published_after_copy=bool(need_publish)
                 )
 
-        dst_block_remove_check = []
+            dst_block_remove_check = []
+            removed_src_blocks_info = {}
 
-        for some_dst_block in all_dst_blocks:
-            some_dst_block_id = str(some_dst_block.block_id)
-            dst_item = modulestore().get_item(UsageKey.from_string(some_dst_block_id))
-            sibling_dst_not_connected = _get_sibling_not_connected(dst_item, dst_course_id, course_id, user)
-
-            for dst_module in yield_dynamic_descriptor_descendants(dst_item, user.id):
-                dst_module_location = str(dst_module.location)
-                if dst_module_location not in dst_block_ids:
-                    if dst_module_location not in sibling_dst_not_connected:
+            for some_dst_block in all_dst_blocks:
+                dst_item = store.get_item(UsageKey.from_string(str(some_dst_block.block_id)))
+                dst_modules_ids = []
+                dst_verticals = {}
+                for dst_module in yield_dynamic_descriptor_descendants(dst_item, user.id):
+                    dst_module_location = str(dst_module.location)
+                    dst_modules_ids.append(dst_module_location)
+                    if dst_module.category == 'vertical':
+                        dst_verticals[dst_module_location] = [str(child) for child in dst_module.children]
+                sibling_dst_not_connected = _get_sibling_not_connected(dst_verticals, dst_course_id, course_id)
+
+                for dst_module_location in dst_modules_ids:
+                    if dst_module_location not in dst_block_ids\
+                      and dst_module_location not in sibling_dst_not_connected:
                         dst_block_remove_check.append(dst_module_location)
 
-        if dst_block_remove_check:
-            dst_blocks_info = ApiBlockInfo.objects.filter(
-                block_id__in=dst_block_remove_check, course_id=dst_course_id, deleted=False)
-            for dst_block in dst_blocks_info:
-                removed_src_block_info = ApiBlockInfo.objects.filter(
-                    hash_id=dst_block.hash_id, course_id=course_id).first()
-                if removed_src_block_info:
-                    need_remove = False
-                    if removed_src_block_info.deleted:
-                        need_remove = True
-                    elif removed_src_block_info.block_id not in src_modules_ids:
+            if dst_block_remove_check:
+                dst_blocks_info = list(ApiBlockInfo.objects.filter(
+                    block_id__in=dst_block_remove_check, course_id=dst_course_id, deleted=False))
+                for removed_src_block_info in ApiBlockInfo.objects.filter(
+                        hash_id__in=set(dst_block.hash_id for dst_block in dst_blocks_info), course_id=course_id
+                ).order_by('id'):
+                    removed_src_blocks_info.setdefault(removed_src_block_info.hash_id, removed_src_block_info)
+
+                for dst_block in dst_blocks_info:
+                    removed_src_block_info = removed_src_blocks_info.get(dst_block.hash_id)
+                    if removed_src_block_info:
+                        need_remove = False
+                        if removed_src_block_info.deleted:
+                            need_remove = True
+                        elif removed_src_block_info.block_id not in src_modules_ids:
+                            try:
+                                removed_src_block_info_key = UsageKey.from_string(removed_src_block_info.block_id)
+                                store.get_item(removed_src_block_info_key)
+                            except ItemNotFoundError:
+                                need_remove = True
+                                removed_src_block_info.deleted = True
+                                removed_src_block_info.updated_time = timezone.now()
+                                removed_src_block_info.updated_by = user.id
+                                removed_src_block_info.save()
+
+                        if need_remove:
+                            items_to_remove.append(dst_block.block_id)
+                            dst_block_ids.add(dst_block.block_id)
+
+            if items_to_remove:
+                progress.add_total(len(items_to_remove))
+                # blocks could be removed as descendants of other removed blocks
+                for item_id_to_remove in items_to_remove:
+                    if ApiBlockInfo.objects.filter(
+                            block_id=item_id_to_remove, course_id=dst_course_id, deleted=False).exists():
                         try:
-                            removed_src_block_info_key = UsageKey.from_string(removed_src_block_info.block_id)
-                            modulestore().get_item(removed_src_block_info_key)
+                            delete_xblock_fn(UsageKey.from_string(item_id_to_remove), user)
                         except ItemNotFoundError:
-                            need_remove = True
-                            removed_src_block_info.deleted = True
-                            removed_src_block_info.updated_time = timezone.now()
-                            removed_src_block_info.updated_by = user.id
-                            removed_src_block_info.save()
-
-                    if need_remove:
-                        items_to_remove.append(dst_block.block_id)
-                        dst_block_ids.append(dst_block.block_id)
-                        if dst_block.has_children:
-                            dst_block_ids_has_children.append(dst_block.block_id)
-
-        if items_to_remove:
-            for item_id_to_remove in items_to_remove:
-                dst_block_info = ApiBlockInfo.objects.filter(
-                    block_id=item_id_to_remove, course_id=dst_course_id, deleted=False).first()
-                if dst_block_info:
-                    try:
-                        delete_xblock_fn(UsageKey.from_string(item_id_to_remove), user)
-                    except ItemNotFoundError:
-                        pass
-
-        if items_to_add:
-            _update_sibling_block_add_new_items(
-                items_to_add, ['vertical', 'other'], src_block_to_dst_block, dst_course_key, user,
-                published_after_copy=need_publish, duplicate_xblock_fn=duplicate_xblock_fn)
-
-        if need_publish:
-            for some_dst_block in all_dst_blocks:
-                some_dst_block_id = str(some_dst_block.block_id)
-                store.publish(UsageKey.from_string(some_dst_block_id), user.id)
+                            pass
+                    progress.step()
 
-        if items_to_add:
-            _update_sibling_block_add_new_items(
-                items_to_add, ['sequential'], src_block_to_dst_block, dst_course_key, user,
-                published_after_copy=False, duplicate_xblock_fn=duplicate_xblock_fn)
+            if items_to_add:
+                _update_sibling_block_add_new_items(
+                    items_to_add, ['vertical', 'other'], src_block_to_dst_block, dst_course_key, user,
+                    published_after_copy=need_publish, duplicate_xblock_fn=duplicate_xblock_fn, progress=progress)
 
-        if need_publish:
-            for vert_block in vertical_blocks:
-                ApiBlockInfo.objects.filter(
-                    course_id=dst_course_id, hash_id=vert_block['hash_id'], deleted=False).update(
-                    published_after_copy=True,
-                    published_content_version=vert_block['published_content_version']
-                )
-    return True
+            if need_publish:
+                for some_dst_block in all_dst_blocks:
+                    some_dst_block_id = str(some_dst_block.block_id)
+                    store.publish(UsageKey.from_string(some_dst_block_id), user.id)
+                    progress.step()
+
+            if items_to_add:
+                _update_sibling_block_add_new_items(
+                    items_to_add, ['sequential'], src_block_to_dst_block, dst_course_key, user,
+                    published_after_copy=False, duplicate_xblock_fn=duplicate_xblock_fn, progress=progress)
+
+            if need_publish:
+                for vert_block in vertical_blocks:
+                    ApiBlockInfo.objects.filter(
+                        course_id=dst_course_id, hash_id=vert_block['hash_id'], deleted=False).update(
+                        published_after_copy=True,
+                        published_content_version=vert_block['published_content_version']
+                    )
+        invalidate_sibling_graph(
+            hash_ids=set(info.hash_id for info in self.src_blocks_info.values()) | set(removed_src_blocks_info),
+            block_ids=items_to_remove)
+        progress.save()
+        return True
+
+
+def _get_sibling_update_user(user_id, sibling_update_tasks):
+    try:
+        return User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        log.error("update_sibling_block: user not found: %s", user_id)
+        _set_sibling_update_tasks_error(sibling_update_tasks)
+        return None
+
+
+@shared_task()
+def update_sibling_blocks_in_related_courses(task_uuid, source_usage_id, user_id):
+    sibling_update_tasks = list(SiblingBlockUpdateTask.objects.filter(
+        task_id=task_uuid, status=SiblingBlockUpdateTask.NOT_STARTED).order_by('id'))
+    if not sibling_update_tasks:
+        return
+
+    user = _get_sibling_update_user(user_id, sibling_update_tasks)
+    if user:
+        SiblingBlockPropagation(source_usage_id, user, task_uuid=task_uuid).start(sibling_update_tasks)
+
+
+@shared_task()
+def update_sibling_blocks_in_related_courses_chunk(task_uuid, source_usage_id, user_id, sibling_update_task_ids):
+    sibling_update_tasks = list(SiblingBlockUpdateTask.objects.filter(
+        id__in=sibling_update_task_ids, status=SiblingBlockUpdateTask.NOT_STARTED).order_by('id'))
+    if not sibling_update_tasks:
+        return
+
+    user = _get_sibling_update_user(user_id, sibling_update_tasks)
+    if user:
+        SiblingBlockPropagation(source_usage_id, user, task_uuid=task_uuid).run(sibling_update_tasks)
+
+
+@shared_task()
+def update_sibling_block_in_related_course(task_id, source_usage_id, dst_course_id, need_publish, user_id):
+    # kept for the tasks which were queued before the propagation of all related courses in one task
+    try:
+        sibling_update_task = SiblingBlockUpdateTask.objects.get(id=task_id)
+    except SiblingBlockUpdateTask.DoesNotExist:
+        return
+
+    user = _get_sibling_update_user(user_id, [sibling_update_task])
+    if user:
+        SiblingBlockPropagation(source_usage_id, user).run([sibling_update_task])
 
 
 def get_all_descendants_block_ids(xblock, user):
@@ -630,6 +903,7 @@ def sync_api_block_info(xblock, prev_descendants_block_ids, user):
         xblocks[module_id] = module
 
     block_info_data = ApiBlockInfo.objects.filter(course_id=course_id, block_id__in=all_block_ids)
+    changed_hash_ids = set()
 
     for block_info in block_info_data:
         api_block_ids.append(block_info.block_id)
@@ -638,11 +912,14 @@ def sync_api_block_info(xblock, prev_descendants_block_ids, user):
             block_info.updated_by = user.id
             block_info.updated_time = timezone.now()
             block_info.save()
+            changed_hash_ids.add(block_info.hash_id)
         if (block_info.block_id in current_blocks_ids) and block_info.deleted:
             block_info.deleted = False
             block_info.updated_by = user.id
             block_info.updated_time = timezone.now()
             block_info.save()
+            changed_hash_ids.add(block_info.hash_id)
+    invalidate_sibling_graph(hash_ids=changed_hash_ids)
 
     for module_id, module in xblocks.items():
         if module_id not in api_block_ids:
@@ -660,9 +937,12 @@ def sync_api_block_info(xblock, prev_descendants_block_ids, user):
 
 def get_courses_with_duplicates(usage_key_string, user):
     usage_key = UsageKey.from_string(usage_key_string)
+    course_id = str(usage_key.course_key)
     result_course_keys = []
     result = []
     hash_ids = []
+    related_course_ids = set()
+    sibling_graph = SiblingGraph()
 
     src_block_info = ApiBlockInfo.objects.filter(block_id=usage_key_string, has_children=True, deleted=False).first()
 
@@ -671,49 +951,34 @@ def get_courses_with_duplicates(usage_key_string, user):
         non_published_vertical_block_ids = get_non_published_vertical_blocks(usage_key_string, user)
 
         if non_published_vertical_block_ids and usage_key.block_type in ('chapter', 'sequential'):
-
-            courses = ApiBlockInfo.objects.filter(hash_id=src_block_info.hash_id, deleted=False) \
-                .exclude(course_id=str(usage_key.course_key)).values('course_id').distinct()
-            for course in courses:
-                tmp_course_key = CourseKey.from_string(course['course_id'])
-                if has_studio_write_access(user, tmp_course_key):
-                    result_course_keys.append(tmp_course_key)
+            sibling_graph.load([src_block_info.hash_id])
+            related_course_ids = sibling_graph.get_related_course_ids(
+                [src_block_info.hash_id], exclude_course_id=course_id)
 
         else:
             vertical_block_ids = get_vertical_blocks_with_changes(usage_key_string, user)
 
-            block_ids_to_exclude = []
+            block_ids_to_exclude = set()
 
             if vertical_block_ids:
-                vertical_blocks = ApiBlockInfo.objects.filter(
-                    block_id__in=vertical_block_ids, has_children=True, deleted=False)
+                vertical_blocks = list(ApiBlockInfo.objects.filter(
+                    block_id__in=vertical_block_ids, has_children=True, deleted=False))
                 for v_block in vertical_blocks:
                     if not v_block.created_as_copy or (v_block.created_as_copy and v_block.published_after_copy):
                         hash_ids.append(v_block.hash_id)
 
-                blocks_no_siblings1 = ApiBlockInfoNotSiblings.objects.filter(source_block_id__in=vertical_block_ids)
-                for b in blocks_no_siblings1:
-                    if b.dst_block_id not in block_ids_to_exclude:
-                        block_ids_to_exclude.append(b.dst_block_id)
-
-                blocks_no_siblings2 = ApiBlockInfoNotSiblings.objects.filter(dst_block_id__in=vertical_block_ids)
-                for b in blocks_no_siblings2:
-                    if b.source_block_id not in block_ids_to_exclude:
-                        block_ids_to_exclude.append(b.source_block_id)
-
-            exclude_expr = Q(course_id=str(usage_key.course_key))
-            if block_ids_to_exclude:
-                exclude_expr = Q(course_id=str(usage_key.course_key)) | Q(block_id__in=block_ids_to_exclude)
+                sibling_graph.load([v_block.hash_id for v_block in vertical_blocks])
+                for vertical_block_id in vertical_block_ids:
+                    block_ids_to_exclude.update(sibling_graph.get_not_siblings(vertical_block_id))
 
             if hash_ids:
-                courses = ApiBlockInfo.objects.filter(hash_id__in=hash_ids, deleted=False) \
-                    .exclude(exclude_expr).values('course_id')\
-                    .distinct()
+                related_course_ids = sibling_graph.get_related_course_ids(
+                    hash_ids, exclude_course_id=course_id, exclude_block_ids=block_ids_to_exclude)
 
-                for course in courses:
-                    tmp_course_key = CourseKey.from_string(course['course_id'])
-                    if has_studio_write_access(user, tmp_course_key):
-                        result_course_keys.append(tmp_course_key)
+    for related_course_id in related_course_ids:
+        tmp_course_key = CourseKey.from_string(related_course_id)
+        if has_studio_write_access(user, tmp_course_key):
+            result_course_keys.append(tmp_course_key)
 
     if result_course_keys:
         co_data = CourseOverview.objects.filter(id__in=result_course_keys).order_by('display_name')
@@ -739,6 +1004,7 @@ def _sync_api_blocks_remove(xblock, user):
     if block_info_update_lst:
         ApiBlockInfo.objects.filter(block_id__in=block_info_update_lst).update(
             deleted=True, updated_time=timezone.now(), updated_by=user.id)
+        invalidate_sibling_graph(block_ids=block_info_update_lst)
 
 
 def sync_api_blocks_before_remove(usage_key, user):
@@ -748,6 +1014,7 @@ def sync_api_blocks_before_remove(usage_key, user):
 
 def sync_api_blocks_before_move(usage_key, user):
     api_blocks_to_insert = []
+    moved_hash_ids = set()
     course_key = usage_key.course_key
     xblock = modulestore().get_item(usage_key)
     if xblock.has_children:
@@ -760,11 +1027,13 @@ def sync_api_blocks_before_move(usage_key, user):
                 api_block.updated_by = user.id
                 api_block.deleted = True
                 api_block.save()
+                moved_hash_ids.add(api_block.hash_id)
                 api_blocks_to_insert.append(
                     create_api_block_info(module.location, user, auto_save=False)
                 )
     if api_blocks_to_insert:
         ApiBlockInfo.objects.bulk_create(api_blocks_to_insert, 1000)
+    invalidate_sibling_graph(hash_ids=moved_hash_ids)
 
 
 def update_api_block_info(xblock, user, reverted_to_previous_version=False):
@@ -795,37 +1064,39 @@ def get_non_published_vertical_blocks(usage_id, user):
 
 
 def check_connection_between_siblings(user, course_id, vertical_xblocks):
+    api_blocks_info = {}
+    for api_block_info in ApiBlockInfo.objects.filter(
+            course_id=course_id, block_id__in=[str(x.location) for x in vertical_xblocks], deleted=False
+    ).order_by('id'):
+        api_blocks_info.setdefault(api_block_info.block_id, api_block_info)
+
+    sibling_graph = SiblingGraph().load(set(info.hash_id for info in api_blocks_info.values()))
+    api_blocks_to_update = []
+    not_siblings_to_create = []
+
     for vertical_xblock in vertical_xblocks:
         src_block_id = str(vertical_xblock.location)
-        api_block_info = ApiBlockInfo.objects.filter(course_id=course_id, block_id=src_block_id, deleted=False).first()
+        api_block_info = api_blocks_info.get(src_block_id)
         if not api_block_info or (not api_block_info.created_as_copy
                                   or (api_block_info.created_as_copy and api_block_info.published_after_copy)):
-            return
+            break
 
         xblock_content_version = get_content_version(vertical_xblock)
         api_block_info.published_content_version = xblock_content_version
-        api_block_info.save()
+        api_blocks_to_update.append(api_block_info)
 
         if api_block_info.created_as_copy_from_course_id:
-            related_block_info = ApiBlockInfo.objects.filter(
-                course_id=api_block_info.created_as_copy_from_course_id,
-                hash_id=api_block_info.hash_id,
-                deleted=False
-            ).first()
+            related_blocks = sibling_graph.get_blocks(
+                api_block_info.hash_id, course_id=api_block_info.created_as_copy_from_course_id)
         else:
             # fallback
-            related_block_info = ApiBlockInfo.objects.filter(
-                hash_id=api_block_info.hash_id, published_after_copy=False, deleted=False)\
-                .exclude(block_id=src_block_id).first()
+            related_blocks = [b for b in sibling_graph.get_blocks(api_block_info.hash_id)
+                              if not b.published_after_copy and b.block_id != src_block_id]
+        related_block_info = related_blocks[0] if related_blocks else None
 
         if related_block_info:
-            not_siblings = ApiBlockInfoNotSiblings.objects.filter(
-                Q(source_block_id=src_block_id, dst_block_id=related_block_info.block_id)
-                |
-                Q(dst_block_id=src_block_id, source_block_id=related_block_info.block_id)
-            ).first()
-            if not_siblings:
-                return
+            if sibling_graph.are_not_siblings(src_block_id, related_block_info.block_id):
+                break
 
             if related_block_info.published_content_version:
                 related_block_content_version = related_block_info.published_content_version
@@ -836,24 +1107,25 @@ def check_connection_between_siblings(user, course_id, vertical_xblocks):
 
             if xblock_content_version != related_block_content_version:
                 # break connection with ALL related blocks (not only "created_as_copy_from_course_id")
-                related_blocks = ApiBlockInfo.objects.filter(
-                    hash_id=related_block_info.hash_id
-                ).exclude(course_id=course_id)
-                for rel_block in related_blocks:
-                    not_siblings = ApiBlockInfoNotSiblings.objects.filter(
-                        Q(source_block_id=src_block_id, dst_block_id=rel_block.block_id)
-                        |
-                        Q(dst_block_id=src_block_id, source_block_id=rel_block.block_id)
-                    ).first()
-                    if not not_siblings:
-                        not_siblings = ApiBlockInfoNotSiblings(
-                            source_course_id=str(UsageKey.from_string(src_block_id).course_key),
-                            source_block_id=src_block_id,
-                            dst_course_id=str(UsageKey.from_string(rel_block.block_id).course_key),
-                            dst_block_id=rel_block.block_id,
-                            user_id=user.id
-                        )
-                        not_siblings.save()
+                for rel_block in sibling_graph.get_blocks(api_block_info.hash_id, include_deleted=True):
+                    if rel_block.course_id == course_id\
+                      or sibling_graph.are_not_siblings(src_block_id, rel_block.block_id):
+                        continue
+                    sibling_graph.add_not_siblings(src_block_id, rel_block.block_id)
+                    not_siblings_to_create.append(ApiBlockInfoNotSiblings(
+                        source_course_id=str(UsageKey.from_string(src_block_id).course_key),
+                        source_block_id=src_block_id,
+                        dst_course_id=str(UsageKey.from_string(rel_block.block_id).course_key),
+                        dst_block_id=rel_block.block_id,
+                        user_id=user.id
+                    ))
+
+    if api_blocks_to_update:
+        ApiBlockInfo.objects.bulk_update(api_blocks_to_update, ['published_content_version'], 500)
+    if not_siblings_to_create:
+        ApiBlockInfoNotSiblings.objects.bulk_create(not_siblings_to_create, 1000)
+    if api_blocks_to_update or not_siblings_to_create:
+        invalidate_sibling_graph(hash_ids=set(info.hash_id for info in api_blocks_to_update))
 
 
 def get_content_version(vertical_xblock):
@@ -0,0 +1,144 @@
+"""
+Benchmark of the QTI to OLX converter on a synthetic IMS package.
+
+    ./manage.py cms benchmark_qti_converter --items 20000 --assessments 20 --workers 4
+"""
+
+
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from cms.djangoapps.contentstore.qti_converter import convert_to_olx
+
+MANIFEST_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<manifest identifier="synthetic" xmlns="http://www.imsglobal.org/xsd/imsccv1p1/imscp_v1p1">
+  <resources>
+{resources}
+  </resources>
+</manifest>
+"""
+
+RESOURCE_TEMPLATE = """    <resource identifier="{ident}" type="imsqti_xmlv1p2">
+      <file href="{ident}/{ident}.xml"/>
+    </resource>"""
+
+ASSESSMENT_META_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<quiz identifier="{ident}" xmlns="http://canvas.instructure.com/xsd/cccv1p0">
+  <title>Assessment {ident}</title>
+  <description>&lt;p&gt;Synthetic assessment {ident}&lt;/p&gt;</description>
+  <due_at>2030-01-01T00:00:00</due_at>
+  <unlock_at>2020-01-01T00:00:00</unlock_at>
+  <allowed_attempts>2</allowed_attempts>
+  <time_limit>30</time_limit>
+  <show_correct_answers>true</show_correct_answers>
+  <show_correct_answers_last_attempt>false</show_correct_answers_last_attempt>
+</quiz>
+"""
+
+ASSESSMENT_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<questestinterop xmlns="http://www.imsglobal.org/xsd/ims_qtiasiv1p2">
+  <assessment ident="{ident}" title="Assessment {ident}">
+    <section ident="root_section">
+"""
+
+ASSESSMENT_END = """    </section>
+  </assessment>
+</questestinterop>
+"""
+
+QUESTION_TYPES = ('multiple_choice_question', 'multiple_answers_question', 'essay_question',
+                  'fill_in_multiple_blanks_question', 'matching_question')
+
+
+def _material(text):
+    return '<material><mattext texttype="text/html">{0}</mattext></material>'.format(text)
+
+
+def _item_xml(ident, question_type):
+    responses = ''.join(
+        '<response_label ident="{0}_{1}">{2}</response_label>'.format(ident, i, _material('Answer %d' % i))
+        for i in range(4))
+    response_lids = '<response_lid ident="response1">{0}<render_choice>{1}</render_choice></response_lid>'.format(
+        _material('Match me') if question_type == 'matching_question' else '', responses)
+    return """      <item ident="{ident}" title="Question {ident}">
+        <itemmetadata><qtimetadata>
+          <qtimetadatafield><fieldlabel>question_type</fieldlabel><fieldentry>{question_type}</fieldentry></qtimetadatafield>
+          <qtimetadatafield><fieldlabel>points_possible</fieldlabel><fieldentry>1.0</fieldentry></qtimetadatafield>
+          <qtimetadatafield><fieldlabel>assessment_question_identifierref</fieldlabel><fieldentry>q{ident}</fieldentry></qtimetadatafield>
+        </qtimetadata></itemmetadata>
+        <presentation>{text}{response_lids}</presentation>
+        <resprocessing>
+          <respcondition continue="No">
+            <conditionvar><varequal respident="response1">{ident}_1</varequal></conditionvar>
+            <setvar action="Set" varname="SCORE">100</setvar>
+          </respcondition>
+        </resprocessing>
+        <itemfeedback ident="correct_fb"><flow_mat>{feedback}</flow_mat></itemfeedback>
+      </item>
+""".format(ident=ident, question_type=question_type, text=_material('&lt;p&gt;Question %s &lt;br&gt;&lt;/p&gt;' % ident),
+           response_lids=response_lids, feedback=_material('Well done'))
+
+
+def build_synthetic_package(path, items_count, assessments_count):
+    """
+    Write IMS package with `items_count` questions split between `assessments_count` assessments.
+    """
+    resources = []
+    items_per_assessment = max(items_count // assessments_count, 1)
+    item_num = 0
+    for assessment_num in range(assessments_count):
+        ident = 'a%04d' % assessment_num
+        resources.append(RESOURCE_TEMPLATE.format(ident=ident))
+        os.makedirs(os.path.join(path, ident))
+        with open(os.path.join(path, ident, 'assessment_meta.xml'), 'w') as meta_f:
+            meta_f.write(ASSESSMENT_META_TEMPLATE.format(ident=ident))
+        with open(os.path.join(path, ident, ident + '.xml'), 'w') as assessment_f:
+            assessment_f.write(ASSESSMENT_TEMPLATE.format(ident=ident))
+            count = items_per_assessment
+            if assessment_num == assessments_count - 1:
+                count = items_count - item_num
+            for _i in range(count):
+                assessment_f.write(_item_xml('i%06d' % item_num, QUESTION_TYPES[item_num % len(QUESTION_TYPES)]))
+                item_num = item_num + 1
+            assessment_f.write(ASSESSMENT_END)
+    with open(os.path.join(path, 'imsmanifest.xml'), 'w') as manifest_f:
+        manifest_f.write(MANIFEST_TEMPLATE.format(resources='\n'.join(resources)))
+
+
+class Command(BaseCommand):
+    """
+    Converts synthetic IMS package and reports time and peak memory usage.
+    """
+    help = 'Benchmark of the QTI to OLX converter on a synthetic IMS package'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=20000)
+        parser.add_argument('--assessments', type=int, default=20)
+        parser.add_argument('--workers', type=int, default=None)
+        parser.add_argument('--keep', action='store_true', help='Keep generated files')
+
+    def handle(self, *args, **options):
+        path = tempfile.mkdtemp(prefix='qti_benchmark_')
+        try:
+            self.stdout.write('Generate package with {} items in {}'.format(options['items'], path))
+            build_synthetic_package(path, options['items'], options['assessments'])
+
+            start = time.perf_counter()
+            convert_to_olx(path + '/', max_workers=options['workers'])
+            duration = time.perf_counter() - start
+
+            problems_count = len(os.listdir(os.path.join(path, 'problem')))
+            self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            self.stdout.write('Converted in {:.2f}s, problems written: {}'.format(duration, problems_count))
+            self.stdout.write('Peak RSS: {} KB (main process), {} KB (workers)'.format(self_rss, children_rss))
+        finally:
+            if options['keep']:
+                self.stdout.write('Files are kept in {}'.format(path))
+            else:
+                shutil.rmtree(path)
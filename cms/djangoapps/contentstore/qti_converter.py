@@ -9,8 +9,12 @@ Other problem types will be ignored during conversion.
 Converter looks for imsmanifest.xml in root directory of archive and parses all the resources (xml
 files) listed in there. As a result it creates a .tar.gz archive suitable for import in existing
 course.
+Manifest and assessment files are parsed incrementally: OLX files of every problem are written
+as soon as the item is parsed, so memory usage doesn't depend on the size of the question bank.
+Independent assessments are converted in parallel worker processes.
 """
 
+from concurrent.futures import ProcessPoolExecutor
 from shutil import copyfile
 import datetime
 import xml.etree.ElementTree as ET
@@ -25,14 +29,12 @@ NS = {'qti': 'http://www.imsglobal.org/xsd/ims_qtiasiv1p2',
       'ims': 'http://www.imsglobal.org/xsd/imsccv1p1/imscp_v1p1',
       'meta': 'http://canvas.instructure.com/xsd/cccv1p0'}
 
+QTI_ASSESSMENT_TAG = '{%s}assessment' % NS['qti']
+QTI_SECTION_TAG = '{%s}section' % NS['qti']
+QTI_ITEM_TAG = '{%s}item' % NS['qti']
+IMS_RESOURCE_TAG = '{%s}resource' % NS['ims']
 
-class Course(object):
-    """
-    Class representing one course
-    """
-
-    def __init__(self):
-        self.assessments = []
+QTI_CONVERTER_MAX_WORKERS = 4
 
 
 class Item(object):
@@ -123,56 +125,84 @@ def text_from_html(temp_str):
     return temp_str
 
 
-def parse_assessment(tree, new_assessment):
-    """
-    Parse one QTI assessment file.
-    """
-    root = tree.getroot()
-    for assessment_el in root.findall('qti:assessment', NS):
-        new_assessment.title = assessment_el.get('title').replace('&', 'and')
-        new_assessment.ident = assessment_el.get('ident')
-        for item_el in tree.findall('.//qti:section[1]//qti:item', NS):
-            new_item = Item()
-            new_item.title = item_el.get('title').replace('&', 'and')
-            parse_meta(item_el.find('qti:itemmetadata', NS), new_item)
-
-            presentation = item_el.find('qti:presentation', NS)
-            new_item.mattext = get_mattext(presentation)
-            for response_element in presentation.findall('qti:response_lid', NS):
-                match_text = get_mattext(response_element)
-                if match_text:
-                    new_item.match.update({match_text: response_element.get('ident')})
-                for response in response_element.find('qti:render_choice', NS). \
-                        findall('qti:response_label', NS):
-                    response_id = response.get('ident')
-                    value = get_mattext(response)
-                    new_item.responses.update({response_id: value})
-
-            resprocessing = item_el.find('qti:resprocessing', NS)
-            for respcondition_el in resprocessing.findall('qti:respcondition', NS):
-                if respcondition_el.find('qti:setvar', NS) is not None:
-                    conditionvar = respcondition_el.find('qti:conditionvar', NS)
-                    condition = conditionvar.find('qti:and', NS)
-                    if condition is None:
-                        condition = conditionvar
-                    for answer in condition.findall('qti:varequal', NS):
-                        new_item.correct.extend([answer.text])
-                        new_item.match_correct.update({answer.get('respident'): answer.text})
-
-            for feedback_element in item_el.findall('qti:itemfeedback', NS):
-                flowmat = feedback_element.find('qti:flow_mat', NS)
-                value = get_mattext(flowmat)
-                new_item.feedback.update({feedback_element.get('ident'): value})
-
-            new_assessment.items.extend([new_item])
-
-
-def write_essay_question(item, vertical_root, chapter):
-    """
-    Write essay question to file.
-    """
-    open_ass_el = ET.SubElement(vertical_root, 'openassessment')
-    open_ass_el.set("url_name", uuid.uuid3(uuid.NAMESPACE_DNS, item.mattext.encode('utf-8')).hex)
+def parse_item(item_el):
+    """
+    Parse one QTI item.
+    """
+    new_item = Item()
+    new_item.title = item_el.get('title').replace('&', 'and')
+    parse_meta(item_el.find('qti:itemmetadata', NS), new_item)
+
+    presentation = item_el.find('qti:presentation', NS)
+    new_item.mattext = get_mattext(presentation)
+    for response_element in presentation.findall('qti:response_lid', NS):
+        match_text = get_mattext(response_element)
+        if match_text:
+            new_item.match.update({match_text: response_element.get('ident')})
+        for response in response_element.find('qti:render_choice', NS). \
+                findall('qti:response_label', NS):
+            response_id = response.get('ident')
+            value = get_mattext(response)
+            new_item.responses.update({response_id: value})
+
+    resprocessing = item_el.find('qti:resprocessing', NS)
+    for respcondition_el in resprocessing.findall('qti:respcondition', NS):
+        if respcondition_el.find('qti:setvar', NS) is not None:
+            conditionvar = respcondition_el.find('qti:conditionvar', NS)
+            condition = conditionvar.find('qti:and', NS)
+            if condition is None:
+                condition = conditionvar
+            for answer in condition.findall('qti:varequal', NS):
+                new_item.correct.extend([answer.text])
+                new_item.match_correct.update({answer.get('respident'): answer.text})
+
+    for feedback_element in item_el.findall('qti:itemfeedback', NS):
+        flowmat = feedback_element.find('qti:flow_mat', NS)
+        value = get_mattext(flowmat)
+        new_item.feedback.update({feedback_element.get('ident'): value})
+    return new_item
+
+
+def iter_assessment_items(assessment_file, new_assessment):
+    """
+    Incrementally parse one QTI assessment file.
+    Sets title and ident of the assessment and yields the items of the first sections
+    (same as './/qti:section[1]//qti:item') one by one. Parsed items are removed from the tree.
+    """
+    # [element, number of the section children, element is the first section of the parent]
+    stack = []
+    first_sections_depth = 0
+    for event, element in ET.iterparse(assessment_file, events=('start', 'end')):
+        if event == 'start':
+            is_first_section = False
+            if element.tag == QTI_SECTION_TAG and stack:
+                stack[-1][1] = stack[-1][1] + 1
+                is_first_section = stack[-1][1] == 1
+                if is_first_section:
+                    first_sections_depth = first_sections_depth + 1
+            elif element.tag == QTI_ASSESSMENT_TAG and len(stack) == 1:
+                new_assessment.title = element.get('title').replace('&', 'and')
+                new_assessment.ident = element.get('ident')
+            stack.append([element, 0, is_first_section])
+            continue
+
+        is_first_section = stack.pop()[2]
+        if is_first_section:
+            first_sections_depth = first_sections_depth - 1
+        if element.tag == QTI_ITEM_TAG:
+            if first_sections_depth:
+                yield parse_item(element)
+            element.clear()
+            if stack:
+                stack[-1][0].remove(element)
+
+
+def write_essay_question(item, chapter):
+    """
+    Build essay question element of the vertical.
+    """
+    open_ass_el = ET.Element('openassessment')
+    open_ass_el.set("url_name", uuid.uuid3(uuid.NAMESPACE_DNS, item.mattext).hex)
     open_ass_el.set("submission_start", chapter.start)
     open_ass_el.set("submission_due", chapter.end)
     open_ass_el.set("text_response", "required")
@@ -201,6 +231,7 @@ def write_essay_question(item, vertical_root, chapter):
                             'How could it be improved? '
     feedback_def_el = ET.SubElement(rubric_el, 'feedback_default_text')
     feedback_def_el.text = 'I think that this response...'
+    return open_ass_el
 
 
 def write_multiple_answers_question(item, problem_root):
@@ -269,12 +300,12 @@ def write_matching_question(item, problem_root):
             option_el.text = answer
 
 
-def write_problem(item, vertical_root, chapter, problem_dir):
+def write_problem(item, vertical, chapter, problem_dir):
     """
     Write one problem to disk.
     """
     if item.metafields['question_type'] == 'essay_question':
-        write_essay_question(item, vertical_root, chapter)
+        vertical.append(write_essay_question(item, chapter))
         return
 
     item_id = item.metafields['assessment_question_identifierref']
@@ -292,37 +323,77 @@ def write_problem(item, vertical_root, chapter, problem_dir):
     elif item.metafields['question_type'] == 'matching_question':
         write_matching_question(item, problem_root)
 
-    problem_el = ET.SubElement(vertical_root, 'problem')
+    problem_el = ET.Element('problem')
     problem_el.set("url_name", item_id)
+    vertical.append(problem_el)
 
     problem_f = open('{0}/{1}.xml'.format(problem_dir, item_id), "w+")
-    problem_f.write(ET.tostring(problem_root, encoding='unicode').replace('&amp;', '&').replace('&gt;', '>')
-                    .replace('&lt;', '<'))
+    problem_f.write(_unescape(ET.tostring(problem_root, encoding='unicode')))
     problem_f.close()
 
 
-def write_chapter(chapter, html_dir, course_root, chapter_dir, seq_dir, vertical_dir, problem_dir):
+def _unescape(xml_str):
+    return xml_str.replace('&amp;', '&').replace('&gt;', '>').replace('&lt;', '<')
+
+
+class VerticalWriter(object):
+    """
+    Writes vertical OLX file element by element
+    """
+
+    def __init__(self, path, display_name):
+        vertical_root = ET.Element('vertical')
+        vertical_root.set("display_name", display_name)
+        self._empty = _unescape(ET.tostring(vertical_root, encoding='unicode'))
+        self._head = _unescape(ET.tostring(vertical_root, encoding='unicode', short_empty_elements=False))
+        self._head = self._head[:-len('</vertical>')]
+        self._file = open(path, "w+")
+        self._has_children = False
+
+    def append(self, element):
+        if not self._has_children:
+            self._file.write(self._head)
+            self._has_children = True
+        self._file.write(_unescape(ET.tostring(element, encoding='unicode')))
+
+    def close(self):
+        self._file.write('</vertical>' if self._has_children else self._empty)
+        self._file.close()
+
+
+def convert_assessment(assessment_file, assessment_meta_file, olx_dirs):
     """
-    Write one chapter to disk.
+    Convert one QTI assessment to the chapter with one sequential and one vertical.
+    Returns url_name of the chapter.
     """
+    chapter = Assessment()
+    parse_assessment_meta(ET.parse(assessment_meta_file), chapter)
+
+    html_id = None
     if chapter.description:
         c_descr = chapter.description
         html_id = uuid.uuid3(uuid.NAMESPACE_DNS, c_descr.decode("utf-8") if isinstance(c_descr, bytes) else c_descr).hex
-        html_f = open('{0}/{1}.html'.format(html_dir, html_id), 'w+')
-        html_xml = open('{0}/{1}.xml'.format(html_dir, html_id), 'w+')
+        html_f = open('{0}/{1}.html'.format(olx_dirs['html'], html_id), 'w+')
+        html_xml = open('{0}/{1}.xml'.format(olx_dirs['html'], html_id), 'w+')
         html_xml.write('<html filename="{0}"/>'.format(html_id))
         html_f.write('<p>{0}</p>'.format(chapter.description))
         html_f.close()
         html_xml.close()
 
-    chapter_el = ET.SubElement(course_root, 'chapter')
-    chapter_el.set("url_name", chapter.ident)
+    vertical = None
+    for item in iter_assessment_items(assessment_file, chapter):
+        if vertical is None:
+            vertical = _open_vertical(chapter, html_id, olx_dirs)
+        write_problem(item, vertical, chapter, olx_dirs['problem'])
+    if vertical is None:
+        vertical = _open_vertical(chapter, html_id, olx_dirs)
+    vertical.close()
 
     chapter_root = ET.Element('chapter')
     chapter_root.set("display_name", chapter.title)
     sequential_el = ET.SubElement(chapter_root, 'sequential')
     sequential_el.set("url_name", chapter.ident)
-    chapter_f = open('{0}/{1}.xml'.format(chapter_dir, chapter.ident), 'w+')
+    chapter_f = open('{0}/{1}.xml'.format(olx_dirs['chapter'], chapter.ident), 'w+')
     chapter_f.write(ET.tostring(chapter_root, encoding='unicode'))
     chapter_f.close()
 
@@ -338,28 +409,25 @@ def write_chapter(chapter, html_dir, course_root, chapter_dir, seq_dir, vertical
         sequential_root.set("default_time_limit_minutes", chapter.time_limit)
     vertical_el = ET.SubElement(sequential_root, 'vertical')
     vertical_el.set("url_name", chapter.ident)
-    seq_f = open('{0}/{1}.xml'.format(seq_dir, chapter.ident), 'w+')
+    seq_f = open('{0}/{1}.xml'.format(olx_dirs['sequential'], chapter.ident), 'w+')
     seq_f.write(ET.tostring(sequential_root, encoding='unicode'))
     seq_f.close()
 
-    vertical_root = ET.Element('vertical')
-    vertical_root.set("display_name", chapter.title)
+    return chapter.ident
 
-    if chapter.description:
-        html_el = ET.SubElement(vertical_root, 'html')
-        html_el.set("url_name", html_id)
-    for item in chapter.items:
-        write_problem(item, vertical_root, chapter, problem_dir)
 
-    vertical_f = open('{0}/{1}.xml'.format(vertical_dir, chapter.ident), "w+")
-    vertical_f.write(ET.tostring(vertical_root, encoding='unicode').replace('&amp;', '&').replace('&gt;', '>')
-                     .replace('&lt;', '<'))
-    vertical_f.close()
+def _open_vertical(chapter, html_id, olx_dirs):
+    vertical = VerticalWriter('{0}/{1}.xml'.format(olx_dirs['vertical'], chapter.ident), chapter.title)
+    if html_id:
+        html_el = ET.Element('html')
+        html_el.set("url_name", html_id)
+        vertical.append(html_el)
+    return vertical
 
 
-def write_olx(course_directory, course):
+def create_olx_dirs(course_directory):
     """
-    Write parsed OLX file data to file system.
+    Create directories of the OLX course and write the root course.xml file.
     """
     course_el = ET.Element('course')
     course_el.set("url_name", "course")
@@ -369,30 +437,28 @@ def write_olx(course_directory, course):
     course_f.write(ET.tostring(course_el, encoding='unicode'))
     course_f.close()
 
-    chapter_dir = '{0}/chapter'.format(course_directory)
-    os.makedirs(chapter_dir)
-    course_dir = '{0}/course'.format(course_directory)
-    os.makedirs(course_dir)
-    problem_dir = '{0}/problem'.format(course_directory)
-    os.makedirs(problem_dir)
-    seq_dir = '{0}/sequential'.format(course_directory)
-    os.makedirs(seq_dir)
-    vertical_dir = '{0}/vertical'.format(course_directory)
-    os.makedirs(vertical_dir)
-    html_dir = '{0}/html'.format(course_directory)
-    os.makedirs(html_dir)
+    olx_dirs = {}
+    for name in ('chapter', 'course', 'problem', 'sequential', 'vertical', 'html'):
+        olx_dirs[name] = '{0}/{1}'.format(course_directory, name)
+        os.makedirs(olx_dirs[name])
+    return olx_dirs
+
 
+def write_course(olx_dirs, chapter_idents):
+    """
+    Write course OLX file with the list of the chapters.
+    """
     course_root = ET.Element('course')
     course_root.set("display_name", "Course")
     course_root.set("show_chat", "false")
     course_root.set("enable_timed_exams", "true")
     course_root.set("enable_proctored_exams", "false")
 
-    for chapter in course.assessments:
-        write_chapter(chapter, html_dir, course_root, chapter_dir, seq_dir, vertical_dir,
-                      problem_dir)
+    for chapter_ident in chapter_idents:
+        chapter_el = ET.SubElement(course_root, 'chapter')
+        chapter_el.set("url_name", chapter_ident)
 
-    course_xml = open('{0}/course.xml'.format(course_dir), "w+")
+    course_xml = open('{0}/course.xml'.format(olx_dirs['course']), "w+")
     course_xml.write(ET.tostring(course_root, encoding='unicode'))
     course_xml.close()
 
@@ -434,20 +500,41 @@ def parse_assessment_meta(assessment_meta_xml, new_assessment):
                                                      NS).text
 
 
-def convert_to_olx(path_to_ims):
+def convert_assessments(assessment_files, olx_dirs, max_workers=None):
+    """
+    Convert assessments (list of (assessment file, assessment meta file) tuples) in parallel processes.
+    Returns list of chapters url_names in the same order.
+    """
+    if max_workers is None:
+        max_workers = QTI_CONVERTER_MAX_WORKERS
+    max_workers = min(max_workers, os.cpu_count() or 1, len(assessment_files))
+
+    if max_workers <= 1:
+        return [convert_assessment(assessment_file, assessment_meta_file, olx_dirs)
+                for assessment_file, assessment_meta_file in assessment_files]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(convert_assessment,
+                                 [assessment_file for assessment_file, _meta in assessment_files],
+                                 [assessment_meta_file for _file, assessment_meta_file in assessment_files],
+                                 [olx_dirs] * len(assessment_files)))
+
+
+def convert_to_olx(path_to_ims, max_workers=None):
     """
     Convert folder with qti course into a folder with edx course.
     """
     manifest = '{0}imsmanifest.xml'.format(path_to_ims)
-    quiz = Course()
-    manifest_xml = ET.parse(manifest)
-    root_manifest = manifest_xml.getroot()
 
     directory = path_to_ims
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    for resource in root_manifest.find('ims:resources', NS).findall('ims:resource', NS):
+    assessment_files = []
+    for _event, resource in ET.iterparse(manifest):
+        if resource.tag != IMS_RESOURCE_TAG:
+            continue
+
         if resource.get('type') == "webcontent":
             static_directory = '{0}/static'.format(directory)
             if not os.path.exists(static_directory):
@@ -459,12 +546,12 @@ def convert_to_olx(path_to_ims):
 
         if resource.get('type') == "imsqti_xmlv1p2":
             xmlfile = resource.find('ims:file', NS)
-            xml = ET.parse(path_to_ims + xmlfile.get('href'))
-            new_assessment = Assessment()
-            parse_assessment(xml, new_assessment)
-            assessment_meta_xml = ET.parse(
-                path_to_ims + resource.get('identifier') + '/assessment_meta.xml')
-            parse_assessment_meta(assessment_meta_xml, new_assessment)
-            quiz.assessments.extend([new_assessment])
-
-    write_olx(directory, quiz)
+            assessment_files.append((
+                path_to_ims + xmlfile.get('href'),
+                path_to_ims + resource.get('identifier') + '/assessment_meta.xml'
+            ))
+        resource.clear()
+
+    olx_dirs = create_olx_dirs(directory)
+    chapter_idents = convert_assessments(assessment_files, olx_dirs, max_workers=max_workers)
+    write_course(olx_dirs, chapter_idents)
@@ -0,0 +1,142 @@
+"""
+Index of the sibling blocks.
+
+Sibling blocks are the copies of the same block in different courses: they share the `hash_id`
+of the ApiBlockInfo. Connection between two siblings can be broken (ApiBlockInfoNotSiblings).
+
+The index keeps for every hash_id the list of the blocks (in all courses) and the "not siblings"
+adjacency sets of these blocks. Entries are cached per hash_id and invalidated
+when blocks are copied, published or deleted, and when ApiBlockInfoNotSiblings rows are saved
+or deleted in Studio (see signals/handlers.py). Changes made outside of Studio (e.g. in the LMS admin)
+are picked up after SIBLING_GRAPH_CACHE_TIMEOUT.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from openedx.core.djangoapps.content.block_structure.models import ApiBlockInfo, ApiBlockInfoNotSiblings
+
+
+SIBLING_GRAPH_CACHE_TIMEOUT = 60 * 60
+SIBLING_GRAPH_CHUNK_SIZE = 500
+
+SiblingGraphBlock = namedtuple('SiblingGraphBlock', [
+    'course_id', 'block_id', 'deleted', 'has_children', 'created_as_copy', 'created_as_copy_from_course_id',
+    'published_after_copy', 'published_content_version'
+])
+
+
+def _sibling_graph_cache_key(hash_id):
+    return 'sibling_graph:%s' % hash_id
+
+
+def _chunks(items, size=SIBLING_GRAPH_CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def invalidate_sibling_graph(hash_ids=None, block_ids=None):
+    """
+    Removes the index entries of the hashes (hashes of `block_ids` are resolved with one query)
+    """
+    hash_ids = set(hash_ids or [])
+    if block_ids:
+        for block_ids_chunk in _chunks(block_ids):
+            hash_ids.update(ApiBlockInfo.objects.filter(
+                block_id__in=block_ids_chunk).values_list('hash_id', flat=True).distinct())
+    if not hash_ids:
+        return
+
+    cache_keys = [_sibling_graph_cache_key(hash_id) for hash_id in hash_ids]
+    cache.delete_many(cache_keys)
+    # the entry could be filled with the old data by another process before the commit
+    transaction.on_commit(lambda: cache.delete_many(cache_keys))
+
+
+class SiblingGraph:
+    """
+    Answers the questions about the sibling blocks for the set of hashes
+    using a constant number of queries (all hashes are loaded together).
+    """
+
+    def __init__(self):
+        self._blocks = {}
+        self._not_siblings = {}
+        self._block_hash = {}
+
+    def load(self, hash_ids):
+        hash_ids = set(hash_id for hash_id in hash_ids if hash_id and hash_id not in self._blocks)
+        if not hash_ids:
+            return self
+
+        cached = cache.get_many([_sibling_graph_cache_key(hash_id) for hash_id in hash_ids])
+        missing_hash_ids = []
+        for hash_id in hash_ids:
+            entry = cached.get(_sibling_graph_cache_key(hash_id))
+            if entry is None:
+                missing_hash_ids.append(hash_id)
+            else:
+                self._add_entry(hash_id, entry)
+
+        if missing_hash_ids:
+            entries = self._build_entries(missing_hash_ids)
+            cache.set_many({_sibling_graph_cache_key(hash_id): entry for hash_id, entry in entries.items()},
+                           SIBLING_GRAPH_CACHE_TIMEOUT)
+            for hash_id, entry in entries.items():
+                self._add_entry(hash_id, entry)
+        return self
+
+    def _build_entries(self, hash_ids):
+        entries = {hash_id: {'blocks': [], 'not_siblings': {}} for hash_id in hash_ids}
+        block_hash = {}
+        for hash_ids_chunk in _chunks(hash_ids):
+            for row in ApiBlockInfo.objects.filter(hash_id__in=hash_ids_chunk).order_by('id').values_list(
+                    'hash_id', 'course_id', 'block_id', 'deleted', 'has_children', 'created_as_copy',
+                    'created_as_copy_from_course_id', 'published_after_copy', 'published_content_version'):
+                entries[row[0]]['blocks'].append(tuple(row[1:]))
+                block_hash[row[2]] = row[0]
+
+        for block_ids_chunk in _chunks(block_hash.keys()):
+            for source_block_id, dst_block_id in ApiBlockInfoNotSiblings.objects.filter(
+                    Q(source_block_id__in=block_ids_chunk) | Q(dst_block_id__in=block_ids_chunk)
+            ).values_list('source_block_id', 'dst_block_id'):
+                for block_id, other_block_id in ((source_block_id, dst_block_id), (dst_block_id, source_block_id)):
+                    if block_id in block_hash:
+                        not_siblings = entries[block_hash[block_id]]['not_siblings']
+                        not_siblings.setdefault(block_id, set()).add(other_block_id)
+        return entries
+
+    def _add_entry(self, hash_id, entry):
+        self._blocks[hash_id] = [SiblingGraphBlock(*block) for block in entry['blocks']]
+        for block in self._blocks[hash_id]:
+            self._block_hash[block.block_id] = hash_id
+        for block_id, other_block_ids in entry['not_siblings'].items():
+            self._not_siblings[block_id] = set(other_block_ids)
+
+    def get_blocks(self, hash_id, course_id=None, include_deleted=False):
+        return [block for block in self._blocks.get(hash_id, [])
+                if (include_deleted or not block.deleted) and (course_id is None or block.course_id == course_id)]
+
+    def get_not_siblings(self, block_id):
+        return self._not_siblings.get(block_id, set())
+
+    def are_not_siblings(self, block_id_1, block_id_2):
+        return block_id_2 in self.get_not_siblings(block_id_1)
+
+    def add_not_siblings(self, block_id_1, block_id_2):
+        self._not_siblings.setdefault(block_id_1, set()).add(block_id_2)
+        self._not_siblings.setdefault(block_id_2, set()).add(block_id_1)
+
+    def get_related_course_ids(self, hash_ids, exclude_course_id=None, exclude_block_ids=None):
+        """
+        Returns ids of the courses which contain not deleted blocks with the hashes
+        """
+        exclude_block_ids = exclude_block_ids or set()
+        course_ids = set()
+        for hash_id in hash_ids:
+            for block in self.get_blocks(hash_id):
+                if block.course_id != exclude_course_id and block.block_id not in exclude_block_ids:
+                    course_ids.add(block.course_id)
+        return course_ids
@@ -7,6 +7,7 @@ from functools import wraps
 
 from django.conf import settings
 from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from pytz import UTC
 
@@ -15,9 +16,11 @@ from cms.djangoapps.contentstore.courseware_index import (
     CoursewareSearchIndexer,
     LibrarySearchIndexer,
 )
+from cms.djangoapps.contentstore.sibling_graph import invalidate_sibling_graph
 from common.djangoapps.track.event_transaction_utils import get_event_transaction_id, get_event_transaction_type
 from common.djangoapps.util.module_utils import yield_dynamic_descriptor_descendants
 from lms.djangoapps.grades.api import task_compute_all_grades_for_course
+from openedx.core.djangoapps.content.block_structure.models import ApiBlockInfoNotSiblings
 from openedx.core.djangoapps.content.learning_sequences.api import key_supports_outlines
 from openedx.core.djangoapps.discussions.tasks import update_discussions_settings_from_course_task
 from openedx.core.lib.gating import api as gating_api
@@ -133,6 +136,16 @@ def handle_item_deleted(**kwargs):
             gating_api.set_required_content(course_key, module.location, None, None, None)
 
 
+@receiver(post_save, sender=ApiBlockInfoNotSiblings)
+@receiver(post_delete, sender=ApiBlockInfoNotSiblings)
+def handle_not_siblings_changed(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Removes the cached sibling graph entries of the blocks when the connection
+    between them is broken or restored (e.g. in the admin)
+    """
+    invalidate_sibling_graph(block_ids=[instance.source_block_id, instance.dst_block_id])
+
+
 @receiver(GRADING_POLICY_CHANGED)
 @locked(expiry_seconds=GRADING_POLICY_COUNTDOWN_SECONDS, key='course_key')
 def handle_grading_policy_changed(sender, **kwargs):
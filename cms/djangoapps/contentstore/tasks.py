@@ -51,6 +51,7 @@ from cms.djangoapps.contentstore.utils import initialize_permissions, reverse_us
 from cms.djangoapps.models.settings.course_metadata import CourseMetadata
 from cms.djangoapps.contentstore.qti_converter import convert_to_olx
 from cms.djangoapps.contentstore.api_block_info import create_api_block_info, get_content_version, copy_milestones
+from cms.djangoapps.contentstore.sibling_graph import invalidate_sibling_graph
 from common.djangoapps.course_action_state.models import CourseRerunState
 from common.djangoapps.student.auth import has_course_author_access
 from common.djangoapps.util.monitoring import monitor_import_failure
@@ -108,6 +109,8 @@ def clone_instance(instance, field_values):
 def copy_api_block_info_after_course_copy(store, source_course_key, destination_course_key, user_id):
     user = User.objects.get(id=user_id)
     destination_course_id = str(destination_course_key)
+    removed_hash_ids = set(ApiBlockInfo.objects.filter(
+        course_id=destination_course_id).values_list('hash_id', flat=True))
     ApiBlockInfo.objects.filter(course_id=destination_course_id).delete()
 
     api_blocks_to_insert = []
@@ -144,6 +147,7 @@ def copy_api_block_info_after_course_copy(store, source_course_key, destination_
                     api_block_keys.append(dst_block_key)
 
     ApiBlockInfo.objects.bulk_create(api_blocks_to_insert, 1000)
+    invalidate_sibling_graph(hash_ids=removed_hash_ids | set(b.hash_id for b in api_blocks_to_insert))
 
 
 @shared_task
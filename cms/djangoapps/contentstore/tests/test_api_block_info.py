@@ -0,0 +1,162 @@
+"""
+Tests for the propagation of the block changes to the sibling blocks of the related courses
+"""
+
+
+from unittest import mock
+
+from opaque_keys.edx.keys import UsageKey
+
+from cms.djangoapps.contentstore.api_block_info import (
+    SiblingBlockPropagation,
+    update_sibling_blocks_in_related_courses,
+    update_sibling_blocks_in_related_courses_chunk
+)
+from common.djangoapps.credo_modules.models import SiblingBlockUpdateTask
+from common.djangoapps.student.tests.factories import UserFactory
+from openedx.core.djangolib.testing.utils import CacheIsolationTestCase
+
+SOURCE_USAGE_ID = 'block-v1:org+source+run+type@vertical+block@vertical'
+MODULE = 'cms.djangoapps.contentstore.api_block_info'
+
+
+def create_sibling_update_tasks(user, count=3):
+    return [
+        SiblingBlockUpdateTask.objects.create(
+            task_id='task', initiator=user, source_course_id='course-v1:org+source+run',
+            source_block_id=SOURCE_USAGE_ID, sibling_course_id='course-v1:org+sibling%d+run' % i)
+        for i in range(count)
+    ]
+
+
+class SiblingBlockPropagationTest(CacheIsolationTestCase):
+    """
+    Tests for SiblingBlockPropagation
+    """
+    ENABLED_CACHES = ['default']
+
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory.create()
+        self.tasks = create_sibling_update_tasks(self.user)
+        self.propagation = SiblingBlockPropagation(SOURCE_USAGE_ID, self.user)
+        patcher = mock.patch.object(self.propagation, 'load')
+        self.mock_load = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _statuses(self):
+        return [SiblingBlockUpdateTask.objects.get(id=task.id).status for task in self.tasks]
+
+    def test_courses_are_updated_one_by_one(self):
+        updated = []
+
+        def update_course(dst_course_id, need_publish, sibling_update_task=None):
+            # the previous course is finished before the next one is started
+            assert all(status == SiblingBlockUpdateTask.FINISHED for status in self._statuses()[:len(updated)])
+            updated.append(dst_course_id)
+            return True
+
+        with mock.patch.object(self.propagation, 'update_course', side_effect=update_course):
+            self.propagation.run(self.tasks)
+        assert updated == [task.sibling_course_id for task in self.tasks]
+        assert self._statuses() == [SiblingBlockUpdateTask.FINISHED] * 3
+        self.mock_load.assert_called_once_with()
+
+    def test_error_is_reraised_after_all_courses(self):
+        with mock.patch.object(self.propagation, 'update_course',
+                               side_effect=[True, Exception('Boom!'), False]):
+            with self.assertRaisesRegex(Exception, 'Boom!'):
+                self.propagation.run(self.tasks)
+        assert self._statuses() == [
+            SiblingBlockUpdateTask.FINISHED, SiblingBlockUpdateTask.ERROR, SiblingBlockUpdateTask.ERROR
+        ]
+
+    def test_load_error(self):
+        self.mock_load.side_effect = Exception('Boom!')
+        with mock.patch.object(self.propagation, 'update_course') as mock_update_course:
+            with self.assertRaisesRegex(Exception, 'Boom!'):
+                self.propagation.run(self.tasks)
+        assert not mock_update_course.called
+        assert self._statuses() == [SiblingBlockUpdateTask.ERROR] * 3
+
+
+class SiblingBlockPropagationTasksTest(CacheIsolationTestCase):
+    """
+    Tests that the related courses are updated by the parallel tasks using the source subtree loaded once
+    """
+    ENABLED_CACHES = ['default']
+
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory.create()
+        self.tasks = create_sibling_update_tasks(self.user)
+        self.loaded = []
+
+        def load(propagation):
+            self.loaded.append(propagation.source_usage_id)
+            propagation.verticals = {SOURCE_USAGE_ID: []}
+
+        self.updated = []
+
+        def update_course(propagation, dst_course_id, need_publish, sibling_update_task=None):
+            assert propagation.verticals == {SOURCE_USAGE_ID: []}
+            self.updated.append(dst_course_id)
+            return True
+
+        for name, value in (('load', load), ('update_course', update_course)):
+            patcher = mock.patch.object(SiblingBlockPropagation, name, autospec=True, side_effect=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_courses_are_updated_by_separate_tasks(self):
+        with mock.patch(MODULE + '.update_sibling_blocks_in_related_courses_chunk.delay') as mock_delay:
+            update_sibling_blocks_in_related_courses('task', SOURCE_USAGE_ID, self.user.id)
+        assert [c[0] for c in mock_delay.call_args_list] == [
+            ('task', SOURCE_USAGE_ID, self.user.id, [task.id]) for task in self.tasks]
+        assert not self.updated
+
+        for call in mock_delay.call_args_list:
+            update_sibling_blocks_in_related_courses_chunk(*call[0])
+        # the source subtree was loaded only once, the tasks read it from the cache
+        assert self.loaded == [SOURCE_USAGE_ID]
+        assert self.updated == [task.sibling_course_id for task in self.tasks]
+        assert [SiblingBlockUpdateTask.objects.get(id=task.id).status for task in self.tasks] == \
+            [SiblingBlockUpdateTask.FINISHED] * 3
+
+    def test_source_is_loaded_if_not_cached(self):
+        update_sibling_blocks_in_related_courses_chunk('task', SOURCE_USAGE_ID, self.user.id, [self.tasks[0].id])
+        assert self.loaded == [SOURCE_USAGE_ID]
+        assert self.updated == [self.tasks[0].sibling_course_id]
+
+
+class SiblingSourceCacheTest(CacheIsolationTestCase):
+    """
+    Tests for saving the source subtree into the cache
+    """
+    ENABLED_CACHES = ['default']
+
+    def test_source_is_cached_without_asides(self):
+        module = mock.Mock(location=UsageKey.from_string(SOURCE_USAGE_ID), category='vertical', parent=None,
+                           display_name='Unit', source_library_version=None, has_children=False, data='')
+        module.fields = {}
+        aside = mock.Mock(saved_tags=True)
+        aside.scope_ids.block_type = 'tagging_aside'
+        aside.get_sorted_tags.return_value = {'tag': ['value']}
+        module.runtime.get_asides.return_value = [aside]
+        user = UserFactory.create()
+
+        propagation = SiblingBlockPropagation(SOURCE_USAGE_ID, user, task_uuid='task')
+        with mock.patch(MODULE + '.yield_dynamic_descriptor_descendants', return_value=[module]), \
+                mock.patch(MODULE + '.modulestore'):
+            propagation.load()
+        propagation.save_source()
+
+        propagation = SiblingBlockPropagation(SOURCE_USAGE_ID, user, task_uuid='task')
+        with mock.patch.object(propagation, 'load') as mock_load:
+            propagation.load_source()
+        assert not mock_load.called
+        assert [str(block.location) for block in propagation.blocks] == [SOURCE_USAGE_ID]
+        assert propagation.blocks[0].copy_info.tags == {'tag': ['value']}
+        # the aside is loaded again only if the sibling block is updated
+        assert propagation.blocks[0].copy_info.asides_to_update is None
+        assert propagation.verticals == {SOURCE_USAGE_ID: []}
@@ -0,0 +1,53 @@
+"""
+Tests for the QTI to OLX converter
+"""
+
+
+import os
+import shutil
+import tempfile
+
+import ddt
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from cms.djangoapps.contentstore.management.commands.benchmark_qti_converter import build_synthetic_package
+from cms.djangoapps.contentstore.qti_converter import convert_to_olx
+
+# OLX written by the previous (in-memory) converter for build_synthetic_package(path, 10, 3)
+EXPECTED_OLX_DIR = os.path.join(settings.COMMON_TEST_DATA_ROOT, 'qti_converter', 'expected_olx')
+
+
+def _read_files(path, exclude=()):
+    files = {}
+    for root, _dirs, filenames in os.walk(path):
+        for filename in filenames:
+            file_path = os.path.join(root, filename)
+            rel_path = os.path.relpath(file_path, path)
+            if rel_path not in exclude:
+                with open(file_path) as f:
+                    files[rel_path] = f.read()
+    return files
+
+
+@ddt.ddt
+class ConvertToOlxTest(SimpleTestCase):
+    """
+    Tests for convert_to_olx
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.path = tempfile.mkdtemp(prefix='qti_converter_')
+        self.addCleanup(shutil.rmtree, self.path)
+        build_synthetic_package(self.path, 10, 3)
+        self.package_files = set(_read_files(self.path))
+
+    @ddt.data(1, 2)
+    def test_output_is_equal_to_previous_converter(self, max_workers):
+        convert_to_olx(self.path + '/', max_workers=max_workers)
+        olx_files = _read_files(self.path, exclude=self.package_files)
+        expected_files = _read_files(EXPECTED_OLX_DIR)
+        assert sorted(olx_files) == sorted(expected_files)
+        for rel_path, content in expected_files.items():
+            assert olx_files[rel_path] == content, rel_path
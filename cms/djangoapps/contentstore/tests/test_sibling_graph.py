@@ -0,0 +1,89 @@
+"""
+Tests for the cached index of the sibling blocks
+"""
+
+
+from unittest import mock
+
+from opaque_keys.edx.keys import UsageKey
+
+from cms.djangoapps.contentstore.api_block_info import copy_api_block_info, create_api_block_info
+from cms.djangoapps.contentstore.sibling_graph import SiblingGraph, invalidate_sibling_graph
+from common.djangoapps.student.tests.factories import UserFactory
+from openedx.core.djangoapps.content.block_structure.models import ApiBlockInfoNotSiblings
+from openedx.core.djangolib.testing.utils import CacheIsolationTestCase
+
+SOURCE_BLOCK_ID = 'block-v1:org+source+run+type@vertical+block@vertical'
+SIBLING_BLOCK_ID = 'block-v1:org+sibling+run+type@vertical+block@vertical'
+OTHER_BLOCK_ID = 'block-v1:org+other+run+type@vertical+block@vertical'
+DST_BLOCK_ID = 'block-v1:org+dst+run+type@vertical+block@vertical'
+
+
+class SiblingGraphInvalidationTest(CacheIsolationTestCase):
+    """
+    Tests that the cached sibling graph entries are removed when the siblings are changed
+    """
+    ENABLED_CACHES = ['default']
+
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory.create()
+        self.source_info = create_api_block_info(UsageKey.from_string(SOURCE_BLOCK_ID), self.user)
+        self.sibling_info = create_api_block_info(UsageKey.from_string(SIBLING_BLOCK_ID), self.user,
+                                                  block_hash_id=self.source_info.hash_id, created_as_copy=True)
+        self.other_info = create_api_block_info(UsageKey.from_string(OTHER_BLOCK_ID), self.user)
+
+    def _not_siblings(self, block_id, hash_id):
+        return SiblingGraph().load([hash_id]).get_not_siblings(block_id)
+
+    def _create_not_siblings(self, source_block_id, dst_block_id):
+        return ApiBlockInfoNotSiblings.objects.create(
+            source_block_id=source_block_id, source_course_id=str(UsageKey.from_string(source_block_id).course_key),
+            dst_block_id=dst_block_id, dst_course_id=str(UsageKey.from_string(dst_block_id).course_key),
+            user_id=self.user.id)
+
+    def test_graph_is_cached(self):
+        SiblingGraph().load([self.source_info.hash_id])
+        with self.assertNumQueries(0):
+            blocks = SiblingGraph().load([self.source_info.hash_id]).get_blocks(self.source_info.hash_id)
+        assert [block.block_id for block in blocks] == [SOURCE_BLOCK_ID, SIBLING_BLOCK_ID]
+
+    def test_create_api_block_info(self):
+        SiblingGraph().load([self.source_info.hash_id])
+        create_api_block_info(UsageKey.from_string(DST_BLOCK_ID), self.user, block_hash_id=self.source_info.hash_id)
+        blocks = SiblingGraph().load([self.source_info.hash_id]).get_blocks(self.source_info.hash_id)
+        assert DST_BLOCK_ID in [block.block_id for block in blocks]
+
+    def test_not_siblings_saved_and_deleted(self):
+        assert not self._not_siblings(OTHER_BLOCK_ID, self.other_info.hash_id)
+
+        not_siblings = self._create_not_siblings(SOURCE_BLOCK_ID, OTHER_BLOCK_ID)
+        assert self._not_siblings(SOURCE_BLOCK_ID, self.source_info.hash_id) == {OTHER_BLOCK_ID}
+        assert self._not_siblings(OTHER_BLOCK_ID, self.other_info.hash_id) == {SOURCE_BLOCK_ID}
+
+        not_siblings.delete()
+        assert not self._not_siblings(SOURCE_BLOCK_ID, self.source_info.hash_id)
+        assert not self._not_siblings(OTHER_BLOCK_ID, self.other_info.hash_id)
+
+    def test_copy_api_block_info(self):
+        self._create_not_siblings(SOURCE_BLOCK_ID, OTHER_BLOCK_ID)
+        assert self._not_siblings(OTHER_BLOCK_ID, self.other_info.hash_id) == {SOURCE_BLOCK_ID}
+
+        source_item = mock.Mock(location=UsageKey.from_string(SOURCE_BLOCK_ID), category='vertical')
+        dest_module = mock.Mock(location=UsageKey.from_string(DST_BLOCK_ID), category='vertical')
+        invalidated_block_ids = []
+
+        def check_invalidate_sibling_graph(hash_ids=None, block_ids=None):
+            # the copied rows must be already saved when the entries are removed
+            if block_ids and SOURCE_BLOCK_ID in block_ids:
+                assert ApiBlockInfoNotSiblings.objects.filter(dst_block_id=DST_BLOCK_ID).exists()
+                invalidated_block_ids.extend(block_ids)
+            invalidate_sibling_graph(hash_ids=hash_ids, block_ids=block_ids)
+
+        with mock.patch('cms.djangoapps.contentstore.api_block_info.invalidate_sibling_graph',
+                        side_effect=check_invalidate_sibling_graph):
+            copy_api_block_info(source_item, dest_module, self.user)
+
+        assert set(invalidated_block_ids) == {SOURCE_BLOCK_ID, OTHER_BLOCK_ID}
+        assert self._not_siblings(OTHER_BLOCK_ID, self.other_info.hash_id) == {SOURCE_BLOCK_ID, DST_BLOCK_ID}
+        assert self._not_siblings(DST_BLOCK_ID, self.source_info.hash_id) == {OTHER_BLOCK_ID}
@@ -2156,7 +2156,9 @@ def update_block_in_related_courses_result(request):
         result_list.append({
             'title': t.sibling_course_id,
             'status': t.status,
-            'result': t.is_finished()
+            'result': t.is_finished(),
+            'blocks_total': t.blocks_total,
+            'blocks_processed': t.blocks_processed
         })
 
     return JsonResponse({'result': result, 'courses': result_list})
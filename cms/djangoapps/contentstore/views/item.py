@@ -43,7 +43,7 @@ from common.djangoapps.util.date_utils import get_default_time_display
 from common.djangoapps.util.json_request import JsonResponse, expect_json
 from common.djangoapps.xblock_django.user_service import DjangoXBlockUserService
 from common.djangoapps.badgr_integration.models import Badge, Configuration
-from common.djangoapps.badgr_integration.utils import org_badgr_enabled
+from common.djangoapps.badgr_integration.utils import invalidate_course_badge_blocks, org_badgr_enabled
 from common.djangoapps.credo_modules.models import CopyBlockTask, Organization
 from common.djangoapps.credo_modules.mongo import get_last_published_course_version
 from openedx.core.djangoapps.content.block_structure.models import ApiBlockInfo, BlockCache
@@ -93,6 +93,7 @@ from .preview import get_preview_fragment
 from ..api_block_info import update_api_blocks_before_publish, update_sibling_block_after_publish,\
     sync_api_blocks_before_move, sync_api_blocks_before_remove, create_api_block_info, copy_api_block_info,\
     update_api_block_info, get_vertical_blocks_with_changes, copy_milestones, SyncApiBlockInfo
+from ..sibling_graph import invalidate_sibling_graph
 
 __all__ = [
     'orphan_handler', 'xblock_handler', 'xblock_view_handler', 'xblock_outline_handler', 'xblock_container_handler'
@@ -653,6 +654,7 @@ def _save_xblock(user, xblock, data=None, children_strings=None, metadata=None,
             metadata['supervisor_evaluation_hash'] = old_metadata.get('supervisor_evaluation_hash', str(uuid4()))
             badge_id = metadata.get('badge_id', None)
             BlockCache.update_cache(str(xblock.location.course_key), str(xblock.location), 'badge_id', badge_id)
+            invalidate_course_badge_blocks(xblock.location.course_key)
 
         old_content = xblock.get_explicitly_set_fields_by_scope(Scope.content)
 
@@ -1143,6 +1145,7 @@ def _duplicate_item(parent_usage_key, duplicate_source_usage_key, user, display_
 
         if level == 0 and blocks_to_inserts:
             ApiBlockInfo.objects.bulk_create(blocks_to_inserts)
+            invalidate_sibling_graph(hash_ids=set(b.hash_id for b in blocks_to_inserts))
 
         return dest_module.location
 
@@ -1,10 +1,61 @@
+import logging
+import threading
+import time
 import requests
 from enum import Enum
 from datetime import timedelta
+from django.conf import settings
 from django.utils import timezone
+from requests.adapters import HTTPAdapter
 from .models import Configuration
 
 
+log = logging.getLogger(__name__)
+
+BADGR_API_POOL_SIZE = 10
+BADGR_API_MAX_REQUESTS_PER_SECOND = 5
+BADGR_API_MAX_RETRY_AFTER = 60
+
+
+class BadgrApiError(Exception):
+
+    def __init__(self, msg, status_code=None):
+        super().__init__(msg)
+        self.status_code = status_code
+
+
+class RateLimiter:
+    """
+    Limits the number of the requests per second sent from the process
+    """
+
+    def __init__(self, max_per_second):
+        self._interval = 1.0 / max_per_second if max_per_second else 0
+        self._lock = threading.Lock()
+        self._next_request_time = 0
+
+    def wait(self):
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.time()
+            delay = self._next_request_time - now
+            self._next_request_time = max(now, self._next_request_time) + self._interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _create_session():
+    session = requests.Session()
+    pool_size = getattr(settings, 'BADGR_API_POOL_SIZE', BADGR_API_POOL_SIZE)
+    session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    return session
+
+
+_session = _create_session()
+_rate_limiter = RateLimiter(getattr(settings, 'BADGR_API_MAX_REQUESTS_PER_SECOND', BADGR_API_MAX_REQUESTS_PER_SECOND))
+
+
 class ApiClientMethod(Enum):
     GET = 'get'
     POST = 'post'
@@ -26,7 +77,8 @@ class BadgrApi:
             'User-Agent': self._integration_name
         }
 
-        r = requests.post(url, data={
+        _rate_limiter.wait()
+        r = _session.post(url, data={
             'grant_type': 'refresh_token',
             'refresh_token': self._config.get_refresh_token(),
         }, headers=headers)
@@ -36,7 +88,8 @@ class BadgrApi:
             password = self._config.get_account_password()
 
             if username and password:
-                r = requests.post(url, data={
+                _rate_limiter.wait()
+                r = _session.post(url, data={
                     'username': username,
                     'password': password
                 })
@@ -55,7 +108,8 @@ class BadgrApi:
         self._config.data['expires_dt'] = expires_dt.strftime(self._config.DATE_TEMPLATE)
         self._config.save()
 
-    def _send_request(self, url_part, method=None, data=None, query_params=None, stop_on_error=False):
+    def _send_request(self, url_part, method=None, data=None, query_params=None, stop_on_error=False,
+                      rate_limited=False):
         access_token = self._config.get_access_token()
         token_type = self._config.get_token_type()
 
@@ -77,21 +131,31 @@ class BadgrApi:
             'User-Agent': self._integration_name
         }
 
+        _rate_limiter.wait()
         if method == ApiClientMethod.DELETE:
-            r = requests.delete(url, json=data, headers=headers)
+            r = _session.delete(url, json=data, headers=headers)
         elif method == ApiClientMethod.POST:
-            r = requests.post(url, json=data, headers=headers)
+            r = _session.post(url, json=data, headers=headers)
         else:
-            r = requests.get(url, headers=headers)
+            r = _session.get(url, headers=headers)
 
         if r.ok:
             return r.json()
         elif r.status_code in (401, 403) and not stop_on_error:
             self._update_access_token()
-            return self._send_request(url_part, method, data=data, query_params=query_params, stop_on_error=True)
+            return self._send_request(url_part, method, data=data, query_params=query_params, stop_on_error=True,
+                                      rate_limited=rate_limited)
+        elif r.status_code == 429 and not rate_limited:
+            try:
+                retry_after = int(r.headers.get('Retry-After', 1))
+            except ValueError:
+                retry_after = 1
+            time.sleep(min(retry_after, BADGR_API_MAX_RETRY_AFTER))
+            return self._send_request(url_part, method, data=data, query_params=query_params,
+                                      stop_on_error=stop_on_error, rate_limited=True)
         else:
             err_msg = "Invalid API response from Badgr. Status code: %s. Response: %s" % (str(r.status_code), r.text)
-            raise Exception(err_msg)
+            raise BadgrApiError(err_msg, status_code=r.status_code)
 
     def get_tokens(self):
         url_part = '/v2/auth/tokens'
@@ -123,6 +187,38 @@ class BadgrApi:
         res = self._send_request(url_part, method=ApiClientMethod.POST, data=data)
         return res['result'][0] if isinstance(res['result'], list) else res['result']
 
+    def create_user_assertions(self, user_emails, badge_class_id, notify=True):
+        """
+        Issues the badge class to the list of recipients using the batch endpoint.
+        Returns the list of the assertions in the same order as the recipients.
+        If the batch endpoint is unavailable the recipients are issued one by one
+        and None is returned for the recipients which failed
+        """
+        url_part = '/v2/badgeclasses/%s/issue' % badge_class_id
+        data = {
+            "assertions": [{"recipient": {"identity": email, "type": "email"}} for email in user_emails],
+            "create_notification": notify
+        }
+        try:
+            res = self._send_request(url_part, method=ApiClientMethod.POST, data=data)
+        except BadgrApiError as exc:
+            if exc.status_code not in (404, 405):
+                raise
+            # batch endpoint is unavailable
+            result = []
+            for email in user_emails:
+                try:
+                    result.append(self.create_user_assertion(email, badge_class_id, notify=notify))
+                except BadgrApiError as e:
+                    log.error("Badgr: can't issue badge class %s to %s: %s", badge_class_id, email, str(e))
+                    result.append(None)
+            return result
+        result = res['result']
+        if len(result) != len(user_emails):
+            raise BadgrApiError("Invalid API response from Badgr. Expected %d assertions, received %d"
+                                % (len(user_emails), len(result)))
+        return result
+
     def get_assertion(self, assertion_id):
         url_part = '/v2/assertions/%s' % assertion_id
         res = self._send_request(url_part)
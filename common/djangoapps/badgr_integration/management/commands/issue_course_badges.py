@@ -0,0 +1,40 @@
+import time
+
+from django.core.management import BaseCommand
+from opaque_keys.edx.keys import CourseKey
+from common.djangoapps.badgr_integration.readiness import BadgeReadinessEvaluator
+from common.djangoapps.badgr_integration.service import issue_ready_badges
+
+
+class Command(BaseCommand):
+    """
+    Evaluates the readiness of the course badges for all active learners and issues the ready ones.
+
+    Example:
+
+        ./manage.py lms issue_course_badges course-v1:Org+Course+Run --dry-run
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id')
+        parser.add_argument('--dry-run', action='store_true', help='Only evaluate the readiness')
+        parser.add_argument('--no-notify', action='store_true', help="Don't send notifications to the learners")
+
+    def handle(self, *args, **options):
+        course_key = CourseKey.from_string(options['course_id'])
+        t1 = time.time()
+
+        if options['dry_run']:
+            evaluator = BadgeReadinessEvaluator(course_key)
+            evaluator.evaluate()
+            if evaluator.error:
+                print('Error: ' + evaluator.error)
+                return
+            print('Readiness evaluated in %.2f sec: %s' % (time.time() - t1, str(evaluator.stats)))
+            return
+
+        issued, error = issue_ready_badges(course_key, notify=not options['no_notify'])
+        if error:
+            print('Error: ' + error)
+            return
+        print('%d badges issued in %.2f sec' % (issued, time.time() - t1))
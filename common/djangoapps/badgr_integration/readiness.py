@@ -0,0 +1,271 @@
+"""
+Evaluation of the badges readiness.
+
+Badges are attached to the sequential blocks (`badge_id` field stored in the BlockCache).
+The badge is ready to be issued when all graded blocks of the sequential are completed
+and the learner's score for the sequential is above the configured minimum.
+
+BadgeReadinessEvaluator evaluates the readiness of all badges of the course for many learners
+in a single pass: completions, persisted subsection grades and issued assertions are loaded
+by chunks of the learners instead of rendering the sequential and reading the course grade
+for every learner. Persisted grades are recalculated asynchronously after the score is changed,
+so the readiness of a single learner in the request which changed the score
+(`use_persisted_grades=False`) is checked using the live course grade.
+"""
+from completion.models import BlockCompletion
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from common.djangoapps.student.models import CourseEnrollment
+from lms.djangoapps.courseware.completion_check import check_sequential_block_is_completed
+from lms.djangoapps.courseware.utils import CREDO_GRADED_ITEM_CATEGORIES
+from lms.djangoapps.grades.course_grade_factory import CourseGradeFactory
+from lms.djangoapps.grades.models import PersistentSubsectionGrade
+from openedx.core.djangoapps.content.block_structure.api import get_course_in_cache
+from openedx.core.djangoapps.content.block_structure.models import BlockCache
+from opaque_keys.edx.keys import UsageKey
+from xmodule.modulestore.django import modulestore
+from .models import Assertion, Badge, Configuration, Issuer
+from .utils import get_course_badge_blocks_cache_key, org_badgr_enabled
+
+
+User = get_user_model()
+
+BADGE_BLOCKS_CACHE_TIMEOUT = 60 * 5
+BADGE_READINESS_CACHE_TIMEOUT = 60 * 60
+BADGE_READINESS_CHUNK_SIZE = 500
+
+READINESS_READY = 'ready'
+READINESS_ISSUED = 'issued'
+
+# the set of the children of these blocks depends on the user
+USER_SPECIFIC_BLOCK_TYPES = ('library_content', 'split_test', 'conditional')
+
+
+class BadgeCheckResult:
+    is_ready = False
+    badge = None
+    issuer = None
+    error = None
+
+    def __init__(self, is_ready=False, badge=None, issuer=None, error=None):
+        self.is_ready = is_ready
+        self.issuer = issuer
+        self.badge = badge
+        self.error = error
+
+
+def _chunks(items, size=BADGE_READINESS_CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def get_course_badge_blocks(course_key):
+    """
+    Returns dict {sequential_block_id: {'badge_id': ..., 'leaf_ids': [...], 'user_specific': bool}}
+    for all sequentials of the course with the badge assigned.
+    `leaf_ids` are the graded blocks which should be completed to get the badge
+    """
+    cache_key = get_course_badge_blocks_cache_key(course_key)
+    badge_blocks = cache.get(cache_key)
+    if badge_blocks is not None:
+        return badge_blocks
+
+    badge_blocks = {}
+    badge_ids = dict(BlockCache.objects.filter(
+        course_id=str(course_key), field_name='badge_id').values_list('block_id', 'field_value'))
+    if badge_ids:
+        graded_categories = CREDO_GRADED_ITEM_CATEGORIES[:]
+        graded_categories.append('survey')
+
+        structure = get_course_in_cache(course_key)
+        for seq_block_id, badge_id in badge_ids.items():
+            if not badge_id:
+                continue
+            seq_key = UsageKey.from_string(seq_block_id)
+            if seq_key not in structure:
+                continue
+            leaf_ids = []
+            user_specific = False
+            blocks = list(structure.get_children(seq_key))
+            while blocks:
+                block_key = blocks.pop()
+                children = structure.get_children(block_key)
+                if block_key.block_type in USER_SPECIFIC_BLOCK_TYPES:
+                    user_specific = True
+                if children:
+                    blocks.extend(children)
+                elif block_key.block_type in graded_categories:
+                    leaf_ids.append(str(block_key))
+            badge_blocks[seq_block_id] = {
+                'badge_id': badge_id,
+                'leaf_ids': leaf_ids,
+                'user_specific': user_specific,
+            }
+    cache.set(cache_key, badge_blocks, BADGE_BLOCKS_CACHE_TIMEOUT)
+    return badge_blocks
+
+
+def _readiness_cache_key(user_id, course_key, seq_block_id):
+    return 'badgr_readiness:%s:%s:%s' % (str(user_id), str(course_key), seq_block_id)
+
+
+def get_cached_readiness(user_id, course_key, seq_block_id):
+    return cache.get(_readiness_cache_key(user_id, course_key, seq_block_id))
+
+
+def set_cached_readiness(user_id, course_key, seq_block_id, value):
+    cache.set(_readiness_cache_key(user_id, course_key, seq_block_id), value, BADGE_READINESS_CACHE_TIMEOUT)
+
+
+def get_weighted_score(earned, possible):
+    if not possible:
+        return 0
+    return float(earned) / float(possible)
+
+
+class BadgeReadinessEvaluator:
+    """
+    Evaluates the readiness of the course badges for the learners.
+    Only the final states (the badge is ready or already issued) are saved into the cache:
+    the next score events of the learner don't query the grade data again.
+    """
+
+    def __init__(self, course_key, config=None, use_persisted_grades=True):
+        self.course_key = course_key
+        self.course_id = str(course_key)
+        self.config = Configuration.get_config() if config is None else config
+        self.use_persisted_grades = use_persisted_grades
+        min_percentage = self.config.get_min_percentage()
+        self.min_percentage = float(min_percentage) if min_percentage else 0
+        self.issuer = None
+        self.badges = None
+        self.badge_blocks = {}
+        self.error = None
+        self.stats = {'users': 0, 'ready': 0, 'issued': 0, 'grade_fallbacks': 0}
+
+    def load(self):
+        """
+        Loads the issuer and the active badges of the course. Returns False if badges can't be issued
+        """
+        if self.badges is not None:
+            return self.error is None
+
+        self.badges = {}
+        if not org_badgr_enabled(self.course_key.org):
+            self.error = 'Issuing badges is disabled for this org'
+            return False
+
+        issuer_entity_id = self.config.get_issuer_entity_id()
+        if issuer_entity_id:
+            self.issuer = Issuer.objects.filter(is_active=True, external_id=issuer_entity_id).first()
+        if not self.issuer:
+            self.error = 'Badge issuer is not found'
+            return False
+
+        self.badge_blocks = get_course_badge_blocks(self.course_key)
+        external_ids = set(b['badge_id'] for b in self.badge_blocks.values())
+        if external_ids:
+            active_badges = {badge.external_id: badge for badge in Badge.objects.filter(
+                issuer=self.issuer, external_id__in=external_ids, is_active=True)}
+            for seq_block_id, badge_block in self.badge_blocks.items():
+                if badge_block['badge_id'] in active_badges:
+                    self.badges[seq_block_id] = active_badges[badge_block['badge_id']]
+        return True
+
+    def _check_score(self, user_id, seq_block_id, grade):
+        if grade is None:
+            if self.use_persisted_grades:
+                # grade wasn't persisted yet
+                self.stats['grade_fallbacks'] = self.stats['grade_fallbacks'] + 1
+            user = User.objects.get(id=user_id)
+            course = modulestore().get_course(self.course_key, depth=0)
+            course_grade = CourseGradeFactory().read(user, course)
+            earned, possible = course_grade.score_for_module(UsageKey.from_string(seq_block_id))
+            grade = (earned, possible)
+        weighted_score = get_weighted_score(*grade)
+        if weighted_score > self.min_percentage:
+            return BadgeCheckResult(is_ready=True, badge=self.badges[seq_block_id], issuer=self.issuer)
+        err_msg = "Student's score is less than minimum (%s): %s" % (self.min_percentage, weighted_score)
+        return BadgeCheckResult(error=err_msg)
+
+    def _evaluate_chunk(self, user_ids, seq_block_ids):
+        seq_keys = [UsageKey.from_string(seq_block_id) for seq_block_id in seq_block_ids]
+
+        issued = set(Assertion.objects.filter(
+            course_id=self.course_id, block_id__in=seq_block_ids, user_id__in=user_ids
+        ).values_list('user_id', 'block_id', 'badge_id'))
+
+        grades = {}
+        if self.use_persisted_grades:
+            for user_id, usage_key, earned, possible, earned_override, possible_override in \
+                    PersistentSubsectionGrade.objects.filter(
+                        user_id__in=user_ids, course_id=self.course_key, usage_key__in=seq_keys
+                    ).values_list('user_id', 'usage_key', 'earned_all', 'possible_all',
+                                  'override__earned_all_override', 'override__possible_all_override'):
+                grades[(user_id, str(usage_key))] = (
+                    earned if earned_override is None else earned_override,
+                    possible if possible_override is None else possible_override
+                )
+
+        leaf_keys = set()
+        for seq_block_id in seq_block_ids:
+            leaf_keys.update(UsageKey.from_string(k) for k in self.badge_blocks[seq_block_id]['leaf_ids'])
+        completed = set()
+        if leaf_keys:
+            completed = set((user_id, str(block_key)) for user_id, block_key in BlockCompletion.objects.filter(
+                context_key=self.course_key, block_key__in=leaf_keys, user_id__in=user_ids, completion__gte=1
+            ).values_list('user_id', 'block_key'))
+
+        results = {}
+        users = None
+        for user_id in user_ids:
+            for seq_block_id in seq_block_ids:
+                badge = self.badges[seq_block_id]
+                if (user_id, seq_block_id, badge.id) in issued:
+                    set_cached_readiness(user_id, self.course_key, seq_block_id, READINESS_ISSUED)
+                    self.stats['issued'] = self.stats['issued'] + 1
+                    results[(user_id, seq_block_id)] = BadgeCheckResult(error='Badge was already issued')
+                    continue
+
+                badge_block = self.badge_blocks[seq_block_id]
+                if badge_block['user_specific']:
+                    if users is None:
+                        users = User.objects.in_bulk(user_ids)
+                    is_completed, _blocks_ids = check_sequential_block_is_completed(
+                        self.course_key, seq_block_id, user=users[user_id])
+                else:
+                    is_completed = all((user_id, leaf_id) in completed for leaf_id in badge_block['leaf_ids'])
+                if not is_completed:
+                    results[(user_id, seq_block_id)] = BadgeCheckResult(error='Quiz is not completed yet')
+                    continue
+
+                result = self._check_score(user_id, seq_block_id, grades.get((user_id, seq_block_id)))
+                if result.is_ready:
+                    set_cached_readiness(user_id, self.course_key, seq_block_id, READINESS_READY)
+                    self.stats['ready'] = self.stats['ready'] + 1
+                results[(user_id, seq_block_id)] = result
+        return results
+
+    def evaluate(self, user_ids=None, seq_block_ids=None):
+        """
+        Returns dict {(user_id, sequential_block_id): BadgeCheckResult}.
+        All active learners of the course are checked if `user_ids` isn't passed
+        """
+        if not self.load():
+            return {}
+        if seq_block_ids is None:
+            seq_block_ids = list(self.badges.keys())
+        else:
+            seq_block_ids = [seq_block_id for seq_block_id in seq_block_ids if seq_block_id in self.badges]
+        if not seq_block_ids:
+            return {}
+        if user_ids is None:
+            user_ids = CourseEnrollment.objects.filter(
+                course_id=self.course_key, is_active=True).values_list('user_id', flat=True)
+
+        results = {}
+        for user_ids_chunk in _chunks(user_ids):
+            self.stats['users'] = self.stats['users'] + len(user_ids_chunk)
+            results.update(self._evaluate_chunk(user_ids_chunk, seq_block_ids))
+        return results
@@ -1,12 +1,14 @@
+from django.contrib.auth import get_user_model
 from django.db import transaction
-from lms.djangoapps.grades.course_grade_factory import CourseGradeFactory
-from lms.djangoapps.courseware.completion_check import check_sequential_block_is_completed
-from openedx.core.djangoapps.content.block_structure.models import BlockCache
-from opaque_keys.edx.keys import UsageKey
-from xmodule.modulestore.django import modulestore
+from django.utils import timezone
 from .models import Assertion, Badge, Configuration, Issuer
 from .api_client import BadgrApi
-from .utils import org_badgr_enabled
+from .readiness import BadgeCheckResult, BadgeReadinessEvaluator, get_cached_readiness, set_cached_readiness,\
+    READINESS_ISSUED, READINESS_READY
+
+
+User = get_user_model()
+BADGR_BULK_ISSUE_SIZE = 100
 
 
 def badges_sync():
@@ -47,6 +49,8 @@ def badges_sync():
     badges = Badge.objects.filter(issuer=issuer_obj)
     badges_dict = {b.external_id: b for b in badges}
     existing_badges = []
+    badges_to_create = []
+    badges_to_update = []
 
     badge_classes = api_client.get_badge_classes(issuer_entity_id)
     for b_cl in badge_classes:
@@ -72,7 +76,8 @@ def badges_sync():
                 badge_obj.description = b_cl['description']
                 badge_obj.criteria_narrative = b_cl['criteriaNarrative']
                 badge_obj.image_url = image_url
-                badge_obj.save()
+                badge_obj.updated_at = timezone.now()
+                badges_to_update.append(badge_obj)
                 updated += 1
         else:
             print('Create new badge: ' + b_cl['name'])
@@ -86,116 +91,75 @@ def badges_sync():
                 url=b_cl['openBadgeId'],
                 image_url=image_url,
             )
-            badge_obj.save()
+            badges_to_create.append(badge_obj)
             created += 1
 
+    badges_to_deactivate = []
     for b in badges:
-        if b.external_id not in existing_badges:
+        if b.external_id not in existing_badges and b.is_active:
             print('Deactivate badge: ' + str(b))
-            b.is_active = False
-            b.save()
+            badges_to_deactivate.append(b.id)
             deactivated += 1
 
-    return created, updated, deactivated
-
-
-class BadgeCheckResult:
-    is_ready = False
-    badge = None
-    issuer = None
-    error = None
-
-    def __init__(self, is_ready=False, badge=None, issuer=None, error=None):
-        self.is_ready = is_ready
-        self.issuer = issuer
-        self.badge = badge
-        self.error = error
+    with transaction.atomic():
+        if badges_to_create:
+            Badge.objects.bulk_create(badges_to_create)
+        if badges_to_update:
+            Badge.objects.bulk_update(badges_to_update, ['is_active', 'title', 'url', 'description',
+                                                         'criteria_narrative', 'image_url', 'updated_at'])
+        if badges_to_deactivate:
+            Badge.objects.filter(id__in=badges_to_deactivate).update(is_active=False, updated_at=timezone.now())
 
+    return created, updated, deactivated
 
-def check_badge_is_ready_to_issue(user, course_key, block):
-    course_id = str(course_key)
 
+def _get_sequential_block(block):
     num_attempt = 0
     max_attempts = 10
 
-    badgr_enabled = org_badgr_enabled(course_key.org)
-    if not badgr_enabled:
-        return BadgeCheckResult(error='Issuing badges is disabled for this org')
+    if block.category == 'sequential':
+        return block
+
+    seq_block = block.get_parent()
+    while seq_block and num_attempt < max_attempts:
+        if seq_block.category == 'sequential':
+            break
+        seq_block = seq_block.get_parent()
+        num_attempt = num_attempt + 1
+    return seq_block
 
-    config = Configuration.get_config()
-    issuer_entity_id = config.get_issuer_entity_id()
-    if not issuer_entity_id:
-        return BadgeCheckResult(error='Badge issuer is not found')
 
-    issuer = Issuer.objects.filter(is_active=True, external_id=issuer_entity_id).first()
-    if not issuer:
-        return BadgeCheckResult(error='Badge issuer is not found')
+def check_badge_is_ready_to_issue(user, course_key, block, use_cache=True):
+    seq_block = _get_sequential_block(block)
+    if not seq_block or seq_block.category != 'sequential':
+        return BadgeCheckResult(error='Can\'t find sequential block')
+    seq_block_id = str(seq_block.location)
 
-    if block.category == 'sequential':
-        seq_block = block
-    else:
-        seq_block = block.get_parent()
-
-        while seq_block and num_attempt < max_attempts:
-            if seq_block.category == 'sequential':
-                break
-            seq_block = seq_block.get_parent()
-            num_attempt = num_attempt + 1
-
-    if seq_block and seq_block.category == 'sequential':
-        seq_block_id = str(seq_block.location)
-        block_cache_obj = BlockCache.objects.filter(
-            course_id=str(course_id), block_id=seq_block_id, field_name='badge_id').first()
-
-        if block_cache_obj:
-            badge = Badge.objects.filter(issuer=issuer, external_id=block_cache_obj.field_value, is_active=True).first()
-
-            if badge:
-                assertion = Assertion.objects.filter(
-                    badge=badge, course_id=str(course_id), block_id=seq_block_id, user=user).first()
-
-                if not assertion:
-                    is_completed, blocks_ids = check_sequential_block_is_completed(
-                        course_key, seq_block_id, user=user)
-
-                    if is_completed:
-                        conf = Configuration.get_config()
-                        min_percentage = conf.get_min_percentage()
-                        min_percentage = float(min_percentage) if min_percentage else 0
-
-                        course = modulestore().get_course(course_key, depth=0)
-                        course_grade = CourseGradeFactory().read(user, course)
-                        mapped_usage_key = UsageKey.from_string(seq_block_id)
-                        earned, possible = course_grade.score_for_module(mapped_usage_key)
-                        if possible == 0:
-                            weighted_score = 0
-                        else:
-                            weighted_score = float(earned) / float(possible)
-
-                        if weighted_score > min_percentage:
-                            return BadgeCheckResult(is_ready=True, badge=badge, issuer=issuer)
-                        else:
-                            err_msg = "Student's score is less than minimum (%s): %s" % (min_percentage, weighted_score)
-                            return BadgeCheckResult(error=err_msg)
-
-                    else:
-                        return BadgeCheckResult(error='Quiz is not completed yet')
-
-                else:
-                    return BadgeCheckResult(error='Badge was already issued')
-
-            else:
-                return BadgeCheckResult(error='Badge Class is unavailable or not active')
+    # the persisted grade could be not updated yet with the score changed in the current request
+    evaluator = BadgeReadinessEvaluator(course_key, use_persisted_grades=False)
+    if not evaluator.load():
+        return BadgeCheckResult(error=evaluator.error)
 
+    if seq_block_id not in evaluator.badge_blocks:
         return BadgeCheckResult(error='Quiz is unavailable')
+    if seq_block_id not in evaluator.badges:
+        return BadgeCheckResult(error='Badge Class is unavailable or not active')
+
+    if use_cache:
+        readiness = get_cached_readiness(user.id, course_key, seq_block_id)
+        if readiness == READINESS_ISSUED:
+            return BadgeCheckResult(error='Badge was already issued')
+        elif readiness == READINESS_READY:
+            return BadgeCheckResult(is_ready=True, badge=evaluator.badges[seq_block_id], issuer=evaluator.issuer)
 
-    return BadgeCheckResult(error='Can\'t find sequential block')
+    results = evaluator.evaluate(user_ids=[user.id], seq_block_ids=[seq_block_id])
+    return results[(user.id, seq_block_id)]
 
 
 def issue_badge_assertion(user, course_key, block):
     config = Configuration.get_config()
 
-    badge_res = check_badge_is_ready_to_issue(user, course_key, block)
+    badge_res = check_badge_is_ready_to_issue(user, course_key, block, use_cache=False)
     if badge_res.is_ready:
         with transaction.atomic():
             try:
@@ -212,6 +176,8 @@ def issue_badge_assertion(user, course_key, block):
                     block_id=str(block.location)
                 )
                 assertion.save()
+                seq_block_id = str(_get_sequential_block(block).location)
+                set_cached_readiness(user.id, course_key, seq_block_id, READINESS_ISSUED)
 
                 badge_data = {
                     'badge_title': badge_res.badge.title,
@@ -228,3 +194,51 @@ def issue_badge_assertion(user, course_key, block):
                 return False, None, str(exp)
     else:
         return False, None, badge_res.error
+
+
+def issue_ready_badges(course_key, user_ids=None, notify=True):
+    """
+    Issues all badges of the course which are ready to be issued.
+    Readiness is evaluated for all learners in a single pass and assertions of the same
+    badge class are issued by chunks through the Badgr batch endpoint
+    """
+    evaluator = BadgeReadinessEvaluator(course_key)
+    results = evaluator.evaluate(user_ids=user_ids)
+    if evaluator.error:
+        return 0, evaluator.error
+
+    ready = {}
+    for (user_id, seq_block_id), result in results.items():
+        if result.is_ready:
+            ready.setdefault((result.badge.id, seq_block_id), []).append(user_id)
+    if not ready:
+        return 0, None
+
+    api_client = BadgrApi(config=evaluator.config)
+    badges = {badge.id: badge for badge in evaluator.badges.values()}
+    issued, failed = 0, 0
+    for (badge_id, seq_block_id), badge_user_ids in ready.items():
+        badge = badges[badge_id]
+        users = User.objects.in_bulk(badge_user_ids)
+        for chunk in range(0, len(badge_user_ids), BADGR_BULK_ISSUE_SIZE):
+            chunk_users = [users[user_id] for user_id in badge_user_ids[chunk:chunk + BADGR_BULK_ISSUE_SIZE]]
+            api_results = api_client.create_user_assertions([u.email for u in chunk_users], badge.external_id,
+                                                            notify=notify)
+            # assertions issued before the failed recipients are saved too
+            issued_users = [(user, result) for user, result in zip(chunk_users, api_results) if result]
+            Assertion.objects.bulk_create([Assertion(
+                external_id=result['entityId'],
+                user=user,
+                badge=badge,
+                url=result['openBadgeId'],
+                image_url=result['image'],
+                course_id=str(course_key),
+                block_id=seq_block_id
+            ) for user, result in issued_users])
+            for user, _result in issued_users:
+                set_cached_readiness(user.id, course_key, seq_block_id, READINESS_ISSUED)
+            issued = issued + len(issued_users)
+            failed = failed + len(chunk_users) - len(issued_users)
+    if failed:
+        return issued, '%d badges issued, %d badges failed' % (issued, failed)
+    return issued, None
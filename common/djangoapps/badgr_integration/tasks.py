@@ -1,7 +1,13 @@
 from lms import CELERY_APP
-from .service import badges_sync
+from opaque_keys.edx.keys import CourseKey
+from .service import badges_sync, issue_ready_badges
 
 
 @CELERY_APP.task
 def badges_sync_task():
     badges_sync()
+
+
+@CELERY_APP.task
+def issue_course_badges_task(course_id, notify=True):
+    issue_ready_badges(CourseKey.from_string(course_id), notify=notify)
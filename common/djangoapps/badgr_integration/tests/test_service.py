@@ -0,0 +1,176 @@
+"""
+Tests for issuing of the Badgr assertions
+"""
+
+
+from unittest.mock import MagicMock, patch
+
+import ddt
+from django.test import TestCase
+from opaque_keys.edx.locator import BlockUsageLocator, CourseLocator
+
+from common.djangoapps.badgr_integration.api_client import BadgrApi, BadgrApiError
+from common.djangoapps.badgr_integration.models import Assertion, Badge, Issuer
+from common.djangoapps.badgr_integration.readiness import READINESS_ISSUED, BadgeCheckResult, BadgeReadinessEvaluator
+from common.djangoapps.badgr_integration.service import (
+    check_badge_is_ready_to_issue,
+    issue_badge_assertion,
+    issue_ready_badges
+)
+from common.djangoapps.student.tests.factories import UserFactory
+
+SERVICE_MODULE = 'common.djangoapps.badgr_integration.service'
+READINESS_MODULE = 'common.djangoapps.badgr_integration.readiness'
+
+
+def _assertion(entity_id):
+    return {
+        'entityId': entity_id,
+        'openBadgeId': 'https://api.badgr.io/public/assertions/' + entity_id,
+        'image': 'https://api.badgr.io/public/assertions/%s/image' % entity_id,
+        'issuerOpenBadgeId': 'https://api.badgr.io/public/issuers/issuer',
+    }
+
+
+class CreateUserAssertionsTest(TestCase):
+    """
+    Tests for BadgrApi.create_user_assertions
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.api_client = BadgrApi(config=MagicMock())
+        patcher = patch.object(self.api_client, '_send_request')
+        self.mock_send_request = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_batch_endpoint(self):
+        self.mock_send_request.return_value = {'result': [_assertion('a1'), _assertion('a2')]}
+        result = self.api_client.create_user_assertions(['u1@example.com', 'u2@example.com'], 'badge')
+        assert [r['entityId'] for r in result] == ['a1', 'a2']
+        assert self.mock_send_request.call_count == 1
+
+    def test_fallback_returns_partial_results(self):
+        self.mock_send_request.side_effect = [
+            BadgrApiError('Not Found', status_code=404),
+            {'result': [_assertion('a1')]},
+            BadgrApiError('Bad Request', status_code=400),
+            {'result': [_assertion('a3')]},
+        ]
+        result = self.api_client.create_user_assertions(
+            ['u1@example.com', 'u2@example.com', 'u3@example.com'], 'badge')
+        assert [r['entityId'] if r else None for r in result] == ['a1', None, 'a3']
+
+    def test_batch_endpoint_error(self):
+        self.mock_send_request.side_effect = BadgrApiError('Server Error', status_code=500)
+        with self.assertRaises(BadgrApiError):
+            self.api_client.create_user_assertions(['u1@example.com'], 'badge')
+
+
+class IssueBadgesTest(TestCase):
+    """
+    Tests for issuing of the ready badges
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.course_key = CourseLocator(org='org', course='course', run='run')
+        self.seq_location = BlockUsageLocator(self.course_key, 'sequential', 'quiz')
+        self.issuer = Issuer.objects.create(title='Issuer', external_id='issuer', is_active=True,
+                                            url='https://example.com/issuer', image_url='https://example.com/i.png')
+        self.badge = Badge.objects.create(title='Badge', external_id='badge', issuer=self.issuer, is_active=True,
+                                          url='https://example.com/badge', image_url='https://example.com/b.png')
+        self.users = [UserFactory.create() for _i in range(3)]
+        self.mock_api_client = MagicMock()
+        self.mock_set_cached_readiness = MagicMock()
+        for target, value in (('BadgrApi', MagicMock(return_value=self.mock_api_client)),
+                              ('set_cached_readiness', self.mock_set_cached_readiness)):
+            patcher = patch(SERVICE_MODULE + '.' + target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_partial_results_are_saved(self):
+        evaluator = MagicMock(error=None, config=MagicMock(), badges={str(self.seq_location): self.badge})
+        evaluator.evaluate.return_value = {
+            (user.id, str(self.seq_location)): BadgeCheckResult(is_ready=True, badge=self.badge, issuer=self.issuer)
+            for user in self.users
+        }
+        self.mock_api_client.create_user_assertions.return_value = [_assertion('a1'), None, _assertion('a3')]
+
+        with patch(SERVICE_MODULE + '.BadgeReadinessEvaluator', return_value=evaluator):
+            issued, error = issue_ready_badges(self.course_key)
+
+        assert issued == 2
+        assert error == '2 badges issued, 1 badges failed'
+        assert set(Assertion.objects.values_list('user_id', 'external_id', 'block_id')) == {
+            (self.users[0].id, 'a1', str(self.seq_location)),
+            (self.users[2].id, 'a3', str(self.seq_location)),
+        }
+        assert sorted(c[0][0] for c in self.mock_set_cached_readiness.call_args_list) == sorted(
+            [self.users[0].id, self.users[2].id])
+
+    def test_issued_readiness_is_cached_for_sequential(self):
+        seq_block = MagicMock(category='sequential', location=self.seq_location)
+        vertical_block = MagicMock(category='vertical', location=BlockUsageLocator(self.course_key, 'vertical', 'v'))
+        vertical_block.get_parent.return_value = seq_block
+        problem_block = MagicMock(category='problem', location=BlockUsageLocator(self.course_key, 'problem', 'p'))
+        problem_block.get_parent.return_value = vertical_block
+        self.mock_api_client.create_user_assertion.return_value = _assertion('a1')
+
+        with patch(SERVICE_MODULE + '.check_badge_is_ready_to_issue',
+                   return_value=BadgeCheckResult(is_ready=True, badge=self.badge, issuer=self.issuer)):
+            is_issued, _badge_data, error = issue_badge_assertion(self.users[0], self.course_key, problem_block)
+
+        assert is_issued, error
+        self.mock_set_cached_readiness.assert_called_once_with(
+            self.users[0].id, self.course_key, str(self.seq_location), READINESS_ISSUED)
+
+
+@ddt.ddt
+class BadgeReadinessGradesTest(TestCase):
+    """
+    Tests for the grades used to evaluate the badge readiness
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.course_key = CourseLocator(org='org', course='course', run='run')
+        self.seq_block_id = str(BlockUsageLocator(self.course_key, 'sequential', 'quiz'))
+        self.user = UserFactory.create()
+        self.badge = MagicMock(id=1)
+
+        # the persisted grade isn't updated yet: 1 of 2, the live course grade is 2 of 2
+        self.mock_persisted_grades = MagicMock()
+        self.mock_persisted_grades.objects.filter.return_value.values_list.return_value = [
+            (self.user.id, self.seq_block_id, 1, 2, None, None)]
+        self.mock_grade_factory = MagicMock()
+        self.mock_grade_factory.return_value.read.return_value.score_for_module.return_value = (2, 2)
+        for target, value in (('PersistentSubsectionGrade', self.mock_persisted_grades),
+                              ('CourseGradeFactory', self.mock_grade_factory),
+                              ('modulestore', MagicMock())):
+            patcher = patch(READINESS_MODULE + '.' + target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _evaluate(self, use_persisted_grades):
+        evaluator = BadgeReadinessEvaluator(self.course_key, config=MagicMock(get_min_percentage=lambda: '0.75'),
+                                            use_persisted_grades=use_persisted_grades)
+        evaluator.badges = {self.seq_block_id: self.badge}
+        evaluator.badge_blocks = {self.seq_block_id: {'badge_id': 'badge', 'leaf_ids': [], 'user_specific': False}}
+        return evaluator.evaluate(user_ids=[self.user.id])[(self.user.id, self.seq_block_id)]
+
+    @ddt.data((True, False), (False, True))
+    @ddt.unpack
+    def test_grades(self, use_persisted_grades, is_ready):
+        with patch(READINESS_MODULE + '.set_cached_readiness'):
+            assert self._evaluate(use_persisted_grades).is_ready == is_ready
+        assert self.mock_persisted_grades.objects.filter.called == use_persisted_grades
+        assert self.mock_grade_factory.return_value.read.called != use_persisted_grades
+
+    def test_single_user_check_uses_live_grade(self):
+        block = MagicMock(category='sequential', location=BlockUsageLocator(self.course_key, 'sequential', 'quiz'))
+        evaluator = MagicMock(badge_blocks={self.seq_block_id: {}}, badges={self.seq_block_id: self.badge})
+        evaluator.evaluate.return_value = {(self.user.id, self.seq_block_id): BadgeCheckResult(is_ready=True)}
+        with patch(SERVICE_MODULE + '.BadgeReadinessEvaluator', return_value=evaluator) as mock_evaluator:
+            assert check_badge_is_ready_to_issue(self.user, self.course_key, block, use_cache=False).is_ready
+        mock_evaluator.assert_called_once_with(self.course_key, use_persisted_grades=False)
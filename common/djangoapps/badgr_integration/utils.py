@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from common.djangoapps.credo_modules.models import Organization
 
 
@@ -8,3 +9,11 @@ def org_badgr_enabled(org):
         return False
 
     return org.is_badgr_enabled
+
+
+def get_course_badge_blocks_cache_key(course_id):
+    return 'badgr_course_badge_blocks:%s' % str(course_id)
+
+
+def invalidate_course_badge_blocks(course_id):
+    cache.delete(get_course_badge_blocks_cache_key(course_id))
@@ -1,5 +1,22 @@
 import json
 import requests
+from requests.adapters import HTTPAdapter
+
+
+CREDO_API_POOL_SIZE = 10
+CREDO_API_CONNECT_TIMEOUT = 2
+CREDO_API_READ_TIMEOUT = 5
+
+
+def _create_session():
+    session = requests.Session()
+    for prefix in ('http://', 'https://'):
+        session.mount(prefix, HTTPAdapter(pool_connections=CREDO_API_POOL_SIZE, pool_maxsize=CREDO_API_POOL_SIZE))
+    return session
+
+
+# keep-alive connections to the Credo API are shared by all clients of the process
+_session = _create_session()
 
 
 class ApiConnectionError(Exception):
@@ -18,13 +35,16 @@ class ApiClient:
     _uri_prefix = '/api/v2'
     _token = None
     _user_agent = 'edx-platform-api-client'
+    _timeout = (CREDO_API_CONNECT_TIMEOUT, CREDO_API_READ_TIMEOUT)
 
-    def __init__(self, domain=None, secure=False, token=None):
+    def __init__(self, domain=None, secure=False, token=None, timeout=None):
         self._secure = secure
         if domain:
             self._domain = domain
         if token:
             self._token = token
+        if timeout:
+            self._timeout = timeout
 
     def _get_url(self, path):
         protocol = 'https' if self._secure else 'http'
@@ -35,7 +55,7 @@ class ApiClient:
 
     def _make_request(self, url, params):
         try:
-            r = requests.get(url, params=params, headers={
+            r = _session.get(url, params=params, timeout=self._timeout, headers={
                 'authorization': 'Token ' + str(self._token),
                 'content-type': 'application/vnd.api+json',
                 'user-agent': self._user_agent,
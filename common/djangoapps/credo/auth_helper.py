@@ -1,26 +1,80 @@
+import hashlib
 import logging
+import time
 
-from .api_client import ApiClient
+from .api_client import ApiClient, CREDO_API_CONNECT_TIMEOUT, CREDO_API_READ_TIMEOUT
 from django.conf import settings
+from django.core.cache import cache
 from urllib.parse import urlparse
 
 
 log = logging.getLogger("edx.credo.api_helper")
 
+CREDO_AUTH_CACHE_TTL = 60 * 5
+CREDO_AUTH_NEGATIVE_CACHE_TTL = 60
+CREDO_AUTH_COALESCE_POLL_INTERVAL = 0.05
+
 
 class CredoIpHelper:
+    """
+    Authenticates embedded launches using the Credo API.
+
+    Answers of the API are cached (successful answers for `auth_cache_ttl` seconds, empty answers
+    for `auth_negative_cache_ttl` seconds). Concurrent lookups of the same IP set / referrer are coalesced:
+    only the process which holds the lock calls the API, others wait for the cached answer.
+    """
 
     _client = None
 
     def __init__(self):
-        domain = settings.CREDO_API_CONFIG.get('domain', None)
-        secure = settings.CREDO_API_CONFIG.get('secure', False)
-        token = settings.CREDO_API_CONFIG.get('token', None)
-        self._client = ApiClient(domain=domain, secure=secure, token=token)
+        config = settings.CREDO_API_CONFIG
+        domain = config.get('domain', None)
+        secure = config.get('secure', False)
+        token = config.get('token', None)
+        self._timeout = (config.get('connect_timeout', CREDO_API_CONNECT_TIMEOUT),
+                         config.get('read_timeout', CREDO_API_READ_TIMEOUT))
+        self._cache_ttl = config.get('auth_cache_ttl', CREDO_AUTH_CACHE_TTL)
+        self._negative_cache_ttl = config.get('auth_negative_cache_ttl', CREDO_AUTH_NEGATIVE_CACHE_TTL)
+        self._client = ApiClient(domain=domain, secure=secure, token=token, timeout=self._timeout)
 
     def _get_api_client(self):
         return self._client
 
+    def _cached_call(self, kind, cache_value, api_method, param):
+        """
+        Returns tuple (API answer, True if the answer was taken from the cache)
+        """
+        cache_key = 'credo_auth:%s:%s' % (kind, hashlib.md5(cache_value.encode('utf-8')).hexdigest())
+        lock_key = cache_key + ':lock'
+
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached['result'], True
+
+        max_wait = sum(self._timeout)
+        lock_acquired = cache.add(lock_key, 1, int(max_wait) + 1)
+        if not lock_acquired:
+            deadline = time.time() + max_wait
+            while time.time() < deadline:
+                time.sleep(CREDO_AUTH_COALESCE_POLL_INTERVAL)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    return cached['result'], True
+                if cache.get(lock_key) is None:
+                    # the request of the other process failed
+                    break
+
+        try:
+            result = api_method(param)
+        finally:
+            if lock_acquired:
+                cache.delete(lock_key)
+
+        ttl = self._cache_ttl if isinstance(result, dict) and result.get('data') else self._negative_cache_ttl
+        if ttl:
+            cache.set(cache_key, {'result': result}, ttl)
+        return result, False
+
     def authenticate_by_ip_address(self, request):
         api_client = self._get_api_client()
 
@@ -32,11 +86,16 @@ class CredoIpHelper:
             header_name = 'HTTP_X_FORWARDED_FOR'
             ip = x_forwarded_for
         if ip:
-            ip_list = [i.strip() for i in ip.split(',')]
+            ip_list = []
+            for i in ip.split(','):
+                i = i.strip().lower()
+                if i and i not in ip_list:
+                    ip_list.append(i)
             ip_param = ','.join(ip_list)
-            result = api_client.authenticate_ip(ip_param)
-            log.info(u'authenticate_ip API answered %s for IP %s (from %s header)'
-                     % (str(result), ip_param, header_name))
+            result, from_cache = self._cached_call('ip', ','.join(sorted(ip_list)),
+                                                   api_client.authenticate_ip, ip_param)
+            log.info(u'authenticate_ip API answered %s for IP %s (from %s header%s)'
+                     % (str(result), ip_param, header_name, ', cached' if from_cache else ''))
             return result, ip_param
 
         return False, ip
@@ -52,11 +111,11 @@ class CredoIpHelper:
         if referer_url:
             api_client = self._get_api_client()
             o = urlparse(referer_url)
-            referer = o.scheme + '://' + o.netloc + o.path
+            referer = o.scheme.lower() + '://' + o.netloc.lower() + o.path
 
-            result = api_client.authenticate_referrer(referer)
-            log.info(u'authenticate_referrer API answered %s for referer %s taken from %s'
-                     % (str(result), referer, taken_from))
+            result, from_cache = self._cached_call('referrer', referer, api_client.authenticate_referrer, referer)
+            log.info(u'authenticate_referrer API answered %s for referer %s taken from %s%s'
+                     % (str(result), referer, taken_from, ' (cached)' if from_cache else ''))
             return result, referer, taken_from
 
         log.info(u'Referer is not defined')
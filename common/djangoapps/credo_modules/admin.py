@@ -13,7 +13,7 @@ from django.utils.safestring import mark_safe
 from .models import RegistrationPropertiesPerOrg, EnrollmentPropertiesPerCourse,\
     Organization, OrganizationType, CourseExcludeInsights, CustomUserRole, TagDescription, EdxApiToken,\
     RutgersCampusMapping, Feature, FeatureBetaTester, CredoModulesUserProfile, CredoStudentProperties, SendScores,\
-    TrackingLogConfig, PropertiesInfo, SiblingBlockUpdateTask, DelayedTask,\
+    TrackingLogConfig, PropertiesInfo, SiblingBlockUpdateTask, DelayedTask, DelayedTaskHistory,\
     LoginRedirectAllowedHost
 from openedx.core.djangoapps.content.block_structure.models import ApiCourseStructure, ApiBlockInfoNotSiblings
 from openedx.core.djangoapps.site_configuration import helpers as configuration_helpers
@@ -190,6 +190,12 @@ class DelayedTaskForm(ReadOnlyMixin, admin.ModelAdmin):
     ordering = ['-created']
 
 
+class DelayedTaskHistoryForm(ReadOnlyMixin, admin.ModelAdmin):
+    list_display = ('id', 'task_id', 'task_name', 'start_time', 'attempt_num', 'result',
+                    'course_id', 'user_id', 'assignment_id', 'created', 'finished')
+    search_fields = ['course_id', 'user_id', 'assignment_id']
+
+
 class CredoModulesUserProfileForm(ReadOnlyMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'course_id', 'meta')
     search_fields = ['user__username', 'user__email', 'course_id']
@@ -217,7 +223,7 @@ class PropertiesInfoForm(ReadOnlyMixin, admin.ModelAdmin):
 class SiblingBlockUpdateTaskForm(ReadOnlyMixin, admin.ModelAdmin):
     list_display = ('id', 'created', 'task_id', 'initiator', 'status',
                     'source_course_id', 'source_block_id', 'sibling_course_id', 'sibling_block_id',
-                    'published', 'sibling_block_prev_version')
+                    'published', 'sibling_block_prev_version', 'blocks_total', 'blocks_processed')
     search_fields = ['source_course_id', 'source_block_id', 'sibling_course_id', 'sibling_block_id']
 
 
@@ -290,6 +296,7 @@ admin.site.register(EdxApiToken, EdxApiTokenForm)
 admin.site.register(RutgersCampusMapping, RutgersCampusMappingForm)
 admin.site.register(Feature, FeatureForm)
 admin.site.register(DelayedTask, DelayedTaskForm)
+admin.site.register(DelayedTaskHistory, DelayedTaskHistoryForm)
 admin.site.register(FeatureBetaTester, FeatureBetaTesterForm)
 admin.site.register(CredoModulesUserProfile, CredoModulesUserProfileForm)
 admin.site.register(CredoStudentProperties, CredoStudentPropertiesForm)
@@ -0,0 +1,121 @@
+import time
+import uuid
+
+from django.core.cache import caches
+from opaque_keys.edx.keys import CourseKey
+
+from common.djangoapps.student.models import CourseAccessRole
+from common.djangoapps.credo_modules.events_processor.utils import INSIGHTS_COURSE_STAFF_ROLES,\
+    INSIGHTS_ORG_STAFF_ROLES
+from openedx.core.djangoapps.content.block_structure.models import BlockToSequential, CourseFieldsCache
+
+
+class CourseMetadataCache:
+    """
+    Course metadata required to process tracking logs (block -> sequential mapping,
+    staff users, additional profile fields).
+
+    Data is shared between processes through the Django cache and is keyed by the version
+    of the course structure. The version is changed every time `update_course_structure`
+    runs for the course (or course access roles are changed) so stale entries are never used.
+    Every process also keeps a local copy of the data and re-checks the version
+    not more often than once per LOCAL_TTL seconds.
+    """
+
+    CACHE_NAME = 'default'
+    CACHE_TIMEOUT = 60 * 60 * 24
+    LOCAL_TTL = 30
+
+    def __init__(self):
+        self._local = {}
+
+    @classmethod
+    def _cache(cls):
+        return caches[cls.CACHE_NAME]
+
+    @classmethod
+    def _version_key(cls, scope, value):
+        return 'credo_course_metadata_version:%s:%s' % (scope, value)
+
+    @classmethod
+    def _get_version(cls, scope, value):
+        cache = cls._cache()
+        key = cls._version_key(scope, value)
+        version = cache.get(key)
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(key, version, cls.CACHE_TIMEOUT):
+                version = cache.get(key, version)
+        return version
+
+    @classmethod
+    def invalidate_course(cls, course_id):
+        cls._cache().set(cls._version_key('course', str(course_id)), uuid.uuid4().hex, cls.CACHE_TIMEOUT)
+
+    @classmethod
+    def invalidate_org(cls, org):
+        cls._cache().set(cls._version_key('org', org), uuid.uuid4().hex, cls.CACHE_TIMEOUT)
+
+    def _get(self, name, course_id, versions, load_fn):
+        local_key = (name, course_id)
+        now = time.time()
+        local_item = self._local.get(local_key)
+        if local_item and now - local_item[0] < self.LOCAL_TTL:
+            return local_item[1]
+
+        version = '|'.join(self._get_version(scope, value) for scope, value in versions)
+        if local_item and local_item[2] == version:
+            self._local[local_key] = (now, local_item[1], version)
+            return local_item[1]
+
+        cache = self._cache()
+        cache_key = 'credo_course_metadata:%s:%s:%s' % (name, course_id, version)
+        data = cache.get(cache_key)
+        if data is None:
+            data = load_fn(course_id)
+            cache.set(cache_key, data, self.CACHE_TIMEOUT)
+        self._local[local_key] = (now, data, version)
+        return data
+
+    def reset_local(self, course_id=None):
+        if course_id is None:
+            self._local = {}
+        else:
+            self._local = {k: v for k, v in self._local.items() if k[1] != course_id}
+
+    def get_block_to_sequential(self, course_id):
+        """
+        Returns dict: block_id -> (sequential_id, sequential_name, graded, visible_to_staff_only)
+        """
+        return self._get('b2s', course_id, [('course', course_id)], self._load_block_to_sequential)
+
+    def get_staff_user_ids(self, course_id):
+        org = CourseKey.from_string(course_id).org
+        return self._get('staff', course_id, [('course', course_id), ('org', org)], self._load_staff_user_ids)
+
+    def get_additional_profile_fields(self, course_id):
+        return self._get('profile_fields', course_id, [('course', course_id)], self._load_additional_profile_fields)
+
+    def _load_block_to_sequential(self, course_id):
+        b2s_items = BlockToSequential.objects.filter(course_id=course_id).values_list(
+            'block_id', 'sequential_id', 'sequential_name', 'graded', 'visible_to_staff_only')
+        return {block_id: (sequential_id, sequential_name, graded, visible_to_staff_only)
+                for block_id, sequential_id, sequential_name, graded, visible_to_staff_only in b2s_items}
+
+    def _load_staff_user_ids(self, course_id):
+        course_key = CourseKey.from_string(course_id)
+        staff_user_ids = set(CourseAccessRole.objects.filter(
+            role__in=INSIGHTS_COURSE_STAFF_ROLES, course_id=course_key).values_list('user_id', flat=True))
+
+        org_access_roles = CourseAccessRole.objects.filter(
+            role__in=INSIGHTS_ORG_STAFF_ROLES, org=course_key.org).values_list('user_id', 'course_id')
+        for user_id, role_course_id in org_access_roles:
+            if not role_course_id:
+                staff_user_ids.add(user_id)
+        return staff_user_ids
+
+    def _load_additional_profile_fields(self, course_id):
+        return CourseFieldsCache.get_cache(course_id).get_additional_profile_fields()
+
+
+course_metadata_cache = CourseMetadataCache()
@@ -0,0 +1,80 @@
+import calendar
+from array import array
+from bisect import bisect_right
+
+from common.djangoapps.credo_modules.models import SequentialBlockAttempt
+
+
+ATTEMPTS_START_TS = 1562025600  # i.e '2019-07-02'
+
+
+class SequentialAttemptsIndex:
+    """
+    In-memory index of the students' sequential block attempts.
+    All attempts for a course are loaded using one query and stored as sorted
+    arrays of timestamps per (sequential_id, user_id) key.
+    Courses which were not used during the last processing window are evicted.
+    """
+
+    def __init__(self):
+        last_attempt = SequentialBlockAttempt.objects.all().order_by('-dt').first()
+        self._last_attempt_dt = last_attempt.dt if last_attempt else None
+        self._courses = {}
+        self._window_courses = set()
+
+    def start_window(self, course_ids=None):
+        self._window_courses = set()
+        if course_ids:
+            self.load_courses(course_ids)
+
+    def finish_window(self):
+        for course_id in list(self._courses):
+            if course_id not in self._window_courses:
+                del self._courses[course_id]
+
+    def load_courses(self, course_ids):
+        self._window_courses.update(course_ids)
+        course_ids = [c for c in set(course_ids) if c not in self._courses]
+        if not course_ids:
+            return
+
+        for course_id in course_ids:
+            self._courses[course_id] = {}
+        if self._last_attempt_dt is None:
+            return
+
+        attempts = SequentialBlockAttempt.objects.filter(
+            course_id__in=course_ids, dt__lte=self._last_attempt_dt
+        ).values_list('course_id', 'sequential_id', 'user_id', 'dt')
+        for course_id, sequential_id, user_id, dt in attempts:
+            course_attempts = self._courses[course_id]
+            key = (sequential_id, user_id)
+            if key not in course_attempts:
+                course_attempts[key] = array('q')
+            course_attempts[key].append(calendar.timegm(dt.timetuple()))
+
+        for course_id in course_ids:
+            course_attempts = self._courses[course_id]
+            for key, user_attempts in course_attempts.items():
+                course_attempts[key] = array('q', sorted(user_attempts))
+
+    def get_attempts_info(self, course_id, answer_ts, user_id, sequential_id):
+        """
+        Returns the tuple (attempt_ts, is_last_attempt, user_attempts)
+        for the answer submitted at the `answer_ts` time
+        """
+        if not sequential_id or answer_ts < ATTEMPTS_START_TS:
+            return 0, True, []
+
+        if course_id not in self._courses:
+            self.load_courses([course_id])
+        self._window_courses.add(course_id)
+
+        user_attempts = self._courses[course_id].get((sequential_id, user_id))
+        if not user_attempts:
+            return 0, True, []
+
+        idx = bisect_right(user_attempts, answer_ts) - 1
+        if 0 <= idx < len(user_attempts) - 1:
+            return user_attempts[idx], False, user_attempts
+        return user_attempts[-1], True, user_attempts
@@ -1,11 +1,17 @@
 import datetime
 import hashlib
 import json
+from functools import lru_cache
 from ..event_data import EventData
 from ..utils import get_timestamp_from_datetime, update_course_and_student_properties,\
     get_prop_user_info, filter_properties, combine_student_properties
 
 
+@lru_cache(maxsize=4096)
+def _split_course_id(course_id):
+    return tuple(course_id[len('course-v1:'):].split('+'))
+
+
 class AbstractEventParser:
 
     def _get_md5(self, val):
@@ -148,13 +154,13 @@ class AbstractEventParser:
 
     def get_run_for_course(self, course_id):
         try:
-            return course_id[len('course-v1:'):].split('+')[2]
+            return _split_course_id(course_id)[2]
         except IndexError:
             return None
 
     def get_course_for_course(self, course_id):
         try:
-            return course_id[len('course-v1:'):].split('+')[1]
+            return _split_course_id(course_id)[1]
         except IndexError:
             return None
 
@@ -170,7 +176,7 @@ class AbstractEventParser:
         try:
             # course_key = CourseKey.from_string(course_id)
             # return course_key.org
-            return course_id[len('course-v1:'):].split('+')[0]
+            return _split_course_id(course_id)[0]
         except IndexError:
             return None
 
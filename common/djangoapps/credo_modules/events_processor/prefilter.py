@@ -0,0 +1,42 @@
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+if orjson is not None:
+    events_json_loads = orjson.loads
+elif ujson is not None:
+    events_json_loads = ujson.loads
+else:
+    events_json_loads = json.loads
+
+
+class EventsPrefilter:
+    """
+    Cheap check of the raw tracking log line which allows to skip
+    full JSON decoding of the events that will be ignored anyway.
+    The check could give false positives but never rejects the relevant event.
+    """
+
+    def __init__(self, event_types, event_source='server'):
+        types_pattern = '|'.join(re.escape(event_type) for event_type in event_types)
+        source_pattern = '"event_source":\\s*"%s"' % re.escape(event_source)
+        type_pattern = '"event_type":\\s*"(?:%s)"' % types_pattern
+        self._source_re = re.compile(source_pattern)
+        self._type_re = re.compile(type_pattern)
+        self._source_re_bytes = re.compile(source_pattern.encode('utf-8'))
+        self._type_re_bytes = re.compile(type_pattern.encode('utf-8'))
+
+    def match(self, line):
+        if isinstance(line, bytes):
+            return self._type_re_bytes.search(line) is not None and self._source_re_bytes.search(line) is not None
+        return self._type_re.search(line) is not None and self._source_re.search(line) is not None
@@ -0,0 +1,180 @@
+import time
+
+from django.db import transaction, IntegrityError
+
+from common.djangoapps.credo_modules.models import TrackingLog
+from .utils import prepare_text_for_column_db
+
+
+class TrackingLogWriter:
+    """
+    Buffers parsed events and writes them into the TrackingLog table in batches.
+    Existing rows for all (answer_id, attempt_ts) keys of the batch are fetched at once
+    and changes are saved using bulk_create / bulk_update.
+    """
+
+    UPDATE_FIELDS = [
+        'course_id', 'org_id', 'course', 'run', 'term', 'block_id', 'block_tag_id', 'user_id', 'is_view',
+        'answer_id', 'ts', 'display_name', 'question_name', 'question_hash', 'is_ora_block', 'ora_criterion_name',
+        'is_ora_empty_rubrics', 'ora_status', 'ora_answer', 'grade', 'max_grade', 'answer', 'correctness',
+        'is_correct', 'is_incorrect', 'sequential_name', 'sequential_id', 'sequential_graded', 'is_staff',
+        'attempt_ts', 'is_last_attempt', 'course_user_id', 'update_ts', 'update_process_num'
+    ]
+    QUERY_CHUNK_SIZE = 1000
+
+    def __init__(self, update_process_num=None, batch_size=5000):
+        self.update_process_num = update_process_num
+        self.batch_size = batch_size
+        self.updated_count = 0
+        self.created_count = 0
+        self._events = []
+        self._last_attempts = {}
+        self._processed_last_attempts = {}
+
+    def add(self, e, is_view, attempt_ts, is_last_attempt):
+        self._events.append((e, is_view, attempt_ts, is_last_attempt))
+        if len(self._events) >= self.batch_size:
+            self.flush()
+
+    def reset_previous_attempts(self, user_id, sequential_id, last_attempt_ts):
+        """
+        Schedules reset of the `is_last_attempt` flag for all user's attempts
+        in the sequential block except the last one
+        """
+        key = (user_id, sequential_id)
+        if self._processed_last_attempts.get(key) != last_attempt_ts:
+            self._last_attempts[key] = last_attempt_ts
+            self._processed_last_attempts[key] = last_attempt_ts
+
+    def flush(self):
+        self._flush_last_attempts()
+        self._flush_events()
+
+    def _chunks(self, items):
+        items = list(items)
+        for i in range(0, len(items), self.QUERY_CHUNK_SIZE):
+            yield items[i:i + self.QUERY_CHUNK_SIZE]
+
+    def _flush_last_attempts(self):
+        if not self._last_attempts:
+            return
+
+        last_attempts, self._last_attempts = self._last_attempts, {}
+        user_ids = {user_id for user_id, _ in last_attempts}
+        sequential_ids = {sequential_id for _, sequential_id in last_attempts}
+
+        ids_to_reset = []
+        for user_ids_chunk in self._chunks(user_ids):
+            rows = TrackingLog.objects.filter(
+                user_id__in=user_ids_chunk, sequential_id__in=sequential_ids, is_last_attempt=1
+            ).values_list('id', 'user_id', 'sequential_id', 'attempt_ts')
+            for row_id, user_id, sequential_id, attempt_ts in rows:
+                last_attempt_ts = last_attempts.get((user_id, sequential_id))
+                if last_attempt_ts is not None and last_attempt_ts != attempt_ts:
+                    ids_to_reset.append(row_id)
+
+        for ids_chunk in self._chunks(ids_to_reset):
+            TrackingLog.objects.filter(id__in=ids_chunk).update(
+                is_last_attempt=0,
+                update_process_num=self.update_process_num
+            )
+
+    def _flush_events(self):
+        if not self._events:
+            return
+
+        events, self._events = self._events, []
+        existing = {}
+        for answer_ids_chunk in self._chunks({e.answer_id for e, _, _, _ in events}):
+            for tr_log in TrackingLog.objects.filter(answer_id__in=answer_ids_chunk):
+                existing[(tr_log.answer_id, tr_log.attempt_ts)] = tr_log
+
+        to_update = {}
+        to_create = {}
+        for e, is_view, attempt_ts, is_last_attempt in events:
+            key = (e.answer_id, attempt_ts)
+            tr_log = existing.get(key)
+            if tr_log is not None:
+                self.updated_count = self.updated_count + 1
+                if self.need_update(tr_log, is_view, e.dtime_ts):
+                    self.fill(tr_log, e, is_view, attempt_ts, is_last_attempt)
+                    to_update[key] = tr_log
+                continue
+
+            tr_log = to_create.get(key)
+            if tr_log is None:
+                tr_log = TrackingLog()
+                self.fill(tr_log, e, is_view, attempt_ts, is_last_attempt)
+                to_create[key] = tr_log
+            elif self.need_update(tr_log, is_view, e.dtime_ts):
+                self.fill(tr_log, e, is_view, attempt_ts, is_last_attempt)
+
+        if to_update:
+            TrackingLog.objects.bulk_update(list(to_update.values()), self.UPDATE_FIELDS, self.QUERY_CHUNK_SIZE)
+        if to_create:
+            self._create(list(to_create.values()))
+
+    def _create(self, items):
+        try:
+            with transaction.atomic():
+                TrackingLog.objects.bulk_create(items, self.QUERY_CHUNK_SIZE)
+            self.created_count = self.created_count + len(items)
+        except IntegrityError:
+            # some records were inserted concurrently (e.g. by the worker processing another shard)
+            for item in items:
+                tr_log = TrackingLog.objects.filter(answer_id=item.answer_id, attempt_ts=item.attempt_ts).first()
+                if tr_log is None:
+                    item.save()
+                    self.created_count = self.created_count + 1
+                elif self.need_update(tr_log, item.is_view, item.ts):
+                    item.pk = tr_log.pk
+                    item.save()
+                    self.updated_count = self.updated_count + 1
+
+    def need_update(self, tr_log, is_view, real_timestamp):
+        if (tr_log.is_view and not is_view) or (not tr_log.is_view and not is_view and real_timestamp > tr_log.ts):
+            return True
+        return False
+
+    def fill(self, tr_log, e, is_view, attempt_ts, is_last_attempt):
+        tr_log.course_id = e.course_id
+        tr_log.org_id = e.org_id
+        tr_log.course = e.course
+        tr_log.run = e.run
+        tr_log.term = e.term
+        tr_log.block_id = e.block_id
+        tr_log.block_tag_id = e.block_tag_id
+        tr_log.user_id = e.user_id
+        tr_log.is_view = is_view
+        tr_log.answer_id = e.answer_id
+        tr_log.ts = e.dtime_ts
+        tr_log.display_name = e.display_name
+        tr_log.question_name = e.question_name
+        tr_log.question_hash = e.question_hash
+        tr_log.is_ora_block = e.ora_block
+        tr_log.ora_criterion_name = e.criterion_name
+        tr_log.is_ora_empty_rubrics = e.is_ora_empty_rubrics
+        tr_log.ora_status = e.ora_status
+        tr_log.ora_answer = e.ora_user_answer
+        tr_log.grade = e.grade
+        tr_log.max_grade = e.max_grade
+        tr_log.answer = e.answers
+        tr_log.correctness = e.correctness
+        if e.ora_block and not e.is_ora_empty_rubrics:
+            tr_log.is_correct = 0
+            tr_log.is_incorrect = 0
+        else:
+            tr_log.is_correct = 1 if e.is_correct else 0
+            tr_log.is_incorrect = 0 if e.is_correct else 1
+        tr_log.sequential_name = prepare_text_for_column_db(e.sequential_name) if e.sequential_name else None
+        tr_log.sequential_id = e.sequential_id
+        if e.graded is not None:
+            tr_log.sequential_graded = 1 if e.graded else 0
+        else:
+            tr_log.sequential_graded = 1 if e.sequential_graded else 0
+        tr_log.is_staff = 1 if e.is_staff else 0
+        tr_log.attempt_ts = attempt_ts
+        tr_log.is_last_attempt = 1 if is_last_attempt else 0
+        tr_log.course_user_id = e.course_user_id
+        tr_log.update_ts = int(time.time())
+        tr_log.update_process_num = self.update_process_num
@@ -0,0 +1,115 @@
+import json
+import os
+import random
+import tempfile
+import time
+
+from django.core.management import BaseCommand
+from common.djangoapps.credo_modules.events_processor.prefilter import EventsPrefilter, events_json_loads
+from .process_tracking_logs import Command as ProcessLogsCommand
+
+
+class Command(BaseCommand):
+    """
+    Measures lines/sec of the tracking log lines filtering
+    with and without prefilter using a synthetic log file
+    """
+
+    IRRELEVANT_EVENTS = [
+        ('browser', 'page_close'),
+        ('browser', 'play_video'),
+        ('server', '/courseware/'),
+        ('server', 'edx.course.enrollment.activated'),
+        ('server', 'problem_graded'),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1024, help='Size (MB) of the synthetic log file')
+        parser.add_argument('--relevant_percent', type=int, default=10,
+                            help='Percent of the lines which pass the filter')
+        parser.add_argument('--log_file', help='Use existing log file instead of the synthetic one')
+
+    def _generate_log(self, size, relevant_percent):
+        size_bytes = size * 1024 * 1024
+        rnd = random.Random(0)
+        tf = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.log')
+        print('Generate synthetic log file: %s' % tf.name)
+        written = 0
+        i = 0
+        while written < size_bytes:
+            if rnd.randint(1, 100) <= relevant_percent:
+                event_source, event_type = 'server', rnd.choice(ProcessLogsCommand.EVENT_TYPES)
+            else:
+                event_source, event_type = rnd.choice(self.IRRELEVANT_EVENTS)
+            line = json.dumps({
+                'username': 'user%d' % (i % 10000),
+                'event_source': event_source,
+                'event_type': event_type,
+                'time': '2022-01-01T00:00:00.%06d+00:00' % (i % 1000000),
+                'context': {
+                    'course_id': 'course-v1:Org+Course+Run',
+                    'user_id': i % 10000,
+                    'org_id': 'Org',
+                    'path': '/courses/course-v1:Org+Course+Run/xblock/block-v1:Org+Course+Run+type@problem',
+                },
+                'event': {'answers': {'%032x_2_1' % i: 'choice_%d' % (i % 4)}, 'attempts': 1, 'grade': 1},
+                'referer': 'https://example.com/courses/course-v1:Org+Course+Run/courseware/',
+                'agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko)',
+            }) + '\n'
+            tf.write(line)
+            written = written + len(line)
+            i = i + 1
+        tf.close()
+        return tf.name
+
+    def _run_baseline(self, log_file_name):
+        relevant = 0
+        lines = 0
+        with open(log_file_name, 'rb') as fp:
+            for line in fp:
+                lines = lines + 1
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event.get('event_source') == 'server' and event.get('event_type') in ProcessLogsCommand.EVENT_TYPES:
+                    relevant = relevant + 1
+        return lines, relevant
+
+    def _run_prefilter(self, log_file_name):
+        prefilter = EventsPrefilter(ProcessLogsCommand.EVENT_TYPES)
+        relevant = 0
+        lines = 0
+        with open(log_file_name, 'rb') as fp:
+            for line in fp:
+                lines = lines + 1
+                if not prefilter.match(line):
+                    continue
+                try:
+                    event = events_json_loads(line)
+                except ValueError:
+                    continue
+                if event.get('event_source') == 'server' and event.get('event_type') in ProcessLogsCommand.EVENT_TYPES:
+                    relevant = relevant + 1
+        return lines, relevant
+
+    def _measure(self, title, fn, log_file_name):
+        t1 = time.time()
+        lines, relevant = fn(log_file_name)
+        spent = max(time.time() - t1, 0.001)
+        print('%s: %d lines (%d relevant), %.2f sec, %d lines/sec' % (title, lines, relevant, spent, lines / spent))
+
+    def handle(self, *args, **options):
+        log_file_name = options.get('log_file')
+        remove_file = False
+        if not log_file_name:
+            log_file_name = self._generate_log(options['size'], options['relevant_percent'])
+            remove_file = True
+
+        try:
+            print('JSON decoder: %s' % events_json_loads.__module__)
+            self._measure('Full JSON decoding', self._run_baseline, log_file_name)
+            self._measure('Prefilter', self._run_prefilter, log_file_name)
+        finally:
+            if remove_file:
+                os.remove(log_file_name)
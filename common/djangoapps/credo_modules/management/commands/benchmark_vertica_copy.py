@@ -0,0 +1,80 @@
+import csv
+import os
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management import BaseCommand
+from common.djangoapps.credo_modules.vertica import COPY_BUFFER_SIZE, prepare_row_for_vertica,\
+    stream_rows_into_vertica
+
+
+class FakeCopyCursor:
+    """
+    Local COPY sink: reads data the same way vertica_python does and drops it
+    """
+
+    def __init__(self):
+        self.bytes_num = 0
+
+    def copy(self, sql, data, buffer_size=COPY_BUFFER_SIZE):
+        while True:
+            chunk = data.read(buffer_size)
+            if not chunk:
+                break
+            self.bytes_num = self.bytes_num + len(chunk)
+
+
+class Command(BaseCommand):
+    """
+    Compares the old "materialize rows + temporary CSV file" COPY approach
+    with the streaming one using synthetic TrackingLog-like rows
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Number of synthetic rows')
+
+    def _generate_rows(self, rows_num):
+        for i in range(rows_num):
+            yield (i + 1, 'course-v1:Org+Course+Run', 'Org', 'Course', 'Run', None,
+                   'block-v1:Org+Course+Run+type@problem+block@%032x' % i, None, i % 5000, bool(i % 2),
+                   '%032x_2_1' % i, 1600000000 + i, 'Problem display name', 'Question text with\nnew line',
+                   '%032x' % i, False, False, None, None, 1.0, 1.0, 1, 0, 'Answer text', None, 'correct',
+                   'Sequential name', 'block-v1:Org+Course+Run+type@sequential+block@1', 1, 0, 1600000000, 1,
+                   '%032x' % i, 1600000000, 1)
+
+    def _run_temp_csv(self, rows_num, delimiter):
+        cursor = FakeCopyCursor()
+        model_data = list(self._generate_rows(rows_num))
+        tf = tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.csv')
+        csvwriter = csv.writer(tf, delimiter=delimiter)
+        for model_item in model_data:
+            csvwriter.writerow(prepare_row_for_vertica(model_item))
+        tf.close()
+        try:
+            with open(tf.name, "r") as fs:
+                cursor.copy('COPY', fs, buffer_size=COPY_BUFFER_SIZE)
+        finally:
+            os.remove(tf.name)
+        return cursor.bytes_num
+
+    def _run_streaming(self, rows_num, delimiter):
+        cursor = FakeCopyCursor()
+        rows = (prepare_row_for_vertica(model_item) for model_item in self._generate_rows(rows_num))
+        stream_rows_into_vertica(cursor, 'COPY', rows, delimiter=delimiter)
+        return cursor.bytes_num
+
+    def _measure(self, title, fn, rows_num):
+        tracemalloc.start()
+        t1 = time.time()
+        bytes_num = fn(rows_num, '|')
+        spent = max(time.time() - t1, 0.001)
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('%s: %d rows, %.1f MB copied, %.2f sec, %d rows/sec, peak memory %.1f MB' % (
+            title, rows_num, bytes_num / 1048576.0, spent, rows_num / spent, peak / 1048576.0))
+
+    def handle(self, *args, **options):
+        rows_num = options['rows']
+        self._measure('Temporary CSV', self._run_temp_csv, rows_num)
+        self._measure('Streaming', self._run_streaming, rows_num)
@@ -14,9 +14,12 @@ class Command(BaseCommand):
         course_key = CourseKey.from_string(course_id)
         enrollments = get_user_enrollments(course_key)
         data_to_insert = []
+        user_ids = list(enrollments.values_list('user_id', flat=True))
+        self._props_updater.clear_prefetched()
+        self._props_updater.prefetch(course_id, user_ids)
 
-        for enrollment in enrollments:
-            log_prop = self._props_updater.update_props_for_course_and_user(course_id, enrollment.user.id, org_props)
+        for user_id in user_ids:
+            log_prop = self._props_updater.update_props_for_course_and_user(course_id, user_id, org_props)
             if log_prop:
                 data_to_insert.append(log_prop)
 
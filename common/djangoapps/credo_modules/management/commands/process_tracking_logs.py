@@ -6,21 +6,22 @@ import logging
 import tempfile
 import time
 import subprocess
-import pytz
 import os
+import multiprocessing
 from django.conf import settings
 from django.core.management import BaseCommand
+from django.db import connections
 from django.contrib.auth import get_user_model
 from django.db.models import Q
+from common.djangoapps.credo_modules.course_metadata import course_metadata_cache
 from common.djangoapps.credo_modules.events_processor import EventProcessor
-from common.djangoapps.credo_modules.events_processor.utils import prepare_text_for_column_db, update_user_info,\
-    INSIGHTS_COURSE_STAFF_ROLES, INSIGHTS_ORG_STAFF_ROLES
-from common.djangoapps.credo_modules.models import DBLogEntry, TrackingLog, TrackingLogFile, TrackingLogConfig,\
-    SequentialBlockAttempt
-from openedx.core.djangoapps.content.block_structure.models import BlockToSequential
+from common.djangoapps.credo_modules.events_processor.attempts import SequentialAttemptsIndex
+from common.djangoapps.credo_modules.events_processor.prefilter import EventsPrefilter, events_json_loads
+from common.djangoapps.credo_modules.events_processor.utils import update_user_info
+from common.djangoapps.credo_modules.events_processor.writer import TrackingLogWriter
+from common.djangoapps.credo_modules.models import DBLogEntry, TrackingLogFile, TrackingLogConfig,\
+    TrackingLogFileShard
 from openedx.core.djangoapps.content.block_structure.tasks import update_course_structure
-from common.djangoapps.student.models import CourseAccessRole
-from opaque_keys.edx.keys import CourseKey
 
 
 User = get_user_model()
@@ -38,47 +39,16 @@ class Command(BaseCommand):
         'xblock.text-highlighter.new_submission',
         'xblock.freetextresponse.submit'
     ]
+    events_prefilter = EventsPrefilter(EVENT_TYPES)
     update_process_num = None
-    _updated_user_attempts = None
-    _last_attempt_dt = None
-    _user_attempts_cache = None
+    batch_size = 5000
+    _attempts_index = None
     _updated_course_structure = None
 
-    def _get_attempts_info(self, answer_ts, user_id, sequential_id):
-        if not self._last_attempt_dt:
-            seq_block_attempt = SequentialBlockAttempt.objects.filter().order_by('-dt').first()
-            self._last_attempt_dt = seq_block_attempt.dt
-            self._user_attempts_cache = {}
-
-        if not sequential_id or answer_ts < 1562025600:  # i.e answer_ts < '2019-07-02'
-            return 0, True, []
-
-        key = sequential_id + '|' + str(user_id)
-        if key not in self._user_attempts_cache:
-            self._user_attempts_cache[key] = []
-            user_attempts = []
-            attempts = SequentialBlockAttempt.objects.filter(sequential_id=sequential_id, user_id=user_id,
-                                                             dt__lte=self._last_attempt_dt).order_by('dt')
-            if attempts:
-                for attempt in attempts:
-                    dt = attempt.dt.replace(tzinfo=pytz.utc)
-                    dt2 = dt - datetime.datetime(1970, 1, 1).replace(tzinfo=pytz.utc)
-                    t = int(dt2.total_seconds())
-                    user_attempts.append(t)
-                    self._user_attempts_cache[key].append(t)
-        else:
-            user_attempts = self._user_attempts_cache[key]
-
-        attempts_num = len(user_attempts)
-        if attempts_num == 0:
-            return 0, True, []
-
-        for i, attempt_ts in enumerate(user_attempts):
-            if (i + 1) == attempts_num:
-                return attempt_ts, True, user_attempts
-            elif attempt_ts <= answer_ts < user_attempts[i + 1]:
-                return attempt_ts, False, user_attempts
-        return 0, True, user_attempts
+    def _get_attempts_index(self):
+        if self._attempts_index is None:
+            self._attempts_index = SequentialAttemptsIndex()
+        return self._attempts_index
 
     def _start_process_log(self, log_path):
         try:
@@ -103,93 +73,6 @@ class Command(BaseCommand):
     def _get_md5(self, val):
         return hashlib.md5(val.encode('utf-8')).hexdigest()
 
-    def _update_b2s_cache(self, course_id, b2s_cache):
-        b2s_items = BlockToSequential.objects.filter(course_id=course_id)
-        b2s_cache[course_id] = {}
-        for b2s_item in b2s_items:
-            b2s_cache[course_id][b2s_item.block_id] = (b2s_item.sequential_id, b2s_item.sequential_name,
-                                                       b2s_item.graded, b2s_item.visible_to_staff_only)
-
-    def _update_staff_cache(self, course_id, staff_cache):
-        staff_cache[course_id] = []
-        course_key = CourseKey.from_string(course_id)
-
-        course_access_roles = CourseAccessRole.objects.filter(
-            role__in=INSIGHTS_COURSE_STAFF_ROLES, course_id=course_key)
-        for role in course_access_roles:
-            staff_cache[course_id].append(role.user_id)
-
-        org_access_roles = CourseAccessRole.objects.filter(
-            role__in=INSIGHTS_ORG_STAFF_ROLES, org=course_key.org)
-        for role in org_access_roles:
-            if not role.course_id:
-                staff_cache[course_id].append(role.user_id)
-
-    def _update_tr_log(self, tr_log, e, is_view, answer_id, real_timestamp, attempt_ts, is_last_attempt):
-        tr_log.course_id = e.course_id
-        tr_log.org_id = e.org_id
-        tr_log.course = e.course
-        tr_log.run = e.run
-        tr_log.term = e.term
-        tr_log.block_id = e.block_id
-        tr_log.block_tag_id = e.block_tag_id
-        tr_log.user_id = e.user_id
-        tr_log.is_view = is_view
-        tr_log.answer_id = answer_id
-        tr_log.ts = real_timestamp
-        tr_log.display_name = e.display_name
-        tr_log.question_name = e.question_name
-        tr_log.question_hash = e.question_hash
-        tr_log.is_ora_block = e.ora_block
-        tr_log.ora_criterion_name = e.criterion_name
-        tr_log.is_ora_empty_rubrics = e.is_ora_empty_rubrics
-        tr_log.ora_status = e.ora_status
-        tr_log.ora_answer = e.ora_user_answer
-        tr_log.grade = e.grade
-        tr_log.max_grade = e.max_grade
-        tr_log.answer = e.answers
-        tr_log.correctness = e.correctness
-        if e.ora_block and not e.is_ora_empty_rubrics:
-            tr_log.is_correct = 0
-            tr_log.is_incorrect = 0
-        else:
-            tr_log.is_correct = 1 if e.is_correct else 0
-            tr_log.is_incorrect = 0 if e.is_correct else 1
-        tr_log.sequential_name = prepare_text_for_column_db(e.sequential_name) if e.sequential_name else None
-        tr_log.sequential_id = e.sequential_id
-        if e.graded is not None:
-            tr_log.sequential_graded = 1 if e.graded else 0
-        else:
-            tr_log.sequential_graded = 1 if e.sequential_graded else 0
-        tr_log.is_staff = 1 if e.is_staff else 0
-        tr_log.attempt_ts = attempt_ts
-        tr_log.is_last_attempt = 1 if is_last_attempt else 0
-        tr_log.course_user_id = e.course_user_id
-        tr_log.update_ts = int(time.time())
-        tr_log.update_process_num = self.update_process_num
-
-    def _tr_log_need_update(self, tr_log, is_view, real_timestamp):
-        if (tr_log.is_view and not is_view) or (not tr_log.is_view and not is_view and real_timestamp > tr_log.ts):
-            return True
-        return False
-
-    def _process_existing_tr(self, e, is_view, answer_id, real_timestamp, attempt_ts, is_last_attempt, db_check=True,
-                             tr_log=None):
-        if db_check:
-            try:
-                tr_log = TrackingLog.objects.get(answer_id=answer_id, attempt_ts=attempt_ts)
-                if self._tr_log_need_update(tr_log, is_view, real_timestamp):
-                    self._update_tr_log(tr_log, e, is_view, answer_id, real_timestamp, attempt_ts, is_last_attempt)
-                    tr_log.save()
-                return True, tr_log
-            except TrackingLog.DoesNotExist:
-                pass
-            return False, None
-        else:
-            if self._tr_log_need_update(tr_log, is_view, real_timestamp):
-                self._update_tr_log(tr_log, e, is_view, answer_id, real_timestamp, attempt_ts, is_last_attempt)
-            return True, tr_log
-
     def _check_sequential_block_viewed(self, res):
         update_attempts_strategy_dt = datetime.datetime(2020, 2, 10, 3, 40, 12, 0)
         if res[0].dtime > update_attempts_strategy_dt:  # process all viewed events after attempts bugfix
@@ -208,26 +91,14 @@ class Command(BaseCommand):
             # there are some answers or 'sequential_block.remove_view' events
             return False
 
-    def _update_previous_attempts(self, user_id, sequential_id, last_attempt_ts):
-        key = sequential_id + '|' + str(user_id)
-        if self._updated_user_attempts is None:
-            self._updated_user_attempts = {}
-        if key not in self._updated_user_attempts or self._updated_user_attempts[key] != last_attempt_ts:
-            TrackingLog.objects.filter(
-                user_id=user_id, sequential_id=sequential_id, is_last_attempt=1
-            ).exclude(
-                attempt_ts=last_attempt_ts
-            ).update(
-                is_last_attempt=0,
-                update_process_num=self.update_process_num
-            )
-            self._updated_user_attempts[key] = last_attempt_ts
-
-    def _process_log(self, line, all_log_items, b2s_cache, staff_cache, users_processed_cache):
+    def _process_log(self, line, writer, staff_cache, users_processed_cache):
         line = line.strip()
 
+        if not self.events_prefilter.match(line):
+            return
+
         try:
-            event = json.loads(line)
+            event = events_json_loads(line)
         except ValueError:
             return
 
@@ -253,31 +124,26 @@ class Command(BaseCommand):
             if not view_process:
                 return
 
-        db_items = 0
-
         for e in res:
             if not e:
                 continue
 
             course_id = e.course_id
-            if course_id not in b2s_cache:
-                self._update_b2s_cache(course_id, b2s_cache)
-
-            if course_id not in staff_cache:
-                self._update_staff_cache(course_id, staff_cache)
+            b2s_data = course_metadata_cache.get_block_to_sequential(course_id)
 
             sequential_id, sequential_name, sequential_graded, visible_to_staff_only = None, None, False, False
-            if e.block_id in b2s_cache[course_id]:
-                sequential_id, sequential_name, sequential_graded, visible_to_staff_only = b2s_cache[course_id][e.block_id]
+            if e.block_id in b2s_data:
+                sequential_id, sequential_name, sequential_graded, visible_to_staff_only = b2s_data[e.block_id]
             else:
                 if self._updated_course_structure is None:
                     self._updated_course_structure = []
                 if course_id not in self._updated_course_structure:
                     update_course_structure(course_id)
-                    self._update_b2s_cache(course_id, b2s_cache)
+                    course_metadata_cache.reset_local(course_id)
+                    b2s_data = course_metadata_cache.get_block_to_sequential(course_id)
                     self._updated_course_structure.append(course_id)
-                if e.block_id in b2s_cache[course_id]:
-                    sequential_id, sequential_name, sequential_graded, visible_to_staff_only = b2s_cache[course_id][e.block_id]
+                if e.block_id in b2s_data:
+                    sequential_id, sequential_name, sequential_graded, visible_to_staff_only = b2s_data[e.block_id]
                 else:
                     print(f"Can't find info for {e.block_id}")
                     log.exception(f"Can't find {e.block_id} in b2s cache")
@@ -286,7 +152,7 @@ class Command(BaseCommand):
             e.sequential_id = sequential_id
             e.sequential_graded = sequential_graded
 
-            if e.user_id in staff_cache['global'] or e.user_id in staff_cache[course_id]:
+            if e.user_id in staff_cache['global'] or e.user_id in course_metadata_cache.get_staff_user_ids(course_id):
                 e.is_staff = True
 
             if is_view and visible_to_staff_only and not e.is_staff:
@@ -300,13 +166,11 @@ class Command(BaseCommand):
             e.question_hash = self._get_md5(question_token)
             e.answers_hash = self._get_md5(question_token + '|' + e.answers)
 
-            real_timestamp = e.dtime_ts
-
             if sequential_id:
-                attempt_ts, is_last_attempt, user_attempts = self._get_attempts_info(
-                    real_timestamp, e.user_id, sequential_id)
+                attempt_ts, is_last_attempt, user_attempts = self._get_attempts_index().get_attempts_info(
+                    course_id, e.dtime_ts, e.user_id, sequential_id)
                 if len(user_attempts) > 1 and is_last_attempt:
-                    self._update_previous_attempts(e.user_id, sequential_id, user_attempts[-1])
+                    writer.reset_previous_attempts(e.user_id, sequential_id, user_attempts[-1])
             else:
                 attempt_ts = 0
                 is_last_attempt = True
@@ -314,34 +178,159 @@ class Command(BaseCommand):
             if attempt_ts is None:
                 attempt_ts = 0
 
-            res_db_check, _tr = self._process_existing_tr(
-                e, is_view, e.answer_id, real_timestamp, attempt_ts, is_last_attempt, db_check=True)
-            if res_db_check:
-                db_items = db_items + 1
-                continue
+            writer.add(e, is_view, attempt_ts, is_last_attempt)
+
+    def _download_log(self, bucket, key_path):
+        key = bucket.get_key(key_path)
+
+        tf = tempfile.NamedTemporaryFile(delete=False, suffix='.log.gz')
+        print("Download gz file " + tf.name)
+        key.get_contents_to_file(tf)
+        tf.close()
+
+        print("Unzip " + tf.name)
+        subprocess.call(["gunzip", tf.name], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return tf.name[:-3]
+
+    def _plan_shards(self, tr_file, log_file_name, shard_size):
+        """
+        Splits unzipped log file into byte ranges aligned to the line boundaries.
+        Shards are created only once so the next run after a crash uses the same ranges
+        (and the saved checkpoints) for the same S3 key.
+        """
+        shards = list(tr_file.shards.all().order_by('shard_num'))
+        if shards:
+            return shards
+
+        file_size = os.path.getsize(log_file_name)
+        start_offset = 0
+        with open(log_file_name, 'rb') as fp:
+            while start_offset < file_size:
+                end_offset = start_offset + shard_size
+                if end_offset < file_size:
+                    fp.seek(end_offset)
+                    fp.readline()
+                    end_offset = fp.tell()
+                else:
+                    end_offset = file_size
+                shards.append(TrackingLogFileShard(
+                    log_file=tr_file,
+                    shard_num=len(shards),
+                    start_offset=start_offset,
+                    end_offset=end_offset,
+                    checkpoint_offset=start_offset
+                ))
+                start_offset = end_offset
+
+        if shards:
+            TrackingLogFileShard.objects.bulk_create(shards)
+        return list(tr_file.shards.all().order_by('shard_num'))
+
+    def process_shard(self, shard_id, log_file_name, checkpoint_lines, staff_cache, users_processed_cache):
+        shard = TrackingLogFileShard.objects.get(id=shard_id)
+        writer = TrackingLogWriter(update_process_num=self.update_process_num, batch_size=self.batch_size)
+        lines_num = 0
+        last_line = None
 
-            log_item_key = e.answer_id + '|' + str(attempt_ts)
+        attempts_index = self._get_attempts_index()
+        attempts_index.start_window()
+
+        with open(log_file_name, 'rb') as fp:
+            fp.seek(shard.checkpoint_offset)
+            while fp.tell() < shard.end_offset:
+                line = fp.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if line:
+                    last_line = line
+                    self._process_log(line, writer, staff_cache, users_processed_cache)
+
+                lines_num = lines_num + 1
+                if lines_num % checkpoint_lines == 0:
+                    writer.flush()
+                    shard.checkpoint_offset = fp.tell()
+                    shard.save(update_fields=['checkpoint_offset', 'updated'])
+
+        writer.flush()
+        attempts_index.finish_window()
+        shard.checkpoint_offset = shard.end_offset
+        shard.status = TrackingLogFileShard.STATUS_FINISHED
+        shard.save(update_fields=['checkpoint_offset', 'status', 'updated'])
+        return shard.id, last_line.decode('utf-8') if last_line else None, writer.updated_count,\
+            writer.created_count
+
+    def _handle_parallel(self, bucket, keys, staff_cache, workers, shard_size, checkpoint_lines):
+        files_num = len(keys)
+        last_line = None
 
-            tr_log = all_log_items.get(log_item_key)
-            if tr_log:
-                res_db_check, updated_tr = self._process_existing_tr(
-                    e, is_view, e.answer_id, real_timestamp, attempt_ts, is_last_attempt, db_check=False, tr_log=tr_log)
-                all_log_items[log_item_key] = updated_tr
-            else:
-                new_item = TrackingLog()
-                self._update_tr_log(new_item, e, is_view, e.answer_id, real_timestamp, attempt_ts, is_last_attempt)
-                all_log_items[log_item_key] = new_item
+        for window_start in range(0, files_num, workers):
+            window_keys = keys[window_start:window_start + workers]
+            local_files = {}
+            shard_tasks = []
+            last_shard_id = None
 
-        return db_items
+            try:
+                for file_num, key_path in enumerate(window_keys, start=window_start):
+                    print('------------------------------------------------')
+                    print("Prepare file %d / %d: %s" % (file_num + 1, files_num, key_path))
+                    res = self._start_process_log(key_path)
+                    if not res:
+                        print("Skip log file")
+                        continue
+
+                    log_file_name = self._download_log(bucket, key_path)
+                    local_files[key_path] = log_file_name
+
+                    tr_file = TrackingLogFile.objects.get(log_filename=key_path)
+                    shards = self._plan_shards(tr_file, log_file_name, shard_size)
+                    for shard in shards:
+                        if shard.status != TrackingLogFileShard.STATUS_FINISHED:
+                            shard_tasks.append((shard.id, log_file_name, checkpoint_lines, self.batch_size))
+                    print("File is split into %d shards, %d of them are not finished yet"
+                          % (len(shards), len([s for s in shards if s.status != TrackingLogFileShard.STATUS_FINISHED])))
+                    if shards and file_num + 1 == files_num:
+                        last_shard_id = shards[-1].id
+
+                print("Start process %d shards using %d workers" % (len(shard_tasks), workers))
+                # child processes must not share DB connections with the parent
+                connections.close_all()
+                ctx = multiprocessing.get_context('fork')
+                with ctx.Pool(workers, initializer=_init_shard_worker, initargs=(staff_cache['global'],)) as pool:
+                    for shard_id, shard_last_line, db_updated_items, created_items in pool.imap_unordered(
+                            _process_shard_worker, shard_tasks):
+                        print("Shard %d: updated %d existing DB records, created %d tracking logs records"
+                              % (shard_id, db_updated_items, created_items))
+                        if shard_id == last_shard_id:
+                            last_line = shard_last_line
+
+                for key_path in local_files:
+                    self._finish_process_log(key_path)
+            finally:
+                for log_file_name in local_files.values():
+                    if os.path.exists(log_file_name):
+                        os.remove(log_file_name)
+
+        return last_line
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes (1 means sequential processing)')
+        parser.add_argument('--shard_size', type=int, default=256,
+                            help='Max size (MB) of the unzipped log file part processed by a single worker')
+        parser.add_argument('--checkpoint_lines', type=int, default=50000,
+                            help='Number of lines after which worker saves the shard checkpoint')
+        parser.add_argument('--batch_size', type=int, default=5000,
+                            help='Number of parsed events written into the DB in one batch')
 
     def handle(self, *args, **options):
+        self.batch_size = options.get('batch_size') or self.batch_size
         aws_access_key_id = getattr(settings, 'AWS_ACCESS_KEY_ID', None)
         aws_secret_access_key = getattr(settings, 'AWS_SECRET_ACCESS_KEY', None)
 
         conn = boto.connect_s3(aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key)
         bucket = conn.get_bucket('edu-credo-edx')
 
-        b2s_cache = {}
         staff_cache = {
             'global': []
         }
@@ -366,6 +355,14 @@ class Command(BaseCommand):
         files_num = len(keys)
         last_line = None
 
+        workers = options.get('workers') or 1
+        if workers > 1:
+            last_line = self._handle_parallel(bucket, keys, staff_cache, workers,
+                                              options['shard_size'] * 1024 * 1024, options['checkpoint_lines'])
+            if last_line:
+                self._update_last_log_time(last_line)
+            return
+
         for file_num, key_path in enumerate(keys):
             print('------------------------------------------------')
             print("Process file %d / %d: %s" % (file_num + 1, files_num, key_path))
@@ -374,24 +371,15 @@ class Command(BaseCommand):
                 print("Skip log file")
                 continue
 
-            key = bucket.get_key(key_path)
-
-            tf = tempfile.NamedTemporaryFile(delete=False, suffix='.log.gz')
-            print("Download gz file " + tf.name)
-            key.get_contents_to_file(tf)
-            tf.close()
-
-            log_file_name = tf.name[:-3]
-
-            print("Unzip " + tf.name)
-            subprocess.call(["gunzip", tf.name], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            log_file_name = self._download_log(bucket, key_path)
 
             fp = open(log_file_name, 'r')
             line = fp.readline()
             line = line.strip()
 
-            db_updated_items = 0
-            all_log_items = {}
+            writer = TrackingLogWriter(update_process_num=self.update_process_num, batch_size=self.batch_size)
+            attempts_index = self._get_attempts_index()
+            attempts_index.start_window()
 
             print("Start process items")
 
@@ -399,20 +387,16 @@ class Command(BaseCommand):
                 while line:
                     if line:
                         last_line = line
-                        db_res = self._process_log(line, all_log_items, b2s_cache, staff_cache,
-                                                   users_processed_cache)
-                        if db_res:
-                            db_updated_items = db_updated_items + db_res
+                        self._process_log(line, writer, staff_cache, users_processed_cache)
 
                     line = fp.readline()
                     line = line.strip()
 
-                all_log_items_lst = all_log_items.values()
+                writer.flush()
+                attempts_index.finish_window()
 
-                print("Updated %d existing DB records" % db_updated_items)
-                print("Try to create %d tracking logs records" % len(all_log_items_lst))
-                if all_log_items_lst:
-                    TrackingLog.objects.bulk_create(all_log_items_lst, 1000)
+                print("Updated %d existing DB records" % writer.updated_count)
+                print("Created %d tracking logs records" % writer.created_count)
 
                 fp.close()
                 os.remove(log_file_name)
@@ -423,8 +407,30 @@ class Command(BaseCommand):
                 raise
 
             if file_num + 1 == files_num:
-                line_json = json.loads(last_line)
-                event_time = line_json.get('time').split('+')[0].replace('T', ' ')
-                TrackingLogConfig.update_setting('last_log_time', event_time)
-                TrackingLogConfig.update_setting('update_process_num', '1')
-                TrackingLogConfig.update_setting('update_time', int(time.time()))
+                self._update_last_log_time(last_line)
+
+    def _update_last_log_time(self, last_line):
+        line_json = json.loads(last_line)
+        event_time = line_json.get('time').split('+')[0].replace('T', ' ')
+        TrackingLogConfig.update_setting('last_log_time', event_time)
+        TrackingLogConfig.update_setting('update_process_num', '1')
+        TrackingLogConfig.update_setting('update_time', int(time.time()))
+
+
+_shard_command = None
+_shard_caches = None
+
+
+def _init_shard_worker(global_staff_ids):
+    global _shard_command, _shard_caches
+    connections.close_all()
+    _shard_command = Command()
+    _shard_caches = ({'global': list(global_staff_ids)}, {})
+
+
+def _process_shard_worker(task):
+    shard_id, log_file_name, checkpoint_lines, batch_size = task
+    _shard_command.batch_size = batch_size
+    staff_cache, users_processed_cache = _shard_caches
+    return _shard_command.process_shard(shard_id, log_file_name, checkpoint_lines, staff_cache,
+                                        users_processed_cache)
@@ -0,0 +1,51 @@
+import datetime
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+from common.djangoapps.credo_modules.models import ProfilerAggregate
+from common.djangoapps.credo_modules.profiler import EventHistogram
+
+
+class Command(BaseCommand):
+    """
+    Prints p50/p95/p99 timings of the profiled events aggregated during the last hours.
+
+    Example:
+
+        ./manage.py lms profiling_report --hours 24 --request_name courseware
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Report period')
+        parser.add_argument('--request_name', help='Filter by request name')
+        parser.add_argument('--event', help='Filter by event')
+
+    def handle(self, *args, **options):
+        dt = timezone.now() - datetime.timedelta(hours=options['hours'])
+        aggregates = ProfilerAggregate.objects.filter(period_start__gte=dt)
+        if options['request_name']:
+            aggregates = aggregates.filter(request_name=options['request_name'])
+        if options['event']:
+            aggregates = aggregates.filter(event=options['event'])
+
+        histograms = {}
+        for item in aggregates.iterator():
+            key = (item.request_name, item.event)
+            if key not in histograms:
+                histograms[key] = EventHistogram()
+            histograms[key].merge(item.count, item.total_time, item.min_time, item.max_time, item.get_buckets())
+
+        if not histograms:
+            print('No profiling data')
+            return
+
+        print('%-40s %-30s %10s %10s %10s %10s %10s %10s' % (
+            'Request', 'Event', 'Count', 'Avg, ms', 'p50, ms', 'p95, ms', 'p99, ms', 'Max, ms'))
+        for (request_name, event), histogram in sorted(histograms.items()):
+            print('%-40s %-30s %10d %10.1f %10.1f %10.1f %10.1f %10.1f' % (
+                request_name[:40], event[:30], histogram.count,
+                histogram.total_time / histogram.count * 1000,
+                histogram.percentile(50) * 1000,
+                histogram.percentile(95) * 1000,
+                histogram.percentile(99) * 1000,
+                histogram.max_time * 1000))
@@ -53,6 +53,7 @@ class Command(BaseProcessEnrollmentsLogsCommand):
                 props_updater.update_props_for_course(course_key.org, log.course_id)
 
             print('Update user properties')
+            props_updater.prefetch_for_logs(logs)
             props_to_insert = []
 
             for log in logs:
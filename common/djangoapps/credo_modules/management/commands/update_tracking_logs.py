@@ -3,6 +3,7 @@ import time
 import pytz
 
 from .process_tracking_logs import Command as BaseProcessLogsCommand
+from common.djangoapps.credo_modules.events_processor.writer import TrackingLogWriter
 from common.djangoapps.credo_modules.models import DBLogEntry, TrackingLog, TrackingLogProp, TrackingLogConfig
 from common.djangoapps.credo_modules.properties_updater import PropertiesUpdater
 from common.djangoapps.credo_modules.vertica import merge_data_into_vertica_table
@@ -43,12 +44,10 @@ class Command(BaseProcessLogsCommand):
         print('Update process num: %d' % self.update_process_num)
         print('Update props process num: %d' % self.update_props_process_num)
 
-        b2s_cache = {}
         staff_cache = {
             'global': []
         }
         users_processed_cache = {}
-        db_updated_items = 0
 
         print('Prepare super users data')
         superusers = User.objects.filter(Q(is_staff=True) | Q(is_superuser=True))
@@ -73,8 +72,8 @@ class Command(BaseProcessLogsCommand):
                     props_updater.update_props_for_course(course_key.org, log.course_id)
 
                 print('Update user properties')
+                props_updater.prefetch_for_logs(logs)
                 props_to_insert = []
-                all_log_items = {}
 
                 for log in logs:
                     log_prop = props_updater.update_props_for_course_and_user(
@@ -89,20 +88,18 @@ class Command(BaseProcessLogsCommand):
                     print('Nothing to insert (props)')
 
                 print('Process %d logs' % logs_count)
+                writer = TrackingLogWriter(update_process_num=self.update_process_num, batch_size=self.batch_size)
+                attempts_index = self._get_attempts_index()
+                attempts_index.start_window(course_ids=[log.course_id for log in logs])
 
                 for log in logs:
-                    db_res = self._process_log(log.message, all_log_items, b2s_cache, staff_cache,
-                                               users_processed_cache)
-                    if db_res:
-                        db_updated_items = db_updated_items + db_res
+                    self._process_log(log.message, writer, staff_cache, users_processed_cache)
                     new_last_log_time = log.time
 
-                all_log_items_lst = all_log_items.values()
-                if all_log_items_lst:
-                    print('Try to insert %d new log items' % len(all_log_items_lst))
-                    TrackingLog.objects.bulk_create(all_log_items_lst, 1000)
-                else:
-                    print('Nothing to insert (log items)')
+                writer.flush()
+                attempts_index.finish_window()
+                print('Updated %d existing log items' % writer.updated_count)
+                print('Inserted %d new log items' % writer.created_count)
 
                 dt_from = dt_from + datetime.timedelta(days=time_interval)
             else:
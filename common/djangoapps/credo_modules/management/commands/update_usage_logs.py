@@ -60,6 +60,7 @@ class Command(BaseProcessUsageLogsCommand):
                     props_updater.update_props_for_course(course_key.org, log.course_id)
 
                 print('Update user properties')
+                props_updater.prefetch_for_logs(logs)
                 props_to_insert = []
 
                 for log in logs:
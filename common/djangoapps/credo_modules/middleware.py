@@ -1,6 +1,7 @@
 from common.djangoapps.credo.auth_helper import get_request_referer_from_other_domain, get_saved_referer, save_referer
-from common.djangoapps.credo_modules.models import CourseUsageHelper, CourseUsageLogEntry, get_student_properties,\
+from common.djangoapps.credo_modules.models import CourseUsageHelper, get_student_properties,\
     update_unique_user_id_cookie, get_unique_user_id, get_inactive_orgs, UNIQUE_USER_ID_COOKIE
+from common.djangoapps.credo_modules.usage_logs import course_usage_log_buffer
 from django.conf import settings
 from django.contrib.auth import logout
 from django.http import HttpResponse
@@ -58,10 +59,17 @@ class CourseUsageMiddleware(MiddlewareMixin):
                     position = int(position) - 1
                     try:
                         child = item.get_children()[position]
+                    except IndexError:
+                        return
+                    if CourseUsageHelper.is_viewed(request, child.location):
+                        return
+                    if item.category == 'sequential':
+                        course_usage_log_buffer.add(request.user, course_key, child.location,
+                                                    child.location.block_type, parent_id=str(item.location))
+                        CourseUsageHelper.mark_viewed(request, child.location)
+                    else:
                         student_properties = get_student_properties(request, course_key, child)
                         CourseUsageHelper.update_block_usage(request, course_key, child.location, student_properties)
-                    except IndexError:
-                        pass
 
     def _get_course_id_from_request(self, request):
         course_id = None
@@ -123,9 +131,7 @@ class CourseUsageMiddleware(MiddlewareMixin):
                 try:
                     course_key = CourseKey.from_string(course_id)
                     CourseUsageHelper.mark_viewed(request, course_id)
-                    student_properties = get_student_properties(request, course_key)
-                    CourseUsageLogEntry.add_new_log(request.user.id, str(course_key), 'course', 'course',
-                                                    student_properties)
+                    course_usage_log_buffer.add(request.user, course_key, 'course', 'course')
                 except InvalidKeyError:
                     pass
 
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.13 on 2026-10-18 10:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credo_modules', '0077_customuserrole_rerun_course'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackingLogFileShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard_num', models.IntegerField()),
+                ('start_offset', models.BigIntegerField()),
+                ('end_offset', models.BigIntegerField()),
+                ('checkpoint_offset', models.BigIntegerField()),
+                ('status', models.CharField(default='started', max_length=255)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('log_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='credo_modules.trackinglogfile')),
+            ],
+            options={
+                'unique_together': {('log_file', 'shard_num')},
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.13 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('credo_modules', '0078_trackinglogfileshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LearnerTagScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('org_id', models.CharField(max_length=80)),
+                ('course_id', models.CharField(max_length=255)),
+                ('block_id', models.CharField(max_length=255)),
+                ('rubric', models.CharField(max_length=255, null=True)),
+                ('tag_value', models.CharField(max_length=255)),
+                ('sequential_id', models.CharField(max_length=255)),
+                ('sequential_name', models.CharField(max_length=255)),
+                ('points_possible', models.IntegerField(default=0)),
+                ('points_earned', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'index_together': {('user', 'course_id'), ('user', 'block_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='LearnerTagScoreCourse',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_id', models.CharField(db_index=True, max_length=255)),
+                ('dirty', models.BooleanField(default=False)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'course_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.13 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credo_modules', '0079_learnertagscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supervisorevaluationinvitation',
+            name='pdf_generated',
+            field=models.BooleanField(default=False),
+        ),
+    ]
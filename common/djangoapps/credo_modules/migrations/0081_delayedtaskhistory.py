@@ -0,0 +1,36 @@
+# Generated by Django 3.2.13 on 2026-10-18 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credo_modules', '0080_supervisorevaluationinvitation_pdf_generated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DelayedTaskHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(db_index=True, max_length=255)),
+                ('task_name', models.CharField(max_length=255)),
+                ('attempt_num', models.IntegerField(default=0)),
+                ('result', models.CharField(max_length=32)),
+                ('course_id', models.CharField(db_index=True, max_length=255, null=True)),
+                ('user_id', models.IntegerField(null=True)),
+                ('assignment_id', models.IntegerField(null=True)),
+                ('start_time', models.DateTimeField()),
+                ('created', models.DateTimeField(null=True)),
+                ('finished', models.DateTimeField(db_index=True, null=True)),
+            ],
+            options={
+                'ordering': ['-finished'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='delayedtask',
+            index=models.Index(fields=['status', 'start_time'], name='delayed_task_status_start'),
+        ),
+    ]
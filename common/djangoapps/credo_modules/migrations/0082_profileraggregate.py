@@ -0,0 +1,27 @@
+# Generated by Django 3.2.13 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credo_modules', '0081_delayedtaskhistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilerAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('request_name', models.CharField(db_index=True, max_length=255)),
+                ('event', models.CharField(max_length=255)),
+                ('period_start', models.DateTimeField(db_index=True)),
+                ('count', models.IntegerField(default=0)),
+                ('total_time', models.FloatField(default=0)),
+                ('min_time', models.FloatField(default=0)),
+                ('max_time', models.FloatField(default=0)),
+                ('buckets', models.TextField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credo_modules', '0082_profileraggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='siblingblockupdatetask',
+            name='blocks_total',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='siblingblockupdatetask',
+            name='blocks_processed',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.13 on 2026-10-18 20:00
+
+from django.db import migrations
+
+
+def mark_finished_invitations_pdf_generated(apps, schema_editor):
+    # reports of the evaluations finished before `pdf_generated` was added were already sent
+    SupervisorEvaluationInvitation = apps.get_model("credo_modules", "SupervisorEvaluationInvitation")
+    SupervisorEvaluationInvitation.objects.filter(survey_finished=True, pdf_generated=False)\
+        .update(pdf_generated=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credo_modules', '0083_siblingblockupdatetask_progress'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            mark_finished_invitations_pdf_generated,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.13 on 2026-10-18 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credo_modules', '0084_supervisorevaluationinvitation_pdf_generated_backfill'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supervisorevaluationinvitation',
+            name='pdf_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -11,6 +11,7 @@ from django.db import models, OperationalError, IntegrityError, transaction
 from django.db.models.signals import post_save, post_delete
 from opaque_keys.edx.django.models import CourseKeyField
 from opaque_keys.edx.keys import CourseKey, UsageKey
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 from django.utils import timezone
@@ -678,6 +679,8 @@ class SiblingBlockUpdateTask(TimeStampedModel, TaskStatusMixin, models.Model):
     sibling_block_id = models.CharField(max_length=255, null=True)
     published = models.BooleanField(default=False)
     sibling_block_prev_version = models.CharField(max_length=255, null=True)  # set only for published
+    blocks_total = models.IntegerField(default=0)
+    blocks_processed = models.IntegerField(default=0)
 
     class Meta:
         verbose_name = "CMS Push Task"
@@ -900,6 +903,27 @@ class TrackingLogFile(models.Model):
     status = models.CharField(max_length=255, null=False)
 
 
+class TrackingLogFileShard(models.Model):
+    """
+    Byte range of the unzipped tracking log file processed by a single worker.
+    `checkpoint_offset` always points to the beginning of a line so that
+    an interrupted run could continue from this position.
+    """
+    STATUS_STARTED = 'started'
+    STATUS_FINISHED = 'finished'
+
+    log_file = models.ForeignKey(TrackingLogFile, on_delete=models.CASCADE, related_name='shards')
+    shard_num = models.IntegerField()
+    start_offset = models.BigIntegerField()
+    end_offset = models.BigIntegerField()
+    checkpoint_offset = models.BigIntegerField()
+    status = models.CharField(max_length=255, null=False, default=STATUS_STARTED)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('log_file', 'shard_num'),)
+
+
 class UsageLog(models.Model):
     course_id = models.CharField(max_length=255, null=False)
     org_id = models.CharField(max_length=80, null=False)
@@ -1035,6 +1059,41 @@ class UserSettings(models.Model):
     my_skills_access = models.BooleanField(default=None, null=True)
 
 
+class LearnerTagScore(models.Model):
+    """
+    Materialized learner's score for the answered graded block (or ORA rubric) tagged by the tag.
+    Used by the MySkills global progress.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    org_id = models.CharField(max_length=80, null=False)
+    course_id = models.CharField(max_length=255, null=False)
+    block_id = models.CharField(max_length=255, null=False)
+    rubric = models.CharField(max_length=255, null=True)
+    tag_value = models.CharField(max_length=255, null=False)
+    sequential_id = models.CharField(max_length=255, null=False)
+    sequential_name = models.CharField(max_length=255, null=False)
+    points_possible = models.IntegerField(default=0)
+    points_earned = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        index_together = (('user', 'course_id'), ('user', 'block_id'))
+
+
+class LearnerTagScoreCourse(models.Model):
+    """
+    State of the LearnerTagScore data for the learner's course.
+    Dirty data is recalculated on the next request.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    course_id = models.CharField(max_length=255, null=False, db_index=True)
+    dirty = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('user', 'course_id'),)
+
+
 class Profiler(models.Model):
     request_name = models.CharField(max_length=255, null=False, db_index=True)
     event = models.CharField(max_length=255)
@@ -1042,6 +1101,23 @@ class Profiler(models.Model):
     created = models.DateTimeField(null=True, auto_now_add=True, db_index=True)
 
 
+class ProfilerAggregate(models.Model):
+    """
+    Timings of the profiled events aggregated in process during the period (see profiler.py)
+    """
+    request_name = models.CharField(max_length=255, null=False, db_index=True)
+    event = models.CharField(max_length=255)
+    period_start = models.DateTimeField(db_index=True)
+    count = models.IntegerField(default=0)
+    total_time = models.FloatField(default=0)
+    min_time = models.FloatField(default=0)
+    max_time = models.FloatField(default=0)
+    buckets = models.TextField()  # JSON list of the histogram bucket counters
+
+    def get_buckets(self):
+        return json.loads(self.buckets) if self.buckets else []
+
+
 class SupervisorEvaluationInvitation(models.Model):
     url_hash = models.CharField(max_length=255)
     course_id = models.CharField(max_length=255, null=False, db_index=True)
@@ -1053,6 +1129,8 @@ class SupervisorEvaluationInvitation(models.Model):
     created = models.DateTimeField(auto_now_add=True, db_index=True)
     survey_finished = models.BooleanField(default=False)
     supervisor_user_id = models.IntegerField(null=True)
+    pdf_generated = models.BooleanField(default=False)
+    pdf_claimed_at = models.DateTimeField(null=True, blank=True)
 
 
 class DelayedTaskStatus:
@@ -1094,6 +1172,28 @@ class DelayedTask(models.Model):
 
     class Meta:
         ordering = ['-start_time']
+        indexes = [
+            models.Index(fields=['status', 'start_time'], name='delayed_task_status_start'),
+        ]
+
+
+class DelayedTaskHistory(models.Model):
+    """
+    Compact copy of the processed DelayedTask rows
+    """
+    task_id = models.CharField(max_length=255, db_index=True)
+    task_name = models.CharField(max_length=255)
+    attempt_num = models.IntegerField(default=0)
+    result = models.CharField(max_length=32)
+    course_id = models.CharField(max_length=255, null=True, db_index=True)
+    user_id = models.IntegerField(null=True)
+    assignment_id = models.IntegerField(null=True)
+    start_time = models.DateTimeField()
+    created = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True, db_index=True)
+
+    class Meta:
+        ordering = ['-finished']
 
 
 class LoginRedirectAllowedHost(models.Model):
@@ -1207,44 +1307,77 @@ def get_student_properties(request, course_key, item=None):
     return student_properties
 
 
-def get_student_properties_event_data(user, course_id, is_ora=False, parent_id=None, skip_user_profile=False):
-    try:
-        from lms.djangoapps.lti_provider.models import LtiContextId
-    except ImportError:
-        LtiContextId = None
+STUDENT_PROPERTIES_CACHE_TIMEOUT = 60
+STUDENT_PROPERTIES_CHUNK_SIZE = 1000
 
-    result = {'registration': {}, 'enrollment': {}}
-    if not skip_user_profile:
-        try:
-            profile = UserProfile.objects.get(user=user)
-            if profile.gender:
-                result['registration']['gender'] = profile.gender
-        except UserProfile.DoesNotExist:
-            pass
 
-    properties = CredoStudentProperties.objects.filter(user=user)
-    for prop in properties:
-        if not prop.course_id:
-            result['registration'][prop.name] = prop.value
-        elif prop.course_id and str(course_id) == str(prop.course_id):
-            result['enrollment'][prop.name] = prop.value
+def _student_properties_version_key(user_id):
+    return 'credo_student_props_version:%s' % str(user_id)
 
-    try:
-        profile = CredoModulesUserProfile.objects.get(user=user, course_id=course_id)
-        result['enrollment'].update(profile.converted_meta())
-    except CredoModulesUserProfile.DoesNotExist:
-        pass
+
+def invalidate_student_properties(user_id):
+    cache.set(_student_properties_version_key(user_id), uuid.uuid4().hex, STUDENT_PROPERTIES_CACHE_TIMEOUT)
+
+
+class StudentPropertiesResolver:
+    """
+    Loads the student properties of many users of the course in a few queries.
+
+    Properties of every user are kept as the compact tuple:
+    (gender, ((name, value), ...) - registration properties, ((name, value), ...) - enrollment properties)
+    """
+
+    def __init__(self, course_id, chunk_size=STUDENT_PROPERTIES_CHUNK_SIZE):
+        self.course_id = str(course_id)
+        self.course_key = CourseKey.from_string(self.course_id)
+        self.chunk_size = chunk_size
+        self._data = {}
+
+    def load(self, user_ids):
+        user_ids = [user_id for user_id in set(user_ids) if user_id not in self._data]
+        for i in range(0, len(user_ids), self.chunk_size):
+            chunk = user_ids[i:i + self.chunk_size]
+            genders = dict(UserProfile.objects.filter(user_id__in=chunk).values_list('user_id', 'gender'))
+            registration = {user_id: {} for user_id in chunk}
+            enrollment = {user_id: {} for user_id in chunk}
+
+            for user_id, course_id, name, value in CredoStudentProperties.objects.filter(
+                    user_id__in=chunk).values_list('user_id', 'course_id', 'name', 'value'):
+                if not course_id:
+                    registration[user_id][name] = value
+                elif self.course_id == str(course_id):
+                    enrollment[user_id][name] = value
+
+            for user_id, meta in CredoModulesUserProfile.objects.filter(
+                    user_id__in=chunk, course_id=self.course_key).values_list('user_id', 'meta'):
+                enrollment[user_id].update(CredoModulesUserProfile(meta=meta).converted_meta())
+
+            for user_id in chunk:
+                self._data[user_id] = (genders.get(user_id), tuple(registration[user_id].items()),
+                                       tuple(enrollment[user_id].items()))
+
+    def get_compact_properties(self, user_id):
+        if user_id not in self._data:
+            self.load([user_id])
+        return self._data[user_id]
+
+    def get_event_data(self, user_id, is_ora=False, skip_user_profile=False):
+        return build_student_properties_event_data(self.get_compact_properties(user_id), user_id, is_ora=is_ora,
+                                                   skip_user_profile=skip_user_profile)
+
+
+def build_student_properties_event_data(compact_properties, user_id, is_ora=False, skip_user_profile=False,
+                                        context_properties=None):
+    gender, registration, enrollment = compact_properties
+    result = {'registration': {}, 'enrollment': dict(enrollment)}
+    if gender and not skip_user_profile:
+        result['registration']['gender'] = gender
+    result['registration'].update(registration)
 
     result['enrollment']['term'] = get_custom_term()
 
-    if parent_id and LtiContextId:
-        parent_usage_key = UsageKey.from_string(parent_id)
-        context = LtiContextId.objects.filter(
-            course_key=course_id,
-            usage_key=parent_usage_key,
-            user=user).first()
-        if context and context.has_properties():
-            result['enrollment'].update(context.get_properties())
+    if context_properties:
+        result['enrollment'].update(context_properties)
 
     if 'context_id' in result['enrollment']:
         result['enrollment'].pop('context_id', None)
@@ -1256,11 +1389,62 @@ def get_student_properties_event_data(user, course_id, is_ora=False, parent_id=N
             result['enrollment'][prop_updated_name] = result['enrollment'].pop(prop_original_name)
 
     if is_ora:
-        return {'student_properties': result, 'student_id': user.id}
+        return {'student_properties': result, 'student_id': user_id}
     else:
         return {'student_properties': result}
 
 
+def _get_cached_student_properties(user_id, course_id, parent_id=None):
+    try:
+        from lms.djangoapps.lti_provider.models import LtiContextId
+    except ImportError:
+        LtiContextId = None
+
+    version_key = _student_properties_version_key(user_id)
+    version = cache.get(version_key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(version_key, version, STUDENT_PROPERTIES_CACHE_TIMEOUT):
+            version = cache.get(version_key, version)
+
+    cache_key = 'credo_student_props:%s:%s:%s:%s' % (str(user_id), str(course_id), str(parent_id), version)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    resolver = StudentPropertiesResolver(course_id)
+    compact_properties = resolver.get_compact_properties(user_id)
+
+    context_properties = None
+    if parent_id and LtiContextId:
+        parent_usage_key = UsageKey.from_string(parent_id)
+        context = LtiContextId.objects.filter(
+            course_key=course_id,
+            usage_key=parent_usage_key,
+            user_id=user_id).first()
+        if context and context.has_properties():
+            context_properties = context.get_properties()
+
+    cached = (compact_properties, context_properties)
+    cache.set(cache_key, cached, STUDENT_PROPERTIES_CACHE_TIMEOUT)
+    return cached
+
+
+def get_student_properties_event_data(user, course_id, is_ora=False, parent_id=None, skip_user_profile=False):
+    compact_properties, context_properties = _get_cached_student_properties(user.id, course_id, parent_id=parent_id)
+    return build_student_properties_event_data(compact_properties, user.id, is_ora=is_ora,
+                                               skip_user_profile=skip_user_profile,
+                                               context_properties=context_properties)
+
+
+@receiver(post_save, sender=CredoStudentProperties)
+@receiver(post_delete, sender=CredoStudentProperties)
+@receiver(post_save, sender=CredoModulesUserProfile)
+@receiver(post_delete, sender=CredoModulesUserProfile)
+def invalidate_student_properties_cache(sender, instance, **kwargs):
+    invalidate_student_properties(instance.user_id)
+
+
 UNIQUE_USER_ID_COOKIE = 'credo-course-usage-id'
 
 
@@ -1374,8 +1558,18 @@ def enrollment_trigger_after_save_course_enrollment(sender, instance, created, *
                 user_settings.save()
 
 
+def _invalidate_course_metadata_staff(course_access_role):
+    from common.djangoapps.credo_modules.course_metadata import CourseMetadataCache
+
+    if course_access_role.course_id:
+        CourseMetadataCache.invalidate_course(str(course_access_role.course_id))
+    elif course_access_role.org:
+        CourseMetadataCache.invalidate_org(course_access_role.org)
+
+
 @receiver(post_save, sender=CourseAccessRole)
 def enrollment_trigger_after_save_course_access_role(sender, instance, created, **kwargs):
+    _invalidate_course_metadata_staff(instance)
     user_id = instance.user_id
     course_id = str(instance.course_id)
     tr = EnrollmentTrigger(
@@ -1388,6 +1582,7 @@ def enrollment_trigger_after_save_course_access_role(sender, instance, created,
 
 @receiver(post_delete, sender=CourseAccessRole)
 def enrollment_trigger_after_delete_course_access_role(sender, instance, **kwargs):
+    _invalidate_course_metadata_staff(instance)
     user = instance.user
     course_id = str(instance.course_id)
     tr = EnrollmentTrigger(
@@ -1,5 +1,158 @@
+import atexit
+import bisect
+import json
+import logging
+import os
+import random
+import threading
 import time
-from .models import Profiler
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import timezone
+from .models import ProfilerAggregate
+
+
+log = logging.getLogger(__name__)
+
+PROFILING_SAMPLE_RATE = 1.0
+PROFILING_FLUSH_INTERVAL = 60
+# upper bounds (sec) of the histogram buckets: 1ms, 1.4ms, 2ms ... ~131 sec, the last bucket is unbounded
+PROFILING_BUCKETS = [0.001 * 2 ** (i / 2.0) for i in range(35)]
+
+
+def get_bucket_index(value):
+    return bisect.bisect_left(PROFILING_BUCKETS, value)
+
+
+def get_percentile(buckets, count, percentile, max_time=None):
+    """
+    Estimates the percentile from the histogram buckets (linear interpolation inside the bucket)
+    """
+    if not count:
+        return 0
+    rank = count * percentile / 100.0
+    seen = 0
+    for i, bucket_count in enumerate(buckets):
+        if not bucket_count:
+            continue
+        if seen + bucket_count >= rank:
+            lower = PROFILING_BUCKETS[i - 1] if i > 0 else 0
+            upper = PROFILING_BUCKETS[i] if i < len(PROFILING_BUCKETS) else (max_time or lower)
+            value = lower + (upper - lower) * (rank - seen) / bucket_count
+            return min(value, max_time) if max_time is not None else value
+        seen = seen + bucket_count
+    return max_time or 0
+
+
+class EventHistogram:
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.min_time = None
+        self.max_time = 0.0
+        self.buckets = [0] * (len(PROFILING_BUCKETS) + 1)
+
+    def add(self, value):
+        self.count = self.count + 1
+        self.total_time = self.total_time + value
+        if self.min_time is None or value < self.min_time:
+            self.min_time = value
+        if value > self.max_time:
+            self.max_time = value
+        self.buckets[get_bucket_index(value)] += 1
+
+    def merge(self, count, total_time, min_time, max_time, buckets):
+        self.count = self.count + count
+        self.total_time = self.total_time + total_time
+        if self.min_time is None or min_time < self.min_time:
+            self.min_time = min_time
+        if max_time > self.max_time:
+            self.max_time = max_time
+        for i, bucket_count in enumerate(buckets[:len(self.buckets)]):
+            self.buckets[i] += bucket_count
+
+    def percentile(self, percentile):
+        return get_percentile(self.buckets, self.count, percentile, self.max_time)
+
+
+class ProfilingAggregator:
+    """
+    Aggregates the timings of the profiled events in process into histograms per (request_name, event).
+    Aggregates are written into the DB in bulk (one ProfilerAggregate row per key)
+    not more often than once per flush interval and on the process exit.
+    """
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._data = {}
+        self._pid = None
+        self._period_start = None
+
+    def _get_flush_interval(self):
+        if self.flush_interval is not None:
+            return self.flush_interval
+        return getattr(settings, 'CREDO_PROFILING_FLUSH_INTERVAL', PROFILING_FLUSH_INTERVAL)
+
+    def _check_process(self):
+        # aggregates aren't inherited by the forked worker processes
+        if self._pid != os.getpid():
+            if self._pid is None:
+                atexit.register(self.flush)
+            self._pid = os.getpid()
+            self._data = {}
+            self._period_start = timezone.now()
+
+    def add(self, request_name, event, value):
+        flush_needed = False
+        with self._lock:
+            self._check_process()
+            key = (request_name, event)
+            histogram = self._data.get(key)
+            if histogram is None:
+                histogram = EventHistogram()
+                self._data[key] = histogram
+            histogram.add(value)
+            if (timezone.now() - self._period_start).total_seconds() >= self._get_flush_interval():
+                flush_needed = True
+        if flush_needed:
+            self.flush()
+
+    def snapshot(self):
+        """
+        Returns the aggregates of the current period: {(request_name, event): EventHistogram}
+        """
+        with self._lock:
+            return dict(self._data)
+
+    def flush(self):
+        with self._lock:
+            data = self._data
+            period_start = self._period_start
+            self._data = {}
+            self._period_start = timezone.now()
+        if not data:
+            return 0
+        try:
+            ProfilerAggregate.objects.bulk_create([ProfilerAggregate(
+                request_name=request_name,
+                event=event,
+                period_start=period_start,
+                count=histogram.count,
+                total_time=histogram.total_time,
+                min_time=histogram.min_time or 0,
+                max_time=histogram.max_time,
+                buckets=json.dumps(histogram.buckets)
+            ) for (request_name, event), histogram in data.items()])
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Can't save profiling aggregates")
+            return 0
+        return len(data)
+
+
+profiling_aggregator = ProfilingAggregator()
 
 
 class Profiling:
@@ -7,9 +160,13 @@ class Profiling:
     _req_name = None
     _is_active = True
 
-    def __init__(self):
+    def __init__(self, sample_rate=None):
         self._data = {}
         self._req_name = 'unknown'
+        if sample_rate is None:
+            sample_rate = getattr(settings, 'CREDO_PROFILING_SAMPLE_RATE', PROFILING_SAMPLE_RATE)
+        # the whole request is either profiled or not
+        self._is_sampled = sample_rate >= 1 or random.random() < sample_rate
 
     def activate(self):
         self._is_active = True
@@ -21,14 +178,17 @@ class Profiling:
         self._req_name = req_name
 
     def start_event(self, event):
-        self._data[event] = time.time()
+        self._data[event] = time.perf_counter()
 
     def finish_event(self, event):
-        if self._is_active and event in self._data:
-            time_diff = str(time.time() - self._data.get(event))
-            p_obj = Profiler(
-                request_name=self._req_name,
-                event=event,
-                time=time_diff
-            )
-            p_obj.save()
+        if self._is_active and self._is_sampled and event in self._data:
+            time_diff = time.perf_counter() - self._data.pop(event)
+            profiling_aggregator.add(self._req_name, event, time_diff)
+
+    @contextmanager
+    def event(self, event):
+        self.start_event(event)
+        try:
+            yield
+        finally:
+            self.finish_event(event)
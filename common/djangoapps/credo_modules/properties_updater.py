@@ -7,8 +7,8 @@ from opaque_keys.edx.keys import CourseKey
 from common.djangoapps.credo_modules.events_processor.utils import EXCLUDE_PROPERTIES, COURSE_PROPERTIES,\
     update_user_info, get_prop_user_info, combine_student_properties
 from common.djangoapps.credo_modules.models import RegistrationPropertiesPerMicrosite, RegistrationPropertiesPerOrg,\
-    EnrollmentPropertiesPerCourse, PropertiesInfo, TrackingLogProp, get_student_properties_event_data
-from openedx.core.djangoapps.content.block_structure.models import CourseFieldsCache
+    EnrollmentPropertiesPerCourse, PropertiesInfo, TrackingLogProp, StudentPropertiesResolver
+from common.djangoapps.credo_modules.course_metadata import course_metadata_cache
 
 
 User = get_user_model()
@@ -21,14 +21,59 @@ class PropertiesUpdater:
     _users_updated = None
     _show_logs = None
     _users_processed_cache = None
+    _resolvers = None
+    _existing_user_ids = None
+    _log_props = None
 
     def __init__(self, show_logs=True):
         self._org_common_props = {}
         self._org_props = {}
         self._course_updated = []
-        self._users_updated = []
+        self._users_updated = set()
         self._show_logs = show_logs
         self._users_processed_cache = {}
+        self._resolvers = {}
+        self._existing_user_ids = set()
+        self._log_props = {}
+
+    def _get_course_user_id(self, course_id, user_id):
+        course_user_id_source = str(course_id) + '|' + str(user_id)
+        return hashlib.md5(course_user_id_source.encode('utf-8')).hexdigest()
+
+    def _get_resolver(self, course_id):
+        if course_id not in self._resolvers:
+            self._resolvers[course_id] = StudentPropertiesResolver(course_id)
+        return self._resolvers[course_id]
+
+    def prefetch(self, course_id, user_ids):
+        """
+        Loads student properties and existing TrackingLogProp rows for the users of the course in bulk
+        """
+        user_ids = set(user_ids)
+        self._existing_user_ids.update(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        self._get_resolver(course_id).load(user_ids)
+        course_user_ids = [self._get_course_user_id(course_id, user_id) for user_id in user_ids]
+        for i in range(0, len(course_user_ids), 1000):
+            for log_prop in TrackingLogProp.objects.filter(course_user_id__in=course_user_ids[i:i + 1000]):
+                self._log_props[log_prop.course_user_id] = log_prop
+
+    def clear_prefetched(self):
+        self._resolvers = {}
+        self._existing_user_ids = set()
+        self._log_props = {}
+
+    def prefetch_for_logs(self, logs):
+        """
+        Replaces prefetched data with the data for all (course_id, user_id) pairs of the logs
+        """
+        self.clear_prefetched()
+        course_users = {}
+        for log in logs:
+            key = str(log.user_id) + '|' + log.course_id
+            if key not in self._users_updated:
+                course_users.setdefault(log.course_id, set()).add(log.user_id)
+        for course_id, user_ids in course_users.items():
+            self.prefetch(course_id, user_ids)
 
     def _log(self, msg):
         if self._show_logs:
@@ -138,8 +183,7 @@ class PropertiesUpdater:
                     if prop_key not in course_props and prop_key not in exclude_properties:
                         course_props.append(prop_key)
 
-        course_fields_cache_obj = CourseFieldsCache.get_cache(course_id)
-        additional_profile_fields = course_fields_cache_obj.get_additional_profile_fields()
+        additional_profile_fields = course_metadata_cache.get_additional_profile_fields(course_id)
         if additional_profile_fields:
             for k, v in additional_profile_fields.items():
                 prop_key = k.strip().lower()
@@ -159,23 +203,20 @@ class PropertiesUpdater:
         if key in self._users_updated:
             return None
 
-        try:
-            user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
+        course_user_id = self._get_course_user_id(course_id, user_id)
+        prefetched = course_id in self._resolvers and user_id in self._existing_user_ids
+        if not prefetched and not User.objects.filter(id=user_id).exists():
             return None
         course_key = CourseKey.from_string(course_id)
         org = course_key.org
 
-        course_user_id_source = str(course_id) + '|' + str(user_id)
-        course_user_id = hashlib.md5(course_user_id_source.encode('utf-8')).hexdigest()
-
         if not org_props:
             prop_obj = self._get_org_prop_obj(org)
             if not prop_obj:
                 return None
             org_props = json.loads(prop_obj.data)
 
-        props = get_student_properties_event_data(user, course_key, skip_user_profile=True)
+        props = self._get_resolver(course_id).get_event_data(user_id, skip_user_profile=True)
         student_properties = props['student_properties']
 
         kwargs = {
@@ -211,22 +252,24 @@ class PropertiesUpdater:
                 prop_value = prop_value[0:255]
             kwargs[prop_key] = prop_value
 
-        self._users_updated.append(key)
-
-        try:
-            log_prop = TrackingLogProp.objects.get(course_user_id=course_user_id)
-            need_update = False
-            for k, v in kwargs.items():
-                if k.startswith('prop'):
-                    old_value = getattr(log_prop, k, None)
-                    if old_value != v:
-                        setattr(log_prop, k, v)
-                        need_update = True
-                if need_update:
-                    log_prop.update_process_num = update_process_num
-                    log_prop.update_ts = int(time.time())
-                    log_prop.save()
-            return None
-        except TrackingLogProp.DoesNotExist:
-            log_prop = TrackingLogProp(**kwargs)
-            return log_prop
+        self._users_updated.add(key)
+
+        if prefetched:
+            log_prop = self._log_props.get(course_user_id)
+        else:
+            log_prop = TrackingLogProp.objects.filter(course_user_id=course_user_id).first()
+        if log_prop is None:
+            return TrackingLogProp(**kwargs)
+
+        need_update = False
+        for k, v in kwargs.items():
+            if k.startswith('prop'):
+                old_value = getattr(log_prop, k, None)
+                if old_value != v:
+                    setattr(log_prop, k, v)
+                    need_update = True
+        if need_update:
+            log_prop.update_process_num = update_process_num
+            log_prop.update_ts = int(time.time())
+            log_prop.save()
+        return None
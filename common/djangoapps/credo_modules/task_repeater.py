@@ -1,14 +1,36 @@
 import uuid
 import json
 import datetime
+import random
+from django.db import transaction
 from django.utils import timezone
-from .models import DelayedTask, DelayedTaskStatus, DelayedTaskResult
+from .models import DelayedTask, DelayedTaskHistory, DelayedTaskStatus, DelayedTaskResult
+
+
+DELAYED_TASKS_BATCH_SIZE = 500
+DELAYED_TASKS_MAX_BATCHES = 20
+# share of the countdown added randomly to spread the retries of the tasks failed at the same time
+DELAYED_TASKS_COUNTDOWN_JITTER = 0.1
+# dispatched tasks are spread over this interval (sec)
+DELAYED_TASKS_DISPATCH_JITTER = 30
+# processed tasks are kept in the DelayedTask table for this time before archiving
+DELAYED_TASKS_ARCHIVE_DELAY = 60 * 60
+# tasks which weren't started during this time after start_time are expired
+DELAYED_TASKS_MAX_DELAY = 60 * 60
+# tasks lost by workers
+DELAYED_TASKS_IN_PROGRESS_TIMEOUT = 60 * 60 * 6
+DELAYED_TASKS_HISTORY_DAYS = 90
 
 
 def get_countdown(attempt_num):
     return (int(2.71 ** attempt_num) + 5) * 60
 
 
+def get_countdown_with_jitter(attempt_num):
+    countdown = get_countdown(attempt_num)
+    return countdown + random.randint(0, int(countdown * DELAYED_TASKS_COUNTDOWN_JITTER))
+
+
 class TaskRepeater:
     task_id = None
     delayed_task = None
@@ -36,7 +58,7 @@ class TaskRepeater:
         if new_attempt_num > max_attempts:
             return
 
-        countdown = get_countdown(new_attempt_num)
+        countdown = get_countdown_with_jitter(new_attempt_num)
         dt_now = timezone.now()
         start_time = dt_now + datetime.timedelta(seconds=countdown)
 
@@ -62,3 +84,105 @@ class TaskRepeater:
             self.delayed_task.status = DelayedTaskStatus.PROCESSED
             self.delayed_task.result = DelayedTaskResult.SUCCESS
             self.delayed_task.save()
+
+
+class DelayedTaskScheduler:
+    """
+    Starts the due DelayedTask rows and archives the processed ones.
+
+    Due tasks are claimed in batches using SELECT ... FOR UPDATE SKIP LOCKED over the
+    (status, start_time) index, so several schedulers can run in parallel without
+    dispatching the same task twice. `dispatch_fn` receives the list of
+    (task_name, task_args, countdown) items after the claiming transaction is committed.
+    """
+
+    def __init__(self, dispatch_fn, batch_size=DELAYED_TASKS_BATCH_SIZE, max_batches=DELAYED_TASKS_MAX_BATCHES):
+        self.dispatch_fn = dispatch_fn
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.stats = {'dispatched': 0, 'archived': 0, 'expired': 0, 'history_removed': 0}
+
+    def _claim_batch(self):
+        dt_now = timezone.now()
+        celery_tasks_data = []
+        with transaction.atomic():
+            # the tasks which are late for more than DELAYED_TASKS_MAX_DELAY (e.g. after the scheduler outage)
+            # are never started: they could send outdated data
+            tasks = list(DelayedTask.objects.select_for_update(skip_locked=True).filter(
+                status=DelayedTaskStatus.CREATED, start_time__lte=dt_now,
+                start_time__gt=dt_now - datetime.timedelta(seconds=DELAYED_TASKS_MAX_DELAY)
+            ).order_by('start_time').values_list('id', 'task_id', 'task_name', 'task_params')[:self.batch_size])
+            if not tasks:
+                return 0
+            DelayedTask.objects.filter(id__in=[t[0] for t in tasks]).update(
+                status=DelayedTaskStatus.IN_PROGRESS, updated=dt_now)
+            for _id, task_id, task_name, task_params in tasks:
+                data = json.loads(task_params) if task_params else []
+                data.append(task_id)
+                countdown = random.randint(0, DELAYED_TASKS_DISPATCH_JITTER) if DELAYED_TASKS_DISPATCH_JITTER else 0
+                celery_tasks_data.append((task_name, data, countdown))
+            transaction.on_commit(lambda: self.dispatch_fn(celery_tasks_data))
+        return len(tasks)
+
+    def dispatch_due_tasks(self):
+        for _i in range(self.max_batches):
+            claimed = self._claim_batch()
+            self.stats['dispatched'] = self.stats['dispatched'] + claimed
+            if claimed < self.batch_size:
+                break
+
+    def expire_tasks(self):
+        """
+        Marks as failed the tasks which weren't started in time
+        and the tasks which are in progress for too long (lost by the workers)
+        """
+        dt_now = timezone.now()
+        expired = DelayedTask.objects.filter(
+            status=DelayedTaskStatus.CREATED,
+            start_time__lte=dt_now - datetime.timedelta(seconds=DELAYED_TASKS_MAX_DELAY)
+        ).update(status=DelayedTaskStatus.PROCESSED, result=DelayedTaskResult.FAILURE, updated=dt_now)
+        expired = expired + DelayedTask.objects.filter(
+            status=DelayedTaskStatus.IN_PROGRESS,
+            updated__lte=dt_now - datetime.timedelta(seconds=DELAYED_TASKS_IN_PROGRESS_TIMEOUT)
+        ).update(status=DelayedTaskStatus.PROCESSED, result=DelayedTaskResult.FAILURE, updated=dt_now)
+        self.stats['expired'] = expired
+
+    def archive_processed_tasks(self):
+        dt = timezone.now() - datetime.timedelta(seconds=DELAYED_TASKS_ARCHIVE_DELAY)
+        for _i in range(self.max_batches):
+            with transaction.atomic():
+                tasks = list(DelayedTask.objects.select_for_update(skip_locked=True).filter(
+                    status=DelayedTaskStatus.PROCESSED, updated__lte=dt).order_by('id')[:self.batch_size])
+                if not tasks:
+                    break
+                DelayedTaskHistory.objects.bulk_create([DelayedTaskHistory(
+                    task_id=t.task_id,
+                    task_name=t.task_name,
+                    attempt_num=t.attempt_num,
+                    result=t.result,
+                    course_id=t.course_id,
+                    user_id=t.user_id,
+                    assignment_id=t.assignment_id,
+                    start_time=t.start_time,
+                    created=t.created,
+                    finished=t.updated
+                ) for t in tasks])
+                DelayedTask.objects.filter(id__in=[t.id for t in tasks]).delete()
+            self.stats['archived'] = self.stats['archived'] + len(tasks)
+            if len(tasks) < self.batch_size:
+                break
+
+        dt = timezone.now() - datetime.timedelta(days=DELAYED_TASKS_HISTORY_DAYS)
+        for _i in range(self.max_batches):
+            ids = list(DelayedTaskHistory.objects.filter(
+                finished__lte=dt).values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                break
+            DelayedTaskHistory.objects.filter(id__in=ids).delete()
+            self.stats['history_removed'] = self.stats['history_removed'] + len(ids)
+
+    def run(self):
+        self.expire_tasks()
+        self.dispatch_due_tasks()
+        self.archive_processed_tasks()
+        return self.stats
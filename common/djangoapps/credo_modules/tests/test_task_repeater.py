@@ -0,0 +1,194 @@
+"""
+Tests for the delayed tasks
+"""
+
+
+import datetime
+import json
+import uuid
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from common.djangoapps.credo_modules.models import (
+    DelayedTask,
+    DelayedTaskHistory,
+    DelayedTaskResult,
+    DelayedTaskStatus
+)
+from common.djangoapps.credo_modules.task_repeater import (
+    DELAYED_TASKS_ARCHIVE_DELAY,
+    DELAYED_TASKS_COUNTDOWN_JITTER,
+    DELAYED_TASKS_DISPATCH_JITTER,
+    DELAYED_TASKS_HISTORY_DAYS,
+    DELAYED_TASKS_IN_PROGRESS_TIMEOUT,
+    DELAYED_TASKS_MAX_DELAY,
+    DelayedTaskScheduler,
+    TaskRepeater,
+    get_countdown,
+    get_countdown_with_jitter
+)
+
+
+def create_delayed_task(start_delta, status=DelayedTaskStatus.CREATED, task_name='send_leaf_outcome', params=None):
+    return DelayedTask.objects.create(
+        task_id=str(uuid.uuid4()),
+        celery_task_id='celery-task',
+        task_name=task_name,
+        task_params=json.dumps(params if params is not None else [1, 2]),
+        start_time=timezone.now() + datetime.timedelta(seconds=start_delta),
+        status=status,
+        course_id='course-v1:org+course+run',
+        user_id=1,
+    )
+
+
+def set_updated(task, delta):
+    DelayedTask.objects.filter(id=task.id).update(updated=timezone.now() + datetime.timedelta(seconds=delta))
+
+
+class TaskRepeaterTest(TestCase):
+    """
+    Tests for TaskRepeater
+    """
+
+    def test_countdown_jitter(self):
+        for attempt_num in range(1, 6):
+            countdown = get_countdown(attempt_num)
+            for _i in range(20):
+                assert countdown <= get_countdown_with_jitter(attempt_num) <= \
+                    countdown * (1 + DELAYED_TASKS_COUNTDOWN_JITTER)
+
+    def test_restart(self):
+        TaskRepeater().restart('celery-task', 'send_leaf_outcome', [1, 2], err_msg='Error', max_attempts=2)
+        task = DelayedTask.objects.get()
+        assert task.attempt_num == 1
+        assert task.status == DelayedTaskStatus.CREATED
+        assert get_countdown(1) <= task.countdown <= get_countdown(1) * (1 + DELAYED_TASKS_COUNTDOWN_JITTER)
+        assert task.start_time > timezone.now() + datetime.timedelta(seconds=get_countdown(1) - 60)
+
+        TaskRepeater(task.task_id).restart('celery-task', 'send_leaf_outcome', [1, 2], max_attempts=2)
+        task.refresh_from_db()
+        assert task.status == DelayedTaskStatus.PROCESSED
+        assert task.result == DelayedTaskResult.FAILURE
+        new_task = DelayedTask.objects.exclude(id=task.id).get()
+        assert new_task.attempt_num == 2
+
+        # the last attempt is reached
+        TaskRepeater(new_task.task_id).restart('celery-task', 'send_leaf_outcome', [1, 2], max_attempts=2)
+        assert DelayedTask.objects.filter(status=DelayedTaskStatus.CREATED).count() == 0
+
+
+class DelayedTaskSchedulerTest(TestCase):
+    """
+    Tests for DelayedTaskScheduler
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.dispatched = []
+
+    def _scheduler(self, batch_size=10):
+        return DelayedTaskScheduler(self.dispatched.extend, batch_size=batch_size)
+
+    def test_tasks_are_dispatched_after_commit(self):
+        due = create_delayed_task(-60, params=[1, 2])
+        create_delayed_task(60)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self._scheduler().dispatch_due_tasks()
+            # the task is claimed but not sent until the transaction is committed
+            assert DelayedTask.objects.get(id=due.id).status == DelayedTaskStatus.IN_PROGRESS
+            assert not self.dispatched
+        for callback in callbacks:
+            callback()
+
+        assert len(self.dispatched) == 1
+        task_name, task_args, countdown = self.dispatched[0]
+        assert task_name == 'send_leaf_outcome'
+        assert task_args == [1, 2, due.task_id]
+        assert 0 <= countdown <= DELAYED_TASKS_DISPATCH_JITTER
+
+        # the claimed task isn't dispatched again
+        with self.captureOnCommitCallbacks(execute=True):
+            self._scheduler().dispatch_due_tasks()
+        assert len(self.dispatched) == 1
+
+    def test_tasks_are_claimed_in_batches(self):
+        for i in range(5):
+            create_delayed_task(-60 - i)
+        scheduler = self._scheduler(batch_size=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            scheduler.dispatch_due_tasks()
+        assert scheduler.stats['dispatched'] == 5
+        assert len(self.dispatched) == 5
+        assert DelayedTask.objects.filter(status=DelayedTaskStatus.CREATED).count() == 0
+
+    @skipUnless(connection.features.has_select_for_update_skip_locked, 'SKIP LOCKED is not supported')
+    def test_skip_locked(self):
+        create_delayed_task(-60)
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self._scheduler().dispatch_due_tasks()
+        assert any('SKIP LOCKED' in query['sql'] for query in queries.captured_queries)
+
+    def test_old_task_is_expired_and_not_dispatched(self):
+        old = create_delayed_task(-DELAYED_TASKS_MAX_DELAY - 60)
+        due = create_delayed_task(-60)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = self._scheduler().run()
+
+        assert [data[1][-1] for data in self.dispatched] == [due.task_id]
+        assert stats['dispatched'] == 1
+        assert stats['expired'] == 1
+        old.refresh_from_db()
+        assert old.status == DelayedTaskStatus.PROCESSED
+        assert old.result == DelayedTaskResult.FAILURE
+
+    def test_old_task_is_not_claimed(self):
+        old = create_delayed_task(-DELAYED_TASKS_MAX_DELAY - 60)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._scheduler().dispatch_due_tasks()
+        assert not self.dispatched
+        assert DelayedTask.objects.get(id=old.id).status == DelayedTaskStatus.CREATED
+
+    def test_lost_in_progress_tasks_are_expired(self):
+        lost = create_delayed_task(-60, status=DelayedTaskStatus.IN_PROGRESS)
+        set_updated(lost, -DELAYED_TASKS_IN_PROGRESS_TIMEOUT - 60)
+        running = create_delayed_task(-60, status=DelayedTaskStatus.IN_PROGRESS)
+        set_updated(running, -60)
+
+        scheduler = self._scheduler()
+        scheduler.expire_tasks()
+        assert scheduler.stats['expired'] == 1
+        assert DelayedTask.objects.get(id=lost.id).status == DelayedTaskStatus.PROCESSED
+        assert DelayedTask.objects.get(id=lost.id).result == DelayedTaskResult.FAILURE
+        assert DelayedTask.objects.get(id=running.id).status == DelayedTaskStatus.IN_PROGRESS
+
+    def test_archive_and_purge(self):
+        processed = create_delayed_task(-60, status=DelayedTaskStatus.PROCESSED)
+        DelayedTask.objects.filter(id=processed.id).update(result=DelayedTaskResult.SUCCESS)
+        set_updated(processed, -DELAYED_TASKS_ARCHIVE_DELAY - 60)
+        recent = create_delayed_task(-60, status=DelayedTaskStatus.PROCESSED)
+        set_updated(recent, -60)
+        DelayedTaskHistory.objects.create(
+            task_id='old-task', task_name='send_leaf_outcome', result=DelayedTaskResult.SUCCESS,
+            start_time=timezone.now(), finished=timezone.now() - datetime.timedelta(days=DELAYED_TASKS_HISTORY_DAYS + 1))
+
+        scheduler = self._scheduler(batch_size=1)
+        scheduler.archive_processed_tasks()
+
+        assert scheduler.stats['archived'] == 1
+        assert scheduler.stats['history_removed'] == 1
+        assert list(DelayedTask.objects.values_list('id', flat=True)) == [recent.id]
+        history = DelayedTaskHistory.objects.get()
+        assert history.task_id == processed.task_id
+        assert history.task_name == 'send_leaf_outcome'
+        assert history.result == DelayedTaskResult.SUCCESS
+        assert history.course_id == 'course-v1:org+course+run'
+        assert history.user_id == 1
+        assert history.finished is not None
@@ -0,0 +1,158 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.db import close_old_connections
+from django.utils import timezone
+from edx_django_utils.monitoring import set_custom_attribute
+
+from common.djangoapps.credo_modules.models import CourseUsageLogEntry, get_student_properties_event_data
+
+
+log = logging.getLogger(__name__)
+
+USAGE_LOG_QUEUE_SIZE = 10000
+USAGE_LOG_BATCH_SIZE = 500
+USAGE_LOG_FLUSH_INTERVAL = 2
+USAGE_LOG_SHUTDOWN_TIMEOUT = 10
+USAGE_LOG_STATS_INTERVAL = 300
+
+
+class CourseUsageLogBuffer:
+    """
+    Non-blocking sink for the course usage log entries.
+
+    Entries are put into the bounded in-process queue and are written into the DB in bulk
+    by the background thread (student properties are calculated by the thread too).
+    If the queue is full the entry is written synchronously (backpressure), so entries are never lost.
+    The queue is flushed on the process shutdown.
+    """
+
+    def __init__(self, max_size=USAGE_LOG_QUEUE_SIZE, batch_size=USAGE_LOG_BATCH_SIZE,
+                 flush_interval=USAGE_LOG_FLUSH_INTERVAL):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {}
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'sync_writes': 0,
+            'errors': 0,
+            'max_queue_size': 0,
+        }
+        self._stats_time = time.time()
+
+    def _ensure_worker(self):
+        # the thread isn't inherited by the forked worker processes
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.max_size)
+                    self._reset_stats()
+                    atexit.register(self.shutdown)
+                self._pid = os.getpid()
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='course-usage-log-writer', daemon=True)
+                self._thread.start()
+
+    def add(self, user, course_id, block_id, block_type, parent_id=None, student_properties=None):
+        """
+        Enqueues the new usage log entry. If `student_properties` isn't passed they are calculated
+        in the background using `parent_id` (ID of the sequential block)
+        """
+        item = (user, str(course_id), str(block_id), str(block_type), parent_id, student_properties,
+                timezone.now())
+        if self.max_size <= 0:
+            self._write([item])
+            return
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(item)
+            self.stats['enqueued'] = self.stats['enqueued'] + 1
+        except queue.Full:
+            self.stats['sync_writes'] = self.stats['sync_writes'] + 1
+            self._write([item])
+
+        queue_size = self._queue.qsize()
+        if queue_size > self.stats['max_queue_size']:
+            self.stats['max_queue_size'] = queue_size
+        set_custom_attribute('credo_usage_log_queue_size', queue_size)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.flush(wait=self.flush_interval)
+            if time.time() - self._stats_time > USAGE_LOG_STATS_INTERVAL:
+                log.info('Course usage log buffer stats: %s, queue size: %s',
+                         str(self.stats), str(self._queue.qsize()))
+                self._reset_stats()
+
+    def flush(self, wait=0):
+        """
+        Writes all queued entries into the DB
+        """
+        items = []
+        try:
+            if wait:
+                items.append(self._queue.get(timeout=wait))
+            while True:
+                items.append(self._queue.get_nowait())
+                if len(items) >= self.batch_size:
+                    self._write(items)
+                    items = []
+        except queue.Empty:
+            pass
+        if items:
+            self._write(items)
+
+    def _write(self, items):
+        in_worker = threading.current_thread() is self._thread
+        if in_worker:
+            close_old_connections()
+        try:
+            entries = []
+            for user, course_id, block_id, block_type, parent_id, student_properties, log_time in items:
+                if student_properties is None:
+                    student_properties = get_student_properties_event_data(user, course_id, parent_id=parent_id)
+                entries.append(CourseUsageLogEntry(
+                    user_id=user.id,
+                    course_id=course_id,
+                    block_id=block_id,
+                    block_type=block_type,
+                    message=json.dumps(student_properties if student_properties else {}),
+                    time=log_time
+                ))
+            CourseUsageLogEntry.objects.bulk_create(entries)
+            self.stats['written'] = self.stats['written'] + len(entries)
+        except Exception:  # pylint: disable=broad-except
+            self.stats['errors'] = self.stats['errors'] + len(items)
+            log.exception('Course usage log entries were not saved')
+        finally:
+            if in_worker:
+                close_old_connections()
+
+    def shutdown(self):
+        if self._pid != os.getpid() or self._queue is None:
+            return
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(USAGE_LOG_SHUTDOWN_TIMEOUT)
+        self.flush()
+
+
+course_usage_log_buffer = CourseUsageLogBuffer()
@@ -1,18 +1,117 @@
 import csv
-import os
-import tempfile
-import vertica_python
+import io
 import time
+import vertica_python
 
 from django.db import transaction
 from django.conf import settings
 from .models import TrackingLog
 
 
+COPY_BUFFER_SIZE = 65536
+QUERYSET_CHUNK_SIZE = 10000
+
+
 def get_vertica_dsn():
     return settings.VERTICA_DSN + '?connection_timeout=30'
 
 
+def prepare_row_for_vertica(model_item):
+    row_to_insert = []
+    for v in model_item:
+        if isinstance(v, str):
+            row_to_insert.append(v.strip().replace("\n", " ").replace("\t", " ")
+                                 .encode("utf-8").decode('ascii', errors='ignore'))
+        elif isinstance(v, bool):
+            row_to_insert.append('1' if v else '0')
+        elif v is None:
+            row_to_insert.append('')
+        else:
+            row_to_insert.append(str(v))
+    return row_to_insert
+
+
+def iterate_queryset_rows(queryset, chunk_size=QUERYSET_CHUNK_SIZE):
+    """
+    Yields values_list() rows ordered by primary key reading the table chunk by chunk
+    (keyset pagination) so only one chunk is kept in memory
+    """
+    model_class = queryset.model
+    pk_name = model_class._meta.pk.attname
+    pk_index = [f.attname for f in model_class._meta.concrete_fields].index(pk_name)
+    queryset = queryset.order_by(pk_name)
+    last_pk = None
+
+    while True:
+        chunk_qs = queryset if last_pk is None else queryset.filter(**{pk_name + '__gt': last_pk})
+        rows = list(chunk_qs.values_list()[:chunk_size])
+        if not rows:
+            return
+        yield from rows
+        last_pk = rows[-1][pk_index]
+
+
+class CopyRowsStream:
+    """
+    File-like object for cursor.copy() that encodes rows into the CSV format on demand
+    """
+
+    def __init__(self, rows, delimiter='|'):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, delimiter=delimiter)
+        self._exhausted = False
+        self.rows_num = 0
+        self.bytes_num = 0
+
+    def read(self, size=-1):
+        while not self._exhausted and (size < 0 or self._buffer.tell() < size):
+            try:
+                row = next(self._rows)
+            except StopIteration:
+                self._exhausted = True
+                break
+            self._writer.writerow(row)
+            self.rows_num = self.rows_num + 1
+
+        data = self._buffer.getvalue().encode('utf-8')
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self.bytes_num = self.bytes_num + len(data)
+        return data
+
+
+def get_vertica_rows(model_data, fields, filter_fn=None):
+    for model_item in model_data:
+        if filter_fn and filter_fn(model_item, fields):
+            continue
+        yield prepare_row_for_vertica(model_item)
+
+
+def stream_rows_into_vertica(cursor, sql, rows, delimiter='|', buffer_size=COPY_BUFFER_SIZE):
+    """
+    Runs COPY ... FROM STDIN feeding rows directly from the iterator.
+    Returns number of copied rows.
+    """
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is None:
+        return 0
+
+    def _all_rows():
+        yield first_row
+        yield from rows
+
+    stream = CopyRowsStream(_all_rows(), delimiter=delimiter)
+    t1 = time.time()
+    cursor.copy(sql, stream, buffer_size=buffer_size)
+    spent = max(time.time() - t1, 0.001)
+    print('Vertica COPY done: %d rows, %.1f MB, %s sec (%d rows/sec, %.1f MB/sec)' % (
+        stream.rows_num, stream.bytes_num / 1048576.0, str(spent),
+        stream.rows_num / spent, stream.bytes_num / 1048576.0 / spent))
+    return stream.rows_num
+
+
 def merge_data_into_vertica_table(model_class, update_process_num=None, ids_list=None,
                                   course_ids_lst=None, vertica_dsn=None, filter_fn=None,
                                   skip_delete_step=False, delimiter=None):
@@ -25,17 +124,16 @@ def merge_data_into_vertica_table(model_class, update_process_num=None, ids_list
     if not delimiter:
         delimiter = '|'
 
-    print('Get data from DB to save into CSV')
     if update_process_num:
-        model_data = model_class.objects.filter(update_process_num=update_process_num).values_list()
+        model_qs = model_class.objects.filter(update_process_num=update_process_num)
     elif ids_list:
-        model_data = model_class.objects.filter(id__in=ids_list).values_list()
+        model_qs = model_class.objects.filter(id__in=ids_list)
     elif course_ids_lst:
-        model_data = model_class.objects.filter(course_id__in=course_ids_lst).values_list()
+        model_qs = model_class.objects.filter(course_id__in=course_ids_lst)
     else:
         raise Exception('Please specify "update_process_num", "ids_list" or "course_ids_lst" param')
 
-    if len(model_data) == 0:
+    if not model_qs.exists():
         print('Nothing to copy!')
         return
 
@@ -63,52 +161,19 @@ def merge_data_into_vertica_table(model_class, update_process_num=None, ids_list
         print(sql0)
         cursor.execute(sql0)
 
-        tf = tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.csv')
-        print('Save CSV into file: %s' % tf.name)
-
-        csvwriter = csv.writer(tf, delimiter=delimiter)
-        new_rows_num = 0
-
-        for model_item in model_data:
-            if filter_fn:
-                ignore_res = filter_fn(model_item, fields)
-                if ignore_res:
-                    continue
-
-            row_to_insert = []
-            for v in model_item:
-                if isinstance(v, str):
-                    row_to_insert.append(v.strip().replace("\n", " ").replace("\t", " ")
-                                         .encode("utf-8").decode('ascii', errors='ignore'))
-                elif isinstance(v, bool):
-                    row_to_insert.append('1' if v else '0')
-                elif v is None:
-                    row_to_insert.append('')
-                else:
-                    row_to_insert.append(str(v))
-            csvwriter.writerow(row_to_insert)
-            new_rows_num = new_rows_num + 1
-        tf.close()
+        print('Vertica COPY operation')
+        sql1 = "COPY %s (%s) FROM STDIN DELIMITER '%s' ABORT ON ERROR"\
+               % (table_name_copy_from, insert_columns_sql, delimiter)
+        print(sql1)
+        rows = get_vertica_rows(iterate_queryset_rows(model_qs), fields, filter_fn=filter_fn)
+        new_rows_num = stream_rows_into_vertica(cursor, sql1, rows, delimiter=delimiter)
 
         if new_rows_num == 0:
             print('Nothing to insert/update')
-            os.remove(tf.name)
             return
 
         print('Try to insert/update %d rows' % new_rows_num)
 
-        print('Vertica COPY operation')
-        try:
-            with open(tf.name, "r") as fs:
-                sql1 = "COPY %s (%s) FROM STDIN DELIMITER '%s' ABORT ON ERROR"\
-                       % (table_name_copy_from, insert_columns_sql, delimiter)
-                print(sql1)
-                cursor.copy(sql1, fs, buffer_size=65536)
-            os.remove(tf.name)
-        except Exception:
-            os.remove(tf.name)
-            raise
-
         if not skip_delete_step:
             print('Vertica DELETE operation')
             if course_ids_lst:
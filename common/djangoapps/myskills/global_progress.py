@@ -2,6 +2,7 @@ import json
 from collections import OrderedDict
 
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.http import Http404
 from lms.djangoapps.courseware.module_render import get_module_by_usage_id
 from lms.djangoapps.courseware.models import StudentModule
@@ -12,7 +13,7 @@ from lms.djangoapps.grades.course_grade_factory import CourseGradeFactory
 from lms.djangoapps.lti_provider.models import LtiContextId
 from common.djangoapps.student.models import CourseEnrollment, anonymous_id_for_user
 from common.djangoapps.credo_modules.models import OrganizationTag, TagDescription, OraBlockScore, OraScoreType,\
-    Organization
+    Organization, LearnerTagScore, LearnerTagScoreCourse
 from openedx.core.djangoapps.content.block_structure.models import ApiCourseStructure, ApiCourseStructureTags, \
     BlockToSequential, OraBlockStructure
 from opaque_keys.edx.keys import UsageKey, CourseKey
@@ -84,73 +85,47 @@ def get_global_skills_context(request, user_id=None):
     return user_id, student, course_ids, orgs, org
 
 
-def get_tags_global_data(student, orgs, course_ids, tag_value=None, group_tags=False, group_by_course=False):
-    tags = {}
-    blocks = {}
-    tags_to_hide = []
-    tag_descriptions = {}
+def _calculate_learner_tag_scores(user_id, course_ids, block_ids=None):
+    """
+    Returns list of LearnerTagScore objects (not saved) for all answered graded blocks
+    tagged in the courses. Could be limited by the list of `block_ids`.
+    """
+    tags_qs = ApiCourseStructureTags.objects.filter(course_id__in=course_ids, is_parent=0)
+    blocks_qs = BlockToSequential.objects.filter(
+        course_id__in=course_ids, graded=1, deleted=False, visible_to_staff_only=False)
+    modules_qs = StudentModule.objects.filter(
+        course_id__in=[CourseKey.from_string(ci) for ci in course_ids],
+        module_type__in=CREDO_GRADED_ITEM_CATEGORIES, student_id=user_id)
+    ora_grades_qs = OraBlockScore.objects.filter(
+        course_id__in=course_ids, score_type=OraScoreType.STAFF, user_id=user_id)
+    ora_structure_qs = OraBlockStructure.objects.filter(course_id__in=course_ids, ungraded=False)
+
+    if block_ids is not None:
+        tags_qs = tags_qs.filter(block_id__in=block_ids)
+        blocks_qs = blocks_qs.filter(block_id__in=block_ids)
+        modules_qs = modules_qs.filter(module_state_key__in=[UsageKey.from_string(b) for b in block_ids])
+        ora_grades_qs = ora_grades_qs.filter(block_id__in=block_ids)
+        ora_structure_qs = ora_structure_qs.filter(block_id__in=block_ids)
 
-    if tag_value:
-        tags_raw_data = ApiCourseStructureTags.objects.filter(course_id__in=course_ids, is_parent=0,
-                                                              tag_value=tag_value) \
-            .order_by('tag_value').values('course_id', 'block_id', 'rubric', 'tag_value')
-        tag_course_ids = []
-        for tmp_tag_item in tags_raw_data:
-            if tmp_tag_item['course_id'] not in tag_course_ids:
-                tag_course_ids.append(tmp_tag_item['course_id'])
-        for course_id in course_ids:
-            if course_id not in tag_course_ids:
-                course_ids.remove(course_id)
-    else:
-        tags_raw_data = ApiCourseStructureTags.objects.filter(course_id__in=course_ids, is_parent=0)\
-            .order_by('tag_value').values('block_id', 'rubric', 'tag_value')
-
-    org_tags = OrganizationTag.get_orgs_tags(orgs)
-    course_keys = [CourseKey.from_string(ci) for ci in course_ids]
-
-    if not tag_value:
-        tags_to_hide = [t.tag_name for t in org_tags if not t.progress_view]
-        tag_descriptions = {t.tag_name: t.description for t in TagDescription.objects.all()}
-
-    blocks_raw_data = BlockToSequential.objects.filter(
-        course_id__in=course_ids, graded=1, deleted=False,
-        visible_to_staff_only=False).values('block_id', 'sequential_id', 'sequential_name')
-    for block in blocks_raw_data:
+    blocks = {}
+    for block in blocks_qs.values('block_id', 'sequential_id', 'sequential_name'):
         blocks[block['block_id']] = {
             'sequential_name': block['sequential_name'],
             'sequential_id': block['sequential_id']
         }
 
-    modules_raw_data = StudentModule.objects.filter(
-        course_id__in=course_keys, module_type__in=CREDO_GRADED_ITEM_CATEGORIES,
-        student=student).values('state', 'module_type', 'module_state_key', 'grade', 'max_grade')
-
-    contexts = LtiContextId.objects.filter(
-        course_key__in=course_keys, user=student).values('usage_key', 'properties')
-    seq_block_to_course = {}
-    for context in contexts:
-        if context['properties']:
-            context_data = json.loads(context['properties'])
-            if 'context_label' in context_data:
-                seq_block_to_course[str(context['usage_key'])] = context_data['context_label']
-
     ora_empty_rubrics = []
     grades_data = {}
     ora_grades_data = {}
 
-    ora_grades = OraBlockScore.objects.filter(
-        course_id__in=course_ids, score_type=OraScoreType.STAFF,
-        user=student).values('block_id', 'criterion', 'points_earned')
-    for ora_grade in ora_grades:
+    for ora_grade in ora_grades_qs.values('block_id', 'criterion', 'points_earned'):
         if ora_grade['block_id'] not in ora_grades_data:
             ora_grades_data[ora_grade['block_id']] = {}
         ora_grades_data[ora_grade['block_id']][ora_grade['criterion'].strip()] = {
             'points_earned': ora_grade['points_earned']
         }
 
-    ora_block_structure = OraBlockStructure.objects.filter(
-        course_id__in=course_ids, ungraded=False)
-    for ora_block in ora_block_structure:
+    for ora_block in ora_structure_qs:
         steps = ora_block.get_steps()
 
         if not ora_block.is_ora_empty_rubrics:
@@ -169,7 +144,7 @@ def get_tags_global_data(student, orgs, course_ids, tag_value=None, group_tags=F
             ora_empty_rubrics.append(ora_block.block_id)
             grades_data[ora_block.block_id] = GradeInfo(points_possible=1)
 
-    for item in modules_raw_data:
+    for item in modules_qs.values('state', 'module_type', 'module_state_key', 'grade', 'max_grade'):
         block_id = str(item['module_state_key'])
         if block_id not in blocks:
             continue
@@ -202,37 +177,111 @@ def get_tags_global_data(student, orgs, course_ids, tag_value=None, group_tags=F
             grades_data[block_id] = GradeInfo(points_earned=points_earned, points_possible=points_possible,
                                               answered=answered)
 
-    for tag in tags_raw_data:
+    result = []
+    for tag in tags_qs.values('course_id', 'block_id', 'rubric', 'tag_value'):
         is_ora = bool(tag['rubric'])
         tag_block_id = str(tag['block_id'])
-        if tag_block_id not in blocks:
+        if tag_block_id not in blocks or tag_block_id not in grades_data:
             continue
-        if is_ora and (tag_block_id not in grades_data or tag['rubric'] not in grades_data[tag_block_id]):
+        if is_ora and tag['rubric'] not in grades_data[tag_block_id]:
             continue
-        section_id = blocks[tag_block_id]['sequential_id']
-        sequential_name = blocks[tag_block_id]['sequential_name']
-        tmp_tag_values = get_tag_values([tag['tag_value']], group_tags=group_tags, tags_to_hide=tags_to_hide,
-                                        tag_descriptions=tag_descriptions)
-        points_earned = 0
-        points_possible = 1
-        answered = False
-        correctness = 'Not Answered'
-
-        if tag_block_id in grades_data:
-            grade_info = grades_data[tag_block_id][tag['rubric']] if is_ora else grades_data[tag_block_id]
-            points_earned = grade_info.points_earned
-            points_possible = grade_info.points_possible
-            answered = grade_info.answered
-            if points_earned == 0:
-                correctness = 'incorrect'
-            elif points_possible == points_earned:
-                correctness = 'correct'
-            else:
-                correctness = 'partially correct'
-
-        if not answered:
+        grade_info = grades_data[tag_block_id][tag['rubric']] if is_ora else grades_data[tag_block_id]
+        if not grade_info.answered:
             continue
 
+        result.append(LearnerTagScore(
+            user_id=user_id,
+            org_id=CourseKey.from_string(tag['course_id']).org,
+            course_id=tag['course_id'],
+            block_id=tag_block_id,
+            rubric=tag['rubric'] if is_ora else None,
+            tag_value=tag['tag_value'],
+            sequential_id=blocks[tag_block_id]['sequential_id'],
+            sequential_name=blocks[tag_block_id]['sequential_name'],
+            points_possible=grade_info.points_possible,
+            points_earned=grade_info.points_earned
+        ))
+    return result
+
+
+def update_learner_tag_scores(user_id, course_id, block_ids=None):
+    """
+    Recalculates materialized learner's tag scores for the whole course
+    or only for the `block_ids` blocks (if the course data is already calculated)
+    """
+    course_id = str(course_id)
+    with transaction.atomic():
+        if block_ids is None:
+            scores = _calculate_learner_tag_scores(user_id, [course_id])
+            LearnerTagScore.objects.filter(user_id=user_id, course_id=course_id).delete()
+            LearnerTagScore.objects.bulk_create(scores, batch_size=1000)
+            LearnerTagScoreCourse.objects.update_or_create(
+                user_id=user_id, course_id=course_id, defaults={'dirty': False})
+        else:
+            course_state = LearnerTagScoreCourse.objects.select_for_update().filter(
+                user_id=user_id, course_id=course_id).first()
+            if not course_state or course_state.dirty:
+                # whole course will be recalculated on the next request
+                return
+            block_ids = [str(b) for b in block_ids]
+            scores = _calculate_learner_tag_scores(user_id, [course_id], block_ids=block_ids)
+            LearnerTagScore.objects.filter(user_id=user_id, block_id__in=block_ids).delete()
+            LearnerTagScore.objects.bulk_create(scores, batch_size=1000)
+
+
+def _ensure_learner_tag_scores(student, course_ids):
+    ready_course_ids = set(LearnerTagScoreCourse.objects.filter(
+        user_id=student.id, course_id__in=course_ids, dirty=False).values_list('course_id', flat=True))
+    for course_id in course_ids:
+        if course_id not in ready_course_ids:
+            update_learner_tag_scores(student.id, course_id)
+
+
+def get_tags_global_data(student, orgs, course_ids, tag_value=None, group_tags=False, group_by_course=False):
+    tags = {}
+    tags_to_hide = []
+    tag_descriptions = {}
+
+    _ensure_learner_tag_scores(student, course_ids)
+
+    scores_qs = LearnerTagScore.objects.filter(user_id=student.id, course_id__in=course_ids)
+    if tag_value:
+        scores_qs = scores_qs.filter(tag_value=tag_value)
+    scores = scores_qs.order_by('tag_value').values(
+        'block_id', 'rubric', 'tag_value', 'sequential_id', 'sequential_name', 'points_possible', 'points_earned')
+
+    org_tags = OrganizationTag.get_orgs_tags(orgs)
+    course_keys = [CourseKey.from_string(ci) for ci in course_ids]
+
+    if not tag_value:
+        tags_to_hide = [t.tag_name for t in org_tags if not t.progress_view]
+        tag_descriptions = {t.tag_name: t.description for t in TagDescription.objects.all()}
+
+    contexts = LtiContextId.objects.filter(
+        course_key__in=course_keys, user=student).values('usage_key', 'properties')
+    seq_block_to_course = {}
+    for context in contexts:
+        if context['properties']:
+            context_data = json.loads(context['properties'])
+            if 'context_label' in context_data:
+                seq_block_to_course[str(context['usage_key'])] = context_data['context_label']
+
+    for score in scores:
+        tag_block_id = score['block_id']
+        section_id = score['sequential_id']
+        sequential_name = score['sequential_name']
+        tmp_tag_values = get_tag_values([score['tag_value']], group_tags=group_tags, tags_to_hide=tags_to_hide,
+                                        tag_descriptions=tag_descriptions)
+        points_earned = score['points_earned']
+        points_possible = score['points_possible']
+        answered = True
+        if points_earned == 0:
+            correctness = 'incorrect'
+        elif points_possible == points_earned:
+            correctness = 'correct'
+        else:
+            correctness = 'partially correct'
+
         for tmp_tag in tmp_tag_values:
             tag_key = tmp_tag['value'].strip()
             if tag_key not in tags:
@@ -1,4 +1,11 @@
 from corsheaders.signals import check_request_enabled
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from common.djangoapps.credo_modules.models import OraBlockScore, OraScoreType
+from lms.djangoapps.courseware.models import StudentModule
+from lms.djangoapps.grades.signals.signals import PROBLEM_WEIGHTED_SCORE_CHANGED
 
 
 def cors_allow_myskills_api(sender, request, **kwargs):
@@ -6,3 +13,33 @@ def cors_allow_myskills_api(sender, request, **kwargs):
 
 
 check_request_enabled.connect(cors_allow_myskills_api)
+
+
+def _update_learner_tag_scores_on_commit(user_id, course_id, block_id):
+    from common.djangoapps.myskills.global_progress import update_learner_tag_scores
+    from common.djangoapps.myskills.progress_cache import invalidate_grade_version
+
+    # also after the commit: the progress calculated before the commit could contain the old score
+    invalidate_grade_version(user_id, course_id)
+    transaction.on_commit(lambda: invalidate_grade_version(user_id, course_id))
+    transaction.on_commit(lambda: update_learner_tag_scores(user_id, str(course_id), block_ids=[str(block_id)]))
+
+
+@receiver(PROBLEM_WEIGHTED_SCORE_CHANGED, dispatch_uid='myskills_problem_score_changed')
+def problem_score_changed_handler(sender, **kwargs):
+    if kwargs.get('user_id') and kwargs.get('course_id') and kwargs.get('usage_id'):
+        _update_learner_tag_scores_on_commit(kwargs['user_id'], kwargs['course_id'], kwargs['usage_id'])
+
+
+@receiver(post_save, sender=OraBlockScore, dispatch_uid='myskills_ora_score_saved')
+@receiver(post_delete, sender=OraBlockScore, dispatch_uid='myskills_ora_score_deleted')
+def ora_score_changed_handler(sender, instance, **kwargs):
+    if instance.score_type == OraScoreType.STAFF:
+        _update_learner_tag_scores_on_commit(instance.user_id, instance.course_id, instance.block_id)
+
+
+@receiver(post_save, sender=StudentModule, dispatch_uid='myskills_ora_student_module_saved')
+def ora_student_module_saved_handler(sender, instance, **kwargs):
+    # ORA submission without rubrics doesn't send score changed signals
+    if instance.module_type == 'openassessment' and instance.state and 'submission_uuid' in instance.state:
+        _update_learner_tag_scores_on_commit(instance.student_id, instance.course_id, instance.module_state_key)
@@ -0,0 +1,77 @@
+import time
+import uuid
+
+from django.core.cache import cache
+
+
+PROGRESS_CACHE_TIMEOUT = 60 * 60
+PROGRESS_CACHE_LOCK_TIMEOUT = 60
+PROGRESS_CACHE_WAIT_INTERVAL = 0.2
+
+
+class SectionSummary:
+    """
+    Picklable part of the SubsectionGrade used by the extended progress pages
+    """
+
+    def __init__(self, section):
+        self.location = section.location
+        self.display_name = section.display_name
+        self.graded = section.graded
+        self.problem_scores = section.problem_scores
+        self.last_answer_timestamp = getattr(section, 'last_answer_timestamp', None)
+
+
+def get_courseware_summary_data(courseware_summary):
+    return [{
+        'display_name': chapter['display_name'],
+        'sections': [SectionSummary(section) for section in chapter['sections']]
+    } for chapter in courseware_summary]
+
+
+def _grade_version_key(user_id, course_id):
+    return 'myskills_grade_version:%s:%s' % (str(user_id), str(course_id))
+
+
+def get_grade_version(user_id, course_id):
+    key = _grade_version_key(user_id, course_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, PROGRESS_CACHE_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate_grade_version(user_id, course_id):
+    cache.set(_grade_version_key(user_id, course_id), uuid.uuid4().hex, PROGRESS_CACHE_TIMEOUT)
+
+
+def get_or_compute(key, compute_fn):
+    """
+    Returns the cached value or computes it. Only one process computes the value at a time,
+    the others wait for the result (parallel API calls for the same learner share the computation)
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = key + ':lock'
+    locked = cache.add(lock_key, 1, PROGRESS_CACHE_LOCK_TIMEOUT)
+    if not locked:
+        deadline = time.time() + PROGRESS_CACHE_LOCK_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(PROGRESS_CACHE_WAIT_INTERVAL)
+            value = cache.get(key)
+            if value is not None:
+                return value
+            if cache.get(lock_key) is None:
+                break
+
+    try:
+        value = compute_fn()
+        cache.set(key, value, PROGRESS_CACHE_TIMEOUT)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
@@ -15,6 +15,7 @@ from openedx.core.djangoapps.user_api.accounts.utils import is_user_credo_anonym
 from xmodule.modulestore.django import modulestore
 from opaque_keys.edx.keys import CourseKey, UsageKey
 from .extended_progress import tags_student_progress, assessments_progress
+from .progress_cache import get_courseware_summary_data, get_grade_version, get_or_compute
 from .utils import convert_into_tree
 
 
@@ -30,17 +31,33 @@ class MySkillsService:
     def _get_course_problem_blocks(self):
         return modulestore().get_items(self.course.id, qualifiers={'category': {'$in': CREDO_GRADED_ITEM_CATEGORIES}})
 
+    def _get_cache_key(self, name):
+        # the key is changed when the student's scores or the course content are changed
+        return 'myskills_progress:%s:%s:%s:%s:%s' % (
+            name, str(self.student.id), str(self.course.id), str(getattr(self.course, 'course_version', None)),
+            get_grade_version(self.student.id, self.course.id))
+
+    def _compute_courseware_summary(self):
+        course_grade = CourseGradeFactory().read(self.student, self.course)
+        return get_courseware_summary_data(course_grade.chapter_grades.values())
+
     def _get_courseware_summary(self):
         if not self.courseware_summary:
-            course_grade = CourseGradeFactory().read(self.student, self.course)
-            self.courseware_summary = course_grade.chapter_grades.values()
+            self.courseware_summary = get_or_compute(self._get_cache_key('courseware_summary'),
+                                                     self._compute_courseware_summary)
         return self.courseware_summary
 
-    def get_tags_summary(self):
-        problem_blocks = self._get_course_problem_blocks()
-        courseware_summary = self._get_courseware_summary()
+    def _get_tags_student_progress(self, group_tags=False):
+        def _compute():
+            problem_blocks = self._get_course_problem_blocks()
+            courseware_summary = self._get_courseware_summary()
+            return list(tags_student_progress(self.course, self.student, problem_blocks, courseware_summary,
+                                              group_tags=group_tags))
 
-        tags = tags_student_progress(self.course, self.student, problem_blocks, courseware_summary)
+        return get_or_compute(self._get_cache_key('tags_grouped' if group_tags else 'tags'), _compute)
+
+    def get_tags_summary(self):
+        tags = self._get_tags_student_progress()
         tags_to_100 = sorted(tags, key=lambda k: "%03d_%s" % (k['percent_correct'], k['tag']))
         tags_from_100 = sorted(tags, key=lambda k: "%03d_%s" % (100 - k['percent_correct'], k['tag']))
 
@@ -51,10 +68,7 @@ class MySkillsService:
         return context
 
     def get_tags_all_data(self):
-        problem_blocks = self._get_course_problem_blocks()
-        courseware_summary = self._get_courseware_summary()
-
-        tags = tags_student_progress(self.course, self.student, problem_blocks, courseware_summary, group_tags=True)
+        tags = self._get_tags_student_progress(group_tags=True)
         tags_assessments = [v.copy() for v in tags if v['tag_is_last']]
 
         tags = convert_into_tree(tags)
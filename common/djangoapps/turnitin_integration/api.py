@@ -19,12 +19,36 @@ class TurnitinApi:
     _integration_name = 'EdxApiClient'
     _integration_version = '1.0.0'
 
-    def __init__(self, api_key):
-        main_host = "tii-sandbox.com" if api_key.use_sandbox else "turnitin.com"
-        self._host = "https://%s.%s" % (api_key.url_part, main_host)
+    def __init__(self, api_key, host=None):
+        self._host = host or self.get_host(api_key)
         self._token = api_key.key
         self._key_id = api_key.id
 
+    @staticmethod
+    def get_host(api_key):
+        if getattr(settings, 'TURNITIN_API_HOST', None):
+            return settings.TURNITIN_API_HOST
+        main_host = "tii-sandbox.com" if api_key.use_sandbox else "turnitin.com"
+        return "https://%s.%s" % (api_key.url_part, main_host)
+
+    @staticmethod
+    def get_report_settings(add_to_index, auto_exclude_self_matching_scope):
+        return {
+            "indexing_settings": {
+                "add_to_index": add_to_index
+            },
+            "generation_settings": {
+                "search_repositories": [
+                    "INTERNET",
+                    "SUBMITTED_WORK",
+                    "PUBLICATION",
+                    "CROSSREF",
+                    "CROSSREF_POSTED_CONTENT"
+                ],
+                "auto_exclude_self_matching_scope": "ALL" if auto_exclude_self_matching_scope else "NONE"
+            }
+        }
+
     def is_ext_supported(self, ext):
         return ext.lower() in self._allowed_file_formats
 
@@ -120,21 +144,7 @@ class TurnitinApi:
         return r.status_code, False
 
     def create_report(self, submission_id, add_to_index, auto_exclude_self_matching_scope):
-        data = {
-            "indexing_settings": {
-                "add_to_index": add_to_index
-            },
-            "generation_settings": {
-                "search_repositories": [
-                    "INTERNET",
-                    "SUBMITTED_WORK",
-                    "PUBLICATION",
-                    "CROSSREF",
-                    "CROSSREF_POSTED_CONTENT"
-                ],
-                "auto_exclude_self_matching_scope": "ALL" if auto_exclude_self_matching_scope else "NONE"
-            }
-        }
+        data = self.get_report_settings(add_to_index, auto_exclude_self_matching_scope)
         status_code, content = self._send_request('/submissions/' + submission_id + '/similarity',
                                                   method='put', data=data)
         if status_code == 202:
@@ -0,0 +1,110 @@
+import datetime
+import json
+
+import aiohttp
+
+from .api import TurnitinApi
+from .utils import log_action
+
+
+TURNITIN_HTTP_TIMEOUT = 60
+TURNITIN_MAX_CONNECTIONS = 100
+
+
+class AsyncTurnitinApi:
+    """
+    Asyncio version of the TurnitinApi used to process submissions in batches.
+    All clients share the aiohttp session (connection pool) of the batch and the number
+    of the parallel requests is limited per API key by the semaphore.
+    """
+
+    def __init__(self, api_key, session, semaphore, host=None):
+        self._host = host or TurnitinApi.get_host(api_key)
+        self._token = api_key.key
+        self._key_id = api_key.id
+        self._session = session
+        self._semaphore = semaphore
+
+    def _headers(self, extra=None):
+        headers = {
+            'Authorization': 'Bearer ' + self._token,
+            'X-Turnitin-Integration-Name': TurnitinApi._integration_name,
+            'X-Turnitin-Integration-Version': TurnitinApi._integration_version
+        }
+        if extra:
+            headers.update(extra)
+        return headers
+
+    async def _send_request(self, api_part, method='get', data=None, raw_data=None, headers=None):
+        url = self._host + '/api/v1' + api_part
+        if raw_data is None:
+            headers = self._headers(dict(headers or {}, **{'Content-Type': 'application/json'}))
+        else:
+            headers = self._headers(headers)
+
+        async with self._semaphore:
+            async with self._session.request(method.upper(), url, json=data, data=raw_data,
+                                             headers=headers) as r:
+                body = await r.read()
+                status_code = r.status
+
+        content = None
+        if body:
+            try:
+                content = json.loads(body)
+            except (ValueError, TypeError):
+                content = None
+        if content is None and body and 400 <= status_code <= 500:
+            log_action('turnitin_api', 'API error: ' + body.decode('utf-8', errors='ignore'), status_code=status_code)
+        return status_code, content
+
+    async def create_submission(self, owner, block_title, eula_version):
+        data = {
+            "owner": owner['id'],
+            "title": block_title,
+            "eula": {
+                "accepted_timestamp": datetime.datetime.now().replace(microsecond=0).isoformat() + 'Z',
+                "language": "en-US",
+                "version": eula_version
+            },
+            "metadata": {
+                "owners": [owner]
+            },
+            "owner_default_permission_set": "LEARNER"
+        }
+        status_code, content = await self._send_request('/submissions', method='post', data=data)
+        if status_code == 201:
+            return status_code, content
+        return status_code, None
+
+    async def upload_file(self, submission_id, file_name, file_content):
+        file_name = file_name.encode('utf-8').decode('ascii', errors='ignore')
+        status_code, _content = await self._send_request(
+            '/submissions/%s/original' % submission_id, method='put', raw_data=file_content,
+            headers={'Content-Disposition': 'inline; filename="' + file_name + '"'})
+        return status_code, status_code == 202
+
+    async def get_submission_info(self, submission_id):
+        status_code, content = await self._send_request('/submissions/' + submission_id)
+        if status_code == 200:
+            return status_code, content
+        return status_code, None
+
+    async def create_report(self, submission_id, add_to_index, auto_exclude_self_matching_scope):
+        data = TurnitinApi.get_report_settings(add_to_index, auto_exclude_self_matching_scope)
+        status_code, _content = await self._send_request('/submissions/' + submission_id + '/similarity',
+                                                         method='put', data=data)
+        return status_code, status_code == 202
+
+    async def get_report_info(self, submission_id):
+        status_code, content = await self._send_request('/submissions/' + submission_id + '/similarity')
+        if status_code == 200:
+            return status_code, content
+        return status_code, None
+
+
+def create_session(max_connections=TURNITIN_MAX_CONNECTIONS):
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=max_connections),
+        timeout=aiohttp.ClientTimeout(total=TURNITIN_HTTP_TIMEOUT)
+    )
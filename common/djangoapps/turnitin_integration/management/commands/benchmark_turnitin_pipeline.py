@@ -0,0 +1,125 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from django.core.management import BaseCommand
+from common.djangoapps.turnitin_integration.api import TurnitinApi
+from common.djangoapps.turnitin_integration.async_api import AsyncTurnitinApi, create_session
+
+
+class FakeTurnitinHandler(BaseHTTPRequestHandler):
+    """
+    Emulates Turnitin API endpoints used by the submissions pipeline.
+    Every request is answered after `latency` seconds
+    """
+
+    latency = 0.2
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _send(self, status, data=None):
+        time.sleep(self.latency)
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length)
+
+    def do_POST(self):
+        self._read_body()
+        self._send(201, {'id': str(uuid.uuid4()), 'status': 'CREATED'})
+
+    def do_PUT(self):
+        self._read_body()
+        self._send(202, {'message': 'Accepted'})
+
+    def do_GET(self):
+        if self.path.endswith('/similarity'):
+            self._send(200, {'status': 'COMPLETE', 'overall_match_percentage': 15})
+        elif self.path.endswith('/eula/latest'):
+            self._send(200, {'version': 'v1beta', 'url': 'https://example.com/eula'})
+        else:
+            self._send(200, {'id': self.path.split('/')[-1], 'status': 'COMPLETE'})
+
+
+class Command(BaseCommand):
+    """
+    Compares the sequential processing of Turnitin submissions (one blocking request at a time,
+    as it was done by the per-submission Celery tasks) with the batch processing using the asyncio client.
+    A local fake Turnitin server is used, no DB data is created.
+
+    Example:
+
+        ./manage.py lms benchmark_turnitin_pipeline --submissions 200 --keys 2 --latency 0.2
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=100, help='Number of submissions')
+        parser.add_argument('--keys', type=int, default=2, help='Number of Turnitin API keys')
+        parser.add_argument('--latency', type=float, default=0.2, help='Latency of the fake API (sec)')
+        parser.add_argument('--concurrency', type=int, default=10, help='Parallel requests per API key')
+
+    def _get_api_keys(self, num):
+        return [SimpleNamespace(id=i, key=uuid.uuid4().hex, url_part='benchmark', use_sandbox=True)
+                for i in range(num)]
+
+    def _owner(self, i):
+        return {'id': 'benchmark-user-%d' % i, 'email': 'benchmark-user-%d@example.com' % i}
+
+    def _run_sequential(self, host, api_keys, submissions):
+        for i in range(submissions):
+            api = TurnitinApi(api_keys[i % len(api_keys)], host=host)
+            owner = self._owner(i)
+            turnitin_user = SimpleNamespace(user_id_hash=owner['id'], user=SimpleNamespace(
+                email=owner['email'], first_name='', last_name=''))
+            _status_code, resp = api.create_submission(turnitin_user, 'Benchmark', 'v1beta')
+            api.upload_file(resp['id'], 'text_response.txt', b'Benchmark text response')
+            api.create_report(resp['id'], False, False)
+
+    async def _process(self, api, i):
+        _status_code, resp = await api.create_submission(self._owner(i), 'Benchmark', 'v1beta')
+        await api.upload_file(resp['id'], 'text_response.txt', b'Benchmark text response')
+        await api.get_submission_info(resp['id'])
+        await api.create_report(resp['id'], False, False)
+
+    async def _run_async(self, host, api_keys, submissions, concurrency):
+        async with create_session() as session:
+            apis = [AsyncTurnitinApi(api_key, session, asyncio.Semaphore(concurrency), host=host)
+                    for api_key in api_keys]
+            await asyncio.gather(*[self._process(apis[i % len(apis)], i) for i in range(submissions)])
+
+    def handle(self, *args, **options):
+        FakeTurnitinHandler.latency = options['latency']
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTurnitinHandler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        host = 'http://127.0.0.1:%d' % server.server_address[1]
+
+        api_keys = self._get_api_keys(options['keys'])
+        submissions = options['submissions']
+
+        try:
+            t1 = time.time()
+            self._run_sequential(host, api_keys, submissions)
+            spent_sequential = max(time.time() - t1, 0.001)
+            print('Sequential: %d submissions in %.2f sec' % (submissions, spent_sequential))
+
+            t1 = time.time()
+            asyncio.run(self._run_async(host, api_keys, submissions, options['concurrency']))
+            spent_async = max(time.time() - t1, 0.001)
+            print('Async batch: %d submissions in %.2f sec (x%.1f)'
+                  % (submissions, spent_async, spent_sequential / spent_async))
+        finally:
+            server.shutdown()
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.13 on 2026-10-18 16:00
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import Q
+from django.utils import timezone
+
+
+def schedule_existing_submissions(apps, schema_editor):
+    # files of the submissions created in Turnitin before the pipeline was introduced were already uploaded,
+    # the recent unfinished submissions are scheduled to be processed (or polled) by the pipeline
+    TurnitinSubmission = apps.get_model("turnitin_integration", "TurnitinSubmission")
+    now = timezone.now()
+    TurnitinSubmission.objects.exclude(status='-').update(file_uploaded=True)
+    TurnitinSubmission.objects.filter(creation_time__gte=now - datetime.timedelta(days=2)).filter(
+        Q(status__in=['-', 'CREATED', 'PROCESSING']) | Q(status='COMPLETE', report_status__in=['', 'PROCESSING'])
+    ).update(next_check_time=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turnitin_integration', '0002_auto_20201112_1347'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='turnitinsubmission',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='turnitinsubmission',
+            name='file_uploaded',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='turnitinsubmission',
+            name='next_check_time',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(
+            schedule_existing_submissions,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -52,6 +52,9 @@ class TurnitinSubmission(models.Model):
     report_status = models.CharField(max_length=30, default=TurnitinReportStatus.NOT_SET)
     creation_time = models.DateTimeField(null=True, blank=True, auto_now_add=True)
     update_time = models.DateTimeField(null=True, blank=True, auto_now=True)
+    file_uploaded = models.BooleanField(default=False)
+    attempts = models.IntegerField(default=0)
+    next_check_time = models.DateTimeField(null=True, blank=True, db_index=True)
 
     def get_data(self):
         if self.data:
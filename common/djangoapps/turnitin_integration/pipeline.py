@@ -0,0 +1,335 @@
+import asyncio
+import datetime
+import os
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from opaque_keys.edx.keys import UsageKey
+from xmodule.modulestore.django import modulestore
+from openedx.core.djangoapps.content.block_structure.models import BlockToSequential
+from openassessment.fileupload.backends.s3 import Backend as S3Backend
+from common.djangoapps.credo_modules.task_repeater import get_countdown
+from .api import TurnitinApi
+from .async_api import AsyncTurnitinApi, create_session
+from .models import TurnitinSubmission, TurnitinSubmissionStatus, TurnitinReportStatus, TurnitinUser
+from .utils import log_action
+
+
+TURNITIN_BATCH_SIZE = 200
+TURNITIN_MAX_CONCURRENCY_PER_KEY = 10
+TURNITIN_MAX_ATTEMPTS = 7
+# time to wait for the webhook before the status is requested from the API
+TURNITIN_POLL_DELAY = 120
+TURNITIN_POLL_INTERVAL = 300
+TURNITIN_POLL_MAX_AGE = 60 * 60 * 24 * 2
+TURNITIN_LEASE_TIME = 60 * 10
+
+ACTION_UPLOAD = 'upload'
+ACTION_CHECK_SUBMISSION = 'check_submission'
+ACTION_CREATE_REPORT = 'create_report'
+ACTION_CHECK_REPORT = 'check_report'
+
+
+def get_submission_action(sub):
+    if not sub.file_uploaded and sub.status == TurnitinSubmissionStatus.NOT_SET:
+        return ACTION_UPLOAD
+    if sub.status in (TurnitinSubmissionStatus.NOT_SET, TurnitinSubmissionStatus.CREATED,
+                      TurnitinSubmissionStatus.PROCESSING):
+        return ACTION_CHECK_SUBMISSION
+    if sub.status == TurnitinSubmissionStatus.COMPLETE:
+        if sub.report_status == TurnitinReportStatus.NOT_SET:
+            return ACTION_CREATE_REPORT
+        if sub.report_status == TurnitinReportStatus.IN_PROGRESS:
+            return ACTION_CHECK_REPORT
+    return None
+
+
+class SubmissionJob:
+
+    def __init__(self, sub, action):
+        self.sub = sub
+        self.action = action
+        self.update_time = sub.update_time
+        self.owner = None
+        self.title = None
+        self.eula_version = None
+        self.add_to_index = False
+        self.auto_exclude_self_matching_scope = False
+        self.remove = False
+        self.error = None
+
+
+class TurnitinSubmissionsProcessor:
+    """
+    Processes all due Turnitin submissions (see `next_check_time`) in batches:
+    creates submissions and uploads files, creates similarity reports and polls the API
+    for the statuses which weren't received through the webhooks.
+
+    All DB work is done synchronously before and after the batch, the HTTP requests of the batch
+    are sent in parallel using asyncio (not more than TURNITIN_MAX_CONCURRENCY_PER_KEY per API key).
+    """
+
+    def __init__(self, batch_size=TURNITIN_BATCH_SIZE, host=None):
+        self.batch_size = batch_size
+        self.max_concurrency = getattr(settings, 'TURNITIN_MAX_CONCURRENCY_PER_KEY', TURNITIN_MAX_CONCURRENCY_PER_KEY)
+        self.host = host
+        self._blocks = {}
+        self.stats = {'processed': 0, 'errors': 0}
+
+    def _claim_due_submissions(self):
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(TurnitinSubmission.objects.select_for_update(skip_locked=True).filter(
+                next_check_time__lte=now).order_by('next_check_time').values_list('id', flat=True)[:self.batch_size])
+            if ids:
+                TurnitinSubmission.objects.filter(id__in=ids).update(
+                    next_check_time=now + datetime.timedelta(seconds=TURNITIN_LEASE_TIME))
+        return list(TurnitinSubmission.objects.filter(id__in=ids).select_related('api_key', 'user'))
+
+    def _get_block_info(self, block_id):
+        if block_id not in self._blocks:
+            usage_key = UsageKey.from_string(block_id)
+            block = modulestore().get_item(usage_key)
+            display_name = block.display_name
+            b2s = BlockToSequential.objects.filter(course_id=str(usage_key.course_key), block_id=block_id).first()
+            if b2s:
+                display_name = b2s.sequential_name + ': ' + block.display_name
+            self._blocks[block_id] = (display_name, block.turnitin_config.get('add_to_index', False),
+                                      block.turnitin_config.get('auto_exclude_self_matching_scope', False))
+        return self._blocks[block_id]
+
+    def _get_turnitin_users(self, user_ids):
+        turnitin_users = {}
+        for turnitin_user in TurnitinUser.objects.filter(user_id__in=user_ids):
+            turnitin_users.setdefault(turnitin_user.user_id, turnitin_user)
+        for user_id in user_ids:
+            if user_id not in turnitin_users:
+                turnitin_user = TurnitinUser(user_id=user_id, user_id_hash=str(uuid.uuid4()))
+                turnitin_user.save()
+                turnitin_users[user_id] = turnitin_user
+        return turnitin_users
+
+    def _prepare_jobs(self, submissions):
+        jobs = []
+        upload_user_ids = set(s.user_id for s in submissions if get_submission_action(s) == ACTION_UPLOAD
+                              and s.turnitin_submission_id == '-')
+        turnitin_users = self._get_turnitin_users(upload_user_ids) if upload_user_ids else {}
+        cache = caches['default']
+        eula_versions = {}
+
+        for sub in submissions:
+            action = get_submission_action(sub)
+            job = SubmissionJob(sub, action)
+            jobs.append(job)
+            if action is None:
+                continue
+            if not sub.api_key.is_active:
+                job.action = None
+                log_action('turnitin_task', 'Turnitin API key is inactive', key_id=sub.api_key_id,
+                           ora_submission_uuid=sub.ora_submission_id, item_id=sub.block_id, user_id=sub.user_id)
+                continue
+            if action in (ACTION_CHECK_SUBMISSION, ACTION_CHECK_REPORT) and sub.creation_time \
+                    and (timezone.now() - sub.creation_time).total_seconds() > TURNITIN_POLL_MAX_AGE:
+                job.action = None
+                log_action('turnitin_task', 'Stop polling of the submission status',
+                           turnitin_submission_id=sub.turnitin_submission_id)
+                continue
+            try:
+                title, job.add_to_index, job.auto_exclude_self_matching_scope = self._get_block_info(sub.block_id)
+                if action == ACTION_UPLOAD and sub.turnitin_submission_id == '-':
+                    filename = sub.file_name if sub.file_name else 'text_response.txt'
+                    job.title = title + ' [' + filename + ']'
+                    turnitin_user = turnitin_users[sub.user_id]
+                    job.owner = {
+                        "id": turnitin_user.user_id_hash,
+                        "email": sub.user.email
+                    }
+                    if sub.user.first_name:
+                        job.owner['given_name'] = sub.user.first_name
+                    if sub.user.last_name:
+                        job.owner['family_name'] = sub.user.last_name
+                    job.eula_version = cache.get('eula_version_' + str(sub.user_id))
+                    if not job.eula_version:
+                        if sub.api_key_id not in eula_versions:
+                            eula_versions[sub.api_key_id], _eula_url = TurnitinApi(
+                                sub.api_key, host=self.host).get_eula_version()
+                        job.eula_version = eula_versions[sub.api_key_id]
+            except Exception as exc:  # pylint: disable=broad-except
+                job.error = str(exc)
+        return jobs
+
+    def _read_file(self, s3_key):
+        s3_backend = S3Backend()
+        if not s3_backend.check_key_exists(s3_key):
+            return None
+        tf = tempfile.NamedTemporaryFile(delete=False)
+        try:
+            s3_backend.save_key_content_into_file(s3_key, tf)
+            tf.close()
+            with open(tf.name, 'rb') as f:
+                return f.read()
+        finally:
+            tf.close()
+            os.remove(tf.name)
+
+    async def _upload(self, job, api):
+        sub = job.sub
+        data = sub.get_data()
+        filename = sub.file_name if sub.file_name else 'text_response.txt'
+        if sub.file_name:
+            # S3 client is blocking
+            content = await asyncio.get_running_loop().run_in_executor(None, self._read_file, data['file_key'])
+            if content is None:
+                job.remove = True
+                return
+        else:
+            content = data['text_response'].encode('utf-8')
+
+        if sub.turnitin_submission_id == '-':
+            status_code, resp = await api.create_submission(job.owner, job.title, job.eula_version)
+            log_action('turnitin_task', 'API create_submission response for file: ' + filename,
+                       ora_submission_uuid=sub.ora_submission_id, item_id=sub.block_id, user_id=sub.user_id,
+                       turnitin_submission_id=resp['id'] if resp else None, success=bool(resp),
+                       status_code=status_code)
+            if not resp:
+                raise Exception("Can't create submission using Turnitin API: status_code=" + str(status_code))
+            sub.turnitin_submission_id = resp['id']
+
+        status_code, uploaded = await api.upload_file(sub.turnitin_submission_id, filename, content)
+        log_action('turnitin_task', 'API upload_file response for file: ' + filename,
+                   ora_submission_uuid=sub.ora_submission_id, item_id=sub.block_id, user_id=sub.user_id,
+                   turnitin_submission_id=sub.turnitin_submission_id, status_code=status_code)
+        if not uploaded:
+            raise Exception("Can't upload file " + filename + " using Turnitin API: status_code=" + str(status_code))
+        sub.file_uploaded = True
+        sub.status = TurnitinSubmissionStatus.CREATED
+        sub.next_check_time = timezone.now() + datetime.timedelta(seconds=TURNITIN_POLL_DELAY)
+
+    async def _check_submission(self, job, api):
+        sub = job.sub
+        status_code, resp = await api.get_submission_info(sub.turnitin_submission_id)
+        if not resp:
+            raise Exception("Can't get submission info using Turnitin API: status_code=" + str(status_code))
+        sub.status = resp['status']
+        sub.update_data({'submission': resp})
+        if sub.status == TurnitinSubmissionStatus.COMPLETE:
+            await self._create_report(job, api)
+        elif sub.status == TurnitinSubmissionStatus.ERROR:
+            sub.next_check_time = None
+        else:
+            sub.next_check_time = timezone.now() + datetime.timedelta(seconds=TURNITIN_POLL_INTERVAL)
+
+    async def _create_report(self, job, api):
+        sub = job.sub
+        status_code, result = await api.create_report(sub.turnitin_submission_id, job.add_to_index,
+                                                      job.auto_exclude_self_matching_scope)
+        log_action('turnitin_task', 'API create_report response for turnitin_submission_id: '
+                   + sub.turnitin_submission_id, status_code=status_code)
+        if not result:
+            raise Exception("Can't create report using Turnitin API: status_code=" + str(status_code))
+        sub.report_status = TurnitinReportStatus.IN_PROGRESS
+        sub.next_check_time = timezone.now() + datetime.timedelta(seconds=TURNITIN_POLL_DELAY)
+
+    async def _check_report(self, job, api):
+        sub = job.sub
+        status_code, resp = await api.get_report_info(sub.turnitin_submission_id)
+        if not resp:
+            raise Exception("Can't get report info using Turnitin API: status_code=" + str(status_code))
+        if resp.get('status') == TurnitinReportStatus.COMPLETE:
+            sub.report_status = TurnitinReportStatus.COMPLETE
+            sub.update_data({'report': dict(resp, submission_id=sub.turnitin_submission_id)})
+            sub.next_check_time = None
+        else:
+            sub.next_check_time = timezone.now() + datetime.timedelta(seconds=TURNITIN_POLL_INTERVAL)
+
+    async def _run_job(self, job, api):
+        handlers = {
+            ACTION_UPLOAD: self._upload,
+            ACTION_CHECK_SUBMISSION: self._check_submission,
+            ACTION_CREATE_REPORT: self._create_report,
+            ACTION_CHECK_REPORT: self._check_report,
+        }
+        try:
+            await handlers[job.action](job, api)
+        except Exception as exc:  # pylint: disable=broad-except
+            job.error = str(exc)
+
+    async def _run_jobs(self, jobs):
+        async with create_session() as session:
+            apis = {}
+            coroutines = []
+            for job in jobs:
+                if job.action is None or job.error:
+                    continue
+                api_key = job.sub.api_key
+                if api_key.id not in apis:
+                    apis[api_key.id] = AsyncTurnitinApi(api_key, session, asyncio.Semaphore(self.max_concurrency),
+                                                        host=self.host)
+                coroutines.append(self._run_job(job, apis[api_key.id]))
+            await asyncio.gather(*coroutines)
+
+    def _save_job(self, job):
+        sub = job.sub
+        if job.remove:
+            log_action('turnitin_task', 'File not found in S3, remove submission',
+                       ora_submission_uuid=sub.ora_submission_id, item_id=sub.block_id, user_id=sub.user_id)
+            sub.delete()
+            return
+        if job.action is None:
+            sub.next_check_time = None
+        elif job.error:
+            self.stats['errors'] = self.stats['errors'] + 1
+            sub.attempts = sub.attempts + 1
+            log_action('turnitin_task', 'Submission processing error: ' + job.error, action=job.action,
+                       ora_submission_uuid=sub.ora_submission_id, item_id=sub.block_id, user_id=sub.user_id,
+                       turnitin_submission_id=sub.turnitin_submission_id, attempt=sub.attempts)
+            if sub.attempts >= TURNITIN_MAX_ATTEMPTS:
+                sub.next_check_time = None
+            else:
+                sub.next_check_time = timezone.now() + datetime.timedelta(seconds=get_countdown(sub.attempts))
+        else:
+            sub.attempts = 0
+
+        # webhooks could update the submission while the batch was processed, their data has priority
+        updated = TurnitinSubmission.objects.filter(id=sub.id, update_time=job.update_time).update(
+            turnitin_submission_id=sub.turnitin_submission_id,
+            status=sub.status,
+            report_status=sub.report_status,
+            data=sub.data,
+            file_uploaded=sub.file_uploaded,
+            attempts=sub.attempts,
+            next_check_time=sub.next_check_time,
+            update_time=timezone.now()
+        )
+        if not updated:
+            log_action('turnitin_task', 'Submission was updated during processing', action=job.action,
+                       turnitin_submission_id=sub.turnitin_submission_id)
+
+    def process_batch(self):
+        """
+        Processes one batch of the due submissions. Returns number of the processed submissions
+        """
+        submissions = self._claim_due_submissions()
+        if not submissions:
+            return 0
+        jobs = self._prepare_jobs(submissions)
+        asyncio.run(self._run_jobs(jobs))
+        for job in jobs:
+            self._save_job(job)
+        self.stats['processed'] = self.stats['processed'] + len(jobs)
+        return len(jobs)
+
+    def run(self):
+        while self.process_batch() >= self.batch_size:
+            pass
+        log_action('turnitin_task', 'Turnitin submissions processed', **self.stats)
+        return self.stats
+
+    @staticmethod
+    def get_next_check_time():
+        return TurnitinSubmission.objects.filter(next_check_time__isnull=False)\
+            .order_by('next_check_time').values_list('next_check_time', flat=True).first()
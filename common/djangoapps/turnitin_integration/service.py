@@ -1,12 +1,13 @@
 from django.conf import settings
 from django.db import transaction
+from django.utils import timezone
 from django.urls import reverse
 from common.djangoapps.credo_modules.models import Organization
 from common.djangoapps.student.models import AnonymousUserId
 from opaque_keys.edx.keys import CourseKey
 from .models import TurnitinApiKey, TurnitinSubmission, TurnitinSubmissionStatus, TurnitinReportStatus
 from .api import TurnitinApi
-from .tasks import turnitin_create_submissions
+from .tasks import schedule_turnitin_processing
 from .utils import log_action
 
 
@@ -81,6 +82,7 @@ def create_submissions(submission_uuid, student_item_dict, submission_answer):
                 turnitin_submission_id='-',
                 user=user,
                 status='-',
+                next_check_time=timezone.now(),
             )
             t_sub.set_data({
                 'text_response': text_response,
@@ -110,6 +112,7 @@ def create_submissions(submission_uuid, student_item_dict, submission_answer):
                         turnitin_submission_id='-',
                         user=user,
                         status='-',
+                        next_check_time=timezone.now(),
                     )
                     t_sub.set_data({
                         'file_num': idx,
@@ -117,8 +120,7 @@ def create_submissions(submission_uuid, student_item_dict, submission_answer):
                     })
                     t_sub.save()
 
-    transaction.on_commit(lambda: turnitin_create_submissions.delay(turnitin_key.id, submission_uuid,
-                                                                    course_id, item_id, user.id))
+    transaction.on_commit(schedule_turnitin_processing)
 
 
 def get_submissions_status(ora_submission_id, display_score=True):
@@ -0,0 +1,226 @@
+"""
+Tests for the batch processing of the Turnitin submissions
+"""
+
+
+import datetime
+import threading
+from http.server import ThreadingHTTPServer
+from importlib import import_module
+from unittest.mock import patch
+
+from django.apps import apps
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from common.djangoapps.credo_modules.models import Organization
+from common.djangoapps.student.tests.factories import UserFactory
+from common.djangoapps.turnitin_integration.api import TurnitinApi
+from common.djangoapps.turnitin_integration.management.commands.benchmark_turnitin_pipeline import (
+    FakeTurnitinHandler
+)
+from common.djangoapps.turnitin_integration.models import (
+    TurnitinApiKey,
+    TurnitinReportStatus,
+    TurnitinSubmission,
+    TurnitinSubmissionStatus
+)
+from common.djangoapps.turnitin_integration.pipeline import TurnitinSubmissionsProcessor
+from common.djangoapps.turnitin_integration.tasks import (
+    TURNITIN_PROCESSING_SCHEDULE_KEY,
+    schedule_due_turnitin_processing,
+    schedule_turnitin_processing
+)
+from openedx.core.djangolib.testing.utils import CacheIsolationTestCase
+
+BLOCK_ID = 'block-v1:org+course+run+type@openassessment+block@ora'
+
+
+class RecordingTurnitinHandler(FakeTurnitinHandler):
+    """
+    Fake Turnitin API which answers immediately and records the requests
+    """
+
+    latency = 0
+    requests = []
+
+    def _send(self, status, data=None):
+        self.requests.append((self.command, self.path.replace('/api/v1', '', 1)))
+        super()._send(status, data)
+
+
+def create_api_key(org='org'):
+    with patch.object(TurnitinApi, 'create_webhook', return_value=(201, 'webhook', 'https://example.com')):
+        return TurnitinApiKey.objects.create(is_active=True, org=Organization.objects.create(org=org),
+                                             key='token', url_part='test')
+
+
+def create_submission(api_key, user, **kwargs):
+    kwargs.setdefault('status', TurnitinSubmissionStatus.NOT_SET)
+    sub = TurnitinSubmission(api_key=api_key, block_id=BLOCK_ID, ora_submission_id='ora-submission',
+                             turnitin_submission_id='-', user=user, **kwargs)
+    sub.set_data({'text_response': 'Text response'})
+    sub.save()
+    return sub
+
+
+class TurnitinSubmissionsProcessorTest(TestCase):
+    """
+    Tests for TurnitinSubmissionsProcessor using a local fake Turnitin server
+    """
+
+    def setUp(self):
+        super().setUp()
+        RecordingTurnitinHandler.requests = []
+        server = ThreadingHTTPServer(('127.0.0.1', 0), RecordingTurnitinHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.host = 'http://127.0.0.1:%d' % server.server_address[1]
+
+        patcher = patch.object(TurnitinSubmissionsProcessor, '_get_block_info', return_value=('Quiz', False, False))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.api_key = create_api_key()
+        self.sub = create_submission(self.api_key, UserFactory.create(), next_check_time=timezone.now())
+
+    def _process_due(self):
+        TurnitinSubmission.objects.filter(id=self.sub.id).update(next_check_time=timezone.now())
+        RecordingTurnitinHandler.requests = []
+        assert TurnitinSubmissionsProcessor(host=self.host).process_batch() == 1
+        self.sub.refresh_from_db()
+        return RecordingTurnitinHandler.requests
+
+    def test_upload_poll_and_report(self):
+        requests = self._process_due()
+        turnitin_submission_id = self.sub.turnitin_submission_id
+        assert requests == [
+            ('GET', '/eula/latest'),
+            ('POST', '/submissions'),
+            ('PUT', '/submissions/%s/original' % turnitin_submission_id),
+        ]
+        assert self.sub.file_uploaded
+        assert self.sub.status == TurnitinSubmissionStatus.CREATED
+        assert self.sub.next_check_time > timezone.now()
+
+        # the webhook didn't arrive: the submission status is requested and the report is created
+        requests = self._process_due()
+        assert requests == [
+            ('GET', '/submissions/' + turnitin_submission_id),
+            ('PUT', '/submissions/%s/similarity' % turnitin_submission_id),
+        ]
+        assert self.sub.status == TurnitinSubmissionStatus.COMPLETE
+        assert self.sub.report_status == TurnitinReportStatus.IN_PROGRESS
+
+        requests = self._process_due()
+        assert requests == [('GET', '/submissions/%s/similarity' % turnitin_submission_id)]
+        assert self.sub.report_status == TurnitinReportStatus.COMPLETE
+        assert self.sub.next_check_time is None
+        data = self.sub.get_data()
+        assert data['text_response'] == 'Text response'
+        assert data['submission']['status'] == TurnitinSubmissionStatus.COMPLETE
+        assert data['report']['overall_match_percentage'] == 15
+
+    def test_api_error_is_retried(self):
+        def do_post(handler):
+            handler._read_body()  # pylint: disable=protected-access
+            handler._send(500, {'message': 'Server Error'})  # pylint: disable=protected-access
+
+        with patch.object(RecordingTurnitinHandler, 'do_POST', do_post):
+            self._process_due()
+        assert self.sub.attempts == 1
+        assert self.sub.status == TurnitinSubmissionStatus.NOT_SET
+        assert self.sub.next_check_time > timezone.now()
+
+        self._process_due()
+        assert self.sub.attempts == 0
+        assert self.sub.status == TurnitinSubmissionStatus.CREATED
+
+    def test_submission_updated_during_processing(self):
+        processor = TurnitinSubmissionsProcessor(host=self.host)
+        submissions = processor._claim_due_submissions()  # pylint: disable=protected-access
+        jobs = processor._prepare_jobs(submissions)  # pylint: disable=protected-access
+        # the webhook data is saved while the batch is processed
+        sub = TurnitinSubmission.objects.get(id=self.sub.id)
+        sub.status = TurnitinSubmissionStatus.ERROR
+        sub.save()
+
+        for job in jobs:
+            job.sub.status = TurnitinSubmissionStatus.CREATED
+            processor._save_job(job)  # pylint: disable=protected-access
+        self.sub.refresh_from_db()
+        assert self.sub.status == TurnitinSubmissionStatus.ERROR
+
+
+class ScheduleTurnitinProcessingTest(CacheIsolationTestCase):
+    """
+    Tests for schedule_turnitin_processing
+    """
+    ENABLED_CACHES = ['default']
+
+    @patch('common.djangoapps.turnitin_integration.tasks.turnitin_process_submissions.apply_async')
+    def test_task_is_scheduled_once(self, mock_apply_async):
+        now = timezone.now()
+        schedule_turnitin_processing(now + datetime.timedelta(seconds=300))
+        schedule_turnitin_processing(now + datetime.timedelta(seconds=600))
+        assert mock_apply_async.call_count == 1
+
+        # the task is scheduled again if it must be run earlier
+        schedule_turnitin_processing(now)
+        assert mock_apply_async.call_count == 2
+        assert mock_apply_async.call_args[1]['countdown'] <= 1
+
+    @patch('common.djangoapps.turnitin_integration.tasks.turnitin_process_submissions.apply_async')
+    def test_lost_task_is_rescheduled(self, mock_apply_async):
+        assert schedule_due_turnitin_processing() is None
+        assert not mock_apply_async.called
+
+        create_submission(create_api_key(), UserFactory.create(), next_check_time=timezone.now())
+        schedule_turnitin_processing()
+        assert mock_apply_async.call_count == 1
+        # the task is started (the schedule key is removed) but the worker is stopped
+        cache.delete(TURNITIN_PROCESSING_SCHEDULE_KEY)
+
+        assert schedule_due_turnitin_processing() is not None
+        assert mock_apply_async.call_count == 2
+        # the periodic task doesn't schedule the processing again while the task is scheduled
+        schedule_due_turnitin_processing()
+        assert mock_apply_async.call_count == 2
+
+
+class ScheduleExistingSubmissionsMigrationTest(TestCase):
+    """
+    Tests for the data migration which prepares the submissions created before the pipeline was introduced
+    """
+
+    def test_migration(self):
+        migration = import_module('common.djangoapps.turnitin_integration.migrations.'
+                                  '0003_turnitinsubmission_next_check_time')
+        api_key = create_api_key()
+        user = UserFactory.create()
+        states = {
+            'not_uploaded': (TurnitinSubmissionStatus.NOT_SET, TurnitinReportStatus.NOT_SET),
+            'processing': (TurnitinSubmissionStatus.PROCESSING, TurnitinReportStatus.NOT_SET),
+            'no_report': (TurnitinSubmissionStatus.COMPLETE, TurnitinReportStatus.NOT_SET),
+            'report_processing': (TurnitinSubmissionStatus.COMPLETE, TurnitinReportStatus.IN_PROGRESS),
+            'finished': (TurnitinSubmissionStatus.COMPLETE, TurnitinReportStatus.COMPLETE),
+            'error': (TurnitinSubmissionStatus.ERROR, TurnitinReportStatus.NOT_SET),
+        }
+        subs = {}
+        for name, (status, report_status) in states.items():
+            subs[name] = create_submission(api_key, user, status=status, report_status=report_status)
+        subs['old'] = create_submission(api_key, user, status=TurnitinSubmissionStatus.PROCESSING)
+        TurnitinSubmission.objects.filter(id=subs['old'].id).update(
+            creation_time=timezone.now() - datetime.timedelta(days=3))
+
+        migration.schedule_existing_submissions(apps, None)
+
+        for sub in subs.values():
+            sub.refresh_from_db()
+        assert {name for name, sub in subs.items() if sub.file_uploaded} == {
+            'processing', 'no_report', 'report_processing', 'finished', 'error', 'old'}
+        assert {name for name, sub in subs.items() if sub.next_check_time} == {
+            'not_uploaded', 'processing', 'no_report', 'report_processing'}
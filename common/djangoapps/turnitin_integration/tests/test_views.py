@@ -0,0 +1,82 @@
+"""
+Tests for the Turnitin webhooks
+"""
+
+
+import json
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from common.djangoapps.student.tests.factories import UserFactory
+from common.djangoapps.turnitin_integration.models import (
+    TurnitinReportStatus,
+    TurnitinSubmission,
+    TurnitinSubmissionStatus
+)
+from common.djangoapps.turnitin_integration.utils import generate_hmac256_signature
+
+from .test_pipeline import create_api_key, create_submission
+
+
+@override_settings(TURNITIN_SIGNING_SECRET='secret')
+class TurnitinCallbackTest(TestCase):
+    """
+    Tests for turnitin_callback
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.sub = create_submission(create_api_key(), UserFactory.create(),
+                                     status=TurnitinSubmissionStatus.CREATED, file_uploaded=True)
+        self.sub.turnitin_submission_id = 'turnitin-submission'
+        self.sub.save()
+        patcher = patch('common.djangoapps.turnitin_integration.views.schedule_turnitin_processing')
+        self.mock_schedule = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _callback(self, event_type, data):
+        body = json.dumps(data).encode('utf-8')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('turnitin_callback'), body, content_type='application/json',
+                                        HTTP_X_TURNITIN_SIGNATURE=generate_hmac256_signature(body),
+                                        HTTP_X_TURNITIN_EVENTTYPE=event_type)
+        assert response.status_code == 200
+        self.sub.refresh_from_db()
+
+    def test_data_is_merged(self):
+        self._callback('SUBMISSION_COMPLETE', {'id': 'turnitin-submission', 'status': 'COMPLETE'})
+        assert self.sub.status == TurnitinSubmissionStatus.COMPLETE
+        assert self.sub.next_check_time is not None
+        assert self.mock_schedule.called
+
+        self._callback('SIMILARITY_COMPLETE', {'submission_id': 'turnitin-submission', 'status': 'COMPLETE',
+                                               'overall_match_percentage': 15})
+        assert self.sub.report_status == TurnitinReportStatus.COMPLETE
+        assert self.sub.next_check_time is None
+        assert self.sub.get_data() == {
+            'text_response': 'Text response',
+            'submission': {'id': 'turnitin-submission', 'status': 'COMPLETE'},
+            'report': {'submission_id': 'turnitin-submission', 'status': 'COMPLETE', 'overall_match_percentage': 15},
+        }
+
+        # the updated report replaces the previous one
+        self._callback('SIMILARITY_UPDATED', {'submission_id': 'turnitin-submission', 'status': 'COMPLETE',
+                                              'overall_match_percentage': 20})
+        data = self.sub.get_data()
+        assert data['report']['overall_match_percentage'] == 20
+        assert data['submission'] == {'id': 'turnitin-submission', 'status': 'COMPLETE'}
+
+    def test_submission_error(self):
+        self._callback('SUBMISSION_COMPLETE', {'id': 'turnitin-submission', 'status': 'ERROR'})
+        assert self.sub.status == TurnitinSubmissionStatus.ERROR
+        assert self.sub.next_check_time is None
+        assert self.sub.get_data()['text_response'] == 'Text response'
+        assert not self.mock_schedule.called
+
+    def test_invalid_signature(self):
+        response = self.client.post(reverse('turnitin_callback'), '{}', content_type='application/json',
+                                    HTTP_X_TURNITIN_SIGNATURE='invalid', HTTP_X_TURNITIN_EVENTTYPE='SUBMISSION_COMPLETE')
+        assert response.status_code == 403
+        assert TurnitinSubmission.objects.get(id=self.sub.id).status == TurnitinSubmissionStatus.CREATED
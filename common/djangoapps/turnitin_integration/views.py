@@ -5,11 +5,12 @@ from django.contrib.auth.decorators import login_required
 from django.db import transaction
 from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
 from django.shortcuts import redirect
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from .api import TurnitinApi
 from .models import TurnitinApiKey, TurnitinSubmission, TurnitinReportStatus, TurnitinUser
-from .tasks import turnitin_generate_report
+from .tasks import schedule_turnitin_processing
 from .utils import generate_hmac256_signature, log_action
 
 
@@ -110,11 +111,16 @@ def _submission_complete_callback(data):
         return HttpResponseBadRequest("Api Key is inactive")
 
     turnitin_submission.status = data['status']
-    turnitin_submission.set_data({'submission': data})
+    turnitin_submission.update_data({'submission': data})
+    turnitin_submission.file_uploaded = True
+    if data['status'] != 'ERROR':
+        # the report is created by the submissions pipeline
+        turnitin_submission.next_check_time = timezone.now()
+        transaction.on_commit(schedule_turnitin_processing)
+    else:
+        turnitin_submission.next_check_time = None
     turnitin_submission.save()
 
-    if data['status'] != 'ERROR':
-        transaction.on_commit(lambda: turnitin_generate_report.delay(data['id']))
     return HttpResponse(status=200)
 
 
@@ -129,6 +135,7 @@ def _similarity_complete_callback(data, event_type):
 
     turnitin_submission.report_status = TurnitinReportStatus.COMPLETE
     turnitin_submission.update_data({'report': data})
+    turnitin_submission.next_check_time = None
     turnitin_submission.save()
 
     return HttpResponse(status=200)
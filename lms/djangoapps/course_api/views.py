@@ -635,7 +635,7 @@ class UpdateCourseStructureView(APIView):
         if not course_id:
             return Response({'success': False, 'error': "course_id is not set"})
 
-        update_course_structure(course_id)
+        update_course_structure(course_id, incremental=False)
         return Response({'success': True})
 
 
@@ -0,0 +1,144 @@
+"""
+Rendering and sending of the emails with the learner's scores for the block.
+
+The breadcrumbs of the block are the same for all mailings of the block:
+they are cached, so the course and the block aren't loaded from the modulestore for every email.
+"""
+import json
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.template import engines
+from opaque_keys.edx.keys import CourseKey, UsageKey
+from xmodule.modulestore.django import modulestore
+
+from common.djangoapps.credo_modules.models import SendScoresMailing
+from common.djangoapps.edxmako import Engines
+from openedx.core.djangoapps.site_configuration import helpers as configuration_helpers
+
+try:
+    from premailer import transform
+except ImportError:
+    transform = None
+
+
+log = logging.getLogger("edx.courseware")
+
+SCORES_EMAIL_HTML_TEMPLATE = 'emails/email_scores.html'
+SCORES_EMAIL_TEXT_TEMPLATE = 'emails/email_scores.txt'
+SCORES_EMAIL_SUBJECT = 'Credo Assessment Results: '
+SCORES_EMAIL_PRIVACY_URL = 'https://modules.zendesk.com/hc/en-us/articles/115005329466-Data-Privacy-FERPA-Security'
+SCORES_EMAIL_BLOCK_CACHE_TIMEOUT = 60 * 5
+
+
+def _block_context_cache_key(course_id, usage_id):
+    return 'scores_email_block:%s:%s' % (str(course_id), str(usage_id))
+
+
+def get_scores_email_block_context(course_id, usage_id):
+    """
+    Returns the part of the email context which depends only on the block (breadcrumbs and section name)
+    """
+    cache_key = _block_context_cache_key(course_id, usage_id)
+    block_context = cache.get(cache_key)
+    if block_context is not None:
+        return block_context
+
+    course_key = CourseKey.from_string(course_id)
+    usage_key = UsageKey.from_string(usage_id)
+
+    course = modulestore().get_course(course_key, depth=0)
+    breadcrumbs = []
+
+    org_name = course.display_organization
+    if not org_name:
+        org_name = course_key.org
+    breadcrumbs.append(org_name.strip())
+
+    course_name = course.display_name
+    if not course_name:
+        course_name = course_key.course
+    breadcrumbs.append(course_name.strip())
+
+    item = modulestore().get_item(usage_key)
+    parent = item.get_parent()
+    if parent.display_name != item.display_name:
+        breadcrumbs.append(parent.display_name)
+    breadcrumbs.append(item.display_name)
+
+    block_context = {
+        'breadcrumbs': breadcrumbs,
+        'breadcrumbs_len': len(breadcrumbs) - 1,
+        'section_display_name': item.display_name,
+    }
+    cache.set(cache_key, block_context, SCORES_EMAIL_BLOCK_CACHE_TIMEOUT)
+    return block_context
+
+
+class ScoresEmailRenderer:
+    """
+    Renders the scores emails of the block.
+    Everything except the scores is prepared in the constructor.
+    """
+
+    def __init__(self, course_id, usage_id):
+        self.common_context = {
+            'lms_url': configuration_helpers.get_value('LMS_ROOT_URL', settings.LMS_ROOT_URL),
+            'platform_name': configuration_helpers.get_value('PLATFORM_NAME', settings.PLATFORM_NAME),
+            'support_url': configuration_helpers.get_value('SUPPORT_SITE_LINK', settings.SUPPORT_SITE_LINK),
+            'support_email': configuration_helpers.get_value('CONTACT_EMAIL', settings.CONTACT_EMAIL),
+            'current_year': datetime.now().year,
+            'privacy_url': SCORES_EMAIL_PRIVACY_URL,
+            'use_static': True
+        }
+        self.common_context.update(get_scores_email_block_context(course_id, usage_id))
+        self.subject = SCORES_EMAIL_SUBJECT + self.common_context['section_display_name']
+
+        engine = engines[Engines.MAKO]
+        self._html_template = engine.get_template(SCORES_EMAIL_HTML_TEMPLATE)
+        self._text_template = engine.get_template(SCORES_EMAIL_TEXT_TEMPLATE)
+
+    def get_context(self, scores):
+        context = dict(self.common_context)
+        context['scores'] = scores
+        return context
+
+    def render_html(self, context):
+        html_email = self._html_template.render(context)
+        if transform:
+            html_email = transform(html_email)
+        return html_email
+
+    def render_text(self, context):
+        return self._text_template.render(context)
+
+
+def send_scores_email(course_id, usage_id, mailing_id, emails, from_address=None):
+    """
+    Renders and sends the scores email of the mailing.
+    Returns False if the mailing is not found, SMTP errors are raised
+    """
+    mailing = SendScoresMailing.objects.filter(id=mailing_id).first()
+    if mailing is None:
+        log.error("Scores mailing is not found. Mailing id: %s", str(mailing_id))
+        return False
+
+    if from_address is None:
+        from_address = configuration_helpers.get_value('email_from_address', settings.BULK_EMAIL_DEFAULT_FROM_EMAIL)
+
+    renderer = ScoresEmailRenderer(course_id, usage_id)
+    context = renderer.get_context(json.loads(mailing.data))
+    text_email = renderer.render_text(context)
+    html_email = renderer.render_html(context)
+
+    if settings.DEBUG:
+        log.info('Recipient list: ' + str(emails))
+        log.info('Email text: ' + text_email)
+
+    message = mail.EmailMultiAlternatives(renderer.subject, text_email, from_address, emails)
+    message.attach_alternative(html_email, 'text/html')
+    message.send(fail_silently=False)
+    return True
@@ -1,17 +1,15 @@
 import json
 import logging
-import datetime
 from django.contrib.auth.models import User
 from django.conf import settings
-from django.utils import timezone
-from django.db import transaction
 from lms import CELERY_APP
 from lms.djangoapps.courseware.models import StudentModule
 from lms.djangoapps.courseware.module_render import get_module_by_usage_id
 from lms.djangoapps.courseware.utils import get_block_children, CREDO_GRADED_ITEM_CATEGORIES
 from xmodule.modulestore.django import modulestore
 from opaque_keys.edx.keys import CourseKey, UsageKey
-from common.djangoapps.credo_modules.models import get_student_properties_event_data, DelayedTask, DelayedTaskStatus
+from common.djangoapps.credo_modules.models import get_student_properties_event_data
+from common.djangoapps.credo_modules.task_repeater import DelayedTaskScheduler
 from completion.models import BlockCompletion
 from eventtracking import tracker
 
@@ -160,36 +158,39 @@ def _run_celery_tasks(celery_tasks_data):
     for t in celery_tasks_data:
         task_name = t[0]
         task_args = t[1]
+        countdown = t[2] if len(t) > 2 else 0
         if task_name == 'send_composite_outcome':
-            send_composite_outcome.apply_async(args=task_args, routing_key=settings.HIGH_PRIORITY_QUEUE)
+            send_composite_outcome.apply_async(args=task_args, countdown=countdown,
+                                               routing_key=settings.HIGH_PRIORITY_QUEUE)
         elif task_name == 'send_leaf_outcome':
-            send_leaf_outcome.apply_async(args=task_args, routing_key=settings.HIGH_PRIORITY_QUEUE)
+            send_leaf_outcome.apply_async(args=task_args, countdown=countdown,
+                                          routing_key=settings.HIGH_PRIORITY_QUEUE)
         elif task_name == 'lti1p3_send_composite_outcome':
-            lti1p3_send_composite_outcome.apply_async(args=task_args, routing_key=settings.HIGH_PRIORITY_QUEUE)
+            lti1p3_send_composite_outcome.apply_async(args=task_args, countdown=countdown,
+                                                      routing_key=settings.HIGH_PRIORITY_QUEUE)
         elif task_name == 'lti1p3_send_leaf_outcome':
-            lti1p3_send_leaf_outcome.apply_async(args=task_args, routing_key=settings.HIGH_PRIORITY_QUEUE)
+            lti1p3_send_leaf_outcome.apply_async(args=task_args, countdown=countdown,
+                                                 routing_key=settings.HIGH_PRIORITY_QUEUE)
         elif task_name == 'turnitin_create_submissions':
-            turnitin_create_submissions.apply_async(args=task_args)
+            turnitin_create_submissions.apply_async(args=task_args, countdown=countdown)
         elif task_name == 'turnitin_generate_report':
-            turnitin_generate_report.apply_async(args=task_args)
+            turnitin_generate_report.apply_async(args=task_args, countdown=countdown)
+
+
+def _schedule_overdue_pending_outcomes():
+    from lms.djangoapps.lti_provider.tasks import ScoresHandler
+    from lms.djangoapps.lti1p3_tool.tasks import Lti1p3ScoresHandler
+
+    return ScoresHandler().schedule_overdue_outcomes() + Lti1p3ScoresHandler().schedule_overdue_outcomes()
 
 
 def handle_delayed_tasks():
-    celery_tasks_data = []
-    dt_2 = timezone.now()
-    dt_1 = dt_2 - datetime.timedelta(hours=1)
-    tasks = DelayedTask.objects.select_for_update().filter(
-        start_time__gte=dt_1, start_time__lte=dt_2,
-        status=DelayedTaskStatus.CREATED).order_by('start_time')
-    with transaction.atomic():
-        for t in tasks:
-            data = json.loads(t.task_params)
-            t.status = DelayedTaskStatus.IN_PROGRESS
-            t.save()
-
-            data.append(t.task_id)
-            celery_tasks_data.append((t.task_name, data))
-        transaction.on_commit(lambda: _run_celery_tasks(celery_tasks_data))
+    from common.djangoapps.turnitin_integration.tasks import schedule_due_turnitin_processing
+
+    stats = DelayedTaskScheduler(_run_celery_tasks).run()
+    stats['pending_outcomes_consumers'] = _schedule_overdue_pending_outcomes()
+    stats['turnitin_next_check_time'] = str(schedule_due_turnitin_processing())
+    log.info("Delayed tasks were handled: %s", str(stats))
 
 
 @CELERY_APP.task
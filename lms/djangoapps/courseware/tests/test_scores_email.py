@@ -0,0 +1,80 @@
+"""
+Tests for rendering and sending of the scores emails.
+"""
+
+
+import json
+from smtplib import SMTPRecipientsRefused
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+
+from common.djangoapps.credo_modules.models import SendScores, SendScoresMailing
+from common.djangoapps.student.tests.factories import UserFactory
+from lms.djangoapps.courseware.scores_email import send_scores_email
+from lms.djangoapps.courseware.views.views import send_email_with_scores
+from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase  # lint-amnesty, pylint: disable=wrong-import-order
+from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory  # lint-amnesty, pylint: disable=wrong-import-order
+
+
+SCORES = {
+    'common': {
+        'quiz_name': 'Test Sequential',
+        'browser_datetime': '',
+        'browser_datetime_short': '',
+        'percent_graded': 100,
+        'earned': 1,
+        'possible': 1,
+    },
+    'user': {'full_name': 'Test Learner'},
+    'items': [],
+}
+
+
+class TestSendScoresEmail(ModuleStoreTestCase):
+    """
+    Test suite for sending of the scores email.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.course = CourseFactory.create(display_name='Test Course')
+        chapter = ItemFactory.create(category='chapter', parent=self.course, display_name='Test Chapter')
+        self.sequential = ItemFactory.create(category='sequential', parent=chapter, display_name='Test Sequential')
+        self.usage_id = str(self.sequential.location)
+        self.mailings = []
+        for i in range(3):
+            send_scores = SendScores.objects.create(
+                user=UserFactory.create(), course_id=self.course.id, block_id=self.usage_id)
+            mailing = SendScoresMailing.objects.create(email_scores=send_scores, data=json.dumps(SCORES))
+            self.mailings.append((mailing.id, ['recipient%d@example.com' % i]))
+
+    def test_send_scores_email(self):
+        for mailing_id, emails in self.mailings:
+            assert send_scores_email(str(self.course.id), self.usage_id, mailing_id, emails)
+        assert not send_scores_email(str(self.course.id), self.usage_id, 0, ['no@example.com'])
+        assert len(mail.outbox) == 3
+        for message in mail.outbox:
+            assert message.subject == 'Credo Assessment Results: Test Sequential'
+            assert 'Test Learner' in message.body
+            assert message.alternatives[0][1] == 'text/html'
+
+    def test_block_context_is_cached(self):
+        mailing_id, emails = self.mailings[0]
+        send_scores_email(str(self.course.id), self.usage_id, mailing_id, emails)
+        with mock.patch('lms.djangoapps.courseware.scores_email.modulestore') as mock_modulestore:
+            send_scores_email(str(self.course.id), self.usage_id, mailing_id, emails)
+            assert not mock_modulestore.called
+
+    def test_task_fails_if_email_is_not_sent(self):
+        mailing_id, emails = self.mailings[0]
+        with mock.patch('lms.djangoapps.courseware.scores_email.mail.EmailMultiAlternatives.send',
+                        side_effect=SMTPRecipientsRefused({emails[0]: (550, b'User unknown')})):
+            with self.assertRaises(SMTPRecipientsRefused):
+                send_email_with_scores(str(self.course.id), self.usage_id, mailing_id, emails)
+
+    def test_task_with_removed_mailing(self):
+        send_email_with_scores(str(self.course.id), self.usage_id, 0, ['no@example.com'])
+        assert not mail.outbox
@@ -174,7 +174,7 @@ from common.djangoapps.credo_modules.views import show_student_profile_form
 from common.djangoapps.credo_modules.utils import get_skills_mfe_url
 from mako.template import Template
 from lms import CELERY_APP
-from django.core import mail
+from lms.djangoapps.courseware.scores_email import ScoresEmailRenderer, send_scores_email
 from openedx.core.lib.url_utils import unquote_slashes
 from django.core.validators import validate_email
 from django.core.exceptions import PermissionDenied, ValidationError
@@ -185,11 +185,6 @@ from openedx.core.lib.api.authentication import BearerAuthenticationAllowInactiv
 from rest_framework.views import APIView
 from rest_framework import permissions
 
-try:
-    from premailer import transform
-except ImportError:
-    transform = None
-
 log = logging.getLogger("edx.courseware")
 
 
@@ -2516,50 +2511,13 @@ def get_logo_url(is_secure):
 
 
 def get_student_progress_email_html(course_id, usage_id, request=None, student_progress=None):
-    course_key = CourseKey.from_string(course_id)
-    usage_key = UsageKey.from_string(usage_id)
-
-    course = modulestore().get_course(course_key)
-    breadcrumbs = []
-
-    org_name = course.display_organization
-    if not org_name:
-        org_name = course_key.org
-    breadcrumbs.append(org_name.strip())
-
-    course_name = course.display_name
-    if not course_name:
-        course_name = course_key.course
-    breadcrumbs.append(course_name.strip())
-
-    item = modulestore().get_item(usage_key)
-    parent = item.get_parent()
-    if parent.display_name != item.display_name:
-        breadcrumbs.append(parent.display_name)
-    breadcrumbs.append(item.display_name)
-
-    dt_now = datetime.now()
     if request:
         scores_info = get_block_student_progress(request, course_id, usage_id)
     else:
         scores_info = student_progress
-    context = {
-        'breadcrumbs': breadcrumbs,
-        'breadcrumbs_len': len(breadcrumbs) - 1,
-        'lms_url': configuration_helpers.get_value('LMS_ROOT_URL', settings.LMS_ROOT_URL),
-        'platform_name': configuration_helpers.get_value('PLATFORM_NAME', settings.PLATFORM_NAME),
-        'support_url': configuration_helpers.get_value('SUPPORT_SITE_LINK', settings.SUPPORT_SITE_LINK),
-        'support_email': configuration_helpers.get_value('CONTACT_EMAIL', settings.CONTACT_EMAIL),
-        'scores': scores_info,
-        'current_year': dt_now.year,
-        'section_display_name': item.display_name,
-        'privacy_url': 'https://modules.zendesk.com/hc/en-us/articles/115005329466-Data-Privacy-FERPA-Security',
-        'use_static': True
-    }
-    html_email = render_to_string('emails/email_scores.html', context)
-    if transform:
-        html_email = transform(html_email)
-    return html_email, context
+    renderer = ScoresEmailRenderer(course_id, usage_id)
+    context = renderer.get_context(scores_info)
+    return renderer.render_html(context), context
 
 
 class BlockStudentProgressView(APIView):
@@ -2665,24 +2623,9 @@ class EmailStudentProgressView(APIView):
 @CELERY_APP.task
 def send_email_with_scores(course_id, usage_id, mailing_id, emails):
     log.info("Task to send scores was started. Mailing id: %s", str(mailing_id))
-
-    try:
-        mailing = SendScoresMailing.objects.get(id=mailing_id)
-        scores_info = json.loads(mailing.data)
-
-        html_email, context = get_student_progress_email_html(course_id, usage_id, None, scores_info)
-        text_email = render_to_string('emails/email_scores.txt', context)
-        from_address = configuration_helpers.get_value('email_from_address', settings.BULK_EMAIL_DEFAULT_FROM_EMAIL)
-
-        if settings.DEBUG:
-            log.info('Recipient list: ' + str(emails))
-            log.info('Email text: ' + text_email)
-
-        mail.send_mail('Credo Assessment Results: ' + context['section_display_name'], text_email, from_address, emails,
-                       fail_silently=False, html_message=html_email)
-
+    if send_scores_email(course_id, usage_id, mailing_id, emails):
         log.info("Task to send scores successfully finished. Mailing id: %s", str(mailing_id))
-    except SendScoresMailing.DoesNotExist:
+    else:
         log.error("Task to send scores finished with error. Mailing id: %s", str(mailing_id))
 
 
@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management import BaseCommand
+from lms.djangoapps.lti1p3_tool.models import LtiExternalCourse, LtiTool, LtiToolKey
+from lms.djangoapps.lti1p3_tool.tasks import lti1p3_sync_course_enrollments
+
+
+class StubNrpsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the access token and paginated NRPS membership container.
+    Every page contains `Link: <...>; rel="differences"` header
+    """
+
+    members = 1000
+    page_size = 100
+    changed = 10
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _send(self, data, content_type='application/json', headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _member(self, i, status='Active'):
+        return {
+            'status': status,
+            'user_id': 'nrps-benchmark-user-%d' % i,
+            'email': 'nrps-benchmark-user-%d@example.com' % i,
+            'given_name': 'User',
+            'family_name': str(i),
+            'roles': ['http://purl.imsglobal.org/vocab/lis/v2/membership#Learner'],
+        }
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self._send({'access_token': uuid.uuid4().hex, 'token_type': 'Bearer', 'expires_in': 3600})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        base_url = 'http://%s:%d' % self.server.server_address
+        headers = {'Link': '<%s/memberships/diff>; rel="differences"' % base_url}
+        context = {'id': 'nrps-benchmark', 'label': 'NRPS', 'title': 'NRPS benchmark'}
+
+        if url.path == '/memberships/diff':
+            # the last members were deactivated and the new ones were added
+            members = [self._member(i, 'Inactive') for i in range(self.members - self.changed, self.members)]
+            members.extend(self._member(i) for i in range(self.members, self.members + self.changed))
+        else:
+            page = int(query.get('page', ['0'])[0])
+            start = page * self.page_size
+            members = [self._member(i) for i in range(start, min(start + self.page_size, self.members))]
+            if start + self.page_size < self.members:
+                headers['Link'] = headers['Link'] + ', <%s/memberships?page=%d>; rel="next"' % (base_url, page + 1)
+        self._send({'id': self.path, 'context': context, 'members': members},
+                   'application/vnd.ims.lti-nrps.v2.membershipcontainer+json', headers)
+
+
+class Command(BaseCommand):
+    """
+    Measures the NRPS membership sync of the external course using a local stub NRPS server.
+    Users created by the benchmark are not removed.
+
+    Example:
+
+        ./manage.py lms benchmark_nrps_sync course-v1:Org+Course+Run --members 2000
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', help='Existing edX course')
+        parser.add_argument('--members', type=int, default=1000, help='Number of NRPS members')
+        parser.add_argument('--page_size', type=int, default=100, help='Number of members per NRPS page')
+        parser.add_argument('--changed', type=int, default=10, help='Number of members changed between syncs')
+
+    def _measure(self, title, ext_course, differential):
+        t1 = time.time()
+        lti1p3_sync_course_enrollments.apply(args=[ext_course.id], kwargs={'differential': differential})
+        spent = max(time.time() - t1, 0.001)
+        print('%s: %.2f sec' % (title, spent))
+
+    def handle(self, *args, **options):
+        StubNrpsHandler.members = options['members']
+        StubNrpsHandler.page_size = options['page_size']
+        StubNrpsHandler.changed = options['changed']
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubNrpsHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+        name = 'nrps-benchmark-%s' % uuid.uuid4().hex[:8]
+        tool_key = LtiToolKey(name=name)
+        tool_key.save()
+        lti_tool = LtiTool(
+            title=name,
+            issuer=base_url,
+            client_id=name,
+            auth_login_url=base_url + '/login',
+            auth_token_url=base_url + '/token',
+            key_set_url=base_url + '/jwks',
+            tool_key=tool_key,
+            deployment_ids=[name],
+            automatically_enroll_users=True,
+            automatically_unenroll_users=True,
+        )
+        lti_tool.save()
+        ext_course = LtiExternalCourse(
+            external_course_id=name,
+            edx_course_id=options['course_id'],
+            lti_tool=lti_tool,
+            context_memberships_url=base_url + '/memberships?page=0',
+        )
+        ext_course.save()
+
+        try:
+            self._measure('Initial sync (%d members)' % options['members'], ext_course, False)
+            self._measure('Repeated full sync', ext_course, False)
+            self._measure('Differential sync (%d changes)' % (options['changed'] * 2), ext_course, True)
+        finally:
+            server.shutdown()
+            ext_course.delete()
+            lti_tool.delete()
+            tool_key.delete()
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.13 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lti1p3_tool', '0013_ltitool_deep_linking_short_launch_urls'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ltiexternalcourse',
+            name='nrps_differences_url',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ltiexternalcourse',
+            name='users_last_full_sync_date',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
@@ -172,6 +172,8 @@ class LtiExternalCourse(models.Model):
     lti_tool = models.ForeignKey(LtiTool, on_delete=models.CASCADE)
     context_memberships_url = models.TextField(null=True, blank=True)
     users_last_sync_date = models.DateTimeField(null=True, editable=False)
+    users_last_full_sync_date = models.DateTimeField(null=True, editable=False)
+    nrps_differences_url = models.TextField(null=True, blank=True, editable=False)
 
     class Meta:
         unique_together = (('external_course_id', 'edx_course_id'),)
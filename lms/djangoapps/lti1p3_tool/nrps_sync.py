@@ -0,0 +1,259 @@
+import logging
+import re
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from common.djangoapps.credo_modules.models import check_and_save_enrollment_attributes
+from common.djangoapps.student.models import CourseEnrollment
+from common.djangoapps.student.role_helpers import has_staff_roles
+from lms.djangoapps.lti_provider.models import LtiContextId
+from lms.djangoapps.lti_provider.views import enroll_user_to_course
+from opaque_keys.edx.keys import CourseKey
+from .models import LtiUser, LtiUserEnrollment
+from .users import Lti1p3UserService
+
+
+User = get_user_model()
+log = logging.getLogger("lti1p3_tool.tasks")
+
+NRPS_FULL_SYNC_INTERVAL = 60 * 60 * 24
+NRPS_DB_CHUNK_SIZE = 1000
+
+
+def _chunks(items, size=NRPS_DB_CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def get_differences_url(headers):
+    """
+    Returns URL from the `Link: <...>; rel="differences"` header of the NRPS response
+    """
+    for name, value in (headers or {}).items():
+        if name.lower() == 'link' and value:
+            match = re.search(r'<([^>]*)>;\s*rel="differences"', value.replace('\n', ' '), re.IGNORECASE)
+            if match:
+                return match.group(1)
+    return None
+
+
+class NrpsMembershipSync:
+    """
+    Synchronizes NRPS members of the external course with the edX course enrollments.
+
+    NRPS pages are processed one by one as they are received. Every page is compared with
+    the preloaded LTI enrollments of the external course and active edX enrollments,
+    so the DB is touched only for the new users / enrollments. LTI enrollments are created in bulk.
+
+    In the differential mode the `differences` URL returned by the platform during the previous
+    sync is used, so only the members changed since that sync are received. The full sync
+    (with the unenrollment of the absent users) is performed if the platform doesn't support
+    differences or the last full sync is older than NRPS_FULL_SYNC_INTERVAL.
+    """
+
+    def __init__(self, ext_course, nrps, differential=True):
+        self.ext_course = ext_course
+        self.nrps = nrps
+        self.lti_tool = ext_course.lti_tool
+        self.course_key = CourseKey.from_string(ext_course.edx_course_id)
+        self.user_service = Lti1p3UserService()
+        self.full_sync = not differential or not ext_course.nrps_differences_url \
+            or not ext_course.users_last_full_sync_date \
+            or (timezone.now() - ext_course.users_last_full_sync_date).total_seconds() > NRPS_FULL_SYNC_INTERVAL
+
+        self.context = None
+        self.differences_url = None
+        self.ext_enrollments = {}
+        self.enrolled_user_ids = set()
+        self.processed_subs = set()
+        self.processed_edx_user_ids = set()
+        self.removed_subs = set()
+        self.stats = {
+            'pages': 0,
+            'members': 0,
+            'new_lti_users': 0,
+            'new_lti_enrollments': 0,
+            'enrolled': 0,
+            'unenrolled': 0,
+        }
+
+    def _preload(self):
+        self.ext_enrollments = dict(LtiUserEnrollment.objects.filter(external_course=self.ext_course).values_list(
+            'lti_user__lti_jwt_sub', 'lti_user_id'))
+        self.enrolled_user_ids = set(CourseEnrollment.objects.filter(
+            course_id=self.course_key, is_active=True).values_list('user_id', flat=True))
+
+    def _iter_member_pages(self, members_url):
+        while members_url:
+            data = self.nrps.get_nrps_data(members_url=members_url)
+            differences_url = get_differences_url(data.get('headers'))
+            if differences_url:
+                self.differences_url = differences_url
+            body = data.get('body') or {}
+            if self.context is None:
+                self.context = body.get('context', {})
+            self.stats['pages'] = self.stats['pages'] + 1
+            yield body.get('members', [])
+            members_url = data['next_page_url']
+
+    def _get_context_value(self, name):
+        value = (self.context or {}).get(name)
+        return value.strip() if value else value
+
+    def _process_page(self, members):
+        context_label = self._get_context_value('label')
+        context_title = self._get_context_value('title')
+
+        active_members = []
+        for member in members:
+            self.stats['members'] = self.stats['members'] + 1
+            lti_status = member.get('status')
+            if lti_status:
+                lti_status = lti_status.strip().lower()
+            if lti_status != 'active':
+                self.removed_subs.add(member.get('user_id'))
+                continue
+            active_members.append(member)
+        if not active_members:
+            return
+
+        lti_users = {lti_user.lti_jwt_sub: lti_user for lti_user in LtiUser.objects.filter(
+            lti_tool=self.lti_tool, lti_jwt_sub__in=[m.get('user_id') for m in active_members]
+        ).select_related('edx_user')}
+
+        new_lti_enrollments = []
+        with transaction.atomic():
+            for member in active_members:
+                lti_user_id = member.get('user_id')
+                lti_user = lti_users.get(lti_user_id)
+                if lti_user is None:
+                    log.info("Create user for LTI member %s", member)
+                    lti_user = self.user_service.create_lti_user(lti_user_id, self.lti_tool, member)
+                    lti_users[lti_user_id] = lti_user
+                    self.stats['new_lti_users'] = self.stats['new_lti_users'] + 1
+
+                user = lti_user.edx_user
+                self.processed_subs.add(lti_user_id)
+                self.processed_edx_user_ids.add(user.id)
+
+                if lti_user_id not in self.ext_enrollments:
+                    ext_enrollment = LtiUserEnrollment(lti_user=lti_user, external_course=self.ext_course)
+                    ext_enrollment.set_properties({
+                        'context_label': context_label,
+                        'context_title': context_title
+                    })
+                    new_lti_enrollments.append(ext_enrollment)
+                    self.ext_enrollments[lti_user_id] = lti_user.id
+
+                if user.id in self.enrolled_user_ids:
+                    continue
+
+                roles = []
+                for role in member.get('roles', []):
+                    roles_lst = role.split('#')
+                    if len(roles_lst) > 1:
+                        roles.append(roles_lst[1])
+
+                enroll_result = enroll_user_to_course(user, self.course_key, roles)
+                self.enrolled_user_ids.add(user.id)
+                if enroll_result:
+                    log.info("New user %s was enrolled to course %s", user.id, self.ext_course.edx_course_id)
+                    self.stats['enrolled'] = self.stats['enrolled'] + 1
+
+                    enrollment_attributes = {}
+                    if context_label:
+                        enrollment_attributes['context_label'] = context_label
+                    check_and_save_enrollment_attributes(enrollment_attributes, user, self.course_key)
+
+            if new_lti_enrollments:
+                LtiUserEnrollment.objects.bulk_create(new_lti_enrollments, ignore_conflicts=True)
+                self.stats['new_lti_enrollments'] = self.stats['new_lti_enrollments'] + len(new_lti_enrollments)
+
+    def _unenroll(self, absent_subs, candidate_user_ids):
+        # remove LtiUserEnrollment objects for absent users
+        absent_lti_user_ids = [self.ext_enrollments[sub] for sub in absent_subs if sub in self.ext_enrollments]
+        for lti_user_ids in _chunks(absent_lti_user_ids):
+            LtiUserEnrollment.objects.filter(lti_user_id__in=lti_user_ids, external_course=self.ext_course).delete()
+
+        candidate_user_ids = set(candidate_user_ids) - self.processed_edx_user_ids
+        edx_course_id = self.ext_course.edx_course_id
+        external_course_id = self.ext_course.external_course_id
+
+        for user_ids in _chunks(candidate_user_ids):
+            # skip non-LTI users
+            lti_user_ids = set(LtiUser.objects.filter(
+                edx_user_id__in=user_ids, lti_tool=self.lti_tool).values_list('edx_user_id', flat=True))
+            if not lti_user_ids:
+                continue
+
+            # skip users which have other enrollments in the same edx course
+            other_enrollments_user_ids = set(LtiUserEnrollment.objects.filter(
+                lti_user__edx_user_id__in=lti_user_ids,
+                external_course__edx_course_id=edx_course_id
+            ).exclude(external_course__external_course_id=external_course_id).values_list(
+                'lti_user__edx_user_id', flat=True))
+
+            contexts = {}
+            for user_id, value in LtiContextId.objects.filter(
+                    user_id__in=lti_user_ids, course_key=self.course_key).values_list('user_id', 'value'):
+                user_contexts = contexts.setdefault(user_id, [])
+                if value.strip() not in user_contexts:
+                    user_contexts.append(value.strip())
+
+            users = User.objects.filter(id__in=lti_user_ids - other_enrollments_user_ids)
+            for user in users:
+                if user.is_staff or user.is_superuser or has_staff_roles(user, self.course_key):
+                    continue
+
+                contexts_list_uniq = contexts.get(user.id, [])
+                if len(contexts_list_uniq) > 1 \
+                  or (len(contexts_list_uniq) == 1 and contexts_list_uniq[0] != external_course_id):
+                    continue
+
+                log.info("Try to unenroll user: %s", user.id)
+
+                with transaction.atomic():
+                    # remove LTI enrollment objects
+                    LtiUserEnrollment.objects.filter(
+                        lti_user__edx_user_id=user.id,
+                        lti_user__lti_tool=self.lti_tool,
+                        external_course=self.ext_course).delete()
+
+                    CourseEnrollment.unenroll(user, self.course_key)
+                    self.stats['unenrolled'] = self.stats['unenrolled'] + 1
+
+    def run(self):
+        t1 = time.time()
+        self._preload()
+        if self.full_sync:
+            members_url = self.ext_course.context_memberships_url
+        else:
+            members_url = self.ext_course.nrps_differences_url
+
+        for members in self._iter_member_pages(members_url):
+            self._process_page(members)
+
+        if self.lti_tool.automatically_unenroll_users:
+            if self.full_sync:
+                absent_subs = set(self.ext_enrollments.keys()) - self.processed_subs
+                self._unenroll(absent_subs, self.enrolled_user_ids)
+            elif self.removed_subs:
+                removed_user_ids = set(LtiUser.objects.filter(
+                    lti_tool=self.lti_tool, lti_jwt_sub__in=self.removed_subs).values_list('edx_user_id', flat=True))
+                self._unenroll(self.removed_subs - self.processed_subs, removed_user_ids & self.enrolled_user_ids)
+
+        update_fields = ['nrps_differences_url']
+        self.ext_course.nrps_differences_url = self.differences_url
+        if self.full_sync:
+            self.ext_course.users_last_full_sync_date = timezone.now()
+            update_fields.append('users_last_full_sync_date')
+        self.ext_course.save(update_fields=update_fields)
+
+        log.info("NRPS sync (%s) of the external course %s finished in %.2f sec: %s",
+                 'full' if self.full_sync else 'differential', str(self.ext_course.id),
+                 time.time() - t1, str(self.stats))
+        return self.stats
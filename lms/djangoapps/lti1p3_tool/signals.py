@@ -3,10 +3,13 @@ Signals handlers for the lti_provider Django app.
 """
 from __future__ import absolute_import
 
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 from lms.djangoapps.grades.signals.signals import PROBLEM_WEIGHTED_SCORE_CHANGED
+from .models import LtiTool, LtiToolKey
 from .tasks import Lti1p3ScoresHandler
+from .tool_conf import lti_tools_cache
 
 
 @receiver(PROBLEM_WEIGHTED_SCORE_CHANGED)
@@ -17,3 +20,14 @@ def score_changed_handler(sender, **kwargs):  # pylint: disable=unused-argument
     """
     handler = Lti1p3ScoresHandler()
     handler.score_changed_handler(**kwargs)
+
+
+@receiver(post_save, sender=LtiTool)
+@receiver(post_delete, sender=LtiTool)
+@receiver(post_save, sender=LtiToolKey)
+@receiver(post_delete, sender=LtiToolKey)
+def lti_tool_changed_handler(sender, **kwargs):  # pylint: disable=unused-argument
+    """
+    Drop cached LTI 1.3 registrations in all processes
+    """
+    lti_tools_cache.invalidate()
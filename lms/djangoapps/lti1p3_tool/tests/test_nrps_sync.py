@@ -0,0 +1,131 @@
+"""
+Tests for the synchronization of the NRPS memberships with the course enrollments
+"""
+
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.utils import timezone
+
+from common.djangoapps.student.models import CourseEnrollment
+from common.djangoapps.student.tests.factories import UserFactory
+from lms.djangoapps.lti1p3_tool.models import LtiExternalCourse, LtiTool, LtiToolKey, LtiUser, LtiUserEnrollment
+from lms.djangoapps.lti1p3_tool.nrps_sync import NrpsMembershipSync, get_differences_url
+from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase  # lint-amnesty, pylint: disable=wrong-import-order
+from xmodule.modulestore.tests.factories import CourseFactory  # lint-amnesty, pylint: disable=wrong-import-order
+
+MEMBERSHIPS_URL = 'https://platform.example.com/memberships'
+DIFFERENCES_URL = 'https://platform.example.com/memberships/diff'
+
+
+class FakeNrps:
+    """
+    Returns the configured NRPS pages: {url: (members, next_page_url)}
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested_urls = []
+
+    def get_nrps_data(self, members_url=None):
+        self.requested_urls.append(members_url)
+        members, next_page_url = self.pages[members_url]
+        return {
+            'body': {'context': {'label': 'LABEL', 'title': 'Title'}, 'members': members},
+            'headers': {'Link': '<%s>; rel="differences"' % DIFFERENCES_URL},
+            'next_page_url': next_page_url,
+        }
+
+
+def _member(num, status='Active'):
+    return {
+        'status': status,
+        'user_id': 'sub%d' % num,
+        'email': 'user%d@example.com' % num,
+        'roles': ['http://purl.imsglobal.org/vocab/lis/v2/membership#Learner'],
+    }
+
+
+class NrpsMembershipSyncTest(ModuleStoreTestCase):
+    """
+    Tests for NrpsMembershipSync
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.course = CourseFactory.create()
+        lti_tool = LtiTool(title='Tool', issuer='https://platform.example.com', client_id='client',
+                           auth_login_url=MEMBERSHIPS_URL, auth_token_url=MEMBERSHIPS_URL, key_set_url=MEMBERSHIPS_URL,
+                           tool_key=LtiToolKey.objects.create(name='key'), deployment_ids=['1'],
+                           automatically_enroll_users=True, automatically_unenroll_users=True)
+        lti_tool.save()
+        self.ext_course = LtiExternalCourse.objects.create(
+            external_course_id='context', edx_course_id=str(self.course.id), lti_tool=lti_tool,
+            context_memberships_url=MEMBERSHIPS_URL)
+
+        def create_lti_user(lti_user_id, lti_tool, member):
+            return LtiUser.objects.create(lti_tool=lti_tool, lti_jwt_sub=lti_user_id,
+                                          edx_user=UserFactory.create(email=member['email']))
+
+        patcher = patch('lms.djangoapps.lti1p3_tool.nrps_sync.Lti1p3UserService.create_lti_user',
+                        side_effect=create_lti_user)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _sync(self, pages, differential=True):
+        nrps = FakeNrps(pages)
+        self.ext_course.refresh_from_db()
+        stats = NrpsMembershipSync(self.ext_course, nrps, differential=differential).run()
+        return nrps, stats
+
+    def _enrolled_emails(self):
+        return set(CourseEnrollment.objects.filter(course_id=self.course.id, is_active=True).values_list(
+            'user__email', flat=True))
+
+    def test_full_sync(self):
+        nrps, stats = self._sync({
+            MEMBERSHIPS_URL: ([_member(1), _member(2)], MEMBERSHIPS_URL + '?page=2'),
+            MEMBERSHIPS_URL + '?page=2': ([_member(3), _member(4, 'Inactive')], None),
+        })
+        assert nrps.requested_urls == [MEMBERSHIPS_URL, MEMBERSHIPS_URL + '?page=2']
+        assert stats['pages'] == 2
+        assert stats['new_lti_users'] == 3
+        assert stats['new_lti_enrollments'] == 3
+        assert self._enrolled_emails() == {'user1@example.com', 'user2@example.com', 'user3@example.com'}
+        assert LtiUserEnrollment.objects.filter(external_course=self.ext_course).count() == 3
+
+        self.ext_course.refresh_from_db()
+        assert self.ext_course.nrps_differences_url == DIFFERENCES_URL
+        assert self.ext_course.users_last_full_sync_date is not None
+
+        # the absent member is unenrolled, the others are not processed again
+        _nrps, stats = self._sync({MEMBERSHIPS_URL: ([_member(1), _member(3)], None)}, differential=False)
+        assert stats['new_lti_users'] == 0
+        assert stats['new_lti_enrollments'] == 0
+        assert stats['unenrolled'] == 1
+        assert self._enrolled_emails() == {'user1@example.com', 'user3@example.com'}
+        assert not LtiUserEnrollment.objects.filter(lti_user__lti_jwt_sub='sub2').exists()
+
+    def test_differential_sync(self):
+        self._sync({MEMBERSHIPS_URL: ([_member(1), _member(2)], None)})
+
+        nrps, stats = self._sync({DIFFERENCES_URL: ([_member(2, 'Inactive'), _member(3)], None)})
+        assert nrps.requested_urls == [DIFFERENCES_URL]
+        assert stats['unenrolled'] == 1
+        # members absent in the differences are kept
+        assert self._enrolled_emails() == {'user1@example.com', 'user3@example.com'}
+
+    def test_full_sync_is_forced_after_interval(self):
+        self._sync({MEMBERSHIPS_URL: ([_member(1)], None)})
+        LtiExternalCourse.objects.filter(id=self.ext_course.id).update(
+            users_last_full_sync_date=timezone.now() - timedelta(days=2))
+
+        nrps, _stats = self._sync({MEMBERSHIPS_URL: ([_member(1)], None)})
+        assert nrps.requested_urls == [MEMBERSHIPS_URL]
+
+    def test_get_differences_url(self):
+        headers = {'link': '<https://example.com/next>; rel="next",\n <%s>; rel="differences"' % DIFFERENCES_URL}
+        assert get_differences_url(headers) == DIFFERENCES_URL
+        assert get_differences_url({'Link': '<https://example.com/next>; rel="next"'}) is None
+        assert get_differences_url(None) is None
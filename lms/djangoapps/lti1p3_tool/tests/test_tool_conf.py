@@ -0,0 +1,165 @@
+"""
+Tests for the cached LTI 1.3 tool configuration and platform keys
+"""
+
+
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.test import RequestFactory, SimpleTestCase
+from jwt.algorithms import RSAAlgorithm
+from pylti1p3.exception import LtiException
+from pylti1p3.registration import Registration
+
+from lms.djangoapps.lti1p3_tool import tool_conf
+from lms.djangoapps.lti1p3_tool.tool_conf import (
+    JWKS_CACHE_TTL, JWKS_MIN_REFRESH_INTERVAL, CachedKeysMessageLaunch, JwksCache
+)
+
+KEY_SET_URL = 'https://platform.example.com/jwks'
+
+
+def _private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def _jwk(private_key, kid, alg='RS256'):
+    jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({'kid': kid, 'alg': alg, 'use': 'sig'})
+    return jwk
+
+
+def _response(status_code=200, data=None, etag=None):
+    resp = MagicMock()
+    resp.status_code = status_code
+    resp.headers = {'ETag': etag} if etag else {}
+    if data is None:
+        resp.json.side_effect = ValueError('No JSON object could be decoded')
+        resp.text = 'Server Error'
+    else:
+        resp.json.return_value = data
+        resp.text = json.dumps(data)
+    return resp
+
+
+class JwksCacheTest(SimpleTestCase):
+    """
+    Tests for the process-wide cache of the platforms' public keys
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.private_key = _private_key()
+        self.key_set = {'keys': [_jwk(self.private_key, 'kid1')]}
+        self.jwks_cache = JwksCache()
+        self.session = MagicMock()
+        patcher = patch.object(self.jwks_cache, '_get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _expire(self, seconds):
+        item = self.jwks_cache._items[KEY_SET_URL]  # pylint: disable=protected-access
+        item['fetched'] = item['fetched'] - seconds
+
+    def test_keys_are_cached_by_kid_and_alg(self):
+        self.session.get.return_value = _response(data=self.key_set)
+
+        public_key = self.jwks_cache.get_public_key(KEY_SET_URL, 'kid1', 'RS256')
+        assert public_key.public_numbers() == self.private_key.public_key().public_numbers()
+        self.jwks_cache.get_public_key(KEY_SET_URL, 'kid1', 'RS256')
+        assert self.session.get.call_count == 1
+
+        # the same kid with another alg is a different key
+        with self.assertRaises(LtiException):
+            self.jwks_cache.get_public_key(KEY_SET_URL, 'kid1', 'RS512')
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        self.session.get.return_value = _response(data=self.key_set)
+        self.jwks_cache.get_public_key(KEY_SET_URL, 'kid1', 'RS256')
+
+        with self.assertRaises(LtiException):
+            self.jwks_cache.get_public_key(KEY_SET_URL, 'kid2', 'RS256')
+        assert self.session.get.call_count == 1
+
+        rotated_key = _private_key()
+        self.session.get.return_value = _response(data={'keys': [_jwk(rotated_key, 'kid2')]})
+        self._expire(JWKS_MIN_REFRESH_INTERVAL)
+        public_key = self.jwks_cache.get_public_key(KEY_SET_URL, 'kid2', 'RS256')
+        assert public_key.public_numbers() == rotated_key.public_key().public_numbers()
+        assert self.session.get.call_count == 2
+
+    def test_not_modified_response(self):
+        self.session.get.return_value = _response(data=self.key_set, etag='"v1"')
+        self.jwks_cache.get_public_key(KEY_SET_URL, 'kid1', 'RS256')
+
+        self.session.get.return_value = _response(status_code=304, etag='"v1"')
+        self._expire(JWKS_CACHE_TTL)
+        assert self.jwks_cache.get_public_key(KEY_SET_URL, 'kid1', 'RS256') is not None
+        assert self.session.get.call_args[1]['headers'] == {'If-None-Match': '"v1"'}
+
+    def test_error_response_keeps_cached_keys(self):
+        self.session.get.return_value = _response(data=self.key_set)
+        self.jwks_cache.get_public_key(KEY_SET_URL, 'kid1', 'RS256')
+
+        self.session.get.return_value = _response(status_code=503, data={'error': 'unavailable'})
+        self._expire(JWKS_CACHE_TTL)
+        assert self.jwks_cache.get_public_key(KEY_SET_URL, 'kid1', 'RS256') is not None
+        assert self.session.get.call_count == 2
+
+        # the failed fetch is repeated after JWKS_MIN_REFRESH_INTERVAL, not after JWKS_CACHE_TTL
+        item = self.jwks_cache._items[KEY_SET_URL]  # pylint: disable=protected-access
+        assert time.time() - item['fetched'] < JWKS_CACHE_TTL
+        assert time.time() - item['fetched'] >= JWKS_CACHE_TTL - JWKS_MIN_REFRESH_INTERVAL - 1
+
+    def test_error_response_without_cached_keys(self):
+        self.session.get.return_value = _response(status_code=500)
+        with self.assertRaises(LtiException):
+            self.jwks_cache.get_public_key(KEY_SET_URL, 'kid1', 'RS256')
+        assert KEY_SET_URL not in self.jwks_cache._items  # pylint: disable=protected-access
+
+        self.session.get.return_value = _response(data=self.key_set)
+        assert self.jwks_cache.get_public_key(KEY_SET_URL, 'kid1', 'RS256') is not None
+
+
+class CachedKeysMessageLaunchTest(SimpleTestCase):
+    """
+    Tests for the validation of the launch signature with the cached platform keys
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.private_key = _private_key()
+        self.session = MagicMock()
+        self.session.get.return_value = _response(data={'keys': [_jwk(self.private_key, 'kid1')]})
+        self.jwks_cache = JwksCache()
+        for patcher in (patch.object(tool_conf, 'jwks_cache', self.jwks_cache),
+                        patch.object(self.jwks_cache, '_get_session', return_value=self.session)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _get_launch(self, signing_key, kid='kid1'):
+        body = {'iss': 'https://platform.example.com', 'aud': 'client1', 'nonce': 'nonce'}
+        id_token = jwt.encode(body, signing_key, algorithm='RS256', headers={'kid': kid})
+        request = RequestFactory().post('/lti1p3_tool/launch/', {'id_token': id_token, 'state': 'state'})
+        request.session = {}
+
+        launch = CachedKeysMessageLaunch(request, MagicMock())
+        launch._registration = Registration().set_key_set_url(KEY_SET_URL)  # pylint: disable=protected-access
+        launch.set_jwt({'header': jwt.get_unverified_header(id_token), 'body': body})
+        return launch
+
+    def test_validate_jwt_signature(self):
+        self._get_launch(self.private_key).validate_jwt_signature()
+        self._get_launch(self.private_key).validate_jwt_signature()
+        self.session.get.assert_called_once()
+
+    def test_invalid_signature(self):
+        with self.assertRaises(LtiException):
+            self._get_launch(_private_key()).validate_jwt_signature()
+
+    def test_unknown_kid(self):
+        with self.assertRaises(LtiException):
+            self._get_launch(self.private_key, kid='kid2').validate_jwt_signature()
@@ -1,44 +1,251 @@
+import json
+import logging
+import threading
+import time
+import uuid
+
+import requests
+from django.core.cache import cache
+
 from .models import LtiTool
 try:
+    from cryptography.hazmat.primitives.serialization import load_pem_private_key
+    from jwt.algorithms import RSAAlgorithm
+    from pylti1p3.contrib.django import DjangoMessageLaunch
     from pylti1p3.exception import LtiException
     from pylti1p3.tool_config.abstract import ToolConfAbstract
     from pylti1p3.registration import Registration
     from pylti1p3.deployment import Deployment
 except ImportError:
     ToolConfAbstract = object
+    Registration = object
+    DjangoMessageLaunch = object
 
 
-class ToolConfDb(ToolConfAbstract):
-    _lti_tools = None
+log = logging.getLogger("edx.lti1p3_tool")
+
+REGISTRATION_CACHE_TTL = 300
+REGISTRATION_VERSION_CHECK_INTERVAL = 5
+JWKS_CACHE_TTL = 7200
+JWKS_MIN_REFRESH_INTERVAL = 60
+JWKS_HTTP_TIMEOUT = 10
+
+
+class LtiToolsCache:
+    """
+    Process-wide cache of the active LtiTool rows together with the parsed tool private keys.
+
+    Items expire after REGISTRATION_CACHE_TTL seconds. Every save / delete of LtiTool or LtiToolKey
+    changes the version stored in the Django cache (see signals.py), so the other processes
+    drop their items not later than REGISTRATION_VERSION_CHECK_INTERVAL seconds after the change.
+    """
+
+    VERSION_CACHE_KEY = 'lti1p3_tool_registrations_version'
 
     def __init__(self):
-        super().__init__()
-        self._lti_tools = {}
+        self._items = {}
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked = 0
 
-    def get_lti_tool(self, iss, client_id):
-        lti_tool = self._lti_tools.get(iss) if client_id is None else self._lti_tools.get(iss, {}).get(client_id)
-        if lti_tool:
-            return lti_tool
+    def _check_version(self):
+        now = time.time()
+        if now - self._version_checked < REGISTRATION_VERSION_CHECK_INTERVAL:
+            return
+        version = cache.get(self.VERSION_CACHE_KEY)
+        with self._lock:
+            if version != self._version:
+                self._items = {}
+                self._version = version
+            self._version_checked = now
+
+    def invalidate(self):
+        cache.set(self.VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        with self._lock:
+            self._items = {}
+            self._version_checked = 0
+
+    def get(self, iss, client_id):
+        """
+        Returns (lti_tool, tool_private_key) or (None, None) if the tool isn't found
+        """
+        self._check_version()
+        key = (iss, client_id)
+        item = self._items.get(key)
+        if item and time.time() - item[0] < REGISTRATION_CACHE_TTL:
+            return item[1], item[2]
 
+        lti_tools = LtiTool.objects.filter(issuer=iss, is_active=True).select_related('tool_key')
         if client_id is None:
-            lti_tool = LtiTool.objects.filter(issuer=iss, is_active=True).order_by('use_by_default').first()
+            lti_tool = lti_tools.order_by('use_by_default').first()
         else:
+            lti_tool = lti_tools.filter(client_id=client_id).first()
+        if lti_tool is None:
+            return None, None
+
+        private_key = load_pem_private_key(lti_tool.tool_key.private_key.encode('utf-8'), password=None)
+        with self._lock:
+            self._items[key] = (time.time(), lti_tool, private_key)
+        return lti_tool, private_key
+
+
+lti_tools_cache = LtiToolsCache()
+
+
+class JwksCache:
+    """
+    Process-wide cache of the platforms' public keys (parsed) keyed by `key_set_url`.
+
+    Key sets are revalidated using ETag after JWKS_CACHE_TTL seconds. Unknown `kid`
+    forces the refresh (the platform could rotate keys) but not more often than
+    once per JWKS_MIN_REFRESH_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = requests.Session()
+        return self._session
+
+    def _fetch_failed(self, item, error):
+        if item:
+            # keep the cached keys, the next fetch attempt is in JWKS_MIN_REFRESH_INTERVAL seconds
+            log.warning("Use cached JWKS: %s", error)
+            return dict(item, fetched=time.time() - JWKS_CACHE_TTL + JWKS_MIN_REFRESH_INTERVAL)
+        raise LtiException(error)
+
+    def _fetch(self, key_set_url, item):
+        headers = {}
+        if item and item['etag']:
+            headers['If-None-Match'] = item['etag']
+        try:
+            resp = self._get_session().get(key_set_url, headers=headers, timeout=JWKS_HTTP_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            return self._fetch_failed(item, "Error during fetch URL " + key_set_url + ": " + str(e))
+
+        if resp.status_code == 304 and item:
+            return dict(item, fetched=time.time())
+        if resp.status_code != 200:
+            return self._fetch_failed(item, "Error during fetch URL " + key_set_url
+                                      + ": status code " + str(resp.status_code))
+        try:
+            key_set = resp.json()
+        except ValueError:
+            return self._fetch_failed(item, "Invalid response from " + key_set_url
+                                      + ". Must be JSON: " + resp.text)
+        if not isinstance(key_set, dict) or not isinstance(key_set.get('keys'), list):
+            return self._fetch_failed(item, "Invalid response from " + key_set_url
+                                      + ". Key set must contain keys list")
+
+        keys = {}
+        for key in key_set['keys']:
+            key_kid = key.get('kid')
+            if not key_kid:
+                continue
             try:
-                lti_tool = LtiTool.objects.get(issuer=iss, client_id=client_id, is_active=True)
-            except LtiTool.DoesNotExist:
-                pass
+                keys[(key_kid, key.get('alg', 'RS256'))] = RSAAlgorithm.from_jwk(json.dumps(key))
+            except (ValueError, TypeError):
+                log.warning("Can't parse JWK %s from %s", key_kid, key_set_url)
+        return {
+            'keys': keys,
+            'etag': resp.headers.get('ETag'),
+            'fetched': time.time(),
+        }
 
-        if lti_tool is None:
-            raise LtiException('iss %s not found in settings' % iss)
+    def get_public_key(self, key_set_url, kid, alg):
+        """
+        Returns the parsed public key of the platform
+        """
+        item = self._items.get(key_set_url)
+        now = time.time()
+        if item and now - item['fetched'] < JWKS_CACHE_TTL and (kid, alg) in item['keys']:
+            return item['keys'][(kid, alg)]
 
-        if client_id is None:
-            self._lti_tools[iss] = lti_tool
-        else:
-            if iss not in self._lti_tools:
-                self._lti_tools[iss] = {}
-            self._lti_tools[iss][client_id] = lti_tool
+        if not item or now - item['fetched'] >= JWKS_MIN_REFRESH_INTERVAL:
+            item = self._fetch(key_set_url, item)
+            with self._lock:
+                self._items[key_set_url] = item
+
+        public_key = item['keys'].get((kid, alg))
+        if public_key is None:
+            raise LtiException("Unable to find public key")
+        return public_key
+
+    def clear(self):
+        with self._lock:
+            self._items = {}
+
+
+jwks_cache = JwksCache()
+
+
+class CachedRegistration(Registration):
+    """
+    Registration with the pre-calculated tool JWK (pylti1p3 re-parses the public key on every call)
+    """
+    _public_jwk = None
+
+    def set_public_jwk(self, public_jwk):
+        self._public_jwk = public_jwk
+        return self
+
+    def get_jwks(self):
+        if self._public_jwk:
+            return [self._public_jwk]
+        return super().get_jwks()
+
+    def get_kid(self):
+        if self._public_jwk:
+            return self._public_jwk.get('kid')
+        return super().get_kid()
+
+
+class CachedKeysMessageLaunch(DjangoMessageLaunch):
+    """
+    Message launch which takes the platform's public keys from the process-wide JWKS cache
+    """
 
-        return lti_tool
+    def get_public_key(self):
+        """
+        Returns (public_key, alg) as the pylti1p3 implementation does
+        """
+        key_set_url = self._registration.get_key_set_url()
+        if self._registration.get_key_set() or not key_set_url \
+                or not key_set_url.startswith(('http://', 'https://')):
+            return super().get_public_key()
+
+        kid = self._jwt.get('header', {}).get('kid', None)
+        alg = self._jwt.get('header', {}).get('alg', None)
+        if not kid:
+            raise LtiException("JWT KID not found")
+        if not alg:
+            raise LtiException("JWT ALG not found")
+        return jwks_cache.get_public_key(key_set_url, kid, alg), alg
+
+
+class ToolConfDb(ToolConfAbstract):
+    _lti_tools = None
+
+    def __init__(self):
+        super().__init__()
+        self._lti_tools = {}
+
+    def _get_cached_lti_tool(self, iss, client_id):
+        item = self._lti_tools.get((iss, client_id))
+        if item is None:
+            lti_tool, private_key = lti_tools_cache.get(iss, client_id)
+            if lti_tool is None:
+                raise LtiException('iss %s not found in settings' % iss)
+            item = (lti_tool, private_key)
+            self._lti_tools[(iss, client_id)] = item
+        return item
+
+    def get_lti_tool(self, iss, client_id):
+        return self._get_cached_lti_tool(iss, client_id)[0]
 
     def check_iss_has_one_client(self, iss):
         return False
@@ -50,8 +257,8 @@ class ToolConfDb(ToolConfAbstract):
         pass
 
     def find_registration_by_params(self, iss, client_id, *args, **kwargs):
-        lti_tool = self.get_lti_tool(iss, client_id)
-        reg = Registration()
+        lti_tool, private_key = self._get_cached_lti_tool(iss, client_id)
+        reg = CachedRegistration()
         reg.set_auth_login_url(lti_tool.auth_login_url) \
             .set_auth_token_url(lti_tool.auth_token_url) \
             .set_auth_audience(lti_tool.auth_audience) \
@@ -59,8 +266,9 @@ class ToolConfDb(ToolConfAbstract):
             .set_key_set(lti_tool.key_set) \
             .set_key_set_url(lti_tool.key_set_url) \
             .set_issuer(lti_tool.issuer) \
-            .set_tool_private_key(lti_tool.tool_key.private_key) \
+            .set_tool_private_key(private_key) \
             .set_tool_public_key(lti_tool.tool_key.public_key)
+        reg.set_public_jwk(lti_tool.tool_key.public_jwk)
         return reg
 
     def find_deployment(self, iss, deployment_id):
@@ -38,12 +38,12 @@ from lms.djangoapps.courseware.utils import get_lti_context_session_key
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from .ext_courses import process_external_course
-from .tool_conf import ToolConfDb
+from .tool_conf import CachedKeysMessageLaunch, ToolConfDb
 from .models import GradedAssignment, LtiToolKey
 from .users import Lti1p3UserService
 from .utils import get_lineitem_tag
 try:
-    from pylti1p3.contrib.django import DjangoOIDCLogin, DjangoMessageLaunch, DjangoCacheDataStorage
+    from pylti1p3.contrib.django import DjangoOIDCLogin
     from pylti1p3.contrib.django.session import DjangoSessionService
     from pylti1p3.contrib.django.request import DjangoRequest
     from pylti1p3.deep_link_resource import DeepLinkResource
@@ -403,8 +403,7 @@ def _launch(request, block=None, course_id=None, page=None):
     tool_conf = ToolConfDb()
     jwt_data = None
     try:
-        message_launch = DjangoMessageLaunch(request, tool_conf)
-        message_launch.set_public_key_caching(DjangoCacheDataStorage(), cache_lifetime=7200)
+        message_launch = CachedKeysMessageLaunch(request, tool_conf)
         if page == DEBUG_PAGE:
             message_launch.validate_jwt_format()
             jwt_data = message_launch._jwt
@@ -587,7 +586,7 @@ def _deep_link_launch(request, course_id):
 
         tool_conf = ToolConfDb()
         try:
-            message_launch = DjangoMessageLaunch(request, tool_conf)
+            message_launch = CachedKeysMessageLaunch(request, tool_conf)
             message_launch_data = message_launch.get_launch_data()
             iss = message_launch.get_iss()
             client_id = message_launch.get_client_id()
@@ -651,7 +650,7 @@ def launch_deep_link_submit(request, course_id):
         course_items = get_course_sequential_blocks(course)
 
         tool_conf = ToolConfDb()
-        message_launch = DjangoMessageLaunch.from_cache(launch_id, request, tool_conf)
+        message_launch = CachedKeysMessageLaunch.from_cache(launch_id, request, tool_conf)
         iss = message_launch.get_iss()
         client_id = message_launch.get_client_id()
         tool_conf = message_launch.get_tool_conf()
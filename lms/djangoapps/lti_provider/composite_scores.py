@@ -0,0 +1,233 @@
+"""
+Calculation of the scores for the composite LTI assignments (verticals, sequentials).
+
+Instead of reading the grade of the whole course for every score passback only the subtree
+of the assignment is used. The subtree (scorable descendants with weights) is cached by the
+published version of the course and the scores of the children are cached per user, so
+only the children which state was changed since the previous calculation are recomputed.
+"""
+
+import logging
+from datetime import datetime
+
+from django.core.cache import cache
+from pytz import UTC
+from submissions import api as submissions_api
+
+from common.djangoapps.credo_modules.mongo import get_last_published_course_version
+from common.djangoapps.student.models import anonymous_id_for_user
+from lms.djangoapps.course_blocks.transformers.start_date import StartDateTransformer
+from lms.djangoapps.course_blocks.transformers.user_partitions import UserPartitionTransformer
+from lms.djangoapps.course_blocks.transformers.visibility import VisibilityTransformer
+from lms.djangoapps.courseware.models import StudentModule
+from lms.djangoapps.grades.course_grade_factory import CourseGradeFactory
+from lms.djangoapps.grades.models import PersistentSubsectionGrade
+from lms.djangoapps.grades.scores import weighted_score
+from lms.djangoapps.grades.transformer import GradesTransformer
+from openedx.core.djangoapps.content.block_structure.api import get_course_in_cache
+from xmodule.modulestore.django import modulestore
+
+
+log = logging.getLogger("edx.lti_provider")
+
+SUBTREE_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+SCORES_CACHE_TIMEOUT = 60 * 60 * 24
+
+# the set of the children of these blocks depends on the user
+USER_SPECIFIC_BLOCK_TYPES = ('library_content', 'split_test', 'conditional')
+
+# the scores of these blocks are stored by the Submissions API (not in the StudentModule)
+SUBMISSIONS_BLOCK_TYPES = ('openassessment', 'edx_sga', 'staffgradedxblock')
+
+
+def get_subtree(course_key, usage_key, course_version):
+    """
+    Returns the cached subtree data of the block:
+    {
+        'user_specific': True if the scores must be calculated using the full course grade,
+        'max_start': the latest start date of the blocks inside the subtree,
+        'is_subsection': True if the block is a sequential,
+        'children': [(block_id, weight, max_score, uses_submissions), ...] - scorable descendants
+    }
+    Returns None if the block isn't found in the course.
+    """
+    cache_key = 'lti_composite_subtree:%s:%s' % (str(usage_key), course_version)
+    subtree = cache.get(cache_key)
+    if subtree is None:
+        subtree = _build_subtree(course_key, usage_key)
+        if subtree is None:
+            return None
+        cache.set(cache_key, subtree, SUBTREE_CACHE_TIMEOUT)
+    return subtree
+
+
+def _build_subtree(course_key, usage_key):
+    structure = get_course_in_cache(course_key)
+    if usage_key not in structure:
+        return None
+
+    user_partitions = structure.get_transformer_data(UserPartitionTransformer, 'user_partitions')
+    subtree = {
+        'user_specific': False,
+        'max_start': None,
+        'is_subsection': usage_key.block_type == 'sequential',
+        'children': [],
+    }
+    visited = set()
+    blocks = [usage_key]
+    while blocks:
+        block_key = blocks.pop()
+        if block_key in visited:
+            continue
+        visited.add(block_key)
+
+        if block_key.block_type in USER_SPECIFIC_BLOCK_TYPES \
+                or structure.get_transformer_block_field(
+                    block_key, VisibilityTransformer, VisibilityTransformer.MERGED_VISIBLE_TO_STAFF_ONLY, False):
+            subtree['user_specific'] = True
+        if user_partitions:
+            merged_group_access = structure.get_transformer_block_field(
+                block_key, UserPartitionTransformer, 'merged_group_access')
+            if merged_group_access is not None and getattr(merged_group_access, '_access', None):
+                subtree['user_specific'] = True
+
+        start = structure.get_transformer_block_field(
+            block_key, StartDateTransformer, StartDateTransformer.MERGED_START_DATE)
+        if start and (subtree['max_start'] is None or start > subtree['max_start']):
+            subtree['max_start'] = start
+
+        if structure.get_xblock_field(block_key, 'has_score', False):
+            subtree['children'].append((
+                str(block_key),
+                structure.get_xblock_field(block_key, 'weight'),
+                structure.get_transformer_block_field(block_key, GradesTransformer, 'max_score'),
+                block_key.block_type in SUBMISSIONS_BLOCK_TYPES
+            ))
+        blocks.extend(structure.get_children(block_key))
+    return subtree
+
+
+def calculate_child_score(child, csm_score, submissions_scores):
+    """
+    Returns weighted (earned, possible) score of the scorable block or None.
+    The priority order is the same as in the grades app: submissions API -> CSM -> latest block content
+    """
+    block_id, weight, max_score, _uses_submissions = child
+    submission_value = submissions_scores.get(block_id) if submissions_scores else None
+    if submission_value:
+        return submission_value['points_earned'], submission_value['points_possible']
+    if csm_score and csm_score[1] is not None:
+        raw_earned = csm_score[0] if csm_score[0] is not None else 0.0
+        return weighted_score(raw_earned, csm_score[1], weight)
+    if max_score is None:
+        return None
+    return weighted_score(0.0, max_score, weight)
+
+
+def calculate_scores(children, csm_rows, submissions_scores, state=None):
+    """
+    Sums the scores of the subtree children.
+    `csm_rows` is a dict: block_id -> (grade, max_grade, modified).
+    `state` is a dict: block_id -> (modified, earned, possible) with the scores calculated before.
+    Only the children which StudentModule rows were changed (and the children scored
+    by the submissions API) are recomputed.
+    Returns (earned, possible, new_state, number of the recomputed children)
+    """
+    earned, possible = 0.0, 0.0
+    new_state = {}
+    recomputed = 0
+    for child in children:
+        block_id, _weight, _max_score, uses_submissions = child
+        csm_row = csm_rows.get(block_id)
+        modified = csm_row[2] if csm_row else None
+        prev = state.get(block_id) if state else None
+        if prev is not None and prev[0] == modified and not uses_submissions:
+            child_earned, child_possible = prev[1], prev[2]
+        else:
+            score = calculate_child_score(child, csm_row, submissions_scores)
+            recomputed = recomputed + 1
+            if score is None:
+                continue
+            child_earned, child_possible = score
+        new_state[block_id] = (modified, child_earned, child_possible)
+        earned += child_earned
+        possible += child_possible
+    return earned, possible, new_state, recomputed
+
+
+class CompositeScoreEngine:
+    """
+    Calculates the (earned, possible) score of the composite block for the user.
+    Falls back to the full course grade calculation if the set of the blocks
+    inside the subtree depends on the user (randomized content, cohorts, hidden blocks).
+    """
+
+    def __init__(self, user, course_key):
+        self.user = user
+        self.course_key = course_key
+        self.stats = {'mode': None, 'recomputed': 0}
+
+    def _scores_cache_key(self, usage_key):
+        return 'lti_composite_scores:%s:%s' % (str(self.user.id), str(usage_key))
+
+    def score_for_module(self, usage_key):
+        course_version = get_last_published_course_version(self.course_key)
+        subtree = get_subtree(self.course_key, usage_key, course_version) if course_version else None
+        if subtree is None or subtree['user_specific'] \
+                or (subtree['max_start'] and subtree['max_start'] > datetime.now(UTC)):
+            return self._full_score_for_module(usage_key)
+
+        children = subtree['children']
+        block_ids = [child[0] for child in children]
+        csm_rows = {}
+        if block_ids:
+            rows = StudentModule.objects.filter(
+                student_id=self.user.id, course_id=self.course_key, module_state_key__in=block_ids
+            ).values_list('module_state_key', 'grade', 'max_grade', 'modified')
+            for module_state_key, grade, max_grade, modified in rows:
+                block_id = str(module_state_key.map_into_course(self.course_key))
+                csm_rows[block_id] = (grade, max_grade, modified)
+
+        uses_submissions = any(child[3] for child in children)
+        cache_key = self._scores_cache_key(usage_key)
+        cached = cache.get(cache_key)
+        state = cached[1] if cached and cached[0] == course_version else None
+
+        if state is None and subtree['is_subsection'] and not uses_submissions:
+            persisted_score = self._get_persisted_subsection_score(usage_key, course_version, csm_rows)
+            if persisted_score is not None:
+                self.stats['mode'] = 'persisted'
+                return persisted_score
+
+        submissions_scores = None
+        if uses_submissions:
+            anonymous_user_id = anonymous_id_for_user(self.user, self.course_key)
+            submissions_scores = submissions_api.get_scores(str(self.course_key), anonymous_user_id)
+
+        earned, possible, new_state, recomputed = calculate_scores(children, csm_rows, submissions_scores, state)
+        cache.set(cache_key, (course_version, new_state), SCORES_CACHE_TIMEOUT)
+        self.stats['mode'] = 'incremental' if state is not None else 'subtree'
+        self.stats['recomputed'] = recomputed
+        return earned, possible
+
+    def _get_persisted_subsection_score(self, usage_key, course_version, csm_rows):
+        """
+        Returns the score from the persisted subsection grade if it was calculated
+        using the current version of the course after the last answer of the user
+        """
+        try:
+            grade = PersistentSubsectionGrade.read_grade(self.user.id, usage_key)
+        except PersistentSubsectionGrade.DoesNotExist:
+            return None
+        if grade.course_version != course_version:
+            return None
+        last_modified = max([row[2] for row in csm_rows.values()], default=None)
+        if last_modified and last_modified > grade.modified:
+            return None
+        return grade.earned_all, grade.possible_all
+
+    def _full_score_for_module(self, usage_key):
+        self.stats['mode'] = 'course_grade'
+        course = modulestore().get_course(self.course_key, depth=0)
+        course_grade = CourseGradeFactory().read(self.user, course)
+        return course_grade.score_for_module(usage_key)
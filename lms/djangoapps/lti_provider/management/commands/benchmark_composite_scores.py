@@ -0,0 +1,109 @@
+"""
+Management command to measure the composite LTI score calculation.
+
+Without arguments the synthetic 500-problem course is used: the scores of the assignment
+are recalculated after every answer of the user with and without the per-child scores cache.
+If the course, user and assignment block are passed the full course grade calculation
+is compared with the composite score engine on the real data.
+
+Examples:
+
+    ./manage.py lms benchmark_composite_scores --problems 500 --answers 100
+    ./manage.py lms benchmark_composite_scores --course_id course-v1:Org+Course+Run --username user1 \
+        --usage_key block-v1:Org+Course+Run+type@sequential+block@abc
+
+"""
+
+import random
+import textwrap
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.utils import timezone
+from opaque_keys.edx.keys import CourseKey, UsageKey
+
+from lms.djangoapps.grades.course_grade_factory import CourseGradeFactory
+from lms.djangoapps.lti_provider.composite_scores import CompositeScoreEngine, calculate_scores
+from xmodule.modulestore.django import modulestore
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+
+    help = textwrap.dedent(__doc__)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--problems', type=int, default=500, help='Number of problems in the synthetic course')
+        parser.add_argument('--answers', type=int, default=100, help='Number of answers (score passbacks)')
+        parser.add_argument('--course_id', help='Use the real course')
+        parser.add_argument('--username', help='User of the real course')
+        parser.add_argument('--usage_key', help='Assignment block of the real course')
+        parser.add_argument('--repeat', type=int, default=10, help='Number of the iterations for the real course')
+
+    def _run_synthetic(self, problems, answers):
+        rnd = random.Random(0)
+        course_id = 'course-v1:Org+Course+Run'
+        children = [('block-v1:Org+Course+Run+type@problem+block@p%d' % i, rnd.choice([None, 1.0, 5.0]),
+                     float(rnd.randint(1, 4)), False) for i in range(problems)]
+        csm_rows = {}
+        print('Synthetic course %s: %d problems, %d answers' % (course_id, problems, answers))
+
+        answered = []
+        for i in range(answers):
+            block_id, _weight, max_score, _uses_submissions = rnd.choice(children)
+            answered.append((block_id, float(rnd.randint(0, int(max_score))), max_score))
+
+        t1 = time.time()
+        full_recomputed = 0
+        for block_id, grade, max_grade in answered:
+            csm_rows[block_id] = (grade, max_grade, timezone.now())
+            full_earned, full_possible, _state, recomputed = calculate_scores(children, csm_rows, None)
+            full_recomputed = full_recomputed + recomputed
+        full_spent = max(time.time() - t1, 0.000001)
+
+        csm_rows = {}
+        state = None
+        t1 = time.time()
+        incremental_recomputed = 0
+        for block_id, grade, max_grade in answered:
+            csm_rows[block_id] = (grade, max_grade, timezone.now())
+            earned, possible, state, recomputed = calculate_scores(children, csm_rows, None, state)
+            incremental_recomputed = incremental_recomputed + recomputed
+        incremental_spent = max(time.time() - t1, 0.000001)
+
+        if (earned, possible) != (full_earned, full_possible):
+            print('Scores mismatch: %s != %s' % (str((earned, possible)), str((full_earned, full_possible))))
+        print('Full recomputation: %d children recomputed, %.4f sec, %.2f passbacks/sec'
+              % (full_recomputed, full_spent, answers / full_spent))
+        print('Incremental: %d children recomputed, %.4f sec, %.2f passbacks/sec'
+              % (incremental_recomputed, incremental_spent, answers / incremental_spent))
+
+    def _measure(self, title, fn, repeat):
+        t1 = time.time()
+        for _ in range(repeat):
+            earned, possible = fn()
+        spent = max(time.time() - t1, 0.000001)
+        print('%s: score %s/%s, %.4f sec per calculation' % (title, str(earned), str(possible), spent / repeat))
+
+    def _run_real(self, course_id, username, usage_key, repeat):
+        course_key = CourseKey.from_string(course_id)
+        usage_key = UsageKey.from_string(usage_key).map_into_course(course_key)
+        user = User.objects.get(username=username)
+
+        def full_score():
+            course = modulestore().get_course(course_key, depth=0)
+            return CourseGradeFactory().read(user, course).score_for_module(usage_key)
+
+        engine = CompositeScoreEngine(user, course_key)
+        self._measure('Course grade', full_score, repeat)
+        self._measure('Composite score engine', lambda: engine.score_for_module(usage_key), repeat)
+        print('Composite score engine stats: %s' % str(engine.stats))
+
+    def handle(self, *args, **options):
+        if options.get('course_id'):
+            self._run_real(options['course_id'], options['username'], options['usage_key'], options['repeat'])
+        else:
+            self._run_synthetic(options['problems'], options['answers'])
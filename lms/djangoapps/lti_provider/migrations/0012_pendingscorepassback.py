@@ -0,0 +1,35 @@
+# Generated by Django 3.2.13 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lti_provider', '0011_gradedassignment_disabled'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingScorePassback',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('graded_assignment_id', models.IntegerField()),
+                ('lti_version', models.CharField(choices=[('1.1', 'LTI 1.1'), ('1.3', 'LTI 1.3')], default='1.1', max_length=10)),
+                ('consumer_id', models.IntegerField(db_index=True)),
+                ('user_id', models.IntegerField()),
+                ('course_id', models.CharField(max_length=255)),
+                ('version', models.IntegerField(default=0)),
+                ('is_leaf', models.BooleanField(default=False)),
+                ('points_earned', models.FloatField(null=True)),
+                ('points_possible', models.FloatField(null=True)),
+                ('collapsed', models.IntegerField(default=0)),
+                ('send_after', models.DateTimeField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('graded_assignment_id', 'lti_version')},
+            },
+        ),
+    ]
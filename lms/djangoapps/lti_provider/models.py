@@ -212,6 +212,30 @@ class GradedAssignmentLock(models.Model):
                                             lti_version=lti_version).delete()
 
 
+class PendingScorePassback(models.Model):
+    """
+    The latest not yet sent score for the graded assignment. Score changes which happen
+    before the passback is sent are coalesced into the single row (only the latest version is sent).
+    Rows are grouped by `consumer_id` (LtiConsumer for LTI 1.1, LtiTool for LTI 1.3) to be sent in batches.
+    """
+    graded_assignment_id = models.IntegerField(null=False)
+    lti_version = models.CharField(max_length=10, choices=LTI_VERSIONS, default=LTI1p1)
+    consumer_id = models.IntegerField(null=False, db_index=True)
+    user_id = models.IntegerField(null=False)
+    course_id = models.CharField(max_length=255, null=False)
+    version = models.IntegerField(default=0)
+    is_leaf = models.BooleanField(default=False)
+    points_earned = models.FloatField(null=True)
+    points_possible = models.FloatField(null=True)
+    collapsed = models.IntegerField(default=0)
+    send_after = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('graded_assignment_id', 'lti_version')
+
+
 class LtiContextId(models.Model):
     user = models.ForeignKey(User, db_index=True, on_delete=models.CASCADE)
     course_key = CourseKeyField(max_length=255, db_index=True)
@@ -18,6 +18,21 @@ from lms.djangoapps.lti_provider.models import GradedAssignment, OutcomeService
 
 log = logging.getLogger("edx.lti_provider")
 
+# (connect, read) timeouts of the requests to the outcome service
+OUTCOME_SERVICE_HTTP_TIMEOUT = (5, 30)
+
+_http_session = None
+
+
+def get_http_session():
+    """
+    Persistent HTTP session to reuse connections to the LTI consumers
+    """
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+    return _http_session
+
 
 class OutcomeServiceSendScoreError(Exception):
     def __init__(self, message, response_body=None, request_body=None,
@@ -229,11 +244,12 @@ def sign_and_send_replace_result(assignment, xml):
     )
 
     headers = {'content-type': 'application/xml'}
-    response = requests.post(
+    response = get_http_session().post(
         assignment.outcome_service.lis_outcome_service_url,
         data=xml,
         auth=oauth,
-        headers=headers
+        headers=headers,
+        timeout=OUTCOME_SERVICE_HTTP_TIMEOUT
     )
 
     return response
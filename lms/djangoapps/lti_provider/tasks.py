@@ -2,17 +2,22 @@
 Asynchronous tasks for the LTI provider app.
 """
 
+import datetime
 import logging
 import uuid
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 from opaque_keys.edx.keys import CourseKey
 
 import lms.djangoapps.lti_provider.outcomes as outcomes
+from lms.djangoapps.lti_provider.composite_scores import CompositeScoreEngine
 from lms import CELERY_APP
-from lms.djangoapps.grades.course_grade_factory import CourseGradeFactory
-from lms.djangoapps.lti_provider.models import GradedAssignment, SendScoresLock, log_lti
+from lms.djangoapps.lti_provider.models import GradedAssignment, PendingScorePassback, SendScoresLock, log_lti
 from lms.djangoapps.lti_provider.views import parse_course_and_usage_keys
 from common.djangoapps.credo_modules.task_repeater import TaskRepeater, get_countdown
 from xmodule.modulestore.django import modulestore
@@ -22,6 +27,12 @@ User = get_user_model()
 
 
 LTI_TASKS_MAX_RETRIES = 7
+LTI_LEAF_SCORE_PASSBACK_DELAY = 10
+PENDING_OUTCOMES_SCHEDULE_KEY = 'lti_pending_outcomes_scheduled:%s:%s'
+# the item being sent becomes due again after this time (sec) if the worker was lost
+PENDING_OUTCOMES_LEASE = 60 * 10
+# items which are overdue for this time (sec) are scheduled again by exec_delayed_tasks
+PENDING_OUTCOMES_SWEEP_DELAY = 60
 
 
 @CELERY_APP.task(name='lms.djangoapps.lti_provider.tasks.send_composite_outcome', bind=True)
@@ -84,9 +95,21 @@ def send_leaf_outcome(self, assignment_id, points_earned, points_possible, task_
                    assignment_id=assignment_id, err_msg=str(exc), max_attempts=LTI_TASKS_MAX_RETRIES)
 
 
+@CELERY_APP.task(name='lms.djangoapps.lti_provider.tasks.send_pending_outcomes', bind=True)
+def send_pending_outcomes(self, consumer_id):
+    """
+    Send all pending (coalesced) score updates for the LTI consumer
+    """
+    handler = ScoresHandler()
+    handler.send_pending_outcomes(consumer_id, self.request.id)
+
+
 class ScoresHandler(object):
 
     _lti_version = '1.1'
+    _leaf_task_name = 'send_leaf_outcome'
+    _composite_task_name = 'send_composite_outcome'
+    _assignment_related_fields = ('outcome_service',)
 
     def score_changed_handler(self, **kwargs):  # pylint: disable=unused-argument
         points_possible = kwargs.get('weighted_possible', None)
@@ -100,12 +123,12 @@ class ScoresHandler(object):
             assignments = self._increment_assignment_versions(course_key, usage_key, user_id)
             for assignment in assignments:
                 if assignment.usage_key == usage_key:
-                    self._send_leaf_outcome(assignment.id, points_earned, points_possible)
+                    self._add_pending_outcome(assignment, user_id, course_id, points_earned, points_possible)
                     log_lti('send_leaf_outcome_task_added', user_id, '', course_id, False, assignment, None,
                             points_possible=points_possible, points_earned=points_earned, usage_id=usage_id,
                             lti_version=self._lti_version)
                 else:
-                    self._send_composite_outcome(user_id, course_id, assignment.id, assignment.version_number)
+                    self._add_pending_outcome(assignment, user_id, course_id)
                     log_lti('send_composite_outcome_task_added', user_id, '', course_id, False, assignment, None,
                             points_possible=points_possible, points_earned=points_earned, usage_id=usage_id,
                             countdown=settings.LTI_AGGREGATE_SCORE_PASSBACK_DELAY, lti_version=self._lti_version)
@@ -118,22 +141,133 @@ class ScoresHandler(object):
                     lti_version=self._lti_version)
             log.error(error_msg)
 
-    def _get_assignments_for_problem(self, descriptor, user_id, course_key):
-        return outcomes.get_assignments_for_problem(
-            descriptor, user_id, course_key
-        )
+    def _get_consumer_id(self, assignment):
+        return assignment.outcome_service.lti_consumer_id
+
+    def _get_send_pending_outcomes_task(self):
+        return send_pending_outcomes
 
-    def _send_leaf_outcome(self, assignment_id, points_earned, points_possible):
-        send_leaf_outcome.apply_async(
-            (assignment_id, points_earned, points_possible),
+    def _add_pending_outcome(self, assignment, user_id, course_id, points_earned=None, points_possible=None):
+        """
+        Coalesce the score update with the not yet sent update for the same assignment (if any)
+        """
+        is_leaf = points_earned is not None
+        delay = LTI_LEAF_SCORE_PASSBACK_DELAY if is_leaf else settings.LTI_AGGREGATE_SCORE_PASSBACK_DELAY
+        consumer_id = self._get_consumer_id(assignment)
+
+        with transaction.atomic():
+            pending, created = PendingScorePassback.objects.select_for_update().get_or_create(
+                graded_assignment_id=assignment.id, lti_version=self._lti_version,
+                defaults={
+                    'consumer_id': consumer_id,
+                    'user_id': user_id,
+                    'course_id': str(course_id),
+                    'version': assignment.version_number,
+                    'is_leaf': is_leaf,
+                    'points_earned': points_earned,
+                    'points_possible': points_possible,
+                    'send_after': timezone.now() + datetime.timedelta(seconds=delay),
+                })
+            if not created:
+                pending.version = assignment.version_number
+                pending.is_leaf = is_leaf
+                pending.points_earned = points_earned
+                pending.points_possible = points_possible
+                pending.collapsed = pending.collapsed + 1
+                pending.save()
+
+        send_after = pending.send_after
+        transaction.on_commit(lambda: self._schedule_pending_outcomes(consumer_id, send_after))
+
+    def _schedule_pending_outcomes(self, consumer_id, send_after):
+        """
+        Schedule the task to send pending outcomes for the consumer
+        if there is no task which will be run before `send_after`
+        """
+        key = PENDING_OUTCOMES_SCHEDULE_KEY % (self._lti_version, consumer_id)
+        send_after_ts = send_after.timestamp()
+        scheduled_ts = cache.get(key)
+        if scheduled_ts is not None and scheduled_ts <= send_after_ts:
+            return
+
+        countdown = max(int(send_after_ts - timezone.now().timestamp()) + 1, 0)
+        cache.set(key, send_after_ts, countdown + settings.LTI_AGGREGATE_SCORE_PASSBACK_DELAY)
+        self._get_send_pending_outcomes_task().apply_async(
+            (consumer_id,),
+            countdown=countdown,
             routing_key=settings.HIGH_PRIORITY_QUEUE
         )
 
-    def _send_composite_outcome(self, user_id, course_id, assignment_id, assignment_version_number):
-        send_composite_outcome.apply_async(
-            (user_id, course_id, assignment_id, assignment_version_number),
-            countdown=settings.LTI_AGGREGATE_SCORE_PASSBACK_DELAY,
-            routing_key=settings.HIGH_PRIORITY_QUEUE
+    def send_pending_outcomes(self, consumer_id, celery_task_id=None):
+        cache.delete(PENDING_OUTCOMES_SCHEDULE_KEY % (self._lti_version, consumer_id))
+        pending_items = list(PendingScorePassback.objects.filter(
+            consumer_id=consumer_id, lti_version=self._lti_version, send_after__lte=timezone.now()))
+
+        sent = 0
+        collapsed = 0
+        errors = 0
+        for pending in pending_items:
+            # the item is claimed for PENDING_OUTCOMES_LEASE, it could be updated
+            # (or claimed by another task) in the meantime
+            claimed = PendingScorePassback.objects.filter(
+                id=pending.id, version=pending.version, send_after__lte=timezone.now()
+            ).update(send_after=timezone.now() + datetime.timedelta(seconds=PENDING_OUTCOMES_LEASE))
+            if not claimed:
+                continue
+
+            collapsed = collapsed + pending.collapsed
+            if pending.is_leaf:
+                task_name = self._leaf_task_name
+                task_params = [pending.graded_assignment_id, pending.points_earned, pending.points_possible]
+            else:
+                task_name = self._composite_task_name
+                task_params = [pending.user_id, pending.course_id, pending.graded_assignment_id, pending.version]
+
+            try:
+                if pending.is_leaf:
+                    self.send_leaf_outcome(pending.graded_assignment_id, pending.points_earned,
+                                           pending.points_possible, 0)
+                else:
+                    self.send_composite_outcome(pending.user_id, pending.course_id, pending.graded_assignment_id,
+                                                pending.version, 0)
+                sent = sent + 1
+            except Exception as exc:  # pylint: disable=broad-except
+                errors = errors + 1
+                TaskRepeater().restart(celery_task_id, task_name, task_params,
+                                       course_id=pending.course_id, user_id=pending.user_id,
+                                       assignment_id=pending.graded_assignment_id,
+                                       err_msg=str(exc), max_attempts=LTI_TASKS_MAX_RETRIES)
+
+            # the item is removed only when the outcome is sent or its retry is scheduled
+            deleted, _ = PendingScorePassback.objects.filter(id=pending.id, version=pending.version).delete()
+            if not deleted:
+                # the score was changed while it was sent, the new version is sent by the next task
+                PendingScorePassback.objects.filter(id=pending.id).update(send_after=timezone.now())
+
+        log.info("LTI %s outcomes for consumer %s: sent %d, collapsed %d, errors %d",
+                 self._lti_version, str(consumer_id), sent, collapsed, errors)
+
+        next_item = PendingScorePassback.objects.filter(
+            consumer_id=consumer_id, lti_version=self._lti_version).order_by('send_after').first()
+        if next_item:
+            self._schedule_pending_outcomes(consumer_id, next_item.send_after)
+
+    def schedule_overdue_outcomes(self):
+        """
+        Schedules the sending of the pending outcomes which weren't sent in time:
+        the scheduled task was lost or the worker was stopped while the outcomes were sent.
+        Returns the number of the consumers
+        """
+        dt = timezone.now() - datetime.timedelta(seconds=PENDING_OUTCOMES_SWEEP_DELAY)
+        consumer_ids = set(PendingScorePassback.objects.filter(
+            lti_version=self._lti_version, send_after__lte=dt).values_list('consumer_id', flat=True))
+        for consumer_id in consumer_ids:
+            self._schedule_pending_outcomes(consumer_id, timezone.now())
+        return len(consumer_ids)
+
+    def _get_assignments_for_problem(self, descriptor, user_id, course_key):
+        return outcomes.get_assignments_for_problem(
+            descriptor, user_id, course_key
         )
 
     def _increment_assignment_versions(self, course_key, usage_key, user_id):
@@ -147,9 +281,16 @@ class ScoresHandler(object):
         # a problem has been added several times to a course at different
         # granularities (such as the unit or the vertical).
         assignments = self._get_assignments_for_problem(problem_descriptor, user_id, course_key)
-        for assignment in assignments:
-            assignment.version_number += 1
-            assignment.save()
+        if not assignments:
+            return []
+        assignments = list(assignments.select_related(*self._assignment_related_fields))
+        if assignments:
+            model = type(assignments[0])
+            assignment_ids = [assignment.id for assignment in assignments]
+            model.objects.filter(id__in=assignment_ids).update(version_number=F('version_number') + 1)
+            versions = dict(model.objects.filter(id__in=assignment_ids).values_list('id', 'version_number'))
+            for assignment in assignments:
+                assignment.version_number = versions.get(assignment.id, assignment.version_number + 1)
         return assignments
 
     def send_composite_outcome(self, user_id, course_id, assignment_id, version, request_retries):
@@ -171,9 +312,10 @@ class ScoresHandler(object):
             course_key = CourseKey.from_string(course_id)
             mapped_usage_key = assignment.usage_key.map_into_course(course_key)
             user = User.objects.get(id=user_id)
-            course = modulestore().get_course(course_key, depth=0)
-            course_grade = CourseGradeFactory().read(user, course)
-            earned, possible = course_grade.score_for_module(mapped_usage_key)
+            score_engine = CompositeScoreEngine(user, course_key)
+            earned, possible = score_engine.score_for_module(mapped_usage_key)
+            log.info("Composite score for GradedAssignment %s was calculated: %s",
+                     assignment.id, str(score_engine.stats))
             if possible == 0:
                 weighted_score = 0
             else:
@@ -0,0 +1,120 @@
+"""
+Tests for the calculation of the composite LTI assignments scores
+"""
+
+
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+from opaque_keys.edx.locator import BlockUsageLocator, CourseLocator
+
+from common.djangoapps.student.tests.factories import UserFactory
+from lms.djangoapps.courseware.tests.factories import StudentModuleFactory
+from lms.djangoapps.lti_provider.composite_scores import CompositeScoreEngine, calculate_scores, get_subtree
+from openedx.core.djangolib.testing.utils import CacheIsolationTestCase
+
+MODULE = 'lms.djangoapps.lti_provider.composite_scores'
+
+
+class CompositeScoreEngineTest(CacheIsolationTestCase):
+    """
+    Tests for CompositeScoreEngine
+    """
+    ENABLED_CACHES = ['default']
+
+    def setUp(self):
+        super().setUp()
+        self.course_key = CourseLocator(org='some_org', course='some_course', run='some_run')
+        self.vertical_key = BlockUsageLocator(course_key=self.course_key, block_type='vertical', block_id='vertical')
+        self.problem_keys = [
+            BlockUsageLocator(course_key=self.course_key, block_type='problem', block_id='problem%d' % i)
+            for i in range(2)
+        ]
+        self.subtree = {
+            'user_specific': False,
+            'max_start': None,
+            'is_subsection': False,
+            'children': [(str(problem_key), None, 2.0, False) for problem_key in self.problem_keys],
+        }
+        self.build_subtree_mock = self._patch('_build_subtree', MagicMock(return_value=self.subtree))
+        self._patch('get_last_published_course_version', MagicMock(return_value='version1'))
+        self.course_grade = MagicMock()
+        self.course_grade.score_for_module.return_value = (3.0, 4.0)
+        self.course_grade_read_mock = self._patch('CourseGradeFactory.read', MagicMock(return_value=self.course_grade))
+        self._patch('modulestore', MagicMock())
+
+    def _patch(self, name, mock):
+        patcher = patch(MODULE + '.' + name, mock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return mock
+
+    def _answer(self, user, problem_key, grade, max_grade=2.0):
+        return StudentModuleFactory.create(
+            student=user, course_id=self.course_key, module_state_key=problem_key, grade=grade, max_grade=max_grade)
+
+    def test_subtree_is_shared_between_users(self):
+        for _i in range(3):
+            user = UserFactory.create()
+            self._answer(user, self.problem_keys[0], 1.0)
+            engine = CompositeScoreEngine(user, self.course_key)
+            assert engine.score_for_module(self.vertical_key) == (1.0, 4.0)
+            assert engine.stats['mode'] == 'subtree'
+        self.build_subtree_mock.assert_called_once_with(self.course_key, self.vertical_key)
+        assert not self.course_grade_read_mock.called
+
+    def test_subtree_is_rebuilt_for_new_course_version(self):
+        get_subtree(self.course_key, self.vertical_key, 'version1')
+        get_subtree(self.course_key, self.vertical_key, 'version1')
+        get_subtree(self.course_key, self.vertical_key, 'version2')
+        assert self.build_subtree_mock.call_count == 2
+
+    def test_only_changed_children_are_recomputed(self):
+        user = UserFactory.create()
+        self._answer(user, self.problem_keys[0], 1.0)
+        second_answer = self._answer(user, self.problem_keys[1], 0.0)
+
+        engine = CompositeScoreEngine(user, self.course_key)
+        assert engine.score_for_module(self.vertical_key) == (1.0, 4.0)
+        assert engine.stats['recomputed'] == 2
+
+        second_answer.grade = 2.0
+        second_answer.save()
+        engine = CompositeScoreEngine(user, self.course_key)
+        assert engine.score_for_module(self.vertical_key) == (3.0, 4.0)
+        assert engine.stats == {'mode': 'incremental', 'recomputed': 1}
+
+    def test_user_specific_subtree_uses_course_grade(self):
+        self.subtree['user_specific'] = True
+        engine = CompositeScoreEngine(UserFactory.create(), self.course_key)
+        assert engine.score_for_module(self.vertical_key) == (3.0, 4.0)
+        assert engine.stats['mode'] == 'course_grade'
+        self.course_grade.score_for_module.assert_called_once_with(self.vertical_key)
+
+    def test_unpublished_course_uses_course_grade(self):
+        self._patch('get_last_published_course_version', MagicMock(return_value=None))
+        engine = CompositeScoreEngine(UserFactory.create(), self.course_key)
+        assert engine.score_for_module(self.vertical_key) == (3.0, 4.0)
+        assert engine.stats['mode'] == 'course_grade'
+        assert not self.build_subtree_mock.called
+
+
+class CalculateScoresTest(SimpleTestCase):
+    """
+    Tests for calculate_scores
+    """
+
+    def test_not_answered_children(self):
+        children = [('block1', None, 2.0, False), ('block2', 4.0, 1.0, False), ('block3', None, None, False)]
+        earned, possible, state, recomputed = calculate_scores(children, {}, None)
+        assert (earned, possible) == (0.0, 6.0)
+        assert set(state) == {'block1', 'block2'}
+        assert recomputed == 3
+
+    def test_submissions_children_are_always_recomputed(self):
+        children = [('block1', None, 2.0, True)]
+        state = {'block1': (None, 0.0, 2.0)}
+        submissions_scores = {'block1': {'points_earned': 2.0, 'points_possible': 2.0}}
+        earned, possible, _state, recomputed = calculate_scores(children, {}, submissions_scores, state)
+        assert (earned, possible) == (2.0, 2.0)
+        assert recomputed == 1
@@ -168,14 +168,17 @@ class SignAndSendReplaceResultTest(TestCase):
         )
         self.assignment.save()
 
-    @patch('requests.post', return_value='response')
-    def test_sign_and_send_replace_result(self, post_mock):
+    @patch('lms.djangoapps.lti_provider.outcomes.get_http_session')
+    def test_sign_and_send_replace_result(self, session_mock):
+        post_mock = session_mock.return_value.post
+        post_mock.return_value = 'response'
         response = outcomes.sign_and_send_replace_result(self.assignment, 'xml')
         post_mock.assert_called_with(
             'http://example.com/service_url',
             data='xml',
             auth=ANY,
-            headers={'content-type': 'application/xml'}
+            headers={'content-type': 'application/xml'},
+            timeout=outcomes.OUTCOME_SERVICE_HTTP_TIMEOUT
         )
         assert response == 'response'
 
@@ -3,15 +3,19 @@ Tests for the LTI outcome service handlers, both in outcomes.py and in tasks.py
 """
 
 
-from unittest.mock import MagicMock, patch
+import datetime
+from unittest.mock import ANY, MagicMock, patch
 
 import ddt
 from django.test import TestCase
+from django.utils import timezone
 from opaque_keys.edx.locator import BlockUsageLocator, CourseLocator
 
 import lms.djangoapps.lti_provider.tasks as tasks
+from common.djangoapps.credo_modules.models import DelayedTask
 from common.djangoapps.student.tests.factories import UserFactory
-from lms.djangoapps.lti_provider.models import GradedAssignment, LtiConsumer, OutcomeService
+from lms.djangoapps.lti_provider.models import GradedAssignment, LtiConsumer, OutcomeService, PendingScorePassback
+from openedx.core.djangolib.testing.utils import CacheIsolationMixin
 
 
 class BaseOutcomeTest(TestCase):
@@ -54,7 +58,11 @@ class BaseOutcomeTest(TestCase):
         self.assignment.save()
 
         self.send_score_update_mock = self.setup_patch(
-            'lms.djangoapps.lti_provider.outcomes.send_score_update', None
+            'lms.djangoapps.lti_provider.outcomes.send_score_update', {
+                'request_body': 'request',
+                'response_body': 'response',
+                'lis_outcome_service_url': 'http://example.com/service_url',
+            }
         )
 
     def setup_patch(self, function_name, return_value):
@@ -86,7 +94,7 @@ class SendLeafOutcomeTest(BaseOutcomeTest):
             earned,
             possible
         )
-        self.send_score_update_mock.assert_called_once_with(self.assignment, expected)
+        self.send_score_update_mock.assert_called_once_with(self.assignment, expected, 0, ANY)
 
 
 @ddt.ddt
@@ -105,14 +113,16 @@ class SendCompositeOutcomeTest(BaseOutcomeTest):
         )
         self.course_grade = MagicMock()
         self.course_grade_mock = self.setup_patch(
-            'lms.djangoapps.lti_provider.tasks.CourseGradeFactory.read', self.course_grade
+            'lms.djangoapps.lti_provider.composite_scores.CourseGradeFactory.read', self.course_grade
         )
         self.module_store = MagicMock()
         self.module_store.get_item = MagicMock(return_value=self.descriptor)
         self.check_result_mock = self.setup_patch(
-            'lms.djangoapps.lti_provider.tasks.modulestore',
+            'lms.djangoapps.lti_provider.composite_scores.modulestore',
             self.module_store
         )
+        # the course isn't published in the split modulestore: the full course grade is used
+        self.setup_patch('lms.djangoapps.lti_provider.composite_scores.get_last_published_course_version', None)
 
     @ddt.data(
         (2.0, 2.0, 1.0),
@@ -125,7 +135,7 @@ class SendCompositeOutcomeTest(BaseOutcomeTest):
         tasks.send_composite_outcome(
             self.user.id, str(self.course_key), self.assignment.id, 1
         )
-        self.send_score_update_mock.assert_called_once_with(self.assignment, expected)
+        self.send_score_update_mock.assert_called_once_with(self.assignment, expected, 0, ANY)
 
     def test_outcome_with_outdated_version(self):
         self.assignment.version_number = 2
@@ -134,3 +144,127 @@ class SendCompositeOutcomeTest(BaseOutcomeTest):
             self.user.id, str(self.course_key), self.assignment.id, 1
         )
         assert self.course_grade_mock.call_count == 0
+
+
+class PendingOutcomesTest(CacheIsolationMixin, BaseOutcomeTest):
+    """
+    Tests for the coalescing of the score updates and for the send_pending_outcomes task
+    """
+    ENABLED_CACHES = ['default']
+
+    def setUp(self):
+        super().setUp()
+        self.handler = tasks.ScoresHandler()
+        self.apply_async_mock = self.setup_patch(
+            'lms.djangoapps.lti_provider.tasks.send_pending_outcomes.apply_async', None
+        )
+
+    def _add_pending_outcome(self, version, points_earned=None, points_possible=None):
+        self.assignment.version_number = version
+        self.handler._add_pending_outcome(  # pylint: disable=protected-access
+            self.assignment, self.user.id, str(self.course_key), points_earned, points_possible)
+
+    def _create_pending(self, send_after_seconds, graded_assignment_id=None):
+        return PendingScorePassback.objects.create(
+            graded_assignment_id=graded_assignment_id or self.assignment.id,
+            consumer_id=self.consumer.id,
+            user_id=self.user.id,
+            course_id=str(self.course_key),
+            version=1,
+            is_leaf=True,
+            points_earned=1,
+            points_possible=2,
+            send_after=timezone.now() + datetime.timedelta(seconds=send_after_seconds),
+        )
+
+    def test_updates_are_coalesced(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._add_pending_outcome(2, 1, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._add_pending_outcome(3, 2, 2)
+
+        pending = PendingScorePassback.objects.get(graded_assignment_id=self.assignment.id)
+        assert pending.consumer_id == self.consumer.id
+        assert pending.version == 3
+        assert pending.is_leaf
+        assert (pending.points_earned, pending.points_possible) == (2, 2)
+        assert pending.collapsed == 1
+        # the task which is already scheduled sends the latest update
+        self.apply_async_mock.assert_called_once()
+        assert self.apply_async_mock.call_args[0][0] == (self.consumer.id,)
+
+    def test_composite_update_replaces_leaf_update(self):
+        self._add_pending_outcome(2, 1, 2)
+        self._add_pending_outcome(3)
+
+        pending = PendingScorePassback.objects.get(graded_assignment_id=self.assignment.id)
+        assert not pending.is_leaf
+        assert pending.points_earned is None
+        assert pending.version == 3
+
+    def test_send_pending_outcomes(self):
+        self._create_pending(-10)
+        not_due = self._create_pending(60, graded_assignment_id=self.assignment.id + 1)
+
+        tasks.send_pending_outcomes(self.consumer.id)
+
+        self.send_score_update_mock.assert_called_once_with(self.assignment, 0.5, 0, ANY)
+        assert list(PendingScorePassback.objects.values_list('id', flat=True)) == [not_due.id]
+        # the task is scheduled again for the item which isn't due yet
+        self.apply_async_mock.assert_called_once()
+        assert self.apply_async_mock.call_args[1]['countdown'] > 0
+
+    def test_send_pending_outcomes_error(self):
+        self._create_pending(-10)
+        self.send_score_update_mock.side_effect = Exception('Outcome service error')
+
+        tasks.send_pending_outcomes(self.consumer.id)
+
+        assert not PendingScorePassback.objects.exists()
+        delayed_task = DelayedTask.objects.get(assignment_id=self.assignment.id)
+        assert delayed_task.task_name == 'send_leaf_outcome'
+        assert delayed_task.attempt_num == 1
+
+    def test_item_is_kept_if_worker_is_lost(self):
+        pending = self._create_pending(-10)
+        self.send_score_update_mock.side_effect = SystemExit()
+
+        with self.assertRaises(SystemExit):
+            tasks.send_pending_outcomes(self.consumer.id)
+
+        # the item is claimed and is sent again when the lease is expired
+        pending.refresh_from_db()
+        assert pending.send_after > timezone.now()
+        PendingScorePassback.objects.filter(id=pending.id).update(
+            send_after=timezone.now() - datetime.timedelta(seconds=tasks.PENDING_OUTCOMES_SWEEP_DELAY + 1))
+        assert self.handler.schedule_overdue_outcomes() == 1
+        assert self.apply_async_mock.call_args[0][0] == (self.consumer.id,)
+
+    def test_score_changed_while_sending(self):
+        pending = self._create_pending(-10)
+
+        def send_score_update(*args, **kwargs):
+            with self.captureOnCommitCallbacks(execute=True):
+                self._add_pending_outcome(2, 2, 2)
+            return {'request_body': '', 'response_body': '', 'lis_outcome_service_url': ''}
+
+        self.send_score_update_mock.side_effect = send_score_update
+        tasks.send_pending_outcomes(self.consumer.id)
+
+        # the new score isn't removed with the sent one and is due immediately
+        pending.refresh_from_db()
+        assert pending.version == 2
+        assert (pending.points_earned, pending.points_possible) == (2, 2)
+        assert pending.send_after <= timezone.now()
+        assert self.apply_async_mock.call_args[1]['countdown'] <= 1
+
+    def test_schedule_overdue_outcomes(self):
+        self._create_pending(60)
+        assert self.handler.schedule_overdue_outcomes() == 0
+        assert not self.apply_async_mock.called
+
+        self._create_pending(-tasks.PENDING_OUTCOMES_SWEEP_DELAY - 10, graded_assignment_id=self.assignment.id + 1)
+        assert self.handler.schedule_overdue_outcomes() == 1
+        self.apply_async_mock.assert_called_once()
+        assert self.apply_async_mock.call_args[0][0] == (self.consumer.id,)
+        assert self.apply_async_mock.call_args[1]['countdown'] <= 1
@@ -0,0 +1,90 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management import BaseCommand
+from lms.djangoapps.supervisor_evaluation.pdf_renderer import SupervisorPdfRenderer
+from weasyprint import HTML, CSS
+
+
+STUB_CSS = 'body { font-family: sans-serif; } ' + ' '.join(
+    '.c%d { margin: %dpx; color: #%06x; }' % (i, i % 20, i * 997 % 0xffffff) for i in range(5000))
+
+
+class StubReportHandler(BaseHTTPRequestHandler):
+    """
+    Serves the synthetic report page and its stylesheet. The stylesheet supports ETag
+    """
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _send(self, body, content_type, headers=None):
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/static/report.css'):
+            if self.headers.get('If-None-Match') == '"stub-v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self._send(STUB_CSS, 'text/css', {'ETag': '"stub-v1"'})
+        else:
+            rows = ''.join('<tr class="c%d"><td>Skill %d</td><td>%d%%</td></tr>' % (i, i, i % 100)
+                           for i in range(200))
+            self._send('<html><head><link rel="stylesheet" href="/static/report.css"></head>'
+                       '<body><h1>Supervisor report</h1><table>%s</table></body></html>' % rows,
+                       'text/html; charset=utf-8')
+
+
+class Command(BaseCommand):
+    """
+    Measures throughput (pages/sec) of the supervisor PDF rendering
+    using a local stub HTML server
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=50, help='Number of pages to render')
+        parser.add_argument('--workers', type=int, default=4, help='Number of rendering processes')
+        parser.add_argument('--max_memory', type=int, default=512, help='Worker memory limit (MB)')
+
+    def _render_baseline(self, base_url, pages):
+        for _ in range(pages):
+            r = requests.get(base_url + '/report/')
+            css = CSS(string='@page { size: A4; margin: 0; }')
+            HTML(string=r.text, base_url=base_url).write_pdf(stylesheets=[css])
+
+    def _render_pool(self, base_url, pages, workers, max_memory):
+        tasks = [(i, base_url + '/report/', {}, {}, base_url) for i in range(pages)]
+        with SupervisorPdfRenderer(processes=workers, max_memory=max_memory) as renderer:
+            for item_id, _pdf_bytes, err_msg in renderer.render(tasks):
+                if err_msg:
+                    print('Page %d error: %s' % (item_id, err_msg))
+
+    def _measure(self, title, fn, pages, *args):
+        t1 = time.time()
+        fn(*args)
+        spent = max(time.time() - t1, 0.001)
+        print('%s: %d pages, %.2f sec, %.2f pages/sec' % (title, pages, spent, pages / spent))
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubReportHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+        pages = options['pages']
+
+        try:
+            self._measure('Sequential rendering', self._render_baseline, pages, base_url, pages)
+            self._measure('Pooled rendering (%d workers)' % options['workers'], self._render_pool, pages,
+                          base_url, pages, options['workers'], options['max_memory'])
+        finally:
+            server.shutdown()
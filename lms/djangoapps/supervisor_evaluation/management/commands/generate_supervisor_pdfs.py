@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from common.djangoapps.credo_modules.utils import get_skills_mfe_url
+from lms.djangoapps.supervisor_evaluation.tasks import generate_course_supervisor_pdfs
+
+
+class Command(BaseCommand):
+    """
+    Generates and sends PDF reports for all finished supervisor evaluations
+    of the course which weren't sent yet
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', help='Course ID')
+        parser.add_argument('--workers', type=int, default=2, help='Number of rendering processes')
+        parser.add_argument('--max_memory', type=int, default=512,
+                            help='Recycle rendering processes after the worker exceeds this memory (MB)')
+        parser.add_argument('--email_from', default=settings.BULK_EMAIL_DEFAULT_FROM_EMAIL,
+                            help='Email from address')
+
+    def handle(self, *args, **options):
+        skills_mfe_url = get_skills_mfe_url()
+        if not skills_mfe_url:
+            print('Skills MFE URL is not set')
+            return
+
+        t1 = time.time()
+        sent, errors = generate_course_supervisor_pdfs(
+            options['course_id'], skills_mfe_url, options['email_from'],
+            processes=options['workers'], max_memory=options['max_memory'])
+        print('Sent reports: %d, errors: %d, time: %.2f sec' % (sent, errors, time.time() - t1))
@@ -0,0 +1,236 @@
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+from http.cookiejar import DefaultCookiePolicy
+
+import psutil
+import requests
+from django.db import connections
+from edx_rest_framework_extensions.auth.jwt.cookies import jwt_cookie_header_payload_name, jwt_cookie_signature_name
+from openedx.core.djangoapps.user_authn.cookies import get_jwt_credentials
+from requests.adapters import HTTPAdapter
+from weasyprint import HTML, CSS, default_url_fetcher
+
+
+log = logging.getLogger("supervisor_evaluation.pdf_renderer")
+
+HTTP_TIMEOUT = 60
+HTTP_POOL_SIZE = 10
+ASSETS_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'supervisor_pdf_assets')
+PDF_PAGE_CSS = '@page { size: A4; margin: 0; }'
+RENDER_CHUNK_PER_PROCESS = 4
+
+
+class FakeRequest:
+    META = {}
+
+
+class RejectAllCookiePolicy(DefaultCookiePolicy):
+    """
+    Cookies set by the responses are never stored: the session is shared by the reports of different students
+    """
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+_http_session = None
+_http_session_pid = None
+
+
+def get_http_session():
+    """
+    Persistent HTTP session (one per process) to reuse connections to the MFE and static hosts.
+    The session keeps no cookies, the student's JWT cookies are passed with every MFE request.
+    """
+    global _http_session, _http_session_pid
+    if _http_session is None or _http_session_pid != os.getpid():
+        session = requests.Session()
+        session.cookies.set_policy(RejectAllCookiePolicy())
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _http_session = session
+        _http_session_pid = os.getpid()
+    return _http_session
+
+
+class StaticAssetsCache:
+    """
+    Local disk cache of the static assets (CSS, fonts, images) used by the report pages.
+    Items are keyed by URL and revalidated using ETag so unchanged assets are never re-downloaded.
+    """
+
+    def __init__(self, cache_dir=ASSETS_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.md5(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + '.json'), os.path.join(self.cache_dir, key + '.data')
+
+    def _read(self, url):
+        meta_path, data_path = self._paths(url)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            with open(data_path, 'rb') as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None, None
+
+    def _write(self, url, meta, content):
+        meta_path, data_path = self._paths(url)
+        # write into temp files first to not break items used by other processes
+        for path, mode, value in ((data_path, 'wb', content), (meta_path, 'w', meta)):
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, mode) as f:
+                if mode == 'w':
+                    json.dump(value, f)
+                else:
+                    f.write(value)
+            os.replace(tmp_path, path)
+
+    def fetch(self, url):
+        meta, content = self._read(url)
+        headers = {}
+        if meta and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+
+        r = get_http_session().get(url, headers=headers, timeout=HTTP_TIMEOUT)
+        if r.status_code == 304 and meta:
+            return meta, content
+        if r.status_code != 200:
+            if meta:
+                log.warning('Use cached version of the asset %s, status code: %s', url, str(r.status_code))
+                return meta, content
+            raise Exception('Asset invalid status code: ' + str(r.status_code) + ', url: ' + url)
+
+        meta = {
+            'etag': r.headers.get('ETag'),
+            'mime_type': r.headers.get('Content-Type', '').split(';')[0].strip() or None,
+            'encoding': r.encoding,
+            'redirected_url': r.url,
+        }
+        if meta['etag']:
+            self._write(url, meta, r.content)
+        return meta, r.content
+
+    def url_fetcher(self, url):
+        if not url.startswith('http://') and not url.startswith('https://'):
+            return default_url_fetcher(url)
+        meta, content = self.fetch(url)
+        return {
+            'string': content,
+            'mime_type': meta['mime_type'],
+            'encoding': meta['encoding'],
+            'redirected_url': meta['redirected_url'] or url,
+        }
+
+
+def get_supervisor_report_request(skills_mfe_url, hash_id, student):
+    """
+    Returns (url, cookies, headers) to fetch the report page from the MFE on behalf of the student
+    """
+    jwt_header_and_payload, jwt_signature = get_jwt_credentials(FakeRequest(), student)
+    mfe_url = skills_mfe_url + '/supervisor/results/' + hash_id + '/?headless=true'
+
+    cookies = {}
+    cookies[jwt_cookie_header_payload_name()] = jwt_header_and_payload
+    cookies[jwt_cookie_signature_name()] = jwt_signature
+    headers = {'USE-JWT-COOKIE': 'true'}
+    return mfe_url, cookies, headers
+
+
+def render_pdf(mfe_url, cookies, headers, base_url, assets_cache=None):
+    r = get_http_session().get(mfe_url, cookies=cookies, headers=headers, timeout=HTTP_TIMEOUT)
+    if r.status_code == 200:
+        report_html = r.text
+    else:
+        raise Exception('MFE invalid status code: ' + str(r.status_code))
+
+    if assets_cache is None:
+        assets_cache = StaticAssetsCache()
+    css = CSS(string=PDF_PAGE_CSS)
+    return HTML(string=report_html, base_url=base_url, url_fetcher=assets_cache.url_fetcher)\
+        .write_pdf(stylesheets=[css])
+
+
+_worker_assets_cache = None
+
+
+def _render_worker(task):
+    global _worker_assets_cache
+    item_id, mfe_url, cookies, headers, base_url = task
+    if _worker_assets_cache is None:
+        _worker_assets_cache = StaticAssetsCache()
+    try:
+        pdf_bytes = render_pdf(mfe_url, cookies, headers, base_url, assets_cache=_worker_assets_cache)
+        err_msg = None
+    except Exception as exc:  # pylint: disable=broad-except
+        pdf_bytes = None
+        err_msg = str(exc)
+    rss_mb = psutil.Process().memory_info().rss / (1024 * 1024)
+    return item_id, pdf_bytes, err_msg, rss_mb
+
+
+class SupervisorPdfRenderer:
+    """
+    Bounded pool of the rendering processes.
+    WeasyPrint processes could grow a lot, so the pool is recycled once any worker
+    exceeds `max_memory` MB (and every worker is restarted after `max_tasks_per_child` renders).
+    """
+
+    def __init__(self, processes=2, max_memory=512, max_tasks_per_child=50):
+        self.processes = processes
+        self.max_memory = max_memory
+        self.max_tasks_per_child = max_tasks_per_child
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            connections.close_all()
+            ctx = multiprocessing.get_context('fork')
+            self._pool = ctx.Pool(processes=self.processes, maxtasksperchild=self.max_tasks_per_child)
+        return self._pool
+
+    def _recycle_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def close(self):
+        self._recycle_pool()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def render(self, tasks):
+        """
+        `tasks` is an iterable of (item_id, mfe_url, cookies, headers, base_url), it is consumed lazily.
+        Yields (item_id, pdf_bytes, err_msg) in the order of completion.
+        """
+        tasks = iter(tasks)
+        # memory usage is checked after every chunk, the next chunk of tasks is taken
+        # from the iterable only when the previous one is rendered
+        chunk_size = self.processes * RENDER_CHUNK_PER_PROCESS
+        while True:
+            chunk = list(itertools.islice(tasks, chunk_size))
+            if not chunk:
+                break
+            recycle = False
+            for item_id, pdf_bytes, err_msg, rss_mb in self._get_pool().imap_unordered(_render_worker, chunk):
+                if rss_mb > self.max_memory:
+                    recycle = True
+                yield item_id, pdf_bytes, err_msg
+            if recycle:
+                log.info('Recycle PDF rendering pool: worker memory limit (%s MB) is exceeded', str(self.max_memory))
+                self._recycle_pool()
@@ -1,13 +1,15 @@
+import datetime
 import logging
 import os
 import tempfile
 import time
-import requests
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.mail import EmailMessage
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 from lms import CELERY_APP
 from lms.djangoapps.courseware.completion_check import check_sequential_block_is_completed
 from lms.djangoapps.supervisor_evaluation.utils import get_course_block_with_survey, copy_progress
@@ -15,21 +17,19 @@ from common.djangoapps.credo_modules.task_repeater import TaskRepeater
 from common.djangoapps.credo_modules.models import SupervisorEvaluationInvitation
 from common.djangoapps.student.models import CourseAccessRole
 from opaque_keys.edx.keys import CourseKey, UsageKey
-from edx_rest_framework_extensions.auth.jwt.cookies import jwt_cookie_header_payload_name, jwt_cookie_signature_name
-from openedx.core.djangoapps.user_authn.cookies import get_jwt_credentials
 from xmodule.modulestore.django import modulestore
-from weasyprint import HTML, CSS
+from openedx.core.djangoapps.site_configuration import helpers as configuration_helpers
+from lms.djangoapps.supervisor_evaluation.pdf_renderer import SupervisorPdfRenderer, get_supervisor_report_request,\
+    render_pdf
 
 
 SUPERVISOR_PDF_TASKS_MAX_RETRIES = 7
+# the claim of the report generation is released after this time (sec) if the process was lost
+SUPERVISOR_PDF_CLAIM_TIMEOUT = 60 * 60
 User = get_user_model()
 log = logging.getLogger("supervisor_evaluation.tasks")
 
 
-class FakeRequest:
-    META = {}
-
-
 @CELERY_APP.task(name='lms.djangoapps.supervisor_evaluation.tasks.supervisor_survey_check_finish_task', bind=True)
 def supervisor_survey_check_finish_task(self, invitation_id, skills_mfe_url, email_from_address,
                                         supervisor_generate_pdf):
@@ -62,13 +62,34 @@ def supervisor_survey_check_finish_task(self, invitation_id, skills_mfe_url, ema
                             invitation.id, skills_mfe_url, email_from_address))
 
 
+def _get_claimable_invitations():
+    dt = timezone.now() - datetime.timedelta(seconds=SUPERVISOR_PDF_CLAIM_TIMEOUT)
+    return SupervisorEvaluationInvitation.objects.filter(
+        Q(pdf_claimed_at__isnull=True) | Q(pdf_claimed_at__lte=dt), pdf_generated=False)
+
+
+def claim_supervisor_pdf(invitation_id):
+    """
+    Atomically marks the report as being generated, so the batch command and the Celery task
+    never send the same report twice. Returns False if the report is already sent or claimed.
+    """
+    return _get_claimable_invitations().filter(id=invitation_id).update(pdf_claimed_at=timezone.now()) == 1
+
+
+def release_supervisor_pdf(invitation_id, pdf_generated=False):
+    SupervisorEvaluationInvitation.objects.filter(id=invitation_id).update(
+        pdf_generated=pdf_generated, pdf_claimed_at=None)
+
+
 @CELERY_APP.task(name='common.djangoapps.credo_modules.tasks.generate_supervisor_pdf_task', bind=True)
 def generate_supervisor_pdf_task(self, invitation_id, skills_mfe_url, email_from_address, task_id=None):
     tr = TaskRepeater(task_id)
     pdf_path = None
+    claimed = False
     try:
         invitation = SupervisorEvaluationInvitation.objects.filter(id=invitation_id).first()
-        if invitation:
+        claimed = bool(invitation) and claim_supervisor_pdf(invitation_id)
+        if claimed:
             course_key = CourseKey.from_string(invitation.course_id)
             usage_key = UsageKey.from_string(invitation.evaluation_block_id)
             with modulestore().bulk_operations(course_key):
@@ -78,42 +99,108 @@ def generate_supervisor_pdf_task(self, invitation_id, skills_mfe_url, email_from
                 student = User.objects.get(id=invitation.student_id)
 
                 pdf_bytes = generate_supervisor_pdf(skills_mfe_url, invitation.url_hash, student)
-                pdf_name = 'Report-' + str(invitation_id) + '-' + str(int(time.time())) + '.pdf'
-                pdf_path = os.path.join(tempfile.mkdtemp(), pdf_name)
-
-                tf = open(pdf_path, 'w+b')
-                tf.write(pdf_bytes)
-                tf.close()
+                pdf_path = _save_supervisor_pdf(invitation_id, pdf_bytes)
 
                 send_supervisor_pdf(pdf_path, email_from_address, sequential_name, invitation)
                 os.remove(pdf_path)
+                release_supervisor_pdf(invitation_id, pdf_generated=True)
+        elif invitation:
+            log.info('Supervisor report for invitation %s is already sent or generated by another process',
+                     str(invitation_id))
         tr.finish()
     except Exception as exc:
         if pdf_path:
             os.remove(pdf_path)
+        if claimed:
+            release_supervisor_pdf(invitation_id)
         tr.restart(self.request.id, 'generate_supervisor_pdf_task',
                    [invitation_id, skills_mfe_url, email_from_address],
                    err_msg=str(exc), max_attempts=SUPERVISOR_PDF_TASKS_MAX_RETRIES)
 
 
 def generate_supervisor_pdf(skills_mfe_url, hash_id, student):
-    jwt_header_and_payload, jwt_signature = get_jwt_credentials(FakeRequest(), student)
-    mfe_url = skills_mfe_url + '/supervisor/results/' + hash_id + '/?headless=true'
-
-    cookies = {}
-    cookies[jwt_cookie_header_payload_name()] = jwt_header_and_payload
-    cookies[jwt_cookie_signature_name()] = jwt_signature
-    headers = {'USE-JWT-COOKIE': 'true'}
-
-    r = requests.get(mfe_url, cookies=cookies, headers=headers)
-    if r.status_code == 200:
-        report_html = r.text
-    else:
-        raise Exception('MFE invalid status code: ' + str(r.status_code))
-
-    css = CSS(string='@page { size: A4; margin: 0; }')
-    pdf_bytes = HTML(string=report_html, base_url=skills_mfe_url).write_pdf(stylesheets=[css])
-    return pdf_bytes
+    mfe_url, cookies, headers = get_supervisor_report_request(skills_mfe_url, hash_id, student)
+    return render_pdf(mfe_url, cookies, headers, skills_mfe_url)
+
+
+def _save_supervisor_pdf(invitation_id, pdf_bytes):
+    pdf_name = 'Report-' + str(invitation_id) + '-' + str(int(time.time())) + '.pdf'
+    pdf_path = os.path.join(tempfile.mkdtemp(), pdf_name)
+
+    tf = open(pdf_path, 'w+b')
+    tf.write(pdf_bytes)
+    tf.close()
+    return pdf_path
+
+
+def generate_course_supervisor_pdfs(course_id, skills_mfe_url, email_from_address, processes=2, max_memory=512):
+    """
+    Renders and sends PDF reports for all finished supervisor evaluations in the course
+    which weren't sent yet. Pages are rendered by the pool of processes.
+    Returns tuple (number of sent reports, number of errors)
+    """
+    course_key = CourseKey.from_string(course_id)
+    if not configuration_helpers.get_value_for_org(course_key.org, 'supervisor_generate_pdf', False):
+        log.info('Supervisor reports generation is disabled for the course %s', course_id)
+        return 0, 0
+
+    invitations = {i.id: i for i in _get_claimable_invitations().filter(
+        course_id=course_id, survey_finished=True).order_by('id')}
+    if not invitations:
+        return 0, 0
+
+    students = {u.id: u for u in User.objects.filter(id__in=[i.student_id for i in invitations.values()])}
+    sequential_names = {}
+    with modulestore().bulk_operations(course_key):
+        for invitation in invitations.values():
+            if invitation.evaluation_block_id not in sequential_names:
+                usage_key = UsageKey.from_string(invitation.evaluation_block_id)
+                sequential_names[invitation.evaluation_block_id] = modulestore().get_item(usage_key).display_name
+
+    stats = {'sent': 0, 'errors': 0}
+
+    def _iter_tasks():
+        # JWT is created right before the page is sent to the rendering pool
+        # to not expire while the previous reports are rendered
+        for invitation in invitations.values():
+            # the report could be already sent by generate_supervisor_pdf_task
+            if not claim_supervisor_pdf(invitation.id):
+                continue
+            try:
+                mfe_url, cookies, headers = get_supervisor_report_request(
+                    skills_mfe_url, invitation.url_hash, students[invitation.student_id])
+            except Exception as exc:  # pylint: disable=broad-except
+                log.exception('Supervisor report for invitation %s was not generated: %s',
+                              str(invitation.id), str(exc))
+                release_supervisor_pdf(invitation.id)
+                stats['errors'] = stats['errors'] + 1
+                continue
+            yield invitation.id, mfe_url, cookies, headers, skills_mfe_url
+
+    with SupervisorPdfRenderer(processes=processes, max_memory=max_memory) as renderer:
+        for invitation_id, pdf_bytes, err_msg in renderer.render(_iter_tasks()):
+            invitation = invitations[invitation_id]
+            if err_msg:
+                log.error('Supervisor report for invitation %s was not generated: %s', str(invitation_id), err_msg)
+                release_supervisor_pdf(invitation_id)
+                stats['errors'] = stats['errors'] + 1
+                continue
+
+            pdf_path = None
+            try:
+                pdf_path = _save_supervisor_pdf(invitation_id, pdf_bytes)
+                send_supervisor_pdf(pdf_path, email_from_address,
+                                    sequential_names[invitation.evaluation_block_id], invitation)
+                release_supervisor_pdf(invitation_id, pdf_generated=True)
+                stats['sent'] = stats['sent'] + 1
+            except Exception as exc:  # pylint: disable=broad-except
+                log.exception('Supervisor report for invitation %s was not sent: %s', str(invitation_id), str(exc))
+                release_supervisor_pdf(invitation_id)
+                stats['errors'] = stats['errors'] + 1
+            finally:
+                if pdf_path:
+                    os.remove(pdf_path)
+    return stats['sent'], stats['errors']
 
 
 def send_supervisor_pdf(pdf_path, email_from_address, seq_block_name, invitation):
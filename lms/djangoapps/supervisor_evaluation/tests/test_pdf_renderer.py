@@ -0,0 +1,51 @@
+"""
+Tests for the HTTP session used to render the supervisor PDF reports
+"""
+
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import SimpleTestCase
+
+from lms.djangoapps.supervisor_evaluation.pdf_renderer import get_http_session
+
+
+class CookieHandler(BaseHTTPRequestHandler):
+    """
+    Sets a cookie and returns the cookies sent by the client
+    """
+
+    def do_GET(self):
+        body = (self.headers.get('Cookie') or '').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Set-Cookie', 'sessionid=student; Path=/')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class HttpSessionTest(SimpleTestCase):
+    """
+    Tests for get_http_session
+    """
+
+    def setUp(self):
+        super().setUp()
+        server = ThreadingHTTPServer(('127.0.0.1', 0), CookieHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = 'http://127.0.0.1:%d/' % server.server_address[1]
+
+    def test_cookies_are_not_persisted(self):
+        session = get_http_session()
+        assert session.get(self.url, cookies={'jwt': 'student1'}).text == 'jwt=student1'
+        assert not list(session.cookies)
+        # the next report (or asset) request doesn't receive the cookies of the previous one
+        assert session.get(self.url, cookies={'jwt': 'student2'}).text == 'jwt=student2'
+        assert session.get(self.url).text == ''
@@ -0,0 +1,212 @@
+"""
+Tests for the generation of the supervisor PDF reports
+"""
+
+
+import datetime
+from importlib import import_module
+from unittest.mock import MagicMock, patch
+
+from django.apps import apps
+from django.test import TestCase
+from django.utils import timezone
+
+from common.djangoapps.credo_modules.models import SupervisorEvaluationInvitation
+from common.djangoapps.student.tests.factories import UserFactory
+from lms.djangoapps.supervisor_evaluation.tasks import (
+    SUPERVISOR_PDF_CLAIM_TIMEOUT,
+    claim_supervisor_pdf,
+    generate_course_supervisor_pdfs,
+    generate_supervisor_pdf_task
+)
+
+COURSE_ID = 'course-v1:org+course+run'
+BLOCK_ID = 'block-v1:org+course+run+type@sequential+block@evaluation'
+TASKS_MODULE = 'lms.djangoapps.supervisor_evaluation.tasks'
+
+
+class FakePdfRenderer:
+    """
+    Renders the tasks one by one in the current process
+    """
+
+    def __init__(self, events, errors=None, **kwargs):
+        self.events = events
+        self.errors = errors or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def render(self, tasks):
+        for item_id, _mfe_url, _cookies, _headers, _base_url in tasks:
+            self.events.append(('render', item_id))
+            if item_id in self.errors:
+                yield item_id, None, self.errors[item_id]
+            else:
+                yield item_id, b'%PDF-1.4', None
+
+
+class GenerateCourseSupervisorPdfsTest(TestCase):
+    """
+    Tests for generate_course_supervisor_pdfs
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.events = []
+        self.invitations = [
+            SupervisorEvaluationInvitation.objects.create(
+                url_hash='hash%d' % i, course_id=COURSE_ID, evaluation_block_id=BLOCK_ID,
+                student=UserFactory.create(), email='supervisor%d@example.com' % i, survey_finished=True)
+            for i in range(3)
+        ]
+        SupervisorEvaluationInvitation.objects.create(
+            url_hash='not_finished', course_id=COURSE_ID, evaluation_block_id=BLOCK_ID,
+            student=UserFactory.create(), email='supervisor@example.com', survey_finished=False)
+
+        def get_report_request(skills_mfe_url, hash_id, student):
+            self.events.append(('token', hash_id))
+            return skills_mfe_url + '/supervisor/results/' + hash_id, {}, {}
+
+        mock_modulestore = MagicMock()
+        mock_modulestore.return_value.get_item.return_value.display_name = 'Evaluation'
+        self.mock_send = MagicMock()
+        self.mock_config = MagicMock(return_value=True)
+        for target, value in (('modulestore', mock_modulestore),
+                              ('get_supervisor_report_request', get_report_request),
+                              ('send_supervisor_pdf', self.mock_send),
+                              ('configuration_helpers.get_value_for_org', self.mock_config)):
+            patcher = patch(TASKS_MODULE + '.' + target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _generate(self, errors=None):
+        with patch(TASKS_MODULE + '.SupervisorPdfRenderer',
+                   lambda **kwargs: FakePdfRenderer(self.events, errors=errors, **kwargs)):
+            return generate_course_supervisor_pdfs(COURSE_ID, 'https://skills.example.com', 'from@example.com')
+
+    def _pdf_generated_ids(self):
+        return set(SupervisorEvaluationInvitation.objects.filter(
+            pdf_generated=True).values_list('id', flat=True))
+
+    def test_generation_is_disabled(self):
+        self.mock_config.return_value = False
+        assert self._generate() == (0, 0)
+        assert not self.events
+        self.mock_config.assert_called_once_with('org', 'supervisor_generate_pdf', False)
+
+    def test_reports_are_sent(self):
+        assert self._generate() == (3, 0)
+        assert self.mock_send.call_count == 3
+        assert self._pdf_generated_ids() == {i.id for i in self.invitations}
+        # the next run doesn't send the reports again
+        assert self._generate() == (0, 0)
+
+    def test_token_is_created_before_render(self):
+        self._generate()
+        assert self.events == [
+            event
+            for invitation in self.invitations
+            for event in (('token', invitation.url_hash), ('render', invitation.id))
+        ]
+
+    def test_failed_reports_dont_abort_batch(self):
+        self.mock_send.side_effect = [Exception('SMTP error'), None]
+        assert self._generate(errors={self.invitations[2].id: 'MFE invalid status code: 500'}) == (1, 2)
+        assert self._pdf_generated_ids() == {self.invitations[1].id}
+        # the failed reports are released to be sent by the next run
+        assert not SupervisorEvaluationInvitation.objects.filter(pdf_claimed_at__isnull=False).exists()
+
+    def test_claimed_reports_are_skipped(self):
+        claimed, lost = self.invitations[0], self.invitations[1]
+        assert claim_supervisor_pdf(claimed.id)
+        assert claim_supervisor_pdf(lost.id)
+        # the claim of the lost process is expired
+        SupervisorEvaluationInvitation.objects.filter(id=lost.id).update(
+            pdf_claimed_at=timezone.now() - datetime.timedelta(seconds=SUPERVISOR_PDF_CLAIM_TIMEOUT + 60))
+
+        assert self._generate() == (2, 0)
+        assert [event[1] for event in self.events if event[0] == 'render'] == [lost.id, self.invitations[2].id]
+        assert self._pdf_generated_ids() == {lost.id, self.invitations[2].id}
+
+    def test_report_claimed_during_batch_is_skipped(self):
+        def get_report_request(skills_mfe_url, hash_id, student):
+            # generate_supervisor_pdf_task claims the next report while the batch is processed
+            claim_supervisor_pdf(self.invitations[1].id)
+            return skills_mfe_url + '/supervisor/results/' + hash_id, {}, {}
+
+        with patch(TASKS_MODULE + '.get_supervisor_report_request', get_report_request):
+            assert self._generate() == (2, 0)
+        assert self.mock_send.call_count == 2
+        assert self._pdf_generated_ids() == {self.invitations[0].id, self.invitations[2].id}
+
+
+class GenerateSupervisorPdfTaskTest(TestCase):
+    """
+    Tests for generate_supervisor_pdf_task
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.invitation = SupervisorEvaluationInvitation.objects.create(
+            url_hash='hash', course_id=COURSE_ID, evaluation_block_id=BLOCK_ID,
+            student=UserFactory.create(), email='supervisor@example.com', survey_finished=True)
+        self.mock_send = MagicMock()
+        self.mock_generate = MagicMock(return_value=b'%PDF-1.4')
+        for target, value in (('modulestore', MagicMock()),
+                              ('generate_supervisor_pdf', self.mock_generate),
+                              ('send_supervisor_pdf', self.mock_send)):
+            patcher = patch(TASKS_MODULE + '.' + target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _run_task(self):
+        generate_supervisor_pdf_task.apply(args=[self.invitation.id, 'https://skills.example.com', 'from@example.com'])
+        self.invitation.refresh_from_db()
+
+    def test_report_is_sent_once(self):
+        self._run_task()
+        assert self.mock_send.call_count == 1
+        assert self.invitation.pdf_generated
+        assert self.invitation.pdf_claimed_at is None
+
+        self._run_task()
+        assert self.mock_send.call_count == 1
+
+    def test_claimed_report_is_skipped(self):
+        assert claim_supervisor_pdf(self.invitation.id)
+        self._run_task()
+        assert not self.mock_generate.called
+        assert not self.mock_send.called
+
+    def test_claim_is_released_on_error(self):
+        self.mock_send.side_effect = Exception('SMTP error')
+        self._run_task()
+        assert not self.invitation.pdf_generated
+        assert self.invitation.pdf_claimed_at is None
+
+
+class PdfGeneratedBackfillTest(TestCase):
+    """
+    Tests for the data migration which marks the reports of the finished evaluations as sent
+    """
+
+    def test_backfill(self):
+        migration = import_module(
+            'common.djangoapps.credo_modules.migrations.0084_supervisorevaluationinvitation_pdf_generated_backfill')
+        finished = SupervisorEvaluationInvitation.objects.create(
+            url_hash='finished', course_id=COURSE_ID, evaluation_block_id=BLOCK_ID,
+            student=UserFactory.create(), email='supervisor1@example.com', survey_finished=True)
+        not_finished = SupervisorEvaluationInvitation.objects.create(
+            url_hash='not_finished', course_id=COURSE_ID, evaluation_block_id=BLOCK_ID,
+            student=UserFactory.create(), email='supervisor2@example.com', survey_finished=False)
+
+        migration.mark_finished_invitations_pdf_generated(apps, None)
+
+        finished.refresh_from_db()
+        not_finished.refresh_from_db()
+        assert finished.pdf_generated
+        assert not not_finished.pdf_generated
@@ -1081,6 +1081,10 @@ EXPLICIT_QUEUES = {
         'queue': HIGH_PRIORITY_QUEUE},
     'lms.djangoapps.lti1p3_tool.tasks.lti1p3_send_leaf_outcome': {
         'queue': HIGH_PRIORITY_QUEUE},
+    'lms.djangoapps.lti_provider.tasks.send_pending_outcomes': {
+        'queue': HIGH_PRIORITY_QUEUE},
+    'lms.djangoapps.lti1p3_tool.tasks.lti1p3_send_pending_outcomes': {
+        'queue': HIGH_PRIORITY_QUEUE},
     'lms.djangoapps.courseware.tasks.exec_delayed_tasks': {
         'queue': HIGH_PRIORITY_QUEUE},
 }
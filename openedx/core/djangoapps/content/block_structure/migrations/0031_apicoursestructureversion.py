@@ -0,0 +1,26 @@
+# Generated by Django 3.2.13 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('block_structure', '0030_alter_apiblockinfonotsiblings_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiCourseStructureVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_id', models.CharField(max_length=255, unique=True)),
+                ('version', models.CharField(max_length=255)),
+                ('blocks', models.TextField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'api_course_structure_version',
+            },
+        ),
+    ]
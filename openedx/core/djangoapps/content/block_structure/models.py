@@ -367,6 +367,23 @@ class ApiCourseStructureUpdateTime(models.Model):
         db_table = 'api_course_structure_update_time'
 
 
+class ApiCourseStructureVersion(models.Model):
+    """
+    Published structure version of the course processed by the last `update_course_structure` call
+    with fingerprints of all blocks (used to find blocks changed after the next publish).
+    """
+    course_id = models.CharField(max_length=255, unique=True)
+    version = models.CharField(max_length=255)
+    blocks = models.TextField()
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'api_course_structure_version'
+
+    def get_blocks(self):
+        return json.loads(self.blocks)
+
+
 class ApiCourseStructureLockResult:
 
     def __init__(self, is_locked=False, is_new=False, lock=None):
@@ -24,9 +24,11 @@ from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore import ModuleStoreEnum
 from openedx.core.djangoapps.content.block_structure.models import ApiCourseStructure, ApiCourseStructureLock,\
-    ApiCourseStructureTags, BlockToSequential, CourseFieldsCache, OraBlockStructure
+    ApiCourseStructureTags, ApiCourseStructureVersion, BlockToSequential, CourseFieldsCache, OraBlockStructure
+from common.djangoapps.credo_modules.course_metadata import CourseMetadataCache
 from common.djangoapps.credo_modules.events_processor.utils import prepare_text_for_column_db
-from common.djangoapps.credo_modules.models import TrackingLogConfig
+from common.djangoapps.credo_modules.models import LearnerTagScoreCourse, TrackingLogConfig
+from common.djangoapps.credo_modules.mongo import get_course_structure
 from common.djangoapps.credo_modules.vertica import update_data_in_vertica, get_vertica_dsn
 
 log = logging.getLogger('edx.celery.task')
@@ -224,11 +226,88 @@ def update_structure_of_all_courses(self):
     return "\n".join(logs_data) if logs_data else None
 
 
-def update_course_structure(course_id, logs_data=None):
-    allowed_categories = ['chapter', 'sequential', 'vertical', 'library_content', 'problem',
-                          'openassessment', 'drag-and-drop-v2', 'image-explorer',
-                          'freetextresponse', 'text-highlighter',
-                          'html', 'video', 'survey']
+COURSE_STRUCTURE_CATEGORIES = ['chapter', 'sequential', 'vertical', 'library_content', 'problem',
+                               'openassessment', 'drag-and-drop-v2', 'image-explorer',
+                               'freetextresponse', 'text-highlighter',
+                               'html', 'video', 'survey']
+DB_FILTER_CHUNK_SIZE = 1000
+
+
+def _get_published_structure_fingerprints(course_key):
+    """
+    Returns version of the published course structure and the dict
+    block_id -> [block_type, parent_block_id, fingerprint of the block's definition, settings and asides]
+    """
+    structure = get_course_structure(course_key)
+    if not structure:
+        return None, None
+
+    parents = {}
+    for block in structure['blocks']:
+        for _child_type, child_id in block.get('fields', {}).get('children', []):
+            parents[child_id] = block['block_id']
+
+    fingerprints = {}
+    for block in structure['blocks']:
+        fingerprint_src = json.dumps([str(block.get('definition')), block.get('fields', {}), block.get('asides', [])],
+                                     sort_keys=True, default=str)
+        fingerprints[block['block_id']] = [
+            block['block_type'],
+            parents.get(block['block_id']),
+            hashlib.md5(fingerprint_src.encode('utf-8')).hexdigest()
+        ]
+    return str(structure['_id']), fingerprints
+
+
+def _get_changed_blocks(old_fingerprints, new_fingerprints):
+    """
+    Returns ids of the blocks that should be reprocessed (changed or moved blocks and
+    all their descendants, because they inherit names, graded and visibility settings)
+    and ids of the blocks that should be loaded from the modulestore (changed blocks with their ancestors)
+    """
+    children = {}
+    for block_id, (_block_type, parent_id, _fingerprint) in new_fingerprints.items():
+        if parent_id:
+            children.setdefault(parent_id, []).append(block_id)
+
+    changed = [block_id for block_id, value in new_fingerprints.items() if old_fingerprints.get(block_id) != value]
+    dirty = set(changed)
+    while changed:
+        block_id = changed.pop()
+        for child_id in children.get(block_id, []):
+            if child_id not in dirty:
+                dirty.add(child_id)
+                changed.append(child_id)
+
+    to_load = set(dirty)
+    for block_id in dirty:
+        parent_id = new_fingerprints[block_id][1]
+        while parent_id and parent_id not in to_load:
+            to_load.add(parent_id)
+            parent_id = new_fingerprints[parent_id][1] if parent_id in new_fingerprints else None
+    return dirty, to_load
+
+
+def _filter_by_block_ids(queryset, block_ids, field_name='block_id'):
+    if block_ids is None:
+        return list(queryset)
+    result = []
+    block_ids = list(block_ids)
+    for i in range(0, len(block_ids), DB_FILTER_CHUNK_SIZE):
+        result.extend(queryset.filter(**{field_name + '__in': block_ids[i:i + DB_FILTER_CHUNK_SIZE]}))
+    return result
+
+
+def update_course_structure(course_id, logs_data=None, incremental=True):
+    """
+    Updates ApiCourseStructure, ApiCourseStructureTags, BlockToSequential and OraBlockStructure
+    data using the published version of the course.
+
+    In the incremental mode the published structure is compared with the version
+    processed last time and only changed blocks (and their descendants) are loaded
+    from the modulestore and updated in the DB.
+    """
+    allowed_categories = COURSE_STRUCTURE_CATEGORIES
     course_key = CourseKey.from_string(course_id)
     t1 = time.time()
     if logs_data is None:
@@ -236,6 +315,30 @@ def update_course_structure(course_id, logs_data=None):
 
     auto_update_seq_block_in_vertica = int(TrackingLogConfig.get_setting('auto_update_sequential_block_in_vertica', 0))
 
+    structure_version, fingerprints = _get_published_structure_fingerprints(course_key)
+    version_obj = ApiCourseStructureVersion.objects.filter(course_id=str(course_id)).first()
+    dirty_block_ids = None
+    alive_block_ids = None
+    block_ids_to_load = None
+
+    if incremental and structure_version and version_obj:
+        if version_obj.version == structure_version:
+            log_entry = "Update %s structure results: version %s is already processed"\
+                        % (str(course_id), structure_version)
+            logs_data.append(log_entry)
+            log.info(log_entry)
+            return logs_data
+        dirty, to_load = _get_changed_blocks(version_obj.get_blocks(), fingerprints)
+        dirty_block_ids = set()
+        for block_id in dirty:
+            if fingerprints[block_id][0] in allowed_categories:
+                dirty_block_ids.add(str(course_key.make_usage_key(fingerprints[block_id][0], block_id)))
+        alive_block_ids = set()
+        for block_id, (block_type, _parent_id, _fingerprint) in fingerprints.items():
+            if block_type in allowed_categories:
+                alive_block_ids.add(str(course_key.make_usage_key(block_type, block_id)))
+        block_ids_to_load = list(to_load)
+
     with modulestore().branch_setting(ModuleStoreEnum.Branch.published_only):
         with modulestore().bulk_operations(course_key):
             try:
@@ -243,18 +346,43 @@ def update_course_structure(course_id, logs_data=None):
                 if not course:
                     return
                 CourseFieldsCache.refresh_cache(course_id, course=course)
-                data = modulestore().get_items(course_key)
+                if block_ids_to_load is None:
+                    data = modulestore().get_items(course_key)
+                elif block_ids_to_load:
+                    data = modulestore().get_items(course_key, qualifiers={'name': block_ids_to_load})
+                else:
+                    data = []
             except ItemNotFoundError:
                 log.exception("Course isn't exist or not published: %s" % str(course_id))
                 return
 
     t2 = time.time()
 
-    existing_structure_items = ApiCourseStructure.objects.filter(course_id=str(course_id))
+    structure_dict = {}
+    structure_tags = set()
+    for item in data:
+        if item.category in allowed_categories:
+            structure_dict[str(item.location)] = item
+
+    if alive_block_ids is None:
+        alive_block_ids = set(structure_dict.keys())
+        items_to_process = data
+        db_block_ids = None
+    else:
+        items_to_process = [item for item in data if str(item.location) in dirty_block_ids]
+        db_block_ids = dirty_block_ids | {
+            str(course_key.make_usage_key(block_type, block_id))
+            for block_id, (block_type, _parent_id, _fingerprint) in version_obj.get_blocks().items()
+            if block_id not in fingerprints
+        }
+
+    existing_structure_items = _filter_by_block_ids(
+        ApiCourseStructure.objects.filter(course_id=str(course_id)), db_block_ids)
     existing_structure_items_dict = {s.block_id: s for s in existing_structure_items}
 
     existing_structure_tags_dict = {}
-    existing_structure_tags = ApiCourseStructureTags.objects.filter(course_id=str(course_id))
+    existing_structure_tags = _filter_by_block_ids(
+        ApiCourseStructureTags.objects.filter(course_id=str(course_id)), db_block_ids)
     for tag in existing_structure_tags:
         if tag.rubric:
             k = tag.block_id + '|' + tag.rubric + '|' + tag.tag_name + '|' + tag.tag_value
@@ -262,31 +390,27 @@ def update_course_structure(course_id, logs_data=None):
             k = tag.block_id + '|__|' + tag.tag_name + '|' + tag.tag_value
         existing_structure_tags_dict[k] = tag
 
-    block_to_sequential_items = BlockToSequential.objects.filter(course_id=str(course_id))
+    block_to_sequential_items = _filter_by_block_ids(
+        BlockToSequential.objects.filter(course_id=str(course_id)), db_block_ids)
     block_to_sequential_items_dict = {b2s.block_id: b2s for b2s in block_to_sequential_items}
 
-    ora_blocks = OraBlockStructure.objects.filter(course_id=str(course_id))
+    ora_blocks = _filter_by_block_ids(OraBlockStructure.objects.filter(course_id=str(course_id)), db_block_ids)
     ora_blocks_dict = {o.block_id: o for o in ora_blocks}
 
     t3 = time.time()
 
-    structure_dict = {}
-    structure_tags = []
-    for item in data:
-        if item.category in allowed_categories:
-            structure_dict[str(item.location)] = item
-
     items_to_insert = []
+    items_to_update = []
     ora_to_insert = []
+    ora_to_update = []
     tags_to_insert = []
     b2s_to_insert = []
+    b2s_to_update = []
     sequential_ids_updates = []
-    items_updated = 0
-    b2s_updated = 0
-    ora_items_updated = 0
     course_location = str(course.location)
 
-    if course_location not in existing_structure_items_dict:
+    if course_location not in existing_structure_items_dict\
+      and not ApiCourseStructure.objects.filter(block_id=course_location).exists():
         course_item = ApiCourseStructure(
             block_id=course_location,
             block_type='course',
@@ -300,7 +424,7 @@ def update_course_structure(course_id, logs_data=None):
         items_to_insert.append(course_item)
 
     with transaction.atomic():
-        for item in data:
+        for item in items_to_process:
             if item.category in allowed_categories and item.parent and item.display_name:
                 block_id = str(item.location)
                 if block_id not in existing_structure_items_dict:
@@ -314,7 +438,6 @@ def update_course_structure(course_id, logs_data=None):
                         parent_id=str(item.parent),
                         section_path=_get_section_path(item, structure_dict)
                     )
-                    block_item.save()
                     items_to_insert.append(block_item)
                 else:
                     block_item = existing_structure_items_dict[block_id]
@@ -331,8 +454,7 @@ def update_course_structure(course_id, logs_data=None):
                         block_item.section_path = section_path
                         block_item.parent_id = str(item.parent)
                         block_item.deleted = False
-                        block_item.save()
-                        items_updated += 1
+                        items_to_update.append(block_item)
 
                 if item.category == 'openassessment':
                     is_ora_empty_rubrics = len(item.rubric_criteria) == 0
@@ -383,8 +505,7 @@ def update_course_structure(course_id, logs_data=None):
                         ora_item.display_rubric_step_to_students = item.display_rubric_step_to_students
                         ora_item.steps = ora_steps
                         ora_item.ungraded = item.ungraded
-                        ora_item.save()
-                        ora_items_updated += 1
+                        ora_to_update.append(ora_item)
 
                 if item.category in ('problem', 'drag-and-drop-v2', 'image-explorer', 'text-highlighter',
                                      'freetextresponse', 'survey', 'openassessment'):
@@ -413,8 +534,7 @@ def update_course_structure(course_id, logs_data=None):
                                 b2s_item.sequential_id = parent_id
                                 b2s_item.visible_to_staff_only = item.visible_to_staff_only
                                 b2s_item.deleted = False
-                                b2s_item.save()
-                                b2s_updated += 1
+                                b2s_to_update.append(b2s_item)
 
                                 if auto_update_seq_block_in_vertica \
                                   and not settings.DEBUG \
@@ -448,7 +568,7 @@ def update_course_structure(course_id, logs_data=None):
                                     for idx, _ in enumerate(t_value_lst):
                                         t_value_upd = ' - '.join(t_value_lst[0:idx + 1])
                                         tag_id = block_id + '|__|' + t_name + '|' + t_value_upd
-                                        structure_tags.append(tag_id)
+                                        structure_tags.add(tag_id)
                                         if tag_id not in existing_structure_tags_dict:
                                             is_parent = 1 if len(t_value_lst) > idx + 1 else 0
                                             block_tag_id = hashlib.md5(block_id.encode('utf-8')).hexdigest()
@@ -456,7 +576,7 @@ def update_course_structure(course_id, logs_data=None):
                                             tags_to_insert.append(ApiCourseStructureTags(
                                                 org_id=course_key.org,
                                                 course_id=course_id,
-                                                block=block_item,
+                                                block_id=block_id,
                                                 block_tag_id=block_tag_id,
                                                 root_tag_value_hash=root_tag_value_hash,
                                                 rubric=None,
@@ -487,7 +607,7 @@ def update_course_structure(course_id, logs_data=None):
                                         for idx, _ in enumerate(t_value_lst):
                                             t_value_upd = ' - '.join(t_value_lst[0:idx + 1])
                                             tag_id = block_id + '|' + r_name + '|' + t_name + '|' + t_value_upd
-                                            structure_tags.append(tag_id)
+                                            structure_tags.add(tag_id)
                                             if tag_id not in existing_structure_tags_dict:
                                                 is_parent = 1 if len(t_value_lst) > idx + 1 else 0
                                                 block_token = block_id + '|' + r_name
@@ -496,7 +616,7 @@ def update_course_structure(course_id, logs_data=None):
                                                 tags_to_insert.append(ApiCourseStructureTags(
                                                     org_id=course_key.org,
                                                     course_id=course_id,
-                                                    block=block_item,
+                                                    block_id=block_id,
                                                     block_tag_id=block_tag_id,
                                                     root_tag_value_hash=root_tag_value_hash,
                                                     rubric=r_name,
@@ -506,22 +626,34 @@ def update_course_structure(course_id, logs_data=None):
                                                     ts=int(time.time())
                                                 ))
 
+        if items_to_insert:
+            ApiCourseStructure.objects.bulk_create([i for i in items_to_insert if i.pk is None],
+                                                   DB_FILTER_CHUNK_SIZE)
+        if items_to_update:
+            ApiCourseStructure.objects.bulk_update(
+                items_to_update, ['display_name', 'graded', 'section_path', 'parent_id', 'deleted'],
+                DB_FILTER_CHUNK_SIZE)
+
         items_to_remove = []
         for block_id, block_item in existing_structure_items_dict.items():
-            if block_id not in structure_dict and block_item.block_type != 'course' and not block_item.deleted:
+            if block_id not in alive_block_ids and block_item.block_type != 'course' and not block_item.deleted:
                 items_to_remove.append(block_item.id)
         if items_to_remove:
             ApiCourseStructure.objects.filter(id__in=items_to_remove).update(deleted=True)
 
         b2s_to_remove = []
         for b2s_id, b2s_item in block_to_sequential_items_dict.items():
-            if b2s_id not in structure_dict and not b2s_item.deleted:
+            if b2s_id not in alive_block_ids and not b2s_item.deleted:
                 b2s_to_remove.append(b2s_item.id)
         if b2s_to_remove:
             BlockToSequential.objects.filter(id__in=b2s_to_remove).update(deleted=True)
 
         if b2s_to_insert:
-            BlockToSequential.objects.bulk_create(b2s_to_insert)
+            BlockToSequential.objects.bulk_create(b2s_to_insert, DB_FILTER_CHUNK_SIZE)
+        if b2s_to_update:
+            BlockToSequential.objects.bulk_update(
+                b2s_to_update, ['sequential_name', 'graded', 'sequential_id', 'visible_to_staff_only', 'deleted'],
+                DB_FILTER_CHUNK_SIZE)
 
         tags_to_remove = []
         for tag_id, tag in existing_structure_tags_dict.items():
@@ -531,17 +663,34 @@ def update_course_structure(course_id, logs_data=None):
             ApiCourseStructureTags.objects.filter(id__in=tags_to_remove).delete()
 
         if tags_to_insert:
-            ApiCourseStructureTags.objects.bulk_create(tags_to_insert)
+            ApiCourseStructureTags.objects.bulk_create(tags_to_insert, DB_FILTER_CHUNK_SIZE)
 
         ora_to_remove = []
         for ora_id, ora_item in ora_blocks_dict.items():
-            if ora_id not in structure_dict:
+            if ora_id not in alive_block_ids:
                 ora_to_remove.append(ora_item.id)
         if ora_to_remove:
             OraBlockStructure.objects.filter(id__in=ora_to_remove).delete()
 
         if ora_to_insert:
-            OraBlockStructure.objects.bulk_create(ora_to_insert)
+            OraBlockStructure.objects.bulk_create(ora_to_insert, DB_FILTER_CHUNK_SIZE)
+        if ora_to_update:
+            OraBlockStructure.objects.bulk_update(
+                ora_to_update, ['is_ora_empty_rubrics', 'support_multiple_rubrics', 'is_additional_rubric', 'prompt',
+                                'rubric_criteria', 'display_rubric_step_to_students', 'steps', 'ungraded'],
+                DB_FILTER_CHUNK_SIZE)
+
+        if structure_version:
+            ApiCourseStructureVersion.objects.update_or_create(
+                course_id=str(course_id),
+                defaults={'version': structure_version, 'blocks': json.dumps(fingerprints)}
+            )
+
+        transaction.on_commit(lambda: CourseMetadataCache.invalidate_course(course_id))
+        if items_to_insert or items_to_update or items_to_remove or tags_to_insert or tags_to_remove\
+          or b2s_to_insert or b2s_to_update or b2s_to_remove or ora_to_insert or ora_to_update or ora_to_remove:
+            transaction.on_commit(
+                lambda: LearnerTagScoreCourse.objects.filter(course_id=str(course_id)).update(dirty=True))
 
         t4 = time.time()
         time_total = t4 - t1
@@ -549,13 +698,15 @@ def update_course_structure(course_id, logs_data=None):
         time_to_get_mysql_structure = t3 - t2
         time_to_update_data_in_mysql = t4 - t3
 
-        log_entry = "Update %s structure results: added %s items, updated %s items, removed %s items, "\
+        log_entry = "Update %s structure results (%s mode, %d blocks processed): added %s items, "\
+                    "updated %s items, removed %s items, "\
                     "added %s tags, removed %s tags, added %s b2s, updated %s b2s, removed %s b2s. "\
                     "Time to get data from mongo: %s. Time to get data from Mysql: %s. Time to update data in Mysql: %s. "\
                     "Total time: %s"\
-                    % (str(course_id), str(len(items_to_insert)), str(items_updated), str(len(items_to_remove)),
+                    % (str(course_id), 'full' if db_block_ids is None else 'incremental', len(items_to_process),
+                       str(len(items_to_insert)), str(len(items_to_update)), str(len(items_to_remove)),
                        str(len(tags_to_insert)), str(len(tags_to_remove)), str(len(b2s_to_insert)),
-                       str(b2s_updated), str(len(b2s_to_remove)), str(time_to_get_structure_from_mongo),
+                       str(len(b2s_to_update)), str(len(b2s_to_remove)), str(time_to_get_structure_from_mongo),
                        str(time_to_get_mysql_structure), str(time_to_update_data_in_mysql), str(time_total))
         logs_data.append(log_entry)
         log.info(log_entry)
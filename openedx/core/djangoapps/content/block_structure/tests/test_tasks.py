@@ -5,9 +5,12 @@ Unit tests for the Course Blocks tasks
 
 from unittest.mock import patch
 
+from xmodule.modulestore import ModuleStoreEnum
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
+from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
 
-from ..tasks import update_course_in_cache_v2
+from ..models import ApiCourseStructure, ApiCourseStructureVersion
+from ..tasks import _get_changed_blocks, update_course_in_cache_v2, update_course_structure
 
 
 class UpdateCourseInCacheTaskTest(ModuleStoreTestCase):
@@ -23,3 +26,106 @@ class UpdateCourseInCacheTaskTest(ModuleStoreTestCase):
         mock_update.side_effect = Exception("WHAMMY")
         update_course_in_cache_v2.apply(kwargs=dict(course_id="invalid_course_key raises exception 12345 meow"))
         assert mock_retry.called
+
+
+class UpdateCourseStructureTest(ModuleStoreTestCase):
+    """
+    Tests for the incremental update of the course structure based on the published version.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.course = CourseFactory.create(display_name='Test Course')
+        self.chapter = ItemFactory.create(category='chapter', parent=self.course, display_name='Chapter')
+        self.sequential = ItemFactory.create(category='sequential', parent=self.chapter, display_name='Sequential')
+        self.vertical1 = ItemFactory.create(category='vertical', parent=self.sequential, display_name='Unit 1')
+        self.vertical2 = ItemFactory.create(category='vertical', parent=self.sequential, display_name='Unit 2')
+        self.course_id = str(self.course.id)
+
+    def _published_structure(self, version):
+        """
+        Published structure in the split-mongo format built from the modulestore items
+        """
+        blocks = []
+        with self.store.branch_setting(ModuleStoreEnum.Branch.published_only):
+            for item in self.store.get_items(self.course.id):
+                blocks.append({
+                    'block_id': item.location.block_id,
+                    'block_type': item.location.block_type,
+                    'definition': str(item.definition_locator.definition_id),
+                    'fields': {
+                        'display_name': item.display_name,
+                        'children': [[c.block_type, c.block_id] for c in item.children] if item.has_children else [],
+                    },
+                })
+        return {'_id': version, 'blocks': blocks}
+
+    def _update(self, version, incremental=True):
+        with patch('openedx.core.djangoapps.content.block_structure.tasks.get_course_structure',
+                   return_value=self._published_structure(version)):
+            return update_course_structure(self.course_id, incremental=incremental)
+
+    def _display_name(self, item):
+        return ApiCourseStructure.objects.get(block_id=str(item.location)).display_name
+
+    def test_full_update_without_version(self):
+        logs_data = self._update('version1')
+        assert 'full mode' in logs_data[-1]
+        assert set(ApiCourseStructure.objects.filter(course_id=self.course_id).values_list(
+            'block_id', flat=True)) == {str(i.location) for i in (
+                self.course, self.chapter, self.sequential, self.vertical1, self.vertical2)}
+        assert self._display_name(self.vertical2) == 'Unit 2'
+
+        version_obj = ApiCourseStructureVersion.objects.get(course_id=self.course_id)
+        assert version_obj.version == 'version1'
+        assert self.vertical1.location.block_id in version_obj.get_blocks()
+
+    def test_unchanged_version_is_skipped(self):
+        self._update('version1')
+        with patch('openedx.core.djangoapps.content.block_structure.tasks.modulestore') as mock_modulestore:
+            logs_data = self._update('version1')
+            assert not mock_modulestore.called
+        assert 'version version1 is already processed' in logs_data[-1]
+
+    def test_only_changed_blocks_are_updated(self):
+        self._update('version1')
+        # the row of the unchanged block isn't rewritten even if it differs from the modulestore
+        ApiCourseStructure.objects.filter(block_id=str(self.vertical2.location)).update(display_name='Stale')
+
+        self.vertical1.display_name = 'Unit 1 Updated'
+        self.store.update_item(self.vertical1, self.user.id)
+        self.store.publish(self.vertical1.location, self.user.id)
+
+        logs_data = self._update('version2')
+        assert 'incremental mode, 1 blocks processed' in logs_data[-1]
+        assert self._display_name(self.vertical1) == 'Unit 1 Updated'
+        assert self._display_name(self.vertical2) == 'Stale'
+        assert ApiCourseStructureVersion.objects.get(course_id=self.course_id).version == 'version2'
+
+        # the full mode rewrites all blocks
+        self._update('version2', incremental=False)
+        assert self._display_name(self.vertical2) == 'Unit 2'
+
+    def test_removed_block_is_marked_as_deleted(self):
+        self._update('version1')
+        self.store.delete_item(self.vertical2.location, self.user.id)
+        self.store.publish(self.sequential.location, self.user.id)
+
+        self._update('version2')
+        assert ApiCourseStructure.objects.get(block_id=str(self.vertical2.location)).deleted
+        assert not ApiCourseStructure.objects.get(block_id=str(self.vertical1.location)).deleted
+
+    def test_get_changed_blocks(self):
+        old_fingerprints = {
+            'course': ['course', None, 'a'],
+            'chapter': ['chapter', 'course', 'b'],
+            'seq1': ['sequential', 'chapter', 'c'],
+            'unit1': ['vertical', 'seq1', 'd'],
+            'seq2': ['sequential', 'chapter', 'e'],
+        }
+        new_fingerprints = dict(old_fingerprints)
+        new_fingerprints['seq1'] = ['sequential', 'chapter', 'changed']
+        dirty, to_load = _get_changed_blocks(old_fingerprints, new_fingerprints)
+        # descendants of the changed block are reprocessed, its ancestors are only loaded
+        assert dirty == {'seq1', 'unit1'}
+        assert to_load == {'course', 'chapter', 'seq1', 'unit1'}
@@ -13,7 +13,7 @@ from django.contrib.auth import login as django_login
 from django.shortcuts import redirect
 from common.djangoapps.student.models import UserProfile, CourseEnrollment
 from common.djangoapps.credo.auth_helper import CredoIpHelper
-from common.djangoapps.credo.api_client import ApiRequestError
+from common.djangoapps.credo.api_client import ApiConnectionError, ApiRequestError
 from common.djangoapps.credo_modules.models import update_unique_user_id_cookie
 from django.core.exceptions import PermissionDenied
 from django.db import IntegrityError, transaction
@@ -145,6 +145,13 @@ def validate_credo_access(request, redirect_to=None):
             else:
                 api_referrer_response = msg
             log.info(msg)
+        except ApiConnectionError as e:
+            msg = 'Validate Credo Access: ApiConnectionError raised (%s)' % str(e)
+            if not api_ip_response:
+                api_ip_response = msg
+            else:
+                api_referrer_response = msg
+            log.info(msg)
 
     log_credo_access(course_id, user_ip, headers, ip_param_passed_to_api, referrer_param_passed_to_api,
                      referrer_taken_from, api_ip_response, api_referrer_response, auth_success,